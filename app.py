@@ -30,6 +30,13 @@ try:
 except Exception:
     pass  # Non blocca mai l'app se il modulo ha problemi
 
+# ─── INGESTIONE DATI LIVE IN BACKGROUND (una sola volta per processo) ────────
+try:
+    from modules.scheduler import avvia as _scheduler_avvia
+    _scheduler_avvia()
+except Exception:
+    pass  # Senza scheduler le pagine scaricano al primo accesso
+
 # Misura le prestazioni di caricamento
 start_time = time.time()
 
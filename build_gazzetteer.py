@@ -0,0 +1,200 @@
+"""
+build_gazzetteer.py — Genera il gazzetteer offline dei comuni (data/gazzetteer/).
+
+Fonte: dump GeoNames per l'Italia (https://download.geonames.org/export/dump/IT.zip,
+licenza CC BY 4.0), righe con codice ADM3 = comuni, con sigla di provincia
+(admin2), popolazione e nomi alternativi (es. Bolzano/Bozen). La regione si
+ricava dalla sigla di provincia (regioni_geo.PROVINCE_TO_REGION) o, in
+mancanza, dalle coordinate.
+
+In alternativa (--istat) i comuni ISTAT 2023 distribuiti da Openpolis nel
+pacchetto italy_geopop (wheel da PyPI o cartella data/ estratta, licenza
+CC BY 4.0): nome, sigla di provincia, regione e confini; le coordinate sono
+il baricentro del confine comunale, la popolazione è la somma per età.
+Richiede pandas + pyarrow (solo per la build).
+
+Con --locale il gazzetteer si costruisce senza rete dalle sole coordinate
+di città già presenti nell'app (ingestione, emergenza, punti di raccolta):
+copertura ridotta ai capoluoghi principali, utile solo come base minima:
+la ricerca inversa attribuirebbe un punto alla città grande più vicina.
+
+Esempi:
+    python build_gazzetteer.py                      # scarica IT.zip
+    python build_gazzetteer.py --sorgente IT.zip    # file già scaricato
+    python build_gazzetteer.py --istat italy_geopop-0.6.2-py3-none-any.whl
+    python build_gazzetteer.py --locale
+"""
+
+import argparse
+import io
+import os
+import struct
+import sys
+import zipfile
+
+import numpy as np
+
+from modules import gazzetteer, regioni_geo
+
+URL_GEONAMES = "https://download.geonames.org/export/dump/IT.zip"
+
+
+def _righe_geonames(contenuto: bytes):
+    if contenuto[:2] == b"PK":
+        with zipfile.ZipFile(io.BytesIO(contenuto)) as z:
+            contenuto = z.read("IT.txt")
+    for riga in contenuto.decode("utf-8").splitlines():
+        campi = riga.split("\t")
+        if len(campi) >= 15 and campi[7] == "ADM3":
+            yield campi
+
+
+def da_geonames(contenuto: bytes) -> list:
+    comuni = []
+    for campi in _righe_geonames(contenuto):
+        nome, alternativi = campi[1], [a for a in campi[3].split(",") if a]
+        sigla = campi[11].strip().upper()
+        lat, lon = float(campi[4]), float(campi[5])
+        regione = regioni_geo.PROVINCE_TO_REGION.get(sigla)
+        if regione is None:
+            codice = int(regioni_geo.regioni_da_coordinate(np.array([lat]), np.array([lon]))[0])
+            regione = regioni_geo.nome_regione(codice)
+        # Nomi bilingui ("Bolzano - Bozen") cercabili anche per parte
+        parti = [p.strip() for p in nome.replace("/", " - ").split(" - ") if p.strip()]
+        comuni.append({"nome": nome, "provincia": sigla if len(sigla) == 2 else "",
+                       "regione": regione, "lat": lat, "lon": lon,
+                       "popolazione": int(campi[14] or 0),
+                       # solo alternativi in alfabeto latino (niente cirillico, arabo…)
+                       "alternativi": parti[1:] + [a for a in alternativi
+                                                   if gazzetteer.normalizza(a)
+                                                   and a.isascii() and len(a) > 2][:8]})
+    return comuni
+
+
+def _anelli_esterni(wkb: bytes, o: int = 0):
+    """Anelli esterni (array N×2 lon, lat) di un Polygon/MultiPolygon WKB → (anelli, offset)."""
+    fmt = "<" if wkb[o] == 1 else ">"
+    tipo = struct.unpack_from(fmt + "I", wkb, o + 1)[0] & 0xFF
+    o += 5
+    n = struct.unpack_from(fmt + "I", wkb, o)[0]
+    o += 4
+    anelli = []
+    if tipo == 6:                                   # MultiPolygon
+        for _ in range(n):
+            parte, o = _anelli_esterni(wkb, o)
+            anelli += parte
+        return anelli, o
+    if tipo != 3:
+        raise ValueError(f"geometria WKB non gestita: {tipo}")
+    for k in range(n):                              # Polygon: il primo anello è l'esterno
+        punti = struct.unpack_from(fmt + "I", wkb, o)[0]
+        anello = np.frombuffer(wkb, dtype=fmt + "f8", count=2 * punti, offset=o + 4)
+        o += 4 + 16 * punti
+        if k == 0:
+            anelli.append(anello.reshape(punti, 2))
+    return anelli, o
+
+
+def baricentro(wkb: bytes):
+    """(lat, lon) del baricentro dell'area dei poligoni esterni."""
+    area = cx = cy = 0.0
+    for a in _anelli_esterni(wkb)[0]:
+        x, y = a[:, 0], a[:, 1]
+        x1, y1 = np.roll(x, -1), np.roll(y, -1)
+        c = x * y1 - x1 * y
+        area += c.sum() / 2
+        cx += ((x + x1) * c).sum() / 6
+        cy += ((y + y1) * c).sum() / 6
+    return cy / area, cx / area
+
+
+def da_istat(percorso: str, anno: int = 2023) -> list:
+    """Comuni ISTAT da italy_geopop (wheel .whl o cartella con i .feather)."""
+    import pandas as pd
+
+    if os.path.isdir(percorso):
+        def leggi(nome):
+            return pd.read_feather(os.path.join(percorso, f"{anno}_{nome}.feather"))
+    else:
+        archivio = zipfile.ZipFile(percorso)
+
+        def leggi(nome):
+            return pd.read_feather(io.BytesIO(
+                archivio.read(f"italy_geopop/data/{anno}_{nome}.feather")))
+
+    comuni_df = leggi("italy_municipalities")
+    confini = leggi("italy_geo_municipalities").set_index("municipality_code")["geometry"]
+    popolazione = leggi("italy_pop").groupby("municipality_code")["tot"].sum()
+    comuni = []
+    for r in comuni_df.itertuples(index=False):
+        lat, lon = baricentro(confini[r.municipality_code])
+        sigla = r.province_short.strip().upper()
+        regione = regioni_geo.PROVINCE_TO_REGION.get(sigla)
+        if regione is None:
+            codice = int(regioni_geo.regioni_da_coordinate(np.array([lat]), np.array([lon]))[0])
+            regione = regioni_geo.nome_regione(codice)
+        # Nomi bilingui ISTAT ("Bolzano/Bozen") cercabili anche per parte
+        parti = [p.strip() for p in r.municipality.split("/") if p.strip()]
+        comuni.append({"nome": r.municipality, "provincia": sigla, "regione": regione,
+                       "lat": round(float(lat), 5), "lon": round(float(lon), 5),
+                       "popolazione": int(popolazione.get(r.municipality_code, 0)),
+                       "alternativi": parti if len(parti) > 1 else []})
+    return comuni
+
+
+def da_app() -> list:
+    """Città con coordinate già note nell'app (nessuna rete)."""
+    from modules import ingestione, punti_raccolta
+    from modules.emergenza import COORDINATES_CACHE
+    citta = {}
+    for nome, (lat, lon) in ingestione.CITTA_ARIA.items():
+        citta.setdefault(nome, (lat, lon))
+    for p in punti_raccolta.risolvi():
+        citta.setdefault(p[3].split(":")[0].strip(), (p[0], p[1]))
+    for nome, (lat, lon) in COORDINATES_CACHE.items():
+        if nome not in regioni_geo.REGIONI_BBOX:
+            citta.setdefault(nome, (lat, lon))
+    nomi = sorted(citta)
+    lat = np.array([citta[n][0] for n in nomi])
+    lon = np.array([citta[n][1] for n in nomi])
+    regioni = regioni_geo.regioni_da_coordinate(lat, lon)
+    return [{"nome": n, "provincia": "", "regione": regioni_geo.nome_regione(int(r)),
+             "lat": float(la), "lon": float(lo), "popolazione": 0}
+            for n, la, lo, r in zip(nomi, lat, lon, regioni)]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Gazzetteer offline dei comuni italiani.")
+    parser.add_argument("--sorgente", help="IT.zip / IT.txt GeoNames già scaricato")
+    parser.add_argument("--istat", help="wheel italy_geopop (o cartella data/) con i comuni ISTAT")
+    parser.add_argument("--locale", action="store_true",
+                        help="solo città già presenti nell'app, senza rete")
+    args = parser.parse_args(argv)
+
+    if args.locale:
+        comuni = da_app()
+    elif args.istat:
+        comuni = da_istat(args.istat)
+    else:
+        if args.sorgente:
+            with open(args.sorgente, "rb") as f:
+                contenuto = f.read()
+        else:
+            from modules import http_client
+            print(f"Download {URL_GEONAMES}…")
+            try:
+                r = http_client.get(URL_GEONAMES, timeout=120)
+                r.raise_for_status()
+            except Exception as e:
+                print(f"GeoNames non raggiungibile ({e}): usa --sorgente, --istat o --locale")
+                return 1
+            contenuto = r.content
+        comuni = da_geonames(contenuto)
+
+    gazzetteer.scrivi(comuni)
+    print(f"{len(comuni)} comuni scritti in {gazzetteer.DIR}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
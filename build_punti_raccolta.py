@@ -0,0 +1,70 @@
+"""
+build_punti_raccolta.py — Genera l'indice statico dei punti di raccolta.
+
+Risolve una volta tutte le coordinate dei punti di raccolta dei dizionari
+regionali (modules/dati_regioni_a/b/c.py) e le scrive in
+data/punti_raccolta.json, letto da modules/punti_raccolta.py: la pagina
+emergenza non fa più geocodifiche né chiamate di rete.
+
+Da rilanciare dopo ogni modifica ai punti di raccolta. Con --online i punti
+senza coordinate precaricate vengono geocodificati con Nominatim
+(OpenStreetMap); senza, si usano le coordinate note della città o il centro
+della regione (segnati come approssimati).
+
+Esempi:
+    python build_punti_raccolta.py
+    python build_punti_raccolta.py --online
+"""
+
+import argparse
+import json
+import sys
+import time
+from datetime import datetime, timezone
+
+from modules import punti_raccolta, snapshot
+
+
+def _nominatim(pausa: float):
+    from geopy.geocoders import Nominatim
+    geolocator = Nominatim(user_agent="sismaVer2-app", timeout=5)
+
+    def geocodifica(etichetta: str):
+        time.sleep(pausa)    # policy Nominatim: max 1 richiesta al secondo
+        try:
+            luogo = geolocator.geocode(f"{etichetta}, Italia")
+        except Exception as e:
+            print(f"{etichetta}: geocodifica fallita ({e})")
+            return None
+        return (luogo.latitude, luogo.longitude) if luogo else None
+
+    return geocodifica
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Indice statico dei punti di raccolta.")
+    parser.add_argument("--online", action="store_true",
+                        help="geocodifica con Nominatim i punti senza coordinate")
+    parser.add_argument("--pausa", type=float, default=1.0,
+                        help="secondi tra due richieste Nominatim (default 1)")
+    args = parser.parse_args(argv)
+
+    righe = punti_raccolta.risolvi(_nominatim(args.pausa) if args.online else None)
+    dati = {"generato": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "colonne": ["lat", "lon", "regione", "etichetta", "approssimato"],
+            "punti": righe}
+
+    def scrivi(f):
+        # Un punto per riga: diff leggibili quando cambiano i dati regionali
+        testo = json.dumps(dati, ensure_ascii=False).replace("], [", "],\n  [")
+        f.write(testo.encode("utf-8"))
+
+    snapshot.scrivi_atomico(punti_raccolta.PERCORSO, scrivi)
+    approssimati = sum(1 for r in righe if r[4])
+    print(f"{len(righe)} punti di raccolta scritti in {punti_raccolta.PERCORSO} "
+          f"({approssimati} con coordinate approssimate)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
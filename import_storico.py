@@ -0,0 +1,76 @@
+"""
+import_storico.py — Import offline del catalogo storico INGV nell'archivio colonnare.
+
+Scarica il catalogo FDSN INGV (riquadro Italia + mari circostanti) un mese
+alla volta e lo salva in data/archivio/colonne/<anno>/<mm>/ (vedi
+modules/archivio_colonne.py), letto dalla scheda "Lungo periodo" delle
+statistiche. I mesi già presenti vengono saltati, salvo --forza; il mese
+corrente viene sempre riscaricato. La magnitudo minima di default (M1.5)
+è il minimo del filtro delle statistiche.
+
+Esempi:
+    python import_storico.py --dal 1985-01 --al 2025-12
+    python import_storico.py --dal 2016-08 --al 2016-12 --mag-min 1.0 --forza
+"""
+
+import argparse
+import sys
+import time
+from datetime import datetime
+
+from modules import archivio_colonne, catalogo_sismico
+
+MAG_MIN = 1.5               # minimo dello slider "Magnitudo minima" delle statistiche
+
+
+def _mese(testo: str) -> datetime:
+    return datetime.strptime(testo, "%Y-%m")
+
+
+def _mese_successivo(d: datetime) -> datetime:
+    return datetime(d.year + 1, 1, 1) if d.month == 12 else datetime(d.year, d.month + 1, 1)
+
+
+def main(argv=None) -> int:
+    oggi = datetime.utcnow()
+    parser = argparse.ArgumentParser(description="Import del catalogo storico INGV per mese.")
+    parser.add_argument("--dal", type=_mese, default=datetime(1985, 1, 1),
+                        help="primo mese (AAAA-MM, default 1985-01)")
+    parser.add_argument("--al", type=_mese, default=datetime(oggi.year, oggi.month, 1),
+                        help="ultimo mese incluso (AAAA-MM, default mese corrente)")
+    parser.add_argument("--mag-min", type=float, default=MAG_MIN,
+                        help=f"magnitudo minima (default {MAG_MIN})")
+    parser.add_argument("--forza", action="store_true",
+                        help="riscarica anche i mesi già presenti")
+    parser.add_argument("--pausa", type=float, default=1.0,
+                        help="secondi di attesa tra due mesi (default 1)")
+    args = parser.parse_args(argv)
+
+    presenti = set(archivio_colonne.mesi())
+    corrente = (oggi.year, oggi.month)
+    mese, falliti, totale = args.dal, [], 0
+    while mese <= args.al:
+        chiave = (mese.year, mese.month)
+        fine = min(_mese_successivo(mese), oggi)
+        if chiave in presenti and chiave != corrente and not args.forza:
+            mese = _mese_successivo(mese)
+            continue
+        tab = catalogo_sismico.scarica_intervallo(mese, fine, args.mag_min)
+        if tab is None:
+            print(f"{mese.strftime('%Y-%m')}: INGV non raggiungibile, mese saltato")
+            falliti.append(mese.strftime("%Y-%m"))
+        else:
+            archivio_colonne.scrivi_mese(mese.year, mese.month, tab)
+            totale += len(tab)
+            print(f"{mese.strftime('%Y-%m')}: {len(tab)} eventi")
+        mese = _mese_successivo(mese)
+        time.sleep(args.pausa)
+
+    print(f"Import completato: {totale} eventi scritti in {archivio_colonne.DIR}")
+    if falliti:
+        print(f"Mesi da ripetere: {', '.join(falliti)}")
+    return 1 if falliti else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,7 @@
 
 def show():
     import streamlit as st
-    import requests
+    from modules import http_client
     from streamlit_js_eval import streamlit_js_eval
     from datetime import datetime, timezone, timedelta
     import os
@@ -38,7 +38,7 @@ def show():
 
     if url:
         try:
-            res = requests.get(url)
+            res = http_client.get(url)
             data = res.json()
             if res.status_code != 200 or "main" not in data:
                 st.error("❌ Località non trovata o errore nella richiesta.")
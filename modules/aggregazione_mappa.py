@@ -0,0 +1,230 @@
+"""
+aggregazione_mappa.py — Aggregazione lato server degli eventi per le mappe folium.
+
+Invece di un folium.Circle con popup HTML inline per ogni evento (HTML che
+cresce linearmente, per questo il limite di 100 eventi), gli eventi vengono:
+  - raggruppati in celle di griglia, una griglia per fascia di zoom (una
+    cella con più eventi → un cluster con conteggio e Mmax); il layer
+    Leaflet cambia fascia su "zoomend", da ZOOM_SINGOLI ogni evento è singolo;
+  - serializzati in un unico JSON compatto (coordinate a 4 decimali,
+    proprietà brevi): le feature dei singoli eventi una volta sola, le fasce
+    le richiamano per indice;
+  - resi con UN template JavaScript condiviso per stile, tooltip e popup
+    (con i link di navigazione), generato una volta per mappa.
+Fino a SOGLIA_DETTAGLIO eventi ogni evento resta un punto singolo.
+
+Per le heatmap celle_pesate() somma i pesi per cella e riduce i punti passati
+al plugin HeatMap.
+"""
+
+import json
+from datetime import datetime
+
+import numpy as np
+from branca.element import MacroElement
+from jinja2 import Template
+
+from modules import snapshot
+
+SOGLIA_DETTAGLIO = 400
+# zoom minimo della fascia → lato della cella di aggregazione (gradi)
+_PASSO_ZOOM = {4: 2.0, 5: 1.0, 6: 0.5, 7: 0.25, 8: 0.12, 9: 0.06, 10: 0.03}
+ZOOM_SINGOLI = max(_PASSO_ZOOM) + 1     # da questo zoom nessun cluster
+
+# Classi di colore di default: (magnitudo minima, colore), dalla più alta
+COLORI_DEFAULT = ((4.0, "#DC2626"), (3.0, "#EA580C"), (0.0, "#16A34A"))
+
+
+def _ore(time_ms: np.ndarray) -> list:
+    tz = snapshot.fuso_italia()
+    return [datetime.fromtimestamp(t / 1000.0, tz).strftime("%d/%m/%Y %H:%M")
+            for t in time_ms.tolist()]
+
+
+def _punti(lat, lon, proprieta: dict) -> list:
+    """Feature GeoJSON Point con proprietà per colonna (liste già allineate)."""
+    chiavi = list(proprieta)
+    valori = list(zip(*(proprieta[k] for k in chiavi)))
+    return [{"type": "Feature",
+             "geometry": {"type": "Point", "coordinates": [round(x, 4), round(y, 4)]},
+             "properties": dict(zip(chiavi, v))}
+            for y, x, v in zip(lat.tolist(), lon.tolist(), valori)]
+
+
+def _singoli(tab, indici) -> list:
+    depth = tab.depth[indici].astype(np.float64)
+    return _punti(tab.lat[indici], tab.lon[indici], {
+        "m": np.round(tab.mag[indici].astype(np.float64), 1).tolist(),
+        "l": [p or "N/D" for p in tab.place[indici].tolist()],
+        "t": _ore(tab.time_ms[indici]),
+        "p": [None if np.isnan(d) else round(d, 1) for d in depth.tolist()],
+        "n": [1] * len(indici),
+    })
+
+
+def _celle(tab, passo: float):
+    """
+    Cluster per cella di griglia di lato `passo`: (indici degli eventi soli
+    nella propria cella, feature dei cluster con n, m (Mmax), l (luogo del
+    più forte), t / t0 (ultimo / primo evento)).
+    """
+    r = np.floor(tab.lat / passo).astype(np.int64)
+    c = np.floor(tab.lon / passo).astype(np.int64)
+    chiave = (r - r.min()) * (c.max() - c.min() + 1) + (c - c.min())
+    _u, gruppo, conta = np.unique(chiave, return_inverse=True, return_counts=True)
+    gruppo = gruppo.ravel()
+
+    # Evento più forte di ogni cella: primo dopo l'ordinamento (cella, -mag)
+    ordine = np.lexsort((-tab.mag, gruppo))
+    primi = ordine[np.r_[0, np.flatnonzero(np.diff(gruppo[ordine])) + 1]]
+    t_max = np.full(conta.size, np.iinfo(np.int64).min, dtype=np.int64)
+    t_min = np.full(conta.size, np.iinfo(np.int64).max, dtype=np.int64)
+    np.maximum.at(t_max, gruppo, tab.time_ms)
+    np.minimum.at(t_min, gruppo, tab.time_ms)
+    lat_c = np.bincount(gruppo, weights=tab.lat) / conta
+    lon_c = np.bincount(gruppo, weights=tab.lon) / conta
+
+    multi = np.flatnonzero(conta > 1)
+    forti = primi[multi]
+    cluster = _punti(lat_c[multi], lon_c[multi], {
+        "n": conta[multi].tolist(),
+        "m": np.round(tab.mag[forti].astype(np.float64), 1).tolist(),
+        "l": [p or "N/D" for p in tab.place[forti].tolist()],
+        "t": _ore(t_max[multi]),
+        "t0": _ore(t_min[multi]),
+    })
+    return np.flatnonzero(conta[gruppo] == 1), cluster
+
+
+def aggrega(tab, soglia: int = SOGLIA_DETTAGLIO) -> dict:
+    """
+    TabellaEventi → {"e": feature di ogni evento, "z": fasce}. Ogni fascia è
+    [zoom minimo, indici in "e" dei punti singoli (None = tutti), cluster]:
+    fino a `soglia` eventi una sola fascia senza cluster, altrimenti una
+    griglia per zoom di _PASSO_ZOOM (celle con un solo evento restano punti
+    singoli) e, da ZOOM_SINGOLI o dalla prima griglia senza cluster, tutti
+    gli eventi singoli.
+    """
+    n = len(tab)
+    fasce = []
+    singoli_da = ZOOM_SINGOLI
+    for zoom, passo in sorted(_PASSO_ZOOM.items()):
+        soli, cluster = _celle(tab, passo) if n > soglia else (None, [])
+        if not cluster:
+            singoli_da = zoom
+            break
+        fasce.append([zoom if fasce else 0, soli.tolist(), cluster])
+    fasce.append([singoli_da if fasce else 0, None, []])
+    return {"e": _singoli(tab, np.arange(n)), "z": fasce}
+
+
+def celle_pesate(lat, lon, peso, passo: float = 0.05) -> list:
+    """[lat, lon, peso] sommando i pesi per cella (centroide pesato): input HeatMap."""
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    peso = np.asarray(peso, dtype=np.float64)
+    if not lat.size:
+        return []
+    chiave = np.floor(lat / passo).astype(np.int64) * 100_000 + np.floor(lon / passo).astype(np.int64)
+    _u, gruppo = np.unique(chiave, return_inverse=True)
+    gruppo = gruppo.ravel()
+    somma = np.bincount(gruppo, weights=peso)
+    la = np.bincount(gruppo, weights=lat * peso) / somma
+    lo = np.bincount(gruppo, weights=lon * peso) / somma
+    return np.column_stack([np.round(la, 4), np.round(lo, 4), np.round(somma, 2)]).tolist()
+
+
+class LivelloEventi(MacroElement):
+    """
+    Layer Leaflet per le fasce di aggrega(): cerchi per gli eventi, bolle
+    numerate per i cluster, tooltip e popup da template JS condivisi; a ogni
+    "zoomend" ridisegna la fascia dello zoom corrente.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }}_colori = {{ this.colori }};
+        function {{ this.get_name() }}_colore(m) {
+            for (var i = 0; i < {{ this.get_name() }}_colori.length; i++) {
+                if (m >= {{ this.get_name() }}_colori[i][0]) return {{ this.get_name() }}_colori[i][1];
+            }
+            return "#64748B";
+        }
+        function {{ this.get_name() }}_popup(p, ll) {
+            var nav = "";
+            if ({{ this.navigazione }}) {
+                var q = ll.lat.toFixed(4) + "," + ll.lng.toFixed(4);
+                var s = "color:white;padding:3px 6px;text-decoration:none;border-radius:3px;font-size:10px;font-weight:600;";
+                nav = '<div style="font-size:10px;color:#888;margin:6px 0 4px 0;">📍 Naviga all\\'epicentro:</div>'
+                    + '<div style="display:flex;gap:4px;">'
+                    + '<a href="https://www.google.com/maps/dir/?api=1&destination=' + q + '&travelmode=driving" target="_blank" style="background:#4285F4;' + s + '">🗺️ GMaps</a>'
+                    + '<a href="https://waze.com/ul?ll=' + q + '&navigate=yes" target="_blank" style="background:#00BCD4;' + s + 'color:#000;">🚗 Waze</a>'
+                    + '<a href="https://maps.apple.com/?daddr=' + q + '&dirflg=d" target="_blank" style="background:#555;' + s + '">🍎 Maps</a>'
+                    + '</div>';
+            }
+            var h = '<h4 style="color:#DC2626;margin:0 0 5px 0;font-size:13px;border-bottom:2px solid #DC2626;padding-bottom:3px;">';
+            if (p.n > 1) {
+                return '<div style="min-width:210px;font-family:sans-serif;font-size:12px;">' + h
+                    + '🔴 ' + p.n + ' eventi in quest\\'area</h4>'
+                    + '<p style="margin:0 0 2px 0;"><b>Magnitudo max:</b> ' + p.m.toFixed(1) + '</p>'
+                    + '<p style="margin:0 0 2px 0;"><b>Evento più forte:</b> ' + p.l + '</p>'
+                    + '<p style="margin:0 0 2px 0;"><b>Dal:</b> ' + p.t0 + '</p>'
+                    + '<p style="margin:0 0 2px 0;"><b>Al:</b> ' + p.t + '</p>'
+                    + '<div style="font-size:10px;color:#888;">Ingrandisci per i singoli eventi</div></div>';
+            }
+            return '<div style="min-width:210px;font-family:sans-serif;font-size:12px;">' + h
+                + '🌊 Evento sismico</h4>'
+                + '<p style="margin:0 0 2px 0;"><b>Luogo:</b> ' + p.l + '</p>'
+                + '<p style="margin:0 0 2px 0;"><b>Magnitudo:</b> ' + p.m.toFixed(1) + '</p>'
+                + '<p style="margin:0 0 2px 0;"><b>Data/Ora:</b> ' + p.t + ' (IT)</p>'
+                + '<p style="margin:0;"><b>Profondità:</b> ' + (p.p === null ? 'N/D' : p.p + ' km') + '</p>'
+                + nav + '</div>';
+        }
+        var {{ this.get_name() }}_dati = {{ this.dati }};
+        var {{ this.get_name() }} = L.geoJson(null, {
+            pointToLayer: function (f, ll) {
+                var p = f.properties, col = {{ this.get_name() }}_colore(p.m);
+                if (p.n > 1) {
+                    var d = Math.min(46, 20 + 6 * Math.log(p.n) / Math.LN2);
+                    return L.marker(ll, {icon: L.divIcon({
+                        className: "",
+                        iconSize: [d, d], iconAnchor: [d / 2, d / 2],
+                        html: '<div style="width:' + d + 'px;height:' + d + 'px;border-radius:50%;'
+                            + 'background:' + col + ';opacity:0.8;border:2px solid white;'
+                            + 'box-shadow:0 1px 6px rgba(0,0,0,0.35);display:flex;align-items:center;'
+                            + 'justify-content:center;color:white;font:700 11px sans-serif;">' + p.n + '</div>'
+                    })});
+                }
+                return L.circleMarker(ll, {radius: Math.max(4, p.m * 2.6), color: col,
+                                           fillColor: col, fillOpacity: 0.45, weight: 1.5});
+            },
+            onEachFeature: function (f, layer) {
+                var p = f.properties;
+                layer.bindPopup(function (l) { return {{ this.get_name() }}_popup(p, l.getLatLng()); },
+                                {maxWidth: 270});
+                layer.bindTooltip(p.n > 1 ? p.n + " eventi · Mmax " + p.m.toFixed(1)
+                                          : "M " + p.m.toFixed(1) + " — " + p.l);
+            }
+        }).addTo({{ this._parent.get_name() }});
+        var {{ this.get_name() }}_fascia = -1;
+        function {{ this.get_name() }}_aggiorna() {
+            var d = {{ this.get_name() }}_dati, z = {{ this._parent.get_name() }}.getZoom(), k = 0;
+            while (k + 1 < d.z.length && z >= d.z[k + 1][0]) k++;
+            if (k === {{ this.get_name() }}_fascia) return;
+            {{ this.get_name() }}_fascia = k;
+            {{ this.get_name() }}.clearLayers();
+            {{ this.get_name() }}.addData(d.z[k][1] === null ? d.e
+                : d.z[k][1].map(function (i) { return d.e[i]; }));
+            {{ this.get_name() }}.addData(d.z[k][2]);
+        }
+        {{ this._parent.get_name() }}.on("zoomend", {{ this.get_name() }}_aggiorna);
+        {{ this.get_name() }}_aggiorna();
+        {% endmacro %}
+        """)
+
+    def __init__(self, dati: dict, colori=COLORI_DEFAULT, navigazione: bool = True):
+        super().__init__()
+        self._name = "LivelloEventi"
+        self.dati = json.dumps(dati, separators=(",", ":"), ensure_ascii=False).replace("</", "<\\/")
+        self.colori = json.dumps([list(c) for c in colori])
+        self.navigazione = "true" if navigazione else "false"
@@ -0,0 +1,131 @@
+"""
+analisi_gr.py — Analisi Gutenberg-Richter e b-value vettoriali per SismaVer2.
+
+Tutte le funzioni lavorano su array NumPy di magnitudo (e tempi) — le colonne
+del catalogo / archivio eventi — senza cicli Python sugli eventi:
+  - distribuzione_fm()  distribuzione magnitudo-frequenza (classi e cumulata)
+  - mc_maxc()           magnitudo di completezza, massima curvatura (+ correzione)
+  - b_value()           b-value di massima verosimiglianza (Aki-Utsu) con errore
+                        di Shi & Bolt e a-value
+  - bootstrap_b()       intervallo di confidenza del b-value per bootstrap
+  - b_scorrevole()      serie temporale del b-value su finestre di N eventi
+                        (somme cumulative: tutte le finestre in un colpo)
+
+analisi(area, days) combina i passi sugli eventi dell'archivio locale ed è
+condivisa tra le sessioni per (area, finestra) tramite cache_swr.
+"""
+
+import numpy as np
+
+from modules import archivio_eventi, cache_swr
+
+PASSO = 0.1                 # risoluzione delle magnitudo INGV
+CORREZIONE_MAXC = 0.2       # correzione standard della massima curvatura (Woessner & Wiemer 2005)
+MIN_EVENTI = 50             # sotto questa soglia il b-value non è significativo
+_LOG10E = np.log10(np.e)
+
+
+def distribuzione_fm(mag, passo: float = PASSO) -> dict:
+    """Classi di magnitudo (centri), conteggi per classe e N(≥M) cumulata."""
+    mag = np.asarray(mag, dtype=np.float64)
+    if not mag.size:
+        vuoto = np.zeros(0)
+        return {"m": vuoto, "n": vuoto.astype(int), "n_cum": vuoto.astype(int)}
+    classi = np.round(mag / passo).astype(np.int64)
+    k0 = classi.min()
+    n = np.bincount(classi - k0)
+    return {"m": (np.arange(n.size) + k0) * passo, "n": n, "n_cum": n[::-1].cumsum()[::-1]}
+
+
+def mc_maxc(mag, passo: float = PASSO, correzione: float = CORREZIONE_MAXC):
+    """Magnitudo di completezza: classe più popolata della distribuzione + correzione."""
+    fm = distribuzione_fm(mag, passo)
+    if not fm["n"].size:
+        return None
+    return round(float(fm["m"][np.argmax(fm["n"])]) + correzione, 2)
+
+
+def b_value(mag, mc: float, passo: float = PASSO) -> dict:
+    """
+    b-value di massima verosimiglianza (Aki 1965, correzione di Utsu per le
+    magnitudo discretizzate), errore di Shi & Bolt (1982) e a-value (N≥Mc).
+    """
+    m = np.asarray(mag, dtype=np.float64)
+    m = m[m >= mc - passo / 2]
+    n = m.size
+    if n < 2:
+        return {"b": None, "sigma": None, "a": None, "n": n}
+    media = m.mean()
+    b = _LOG10E / (media - (mc - passo / 2))
+    sigma = 2.3 * b ** 2 * np.sqrt(((m - media) ** 2).sum() / (n * (n - 1)))
+    return {"b": float(b), "sigma": float(sigma), "a": float(np.log10(n) + b * mc), "n": n}
+
+
+def bootstrap_b(mag, mc: float, n_campioni: int = 500, passo: float = PASSO,
+                livello: float = 0.95, seme: int = 0):
+    """
+    Intervallo di confidenza del b-value: ricampionamento con reinserimento
+    degli eventi ≥Mc, a blocchi di campioni per contenere la memoria.
+    → (b_basso, b_alto) oppure None con meno di MIN_EVENTI eventi.
+    """
+    m = np.asarray(mag, dtype=np.float64)
+    m = m[m >= mc - passo / 2]
+    if m.size < MIN_EVENTI:
+        return None
+    rng = np.random.default_rng(seme)
+    blocco = max(1, min(n_campioni, 2_000_000 // m.size))
+    medie = []
+    for inizio in range(0, n_campioni, blocco):
+        k = min(blocco, n_campioni - inizio)
+        medie.append(m[rng.integers(0, m.size, size=(k, m.size))].mean(axis=1))
+    b = _LOG10E / (np.concatenate(medie) - (mc - passo / 2))
+    code = (1 - livello) / 2 * 100
+    basso, alto = np.percentile(b, [code, 100 - code])
+    return float(basso), float(alto)
+
+
+def b_scorrevole(time_ms, mag, mc: float, finestra: int = 200, passo_eventi: int = 20,
+                 passo: float = PASSO) -> dict:
+    """
+    b-value su finestre mobili di `finestra` eventi ≥Mc in ordine di tempo,
+    avanzando di `passo_eventi`. Ogni punto è datato all'ultimo evento della
+    finestra. → {"time_ms", "b", "sigma"} (array, vuoti se eventi insufficienti)
+    """
+    t = np.asarray(time_ms, dtype=np.int64)
+    m = np.asarray(mag, dtype=np.float64)
+    sel = m >= mc - passo / 2
+    t, m = t[sel], m[sel]
+    if m.size < finestra:
+        vuoto = np.zeros(0)
+        return {"time_ms": vuoto.astype(np.int64), "b": vuoto, "sigma": vuoto}
+    ordine = np.argsort(t, kind="stable")
+    t, m = t[ordine], m[ordine]
+    c1 = np.concatenate([[0.0], np.cumsum(m)])
+    c2 = np.concatenate([[0.0], np.cumsum(m * m)])
+    fine = np.arange(finestra, m.size + 1, passo_eventi)
+    somma = c1[fine] - c1[fine - finestra]
+    media = somma / finestra
+    varianza = (c2[fine] - c2[fine - finestra] - somma * media) / (finestra - 1)
+    b = _LOG10E / (media - (mc - passo / 2))
+    sigma = 2.3 * b ** 2 * np.sqrt(np.maximum(varianza, 0) / finestra)
+    return {"time_ms": t[fine - 1], "b": b, "sigma": sigma}
+
+
+@cache_swr.swr(ttl=600)
+def analisi(area: str = None, days: int = 365) -> dict:
+    """
+    Analisi completa sugli eventi dell'archivio per area (None/"Italia…" =
+    tutto il catalogo, nome regione, oppure "vulcano:<Nome>") e finestra in giorni.
+    """
+    time_ms, mag = archivio_eventi.magnitudo(days, area=area,
+                                             min_mag=archivio_eventi.MAG_MIN_ARCHIVIO)
+    fm = distribuzione_fm(mag)
+    mc = mc_maxc(mag)
+    esito = {"n_totale": int(mag.size), "fm": fm, "mc": mc,
+             "b": None, "sigma": None, "a": None, "n_mc": 0, "ic": None,
+             "serie": b_scorrevole(time_ms, mag, mc) if mc is not None else None}
+    if mc is not None:
+        stima = b_value(mag, mc)
+        esito.update(b=stima["b"], sigma=stima["sigma"], a=stima["a"], n_mc=stima["n"],
+                     ic=bootstrap_b(mag, mc))
+    return esito
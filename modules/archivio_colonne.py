@@ -0,0 +1,139 @@
+"""
+archivio_colonne.py — Archivio storico colonnare partizionato per anno/mese per SismaVer2.
+
+Popolato offline da import_storico.py (pagine mensili dal servizio FDSN INGV)
+e letto dalla pagina statistiche per le serie di lungo periodo (decenni).
+
+Layout su disco, una cartella per mese:
+    data/archivio/colonne/<anno>/<mm>/time_ms.npy, mag.npy, depth.npy,
+                                      lat.npy, lon.npy, regione_code.npy,
+                                      place_code.npy, luoghi.npy
+
+File .npy semplici (niente pickle) aperti con np.load(mmap_mode="r"): le
+query leggono dal disco solo le colonne e le partizioni richieste, e gli
+aggregati (per anno, eventi più forti) sono operazioni NumPy vettoriali.
+Formato scelto al posto di Parquet/Arrow per non aggiungere pyarrow alle
+dipendenze: NumPy è già usato da tutto il catalogo (tabella_eventi.py).
+"""
+
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from modules import snapshot
+
+DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                   "data", "archivio", "colonne")
+
+# colonna → dtype (stessi tipi di TabellaEventi)
+COLONNE = {
+    "time_ms": np.int64, "mag": np.float32, "depth": np.float32,
+    "lat": np.float64, "lon": np.float64,
+    "regione_code": np.int8, "place_code": np.int32,
+}
+
+_MMAP = {}                  # (cartella, colonna) → (mtime, array mmap)
+_LOCK = threading.Lock()
+
+
+def _cartella(anno: int, mese: int) -> str:
+    return os.path.join(DIR, f"{anno:04d}", f"{mese:02d}")
+
+
+# ── Scrittura (import offline) ───────────────────────────────────────────────
+
+def scrivi_mese(anno: int, mese: int, tabella):
+    """Sostituisce la partizione anno/mese con gli eventi della TabellaEventi."""
+    cartella = _cartella(anno, mese)
+    colonne = {nome: np.ascontiguousarray(getattr(tabella, nome), dtype=dtype)
+               for nome, dtype in COLONNE.items()}
+    colonne["luoghi"] = np.asarray(tabella.luoghi, dtype=str)
+    # time_ms per ultimo: una partizione è completa solo se esiste time_ms.npy
+    for nome in sorted(colonne, key=lambda n: n == "time_ms"):
+        snapshot.scrivi_atomico(os.path.join(cartella, f"{nome}.npy"),
+                                lambda f, a=colonne[nome]: np.save(f, a, allow_pickle=False))
+
+
+def mesi() -> list:
+    """Partizioni complete presenti su disco, come (anno, mese) in ordine."""
+    trovati = []
+    try:
+        anni = sorted(a for a in os.listdir(DIR) if a.isdigit())
+    except OSError:
+        return []
+    for anno in anni:
+        for mese in sorted(os.listdir(os.path.join(DIR, anno))):
+            if os.path.exists(os.path.join(DIR, anno, mese, "time_ms.npy")):
+                trovati.append((int(anno), int(mese)))
+    return trovati
+
+
+# ── Lettura (mmap) ───────────────────────────────────────────────────────────
+
+def _colonna(anno: int, mese: int, nome: str) -> np.ndarray:
+    percorso = os.path.join(_cartella(anno, mese), f"{nome}.npy")
+    mtime = os.path.getmtime(percorso)
+    chiave = (anno, mese, nome)
+    with _LOCK:
+        voce = _MMAP.get(chiave)
+        if voce is None or voce[0] != mtime:
+            voce = _MMAP[chiave] = (mtime, np.load(percorso, mmap_mode="r",
+                                                    allow_pickle=False))
+    return voce[1]
+
+
+def colonne(campi=("time_ms", "mag"), dal_anno: int = None, al_anno: int = None,
+            min_mag: float = None) -> dict:
+    """
+    Colonne richieste concatenate sulle partizioni [dal_anno, al_anno],
+    filtrate per magnitudo minima. `place` restituisce le stringhe decodificate.
+    """
+    pezzi = {c: [] for c in campi}
+    for anno, mese in mesi():
+        if (dal_anno is not None and anno < dal_anno) or (al_anno is not None and anno > al_anno):
+            continue
+        maschera = None
+        if min_mag is not None:
+            maschera = _colonna(anno, mese, "mag") >= np.float32(min_mag)
+        for c in campi:
+            if c == "place":
+                a = _colonna(anno, mese, "luoghi")[_colonna(anno, mese, "place_code")]
+            else:
+                a = _colonna(anno, mese, c)
+            pezzi[c].append(a[maschera] if maschera is not None else np.asarray(a))
+    return {c: (np.concatenate(v) if v else
+                np.zeros(0, dtype=COLONNE.get(c, str))) for c, v in pezzi.items()}
+
+
+# ── Aggregati ────────────────────────────────────────────────────────────────
+
+def annuale(min_mag: float = 2.0) -> pd.DataFrame:
+    """Per anno: numero di eventi, magnitudo massima, eventi M≥4 e M≥5."""
+    c = colonne(("time_ms", "mag"), min_mag=min_mag)
+    if not len(c["time_ms"]):
+        return pd.DataFrame(columns=["anno", "n_eventi", "mag_max", "n_m4", "n_m5"])
+    anni = pd.to_datetime(c["time_ms"], unit="ms", utc=True).year.to_numpy()
+    a0 = int(anni.min())
+    idx = anni - a0
+    n = int(idx.max()) + 1
+    mag_max = np.full(n, np.nan, dtype=np.float32)
+    np.fmax.at(mag_max, idx, c["mag"])
+    df = pd.DataFrame({
+        "anno":     np.arange(a0, a0 + n),
+        "n_eventi": np.bincount(idx, minlength=n),
+        "mag_max":  mag_max,
+        "n_m4":     np.bincount(idx, weights=c["mag"] >= 4.0, minlength=n).astype(int),
+        "n_m5":     np.bincount(idx, weights=c["mag"] >= 5.0, minlength=n).astype(int),
+    })
+    return df[df["n_eventi"] > 0].reset_index(drop=True)
+
+
+def piu_forti(n: int = 20, min_mag: float = 4.0) -> pd.DataFrame:
+    """Gli n eventi di magnitudo maggiore dell'intero archivio."""
+    c = colonne(("time_ms", "mag", "depth", "lat", "lon", "place"), min_mag=min_mag)
+    if not len(c["mag"]):
+        return pd.DataFrame(columns=list(c))
+    ordine = np.lexsort((-c["time_ms"], -c["mag"]))[:n]
+    return pd.DataFrame({k: v[ordine] for k, v in c.items()})
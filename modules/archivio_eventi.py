@@ -0,0 +1,317 @@
+"""
+archivio_eventi.py — Archivio locale SQLite (WAL) degli eventi sismici per SismaVer2.
+
+Il catalogo condiviso (catalogo_sismico.py) tiene in memoria solo le finestre
+live (7 / 90-365 giorni). Questo archivio le accumula su disco, alimentato
+dallo scheduler di ingestione a ogni refresh del catalogo, e viene completato
+all'indietro mese per mese fino a ANNI_ARCHIVIO anni (completa_storico).
+Solo eventi INGV: gli id EMSC/USGS dello stesso terremoto sono diversi.
+
+Le statistiche interrogano l'archivio con aggregati SQL (conteggi giornalieri,
+classi di magnitudo, ora del giorno, giorno della settimana, celle di griglia)
+invece di riscaricare e ricostruire un DataFrame a ogni scadenza della cache.
+
+Indici: (time_ms), (mag) e (cella) — cella di griglia 0.1° per heatmap e
+viste regionali. Modalità WAL: le letture delle pagine non bloccano mai la
+scrittura dello scheduler (una connessione per thread).
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+PERCORSO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        "data", "archivio", "eventi.sqlite3")
+
+ANNI_ARCHIVIO = 5           # profondità del completamento all'indietro
+MAG_MIN_ARCHIVIO = 1.5      # stessa soglia della finestra storica del catalogo
+CELLA_GRADI = 0.1
+_COLONNE_CELLA = int(360 / CELLA_GRADI)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS eventi (
+    id       TEXT PRIMARY KEY,
+    time_ms  INTEGER NOT NULL,
+    mag      REAL NOT NULL,
+    depth    REAL,
+    lat      REAL NOT NULL,
+    lon      REAL NOT NULL,
+    place    TEXT,
+    mag_type TEXT,
+    fonte    TEXT,
+    regione  INTEGER,
+    cella    INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_eventi_time  ON eventi(time_ms);
+CREATE INDEX IF NOT EXISTS idx_eventi_mag   ON eventi(mag);
+CREATE INDEX IF NOT EXISTS idx_eventi_cella ON eventi(cella);
+CREATE TABLE IF NOT EXISTS meta (
+    chiave TEXT PRIMARY KEY,
+    valore TEXT
+);
+"""
+
+_locale = threading.local()
+_LOCK_SCRITTURA = threading.Lock()
+_LOCK_SCHEMA = threading.Lock()
+_schema_pronto = False
+
+
+def _connessione() -> sqlite3.Connection:
+    """Connessione del thread corrente (WAL, schema creato alla prima apertura)."""
+    global _schema_pronto
+    conn = getattr(_locale, "conn", None)
+    if conn is not None:
+        return conn
+    os.makedirs(os.path.dirname(PERCORSO), exist_ok=True)
+    conn = sqlite3.connect(PERCORSO, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    if not _schema_pronto:
+        with _LOCK_SCHEMA:
+            if not _schema_pronto:
+                conn.executescript(_SCHEMA)
+                # Eventi EMSC/USGS archiviati da versioni precedenti: duplicati
+                # con id diversi degli eventi INGV, da rimuovere
+                with conn:
+                    conn.execute("DELETE FROM eventi WHERE fonte <> 'INGV'")
+                _schema_pronto = True
+    _locale.conn = conn
+    return conn
+
+
+# ── Griglia ──────────────────────────────────────────────────────────────────
+
+def cella(lat, lon):
+    """Indice di cella 0.1° (scalare o array NumPy)."""
+    riga = np.floor((np.asarray(lat, dtype=np.float64) + 90.0) / CELLA_GRADI).astype(np.int64)
+    col = np.floor((np.asarray(lon, dtype=np.float64) + 180.0) / CELLA_GRADI).astype(np.int64)
+    return riga * _COLONNE_CELLA + col
+
+
+# ── Scrittura ────────────────────────────────────────────────────────────────
+
+def registra(tabella) -> int:
+    """Upsert per id degli eventi di una TabellaEventi (le revisioni sostituiscono)."""
+    n = len(tabella)
+    if not n:
+        return 0
+    depth = tabella.depth.astype(np.float64)
+    righe = zip(
+        tabella.id.tolist(), tabella.time_ms.tolist(),
+        np.round(tabella.mag.astype(np.float64), 2).tolist(),
+        [None if np.isnan(d) else round(d, 2) for d in depth.tolist()],
+        tabella.lat.tolist(), tabella.lon.tolist(),
+        tabella.place.tolist(), tabella.mag_type.tolist(), tabella.fonte.tolist(),
+        tabella.regione_code.tolist(), cella(tabella.lat, tabella.lon).tolist(),
+    )
+    conn = _connessione()
+    with _LOCK_SCRITTURA, conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO eventi (id, time_ms, mag, depth, lat, lon, place, "
+            "mag_type, fonte, regione, cella) VALUES (?,?,?,?,?,?,?,?,?,?,?)", righe)
+    return n
+
+
+def _meta(chiave: str, default=None):
+    r = _connessione().execute("SELECT valore FROM meta WHERE chiave = ?", (chiave,)).fetchone()
+    return r[0] if r else default
+
+
+def _imposta_meta(chiave: str, valore):
+    conn = _connessione()
+    with _LOCK_SCRITTURA, conn:
+        conn.execute("INSERT OR REPLACE INTO meta (chiave, valore) VALUES (?, ?)",
+                     (chiave, str(valore)))
+
+
+def _mese_precedente(d: datetime) -> datetime:
+    return datetime(d.year - 1, 12, 1) if d.month == 1 else datetime(d.year, d.month - 1, 1)
+
+
+def completa_storico() -> bool:
+    """
+    Scarica UN mese mancante (dal più recente all'indietro) fino a ANNI_ARCHIVIO
+    anni fa. Chiamata periodicamente dallo scheduler; False se il download fallisce.
+    """
+    from modules import catalogo_sismico
+    ora = datetime.utcnow()
+    limite = datetime(ora.year - ANNI_ARCHIVIO, ora.month, 1)
+    fatto = _meta("completo_dal")          # inizio del mese più vecchio già scaricato
+    if fatto is None:
+        inizio = datetime(ora.year, ora.month, 1)
+        fine = ora
+    else:
+        fine = datetime.strptime(fatto, "%Y-%m-%d")
+        inizio = _mese_precedente(fine)
+    if inizio < limite:
+        return True
+    tab = catalogo_sismico.scarica_intervallo(inizio, fine, MAG_MIN_ARCHIVIO)
+    if tab is None:
+        return False
+    registra(tab)
+    _imposta_meta("completo_dal", inizio.strftime("%Y-%m-%d"))
+    print(f"Archivio eventi: {inizio.strftime('%Y-%m')} completato ({len(tab)} eventi)")
+    return True
+
+
+# ── Query aggregate ──────────────────────────────────────────────────────────
+
+def _filtro(days: float, min_mag: float, ora_ms: int = None):
+    ora_ms = ora_ms if ora_ms is not None else int(time.time() * 1000)
+    return "time_ms >= ? AND mag >= ?", [ora_ms - int(days * 86_400_000), float(min_mag)]
+
+
+def _df(sql: str, params) -> pd.DataFrame:
+    return pd.read_sql_query(sql, _connessione(), params=params)
+
+
+def vuoto() -> bool:
+    """True se l'archivio non contiene alcun evento (nessun filtro)."""
+    return _connessione().execute("SELECT 1 FROM eventi LIMIT 1").fetchone() is None
+
+
+def copertura():
+    """Epoch ms dell'evento più vecchio in archivio (None se vuoto)."""
+    r = _connessione().execute("SELECT MIN(time_ms) FROM eventi").fetchone()
+    return r[0] if r else None
+
+
+def riepilogo(days: float, min_mag: float) -> dict:
+    """Conteggio, magnitudo max/media, profondità media e numero di eventi M≥4."""
+    dove, p = _filtro(days, min_mag)
+    r = _connessione().execute(
+        f"SELECT COUNT(*), MAX(mag), AVG(mag), AVG(depth), SUM(mag >= 4.0), MIN(time_ms) "
+        f"FROM eventi WHERE {dove}", p).fetchone()
+    return {"n": r[0], "mag_max": r[1], "mag_media": r[2], "depth_media": r[3],
+            "n_significativi": r[4] or 0, "primo_ms": r[5]}
+
+
+def giornaliero(days: float, min_mag: float, offset_s: int = 0) -> pd.DataFrame:
+    """Per giorno (ora locale con offset_s): conteggio, magnitudo max e classi M≥3."""
+    dove, p = _filtro(days, min_mag)
+    return _df(
+        f"SELECT date(time_ms / 1000 + ?, 'unixepoch') AS data, COUNT(*) AS count, "
+        f"MAX(mag) AS mag_max, "
+        f"SUM(mag >= 3 AND mag < 4) AS n_3_4, SUM(mag >= 4 AND mag < 5) AS n_4_5, "
+        f"SUM(mag >= 5 AND mag < 6) AS n_5_6, SUM(mag >= 6) AS n_6 "
+        f"FROM eventi WHERE {dove} GROUP BY data ORDER BY data", [offset_s] + p)
+
+
+def istogramma(colonna: str, passo: float, days: float, min_mag: float) -> pd.DataFrame:
+    """Conteggi per classe di ampiezza `passo` di mag o depth (inizio classe, count)."""
+    if colonna not in ("mag", "depth"):
+        raise ValueError(colonna)
+    dove, p = _filtro(days, min_mag)
+    df = _df(
+        f"SELECT CAST(({colonna} + 1e-9) / ? AS INTEGER) AS classe, COUNT(*) AS count "
+        f"FROM eventi WHERE {dove} AND {colonna} IS NOT NULL GROUP BY classe ORDER BY classe",
+        [passo] + p)
+    df[colonna] = (df.pop("classe") * passo).round(3)
+    return df[[colonna, "count"]]
+
+
+def per_ora(days: float, min_mag: float, offset_s: int = 0) -> pd.DataFrame:
+    """Conteggi per ora del giorno locale (0-23, ore senza eventi incluse)."""
+    dove, p = _filtro(days, min_mag)
+    df = _df(
+        f"SELECT CAST(strftime('%H', time_ms / 1000 + ?, 'unixepoch') AS INTEGER) AS ora, "
+        f"COUNT(*) AS count FROM eventi WHERE {dove} GROUP BY ora", [offset_s] + p)
+    return (pd.DataFrame({"ora": range(24)}).merge(df, on="ora", how="left")
+            .fillna(0).astype({"count": int}))
+
+
+def per_giorno_settimana(days: float, min_mag: float, offset_s: int = 0) -> pd.DataFrame:
+    """Conteggi per giorno della settimana locale (0 = lunedì)."""
+    dove, p = _filtro(days, min_mag)
+    df = _df(
+        f"SELECT (CAST(strftime('%w', time_ms / 1000 + ?, 'unixepoch') AS INTEGER) + 6) % 7 "
+        f"AS giorno_settimana, COUNT(*) AS count FROM eventi WHERE {dove} "
+        f"GROUP BY giorno_settimana", [offset_s] + p)
+    return (pd.DataFrame({"giorno_settimana": range(7)})
+            .merge(df, on="giorno_settimana", how="left").fillna(0).astype({"count": int}))
+
+
+def per_luogo(days: float, min_mag: float) -> pd.DataFrame:
+    """Per (luogo, regione): conteggio, magnitudo max e somma delle magnitudo."""
+    dove, p = _filtro(days, min_mag)
+    return _df(
+        f"SELECT place, regione, COUNT(*) AS n_eventi, MAX(mag) AS mag_max, "
+        f"SUM(mag) AS mag_somma FROM eventi WHERE {dove} GROUP BY place, regione", p)
+
+
+def celle(days: float, min_mag: float, gradi: float = CELLA_GRADI) -> pd.DataFrame:
+    """
+    Densità per cella di griglia (multiplo di 0.1°): centro cella, conteggio,
+    magnitudo max. Base della heatmap senza trasferire ogni singolo evento.
+    """
+    k = max(1, int(round(gradi / CELLA_GRADI)))
+    dove, p = _filtro(days, min_mag)
+    df = _df(
+        f"SELECT (cella / {_COLONNE_CELLA}) / {k} AS r, (cella % {_COLONNE_CELLA}) / {k} AS c, "
+        f"COUNT(*) AS count, MAX(mag) AS mag_max FROM eventi WHERE {dove} GROUP BY r, c", p)
+    passo = k * CELLA_GRADI
+    df["lat"] = (df.pop("r") + 0.5) * passo - 90.0
+    df["lon"] = (df.pop("c") + 0.5) * passo - 180.0
+    return df
+
+
+def magnitudo(days: float, area: str = None, min_mag: float = MAG_MIN_ARCHIVIO):
+    """
+    (time_ms, mag) come array NumPy per le analisi vettoriali (analisi_gr).
+    area: None / "Italia…" = tutto, nome regione, oppure "vulcano:<Nome>"
+    (raggio dell'area vulcanica di registro_vulcani.VULCANI, in gradi).
+    """
+    dove, p = _filtro(days, min_mag)
+    vulcano = None
+    if area and area.startswith("vulcano:"):
+        from modules import registro_vulcani
+        vulcano = area.split(":", 1)[1]
+        v = registro_vulcani.VULCANI[vulcano]
+        dove += " AND lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?"
+        dlon = v["rad"] / max(np.cos(np.radians(v["lat"])), 0.1)
+        p += [v["lat"] - v["rad"], v["lat"] + v["rad"], v["lon"] - dlon, v["lon"] + dlon]
+    elif area and not area.startswith("Italia"):
+        from modules import regioni_geo
+        dove += " AND regione = ?"
+        p.append(regioni_geo.codice_regione(area))
+    righe = _connessione().execute(
+        f"SELECT time_ms, mag, lat, lon FROM eventi WHERE {dove}", p).fetchall()
+    dati = np.array(righe, dtype=np.float64).reshape(-1, 4)
+    if vulcano is not None and len(dati):
+        # il riquadro SQL è più largo del raggio: partizione esatta per distanza angolare
+        dentro = registro_vulcani.appartenenza(dati[:, 2], dati[:, 3])
+        dati = dati[dentro[:, registro_vulcani.NOMI.index(vulcano)]]
+    return dati[:, 0].astype(np.int64), dati[:, 1]
+
+
+def punti(days: float, min_mag: float) -> pd.DataFrame:
+    """Eventi della finestra (tempo, magnitudo, posizione, luogo) ordinati per tempo."""
+    dove, p = _filtro(days, min_mag)
+    return _df(f"SELECT time_ms, mag, lat, lon, depth, place FROM eventi "
+               f"WHERE {dove} ORDER BY time_ms", p)
+
+
+def piu_forti(days: float, min_mag: float, n: int = 20) -> pd.DataFrame:
+    """Gli n eventi di magnitudo maggiore nella finestra."""
+    dove, p = _filtro(days, min_mag)
+    return _df(
+        f"SELECT time_ms, mag, depth, place, mag_type, lat, lon FROM eventi "
+        f"WHERE {dove} ORDER BY mag DESC, time_ms DESC LIMIT ?", p + [int(n)])
+
+
+def nel_riquadro(days: float, bbox, min_mag: float = MAG_MIN_ARCHIVIO) -> np.ndarray:
+    """Array N×5 (time_ms, mag, depth, lat, lon) degli eventi nel riquadro, per tempo."""
+    dove, p = _filtro(days, min_mag)
+    la0, la1, lo0, lo1 = bbox
+    righe = _connessione().execute(
+        f"SELECT time_ms, mag, depth, lat, lon FROM eventi WHERE {dove} "
+        f"AND lat BETWEEN ? AND ? AND lon BETWEEN ? AND ? ORDER BY time_ms",
+        p + [la0, la1, lo0, lo1]).fetchall()
+    return np.array([[np.nan if v is None else v for v in r] for r in righe],
+                    dtype=np.float64).reshape(-1, 5)
@@ -4,7 +4,7 @@ Fornisce hero-banner tematizzati per tutte le sezioni della navigazione.
 """
 import streamlit as st
 import base64
-import requests
+from modules import http_client
 
 # ── Fetch immagine come base64 (server-side, aggira blocchi browser/CORS) ────
 @st.cache_data(ttl=86400, show_spinner=False)
@@ -28,7 +28,7 @@ def _img_b64(url: str) -> str:
         thumb_url = url
         if "upload.wikimedia.org" in url and "/1280px-" in url:
             thumb_url = url.replace("/1280px-", "/800px-")
-        r = requests.get(thumb_url, headers=headers, timeout=8)
+        r = http_client.get(thumb_url, headers=headers, timeout=8)
         if r.status_code == 200:
             ct = r.headers.get("content-type", "image/jpeg").split(";")[0]
             b64 = base64.b64encode(r.content).decode()
@@ -0,0 +1,113 @@
+"""
+cache_mappe.py — Cache dell'HTML delle mappe folium condivisa tra le sessioni.
+
+Costruire una mappa folium e serializzarla (folium_static → Figure.render())
+è la voce più pesante in CPU del server, e quasi sempre produce lo stesso
+HTML: i dati sotto (snapshot, catalogo) cambiano al massimo ogni pochi minuti
+e molte sessioni guardano la stessa vista. mostra() calcola un'impronta
+(BLAKE2b) dei dati in ingresso e dei parametri di vista (regione, zoom, layer
+attivi) e riusa l'HTML già renderizzato; la mappa viene costruita solo se
+l'impronta è nuova.
+
+La cache è in memoria di processo, LRU con un tetto in byte (MAX_BYTE).
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+MAX_BYTE = 96 * 1024 * 1024
+_CACHE = OrderedDict()        # impronta → html
+_BYTE = 0
+_LOCK = threading.Lock()
+_STATISTICHE = {"hit": 0, "miss": 0}
+
+
+# ── Impronta dei dati ────────────────────────────────────────────────────────
+
+def _aggiorna(h, v):
+    """Aggiunge all'hash una rappresentazione canonica di v (ricorsiva)."""
+    if isinstance(v, np.ndarray):
+        h.update(f"nd{v.dtype}{v.shape}".encode())
+        if v.dtype == object:
+            h.update(repr(v.tolist()).encode())
+        else:
+            h.update(np.ascontiguousarray(v).tobytes())
+    elif isinstance(v, dict):
+        h.update(b"{")
+        for k in sorted(v, key=repr):
+            _aggiorna(h, k)
+            _aggiorna(h, v[k])
+        h.update(b"}")
+    elif isinstance(v, (list, tuple)):
+        h.update(b"[")
+        for x in v:
+            _aggiorna(h, x)
+        h.update(b"]")
+    elif hasattr(v, "__slots__") and not isinstance(v, (str, bytes)):
+        # oggetti colonnari (TabellaEventi): tutte le colonne
+        _aggiorna(h, {s: getattr(v, s, None) for s in v.__slots__})
+    elif hasattr(v, "to_numpy") and hasattr(v, "columns"):
+        # DataFrame
+        _aggiorna(h, {str(c): v[c].to_numpy() for c in v.columns})
+    else:
+        h.update(repr(v).encode())
+    h.update(b"|")
+
+
+def impronta(*parti) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    _aggiorna(h, parti)
+    return h.hexdigest()
+
+
+# ── Cache ────────────────────────────────────────────────────────────────────
+
+def html(chiave, costruisci) -> str:
+    """
+    HTML della mappa per `chiave` (tupla di dati + parametri di vista);
+    costruisci() → folium.Map viene chiamata solo in caso di miss.
+    """
+    global _BYTE
+    imp = impronta(*chiave) if isinstance(chiave, tuple) else impronta(chiave)
+    with _LOCK:
+        pagina = _CACHE.get(imp)
+        if pagina is not None:
+            _CACHE.move_to_end(imp)
+            _STATISTICHE["hit"] += 1
+            return pagina
+        _STATISTICHE["miss"] += 1
+
+    import folium
+    mappa = costruisci()
+    figura = mappa if isinstance(mappa, folium.Figure) else folium.Figure().add_child(mappa)
+    pagina = figura.render()
+
+    with _LOCK:
+        if imp not in _CACHE:
+            _CACHE[imp] = pagina
+            _BYTE += len(pagina)
+            while _BYTE > MAX_BYTE and len(_CACHE) > 1:
+                _imp, vecchia = _CACHE.popitem(last=False)
+                _BYTE -= len(vecchia)
+    return pagina
+
+
+def mostra(chiave, costruisci, width=700, height: int = 500):
+    """Come folium_static(costruisci(), width, height), ma con l'HTML in cache."""
+    import streamlit.components.v1 as components
+    return components.html(html(chiave, costruisci), height=height + 10, width=width)
+
+
+def stato() -> dict:
+    with _LOCK:
+        return {"mappe": len(_CACHE), "byte": _BYTE, **_STATISTICHE}
+
+
+def invalida():
+    global _BYTE
+    with _LOCK:
+        _CACHE.clear()
+        _BYTE = 0
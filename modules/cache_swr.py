@@ -0,0 +1,173 @@
+"""
+cache_swr.py — Cache stale-while-revalidate CONDIVISA di processo per SismaVer2.
+
+Con `@st.cache_data(ttl=...)` alla scadenza del TTL il visitatore di turno
+attende il refetch completo dall'upstream. Con `@swr(ttl=...)`:
+  - età < ttl            → valore in cache
+  - ttl ≤ età < ttl_duro → valore "stale" SUBITO + un solo refresh in background
+                           (single-flight: deduplicato tra sessioni e thread)
+  - età ≥ ttl_duro / primo accesso → fetch sincrono (anch'esso single-flight:
+                           le richieste concorrenti attendono lo stesso risultato)
+
+Se il refresh fallisce (eccezione o valore non `valido`) resta servito l'ultimo
+valore buono, ma solo finché non supera ttl_duro.
+
+I valori sono condivisi tra sessioni (non copiati come in st.cache_data):
+i chiamanti non devono modificarli.
+"""
+
+import functools
+import heapq
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+_MAX_VOCI = 512
+_NESSUNO = object()
+
+_VOCI = {}
+_LOCK = threading.Lock()
+_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="sismaver-swr")
+
+
+class _Voce:
+    __slots__ = ("valore", "salvato", "usato", "in_volo")
+
+    def __init__(self):
+        self.valore = _NESSUNO
+        self.salvato = 0.0
+        self.usato = time.time()   # ultimo accesso (ordine LRU di _pota)
+        self.in_volo = None        # Future del refresh in corso (single-flight)
+
+
+def _non_none(valore) -> bool:
+    return valore is not None
+
+
+def _pota():
+    """
+    Libera un posto per una nuova voce rimuovendo le meno usate di recente
+    oltre _MAX_VOCI - 1 (chiamata con _LOCK acquisito, PRIMA dell'inserimento:
+    la voce nuova non è mai candidata). Le voci con un refresh in volo restano.
+    """
+    eccesso = len(_VOCI) - (_MAX_VOCI - 1)
+    if eccesso <= 0:
+        return
+    ferme = ((v.usato, i, k) for i, (k, v) in enumerate(_VOCI.items()) if v.in_volo is None)
+    for _u, _i, k in heapq.nsmallest(eccesso, ferme):
+        del _VOCI[k]
+
+
+def _aggiorna(voce: _Voce, volo: Future, calcola, valido, ttl_duro: float):
+    """Esegue il fetch e pubblica il risultato sul Future condiviso."""
+    errore = None
+    try:
+        valore = calcola()
+        ok = valido(valore)
+    except Exception as e:
+        print(f"Cache SWR: refresh fallito: {e}")
+        valore, ok, errore = None, False, e
+    with _LOCK:
+        if ok:
+            voce.valore = valore
+            voce.salvato = time.time()
+        voce.in_volo = None
+        stale_ok = voce.valore is not _NESSUNO and time.time() - voce.salvato < ttl_duro
+        if not ok and stale_ok:
+            valore, errore = voce.valore, None      # ripiego sull'ultimo valore buono
+    if errore is not None:
+        volo.set_exception(errore)
+    else:
+        volo.set_result(valore)
+
+
+def _ottieni(chiave, calcola, ttl: float, ttl_duro: float, valido):
+    with _LOCK:
+        voce = _VOCI.get(chiave)
+        if voce is not None:
+            voce.usato = time.time()
+        if voce is not None and voce.valore is not _NESSUNO:
+            eta = time.time() - voce.salvato
+            if eta < ttl:
+                return voce.valore
+            if eta < ttl_duro:
+                if voce.in_volo is None:
+                    voce.in_volo = Future()
+                    _POOL.submit(_aggiorna, voce, voce.in_volo, calcola, valido, ttl_duro)
+                return voce.valore
+        if voce is None:
+            _pota()
+            voce = _VOCI[chiave] = _Voce()
+        volo = voce.in_volo
+        proprietario = volo is None
+        if proprietario:
+            volo = voce.in_volo = Future()
+    if proprietario:
+        _aggiorna(voce, volo, calcola, valido, ttl_duro)
+    return volo.result()
+
+
+def swr(ttl: float, ttl_duro: float = None, valido=None):
+    """
+    Decoratore stale-while-revalidate.
+    ttl_duro: età massima di un valore stale servito (default 6×ttl).
+    valido:   f(valore) -> bool; i valori non validi non sostituiscono quelli
+              buoni (default: valido se non None).
+    """
+    ttl_duro = ttl_duro if ttl_duro is not None else ttl * 6
+    valido = valido or _non_none
+
+    def decoratore(funzione):
+        # Chiave stabile anche per funzioni ridefinite a ogni rerun (reload delle pagine)
+        nome = f"{funzione.__module__}.{funzione.__qualname__}"
+
+        @functools.wraps(funzione)
+        def wrapper(*args, **kwargs):
+            chiave = (nome, args, tuple(sorted(kwargs.items())))
+            calcola = functools.partial(funzione, *args, **kwargs)
+            try:
+                hash(chiave)
+            except TypeError:
+                return calcola()
+            return _ottieni(chiave, calcola, ttl, ttl_duro, valido)
+
+        wrapper.invalida = functools.partial(invalida, nome)
+        return wrapper
+
+    return decoratore
+
+
+def in_background(chiave, funzione) -> bool:
+    """
+    Esegue `funzione` in background se non è già in corso per `chiave`
+    (single-flight). Ritorna False se un'esecuzione era già in volo.
+    """
+    with _LOCK:
+        voce = _VOCI.get(("_bg", chiave))
+        if voce is None:
+            _pota()
+            voce = _VOCI[("_bg", chiave)] = _Voce()
+        if voce.in_volo is not None:
+            return False
+        volo = voce.in_volo = Future()
+
+    def _esegui():
+        try:
+            funzione()
+        except Exception as e:
+            print(f"Cache SWR: lavoro in background {chiave} fallito: {e}")
+        finally:
+            with _LOCK:
+                voce.in_volo = None
+            volo.set_result(None)
+
+    _POOL.submit(_esegui)
+    return True
+
+
+def invalida(nome: str = None):
+    """Dimentica i valori di una funzione (nome qualificato) o di tutte le funzioni."""
+    with _LOCK:
+        for k in [k for k, v in _VOCI.items()
+                  if v.in_volo is None and k[0] != "_bg" and (nome is None or k[0] == nome)]:
+            del _VOCI[k]
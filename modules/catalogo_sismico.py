@@ -0,0 +1,466 @@
+"""
+catalogo_sismico.py — Catalogo sismico CONDIVISO per SismaVer2.
+
+Un unico store in-process di eventi normalizzati (finestra e bbox "superset"),
+conservati come tabella colonnare NumPy (vedi tabella_eventi.py),
+che sostituisce i fetch FDSN separati di monitoraggio, home, rischi_allerte,
+statistiche e mappa_rischi. Lo store viene aggiornato al massimo una volta per
+TTL; ogni pagina applica i propri filtri (regione, magnitudo minima, giorni,
+raggio) come query locale → una sola richiesta upstream per refresh e conteggi
+coerenti tra tutte le pagine.
+
+Catena fonti: INGV ∥ mirror INGV (cnt.rm.ingv.it) in corsa con hedging, poi
+EMSC ∥ USGS solo se INGV non risponde entro la scadenza (vedi fetch_async).
+
+Dopo ogni refresh riuscito lo store viene salvato in
+data/snapshot/catalogo_<nome>.npz: a un avvio a freddo le pagine mostrano
+subito l'ultimo catalogo noto mentre il refresh (delta) gira in background.
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from modules import cache_swr, fetch_async, snapshot
+
+from modules.tabella_eventi import TabellaEventi
+
+_HDR = {
+    "User-Agent": "SismaVer2/3.3 (https://sisma-ver-2.replit.app/)",
+    "Accept": "application/json",
+}
+
+# ── Parametri store ──────────────────────────────────────────────────────────
+# Superset geografico: Italia + mari circostanti (stesso riquadro di home/allerte)
+BBOX_SUPERSET = (35.0, 48.0, 5.0, 20.0)          # lat_min, lat_max, lon_min, lon_max
+# Territorio italiano in senso stretto (vista nazionale / heatmap / M≥3 24h)
+BBOX_ITALIA = (35.5, 47.1, 6.6, 18.6)
+
+TTL_RECENTE = 300          # 5 minuti
+TTL_STORICO = 900          # 15 minuti
+
+# Scadenza per livello della catena: prima INGV+mirror, poi EMSC/USGS
+SCADENZA_RECENTE = 8.0
+SCADENZA_STORICO = 15.0    # download 90-365 giorni più pesanti
+
+# ── Normalizzazione eventi (INGV / EMSC / USGS → dict unico) ─────────────────
+
+def _parse_time_ms(t):
+    """Converte il campo time (epoch ms oppure ISO, UTC) in epoch millisecondi."""
+    if t is None:
+        return None
+    if isinstance(t, (int, float)):
+        return int(t)
+    s = str(t).replace("Z", "+00:00")
+    dt = datetime.fromisoformat(s)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+
+def _normalizza(feature: dict, fonte: str):
+    """Feature GeoJSON → evento normalizzato, oppure None se incompleto."""
+    try:
+        p = feature.get("properties", {}) or {}
+        g = (feature.get("geometry", {}) or {}).get("coordinates", []) or []
+        lon = float(g[0]) if len(g) > 0 and g[0] is not None else p.get("lon")
+        lat = float(g[1]) if len(g) > 1 and g[1] is not None else p.get("lat")
+        if lat is None or lon is None:
+            return None
+        depth = g[2] if len(g) > 2 else p.get("depth")
+        depth = abs(float(depth)) if depth is not None else None
+        mag = p.get("mag", p.get("magnitude"))
+        if mag is None:
+            return None
+        time_ms = _parse_time_ms(p.get("time"))
+        if time_ms is None:
+            return None
+        ev_id = (p.get("eventId") or p.get("unid") or feature.get("id")
+                 or f"{fonte}-{time_ms}-{lat:.3f}-{lon:.3f}")
+        return {
+            "id":       str(ev_id),
+            "time_ms":  time_ms,
+            "mag":      float(mag),
+            "mag_type": p.get("magType") or p.get("magtype") or "",
+            "lat":      float(lat),
+            "lon":      float(lon),
+            "depth":    depth,
+            "place":    p.get("place") or p.get("flynn_region") or "",
+            "fonte":    fonte,
+        }
+    except Exception:
+        return None
+
+
+# ── Store condiviso ──────────────────────────────────────────────────────────
+
+_FMT = "%Y-%m-%dT%H:%M:%S"
+_MARGINE_S = 120           # sovrapposizione delle finestre delta (ritardi di pubblicazione)
+FULL_OGNI = 3600           # refresh completo periodico (riconcilia eventi cancellati)
+
+
+class _Store:
+    """
+    Finestra di catalogo in memoria, aggiornata al massimo una volta per TTL.
+
+    Dopo il primo download completo i refresh sono INCREMENTALI: con INGV si
+    chiedono solo gli eventi creati o rivisti dopo l'ultimo refresh
+    (`updatedafter`), con EMSC/USGS quelli successivi all'evento più recente.
+    Le revisioni (magnitudo, localizzazione) sostituiscono l'evento per id.
+    """
+
+    def __init__(self, nome: str, giorni: int, min_mag: float, ttl: int, limit: int,
+                 scadenza: float):
+        self.nome = nome
+        self.giorni = giorni
+        self.min_mag = min_mag
+        self.ttl = ttl
+        self.ttl_duro = ttl * 6    # oltre: niente dati stale, refresh sincrono
+        self.limit = limit
+        self.scadenza = scadenza   # s per livello della catena (INGV, poi EMSC/USGS)
+        self.tabella = TabellaEventi.vuota()   # colonnare, ordinata per tempo decrescente
+        self.fonte = None
+        self.avviso = None
+        self.aggiornato = 0.0      # epoch s dell'ultimo refresh riuscito/tentato
+        self.ultimo_full = 0.0     # epoch s dell'ultimo download completo
+        self.ultimo_refresh_utc = None   # datetime UTC di inizio dell'ultimo refresh riuscito
+        self.ultimo_evento_ms = None     # origin time dell'evento più recente
+        self._lock = threading.Lock()
+        self._forza = False        # invalida(): il prossimo accesso attende i dati nuovi
+        self.da_disco = False      # dati ricaricati dal disco, refresh non ancora riuscito
+        self._disco_letto = False
+        self._lock_disco = threading.Lock()
+
+    # ── Cache su disco ──────────────────────────────────────────────────────
+
+    @property
+    def _percorso(self) -> str:
+        return os.path.join(snapshot.DIR, f"catalogo_{self.nome}.npz")
+
+    def _salva_disco(self):
+        meta = {
+            "fonte": self.fonte, "avviso": self.avviso, "giorni": self.giorni,
+            "aggiornato": self.aggiornato, "ultimo_full": self.ultimo_full,
+            "ultimo_refresh_utc": (self.ultimo_refresh_utc.strftime(_FMT)
+                                   if self.ultimo_refresh_utc is not None else None),
+        }
+        tabella = self.tabella
+        try:
+            snapshot.scrivi_atomico(
+                self._percorso, lambda f: tabella.salva(f, meta=np.array(json.dumps(meta))))
+        except Exception as e:
+            print(f"Catalogo {self.nome}: salvataggio su disco fallito: {e}")
+
+    def _carica_disco(self):
+        """Una volta per processo, prima di qualunque refresh: ultimo catalogo salvato."""
+        if self._disco_letto:
+            return
+        with self._lock_disco:
+            if self._disco_letto:
+                return
+            self._disco_letto = True
+            if not os.path.exists(self._percorso):
+                return
+            try:
+                tabella, extra = TabellaEventi.carica(self._percorso)
+                meta = json.loads(str(extra["meta"]))
+            except Exception as e:
+                print(f"Catalogo {self.nome}: file su disco illeggibile: {e}")
+                return
+            if time.time() - meta["aggiornato"] > snapshot.ETA_MAX_DISCO or len(self.tabella):
+                return
+            self.giorni = max(self.giorni, meta["giorni"])
+            self.tabella = tabella
+            self.fonte = meta["fonte"]
+            self.avviso = meta["avviso"]
+            self.ultimo_full = meta["ultimo_full"]
+            self.ultimo_refresh_utc = (datetime.strptime(meta["ultimo_refresh_utc"], _FMT)
+                                       if meta["ultimo_refresh_utc"] else None)
+            self.ultimo_evento_ms = int(tabella.time_ms[0]) if len(tabella) else None
+            self.aggiornato = meta["aggiornato"]
+            self.da_disco = True
+            snapshot.segna_da_disco(f"catalogo_{self.nome}", self.aggiornato)
+            print(f"Catalogo {self.nome}: {len(tabella)} eventi ricaricati dal disco")
+
+    def _sorgenti(self, start, end=None, updatedafter=None, solo=None):
+        """Catena (fonte, url, avviso); `solo` limita alla famiglia di fonti indicata."""
+        la0, la1, lo0, lo1 = BBOX_SUPERSET
+        extra = f"&endtime={end.strftime(_FMT)}" if end is not None else ""
+        extra_ingv = extra + (f"&updatedafter={updatedafter.strftime(_FMT)}"
+                              if updatedafter is not None else "")
+        ingv = (
+            f"https://webservices.ingv.it/fdsnws/event/1/query?format=geojson"
+            f"&starttime={start.strftime(_FMT)}&minmag={self.min_mag}"
+            f"&minlat={la0}&maxlat={la1}&minlon={lo0}&maxlon={lo1}"
+            f"&limit={self.limit}&orderby=time{extra_ingv}"
+        )
+        emsc = (
+            f"https://www.seismicportal.eu/fdsnws/event/1/query?format=json"
+            f"&starttime={start.strftime(_FMT)}&minmagnitude={max(self.min_mag, 1.5)}"
+            f"&minlatitude={la0}&maxlatitude={la1}&minlongitude={lo0}&maxlongitude={lo1}"
+            f"&orderby=time&limit={self.limit}{extra}"
+        )
+        usgs = (
+            f"https://earthquake.usgs.gov/fdsnws/event/1/query?format=geojson"
+            f"&starttime={start.strftime(_FMT)}&minmagnitude={max(self.min_mag, 1.5)}"
+            f"&minlatitude={la0}&maxlatitude={la1}&minlongitude={lo0}&maxlongitude={lo1}"
+            f"&limit={min(self.limit, 20000)}&orderby=time{extra}"
+        )
+        catena = [
+            ("INGV", ingv, None),
+            ("INGV", ingv.replace("webservices.ingv.it", "cnt.rm.ingv.it"), None),
+            ("EMSC", emsc,
+             "⚠️ INGV temporaneamente non disponibile. Dati da EMSC (European-Mediterranean Seismological Centre)."),
+            ("USGS", usgs,
+             "⚠️ INGV temporaneamente non disponibile. Dati da USGS (United States Geological Survey)."),
+        ]
+        if solo:
+            catena = [c for c in catena if c[0] == solo]
+        return catena
+
+    def _corsa(self, gruppo, vuoto_ok):
+        """
+        Un livello della catena (fonti equivalenti) in corsa con hedging: il
+        primo url parte subito, i successivi dopo il p90 di latenza del
+        precedente; vince la prima risposta valida. → (eventi, fonte, avviso) | None
+        """
+        primaria = gruppo[0][0] == "INGV"
+        features_per_risposta = {}
+
+        def _valida(r):
+            if r.status_code == 204:
+                return primaria or vuoto_ok     # nessun evento (nuovo) nella finestra
+            data = r.json()
+            features = data.get("features") if isinstance(data, dict) else None
+            if not isinstance(features, list):
+                return False
+            if not primaria and not features and not vuoto_ok:
+                return False
+            features_per_risposta[id(r)] = features
+            return True
+
+        richiesta = fetch_async.Richiesta(
+            gruppo[0][1], mirror=[url for _f, url, _a in gruppo[1:]], headers=_HDR,
+            timeout=self.scadenza, accetta=(200, 204), valida=_valida, hedge=True)
+        indice, r = fetch_async.fetch_primo(richiesta)
+        if r is None:
+            print(f"Catalogo {self.nome}: {'/'.join(f for f, _u, _a in gruppo)} "
+                  f"senza risposta valida entro {self.scadenza}s")
+            return None
+        fonte, _url, avviso = gruppo[indice]
+        if r.status_code == 204:
+            return TabellaEventi.vuota(), fonte, avviso
+        eventi = [e for e in (_normalizza(f, fonte) for f in features_per_risposta[id(r)]) if e]
+        print(f"INFO catalogo {self.nome}: {len(eventi)} eventi da {fonte}")
+        return TabellaEventi.da_eventi(eventi), fonte, avviso
+
+    def _scarica(self, sorgenti, vuoto_ok=False):
+        """
+        INGV + mirror in corsa; EMSC/USGS solo se INGV non risponde entro la
+        scadenza. Ritorna (eventi, fonte, avviso) oppure None.
+        vuoto_ok: una risposta vuota è valida anche da EMSC/USGS (query delta).
+        """
+        livelli = ([s for s in sorgenti if s[0] == "INGV"],
+                   [s for s in sorgenti if s[0] != "INGV"])
+        for gruppo in livelli:
+            if not gruppo:
+                continue
+            try:
+                esito = self._corsa(gruppo, vuoto_ok)
+            except Exception as e:
+                print(f"Catalogo {self.nome}: {gruppo[0][0]} fallito: {e}")
+                esito = None
+            if esito is not None:
+                return esito
+        return None
+
+    def _unisci(self, nuovi, sostituisci=False):
+        """Merge per id (le revisioni sovrascrivono) e potatura fuori finestra."""
+        tab = nuovi if sostituisci else self.tabella.unisci(nuovi)
+        self.tabella = tab.filtra(days=self.giorni)
+        self.ultimo_evento_ms = int(self.tabella.time_ms[0]) if len(self.tabella) else None
+
+    def _refresh_delta(self, t0):
+        """Solo eventi nuovi o rivisti dall'ultimo refresh, dalla stessa fonte."""
+        margine = timedelta(seconds=_MARGINE_S)
+        if self.fonte == "INGV":
+            start = t0 - timedelta(days=self.giorni)
+            sorgenti = self._sorgenti(start, updatedafter=self.ultimo_refresh_utc - margine,
+                                      solo="INGV")
+        else:
+            # EMSC/USGS: finestra "dall'ultimo evento" (gli id restano coerenti con la fonte)
+            ultimo = datetime.utcfromtimestamp(self.ultimo_evento_ms / 1000.0)
+            sorgenti = self._sorgenti(ultimo - margine, solo=self.fonte)
+        esito = self._scarica(sorgenti, vuoto_ok=True)
+        if esito is None:
+            return False
+        nuovi, _fonte, _avviso = esito
+        self._unisci(nuovi)
+        return True
+
+    def _refresh_full(self, t0):
+        esito = self._scarica(self._sorgenti(t0 - timedelta(days=self.giorni)))
+        if esito is None:
+            return False
+        eventi, self.fonte, self.avviso = esito
+        self._unisci(eventi, sostituisci=True)
+        self.ultimo_full = time.time()
+        return True
+
+    def _estendi_finestra(self, giorni, t0):
+        """Allarga la finestra scaricando solo la fetta più vecchia mancante."""
+        vecchio_inizio = t0 - timedelta(days=self.giorni)
+        self.giorni = giorni
+        if self.fonte is None:
+            return self._refresh_full(t0)
+        sorgenti = self._sorgenti(t0 - timedelta(days=giorni),
+                                  end=vecchio_inizio + timedelta(seconds=_MARGINE_S),
+                                  solo=self.fonte)
+        esito = self._scarica(sorgenti, vuoto_ok=True)
+        if esito is None:
+            return self._refresh_full(t0)
+        self._unisci(esito[0])
+        return True
+
+    def assicura(self, giorni: int = None):
+        """
+        Aggiorna lo store se scaduto (o se serve una finestra più ampia).
+        Stale-while-revalidate: con dati già presenti e non oltre ttl_duro il
+        refresh parte in background e si servono subito i dati attuali; si
+        attende solo al primo caricamento, dopo invalida() o per allargare la finestra.
+        """
+        self._carica_disco()
+        ora = time.time()
+        serve_finestra = giorni is not None and giorni > self.giorni
+        if not serve_finestra and ora - self.aggiornato < self.ttl:
+            return
+        # Dati dal disco (avvio a freddo): serviti subito qualunque sia l'età
+        if (not serve_finestra and not self._forza and len(self.tabella)
+                and (self.da_disco or ora - self.aggiornato < self.ttl_duro)):
+            cache_swr.in_background(("catalogo", self.nome), self._aggiorna)
+            return
+        self._aggiorna(giorni)
+
+    def _aggiorna(self, giorni: int = None, forza: bool = False):
+        self._carica_disco()
+        with self._lock:
+            # Un'altra sessione potrebbe aver già aggiornato mentre attendevamo il lock
+            serve_finestra = giorni is not None and giorni > self.giorni
+            scaduto = forza or time.time() - self.aggiornato >= self.ttl
+            if not serve_finestra and not scaduto:
+                return
+            t0 = datetime.utcnow()
+            if serve_finestra:
+                ok = self._estendi_finestra(giorni, t0)
+                if ok and not scaduto:
+                    return
+            delta_possibile = (
+                self.fonte is not None and self.ultimo_refresh_utc is not None
+                and (self.fonte == "INGV" or self.ultimo_evento_ms is not None)
+                and time.time() - self.ultimo_full < FULL_OGNI
+            )
+            ok = (delta_possibile and self._refresh_delta(t0)) or self._refresh_full(t0)
+            self.aggiornato = time.time()
+            self._forza = False
+            if ok:
+                self.ultimo_refresh_utc = t0
+                self.da_disco = False
+                snapshot.segna_aggiornato(f"catalogo_{self.nome}")
+                self._salva_disco()
+            elif not len(self.tabella):
+                # Mantiene gli ultimi dati validi; avvisa solo se non ne abbiamo
+                self.avviso = "⚠️ Impossibile accedere ai dati sismici — riprova tra qualche minuto."
+
+    def invalida(self):
+        """Prossimo accesso: refresh completo (non delta)."""
+        self.aggiornato = 0.0
+        self.ultimo_full = 0.0
+        self._forza = True
+
+
+_RECENTE = _Store("recente", giorni=7, min_mag=0.5, ttl=TTL_RECENTE, limit=10000,
+                  scadenza=SCADENZA_RECENTE)
+_STORICO = _Store("storico", giorni=90, min_mag=1.5, ttl=TTL_STORICO, limit=10000,
+                  scadenza=SCADENZA_STORICO)
+
+
+# ── Query locali ─────────────────────────────────────────────────────────────
+
+def eventi(days: float = 7, min_mag: float = None, regione: str = None, bbox=None,
+           centro=None, raggio_km: float = None, limit: int = None) -> TabellaEventi:
+    """
+    Eventi recenti (≤7 giorni) dallo store condiviso, ordinati dal più recente.
+    regione: nome regione italiana (sigla provincia → bbox), "Italia…" = nessun filtro.
+    bbox: (lat_min, lat_max, lon_min, lon_max). centro+raggio_km: filtro circolare.
+    """
+    _RECENTE.assicura()
+    return _RECENTE.tabella.filtra(limit=limit, days=days, min_mag=min_mag, regione=regione,
+                                   bbox=bbox, centro=centro, raggio_km=raggio_km)
+
+
+def eventi_storici(days: int = 90, min_mag: float = 2.0, regione: str = None,
+                   bbox=None) -> TabellaEventi:
+    """Eventi della finestra storica (fino a 365 giorni, M≥1.5) per le statistiche."""
+    _STORICO.assicura(giorni=days)
+    return _STORICO.tabella.filtra(days=days, min_mag=min_mag, regione=regione, bbox=bbox)
+
+
+def tabella(storico: bool = False) -> TabellaEventi:
+    """Tabella corrente dello store, senza refresh (per l'archivio su disco)."""
+    return (_STORICO if storico else _RECENTE).tabella
+
+
+_LIMITE_INTERVALLO = 10000
+
+
+def scarica_intervallo(inizio: datetime, fine: datetime, min_mag: float):
+    """
+    Eventi INGV (con mirror in hedging) nel riquadro superset tra inizio e fine
+    UTC, per l'archivio storico. Se la risposta tocca il limite del servizio
+    l'intervallo viene diviso a metà. → TabellaEventi | None se INGV non risponde.
+    """
+    la0, la1, lo0, lo1 = BBOX_SUPERSET
+    url = (
+        f"https://webservices.ingv.it/fdsnws/event/1/query?format=geojson"
+        f"&starttime={inizio.strftime(_FMT)}&endtime={fine.strftime(_FMT)}&minmag={min_mag}"
+        f"&minlat={la0}&maxlat={la1}&minlon={lo0}&maxlon={lo1}"
+        f"&limit={_LIMITE_INTERVALLO}&orderby=time"
+    )
+    r = fetch_async.fetch(url, mirror=(url.replace("webservices.ingv.it", "cnt.rm.ingv.it"),),
+                          headers=_HDR, timeout=SCADENZA_STORICO * 2, accetta=(200, 204),
+                          hedge=True)
+    if r is None:
+        return None
+    if r.status_code == 204:
+        return TabellaEventi.vuota()
+    features = r.json().get("features", [])
+    if len(features) >= _LIMITE_INTERVALLO and fine - inizio > timedelta(hours=12):
+        meta = inizio + (fine - inizio) / 2
+        prima = scarica_intervallo(inizio, meta, min_mag)
+        dopo = scarica_intervallo(meta, fine, min_mag)
+        return prima.unisci(dopo) if prima is not None and dopo is not None else None
+    eventi = [e for e in (_normalizza(f, "INGV") for f in features) if e]
+    return TabellaEventi.da_eventi(eventi)
+
+
+def stato(storico: bool = False) -> dict:
+    """Fonte, eventuale avviso e ora dell'ultimo aggiornamento dello store."""
+    s = _STORICO if storico else _RECENTE
+    return {"fonte": s.fonte, "avviso": s.avviso, "aggiornato": s.aggiornato,
+            "ultimo_full": s.ultimo_full, "ultimo_evento_ms": s.ultimo_evento_ms,
+            "n_eventi": len(s.tabella), "da_disco": s.da_disco}
+
+
+def invalida():
+    """Forza il refresh al prossimo accesso (pulsanti "Aggiorna dati")."""
+    _RECENTE.invalida()
+    _STORICO.invalida()
+
+
+def aggiorna(storico: bool = False):
+    """Refresh immediato dello store (delta se possibile) — usato dallo scheduler."""
+    (_STORICO if storico else _RECENTE)._aggiorna(forza=True)
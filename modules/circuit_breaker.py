@@ -0,0 +1,142 @@
+"""
+circuit_breaker.py — Circuit breaker per host e registro di salute delle fonti.
+
+Quando un upstream (es. INGV) è giù, ogni cache miss di ogni pagina lo
+riscopriva attendendo un timeout completo. Qui ogni host ha un interruttore:
+  - CHIUSO     → le richieste passano; i fallimenti consecutivi vengono contati
+  - APERTO     → dopo SOGLIA_FALLIMENTI fallimenti le richieste falliscono
+                 subito (CircuitoAperto) per `cooldown` secondi
+  - SEMIAPERTO → scaduto il cooldown passa UNA sola richiesta di prova:
+                 se riesce il circuito si richiude, altrimenti si riapre con
+                 cooldown raddoppiato (fino a COOLDOWN_MAX)
+
+Fallimento = errore di connessione/timeout o risposta 5xx; i 4xx e i 204 no.
+http_client e fetch_async consultano il registro prima di ogni richiesta:
+CircuitoAperto è una requests.ConnectionError, quindi le catene di fallback
+esistenti passano alla fonte successiva (o ai dati in cache) in millisecondi.
+"""
+
+import threading
+import time
+
+import requests
+
+SOGLIA_FALLIMENTI = 3
+COOLDOWN_INIZIALE = 30.0     # secondi
+COOLDOWN_MAX = 300.0
+
+CHIUSO = "chiuso"
+APERTO = "aperto"
+SEMIAPERTO = "semiaperto"
+
+
+class CircuitoAperto(requests.ConnectionError):
+    """Richiesta rifiutata senza contattare l'host: circuito aperto."""
+
+
+class _Circuito:
+    __slots__ = ("stato", "fallimenti", "cooldown", "riapre_a", "prova_in_corso",
+                 "ultimo_errore", "ultimo_successo")
+
+    def __init__(self):
+        self.stato = CHIUSO
+        self.fallimenti = 0
+        self.cooldown = COOLDOWN_INIZIALE
+        self.riapre_a = 0.0
+        self.prova_in_corso = False
+        self.ultimo_errore = None
+        self.ultimo_successo = None
+
+
+_CIRCUITI = {}
+_LOCK = threading.Lock()
+
+
+def _circuito(host: str) -> _Circuito:
+    c = _CIRCUITI.get(host)
+    if c is None:
+        c = _CIRCUITI[host] = _Circuito()
+    return c
+
+
+def verifica(host: str):
+    """Solleva CircuitoAperto se l'host non va contattato ora; altrimenti prenota il passaggio."""
+    with _LOCK:
+        c = _circuito(host)
+        if c.stato == CHIUSO:
+            return
+        if c.stato == APERTO and time.time() >= c.riapre_a:
+            c.stato = SEMIAPERTO
+        if c.stato == SEMIAPERTO and not c.prova_in_corso:
+            c.prova_in_corso = True        # questa richiesta è la prova
+            return
+        attesa = max(0.0, c.riapre_a - time.time())
+    raise CircuitoAperto(f"Circuito aperto verso {host} (riprova tra {attesa:.0f}s)")
+
+
+def successo(host: str):
+    with _LOCK:
+        c = _circuito(host)
+        if c.stato != CHIUSO:
+            print(f"Circuit breaker: {host} di nuovo raggiungibile")
+        c.stato = CHIUSO
+        c.fallimenti = 0
+        c.cooldown = COOLDOWN_INIZIALE
+        c.prova_in_corso = False
+        c.ultimo_successo = time.time()
+
+
+def fallimento(host: str, errore: str = None):
+    with _LOCK:
+        c = _circuito(host)
+        c.fallimenti += 1
+        c.ultimo_errore = (errore or "errore")[:200]
+        if c.stato == SEMIAPERTO:
+            c.cooldown = min(c.cooldown * 2, COOLDOWN_MAX)
+        elif c.fallimenti < SOGLIA_FALLIMENTI or c.stato == APERTO:
+            return
+        c.stato = APERTO
+        c.prova_in_corso = False
+        c.riapre_a = time.time() + c.cooldown
+        print(f"Circuit breaker: {host} aperto per {c.cooldown:.0f}s ({c.ultimo_errore})")
+
+
+def annulla(host: str):
+    """Richiesta interrotta senza esito (es. persa una corsa tra mirror): libera la prova."""
+    with _LOCK:
+        c = _CIRCUITI.get(host)
+        if c is not None:
+            c.prova_in_corso = False
+
+
+def esito_status(host: str, status_code: int):
+    """Registra l'esito di una risposta HTTP: 5xx = fallimento."""
+    if status_code >= 500:
+        fallimento(host, f"HTTP {status_code}")
+    else:
+        successo(host)
+
+
+def aperto(host: str) -> bool:
+    """True se una richiesta verso l'host verrebbe rifiutata ora (senza prenotare la prova)."""
+    with _LOCK:
+        c = _CIRCUITI.get(host)
+        if c is None or c.stato == CHIUSO:
+            return False
+        return c.stato == SEMIAPERTO and c.prova_in_corso or time.time() < c.riapre_a
+
+
+def salute() -> dict:
+    """Registro di salute: host → stato, fallimenti consecutivi, riapertura, ultimo errore."""
+    ora = time.time()
+    with _LOCK:
+        return {
+            host: {
+                "stato": c.stato,
+                "fallimenti": c.fallimenti,
+                "riapre_tra_s": round(max(0.0, c.riapre_a - ora)) if c.stato != CHIUSO else 0,
+                "ultimo_errore": c.ultimo_errore,
+                "ultimo_successo": c.ultimo_successo,
+            }
+            for host, c in sorted(_CIRCUITI.items())
+        }
@@ -0,0 +1,158 @@
+"""
+declustering.py — Raggruppamento degli eventi in sequenze sismiche per SismaVer2.
+
+Metodo a finestre di Gardner & Knopoff (1974): ogni evento, in ordine di
+magnitudo decrescente, definisce una finestra spazio-temporale L(M) km / T(M)
+giorni; gli eventi non ancora assegnati che vi ricadono formano la sua sequenza
+(dopo di lui → repliche, prima → precursori, lui stesso → evento principale).
+
+Le candidate di ogni finestra si cercano con un indice a griglia (celle di
+CELLA_KM, eventi di ogni cella ordinati per tempo + ricerca binaria), così il
+costo resta proporzionale agli eventi vicini anche con decine di migliaia di
+eventi. Ruoli e riepiloghi per sequenza (inizio, durata, Mmax, numero eventi)
+sono condivisi da tabelle, mappe e statistiche.
+"""
+
+import numpy as np
+import pandas as pd
+
+from modules import cache_swr
+
+CELLA_KM = 20.0
+FRAZIONE_PRECURSORI = 1.0   # finestra dei precursori = frazione di T(M)
+_KM_GRADO = 111.2
+_R_TERRA_KM = 6371.0
+
+# Ruoli
+ISOLATO, PRINCIPALE, PRECURSORE, REPLICA = 0, 1, 2, 3
+NOMI_RUOLO = {ISOLATO: "Isolato", PRINCIPALE: "Principale",
+              PRECURSORE: "Precursore", REPLICA: "Replica"}
+
+
+def finestre_gk(mag):
+    """Finestre Gardner-Knopoff: (distanza km, durata giorni) per magnitudo."""
+    mag = np.asarray(mag, dtype=np.float64)
+    distanza = 10 ** (0.1238 * mag + 0.983)
+    durata = np.where(mag >= 6.5, 10 ** (0.032 * mag + 2.7389), 10 ** (0.5409 * mag - 0.547))
+    return distanza, durata
+
+
+def _haversine_km(lat0, lon0, lat, lon):
+    p1, p2 = np.radians(lat0), np.radians(lat)
+    dl = np.radians(lon - lon0)
+    a = np.sin((p2 - p1) / 2) ** 2 + np.cos(p1) * np.cos(p2) * np.sin(dl / 2) ** 2
+    return 2 * _R_TERRA_KM * np.arcsin(np.sqrt(a))
+
+
+def decluster(time_ms, mag, lat, lon, frazione_precursori: float = FRAZIONE_PRECURSORI) -> dict:
+    """
+    → {"cluster": int32 (-1 = isolato), "ruolo": int8 (ISOLATO/PRINCIPALE/
+       PRECURSORE/REPLICA)} allineati agli array in ingresso.
+    """
+    t = np.asarray(time_ms, dtype=np.float64) / 86_400_000.0
+    mag = np.asarray(mag, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    n = mag.size
+    cluster = np.full(n, -1, dtype=np.int32)
+    ruolo = np.zeros(n, dtype=np.int8)
+    if n < 2:
+        return {"cluster": cluster, "ruolo": ruolo}
+
+    # Indice a griglia: eventi ordinati per (cella, tempo), intervallo per cella.
+    # Colonne larghe almeno CELLA_KM a ogni latitudine dei dati (cos minimo):
+    # r = ceil(distanza / CELLA_KM) celle coprono il raggio anche a nord
+    coslat = np.cos(np.radians(min(np.nanmax(np.abs(lat)), 89.0)))
+    cx = np.floor(lon * _KM_GRADO * coslat / CELLA_KM).astype(np.int64)
+    cy = np.floor(lat * _KM_GRADO / CELLA_KM).astype(np.int64)
+    ordine = np.lexsort((t, cy, cx))
+    t_ord = t[ordine]
+    chiavi = np.stack([cx[ordine], cy[ordine]], axis=1)
+    _uniche, inizi = np.unique(chiavi, axis=0, return_index=True)   # già in ordine (cx, cy)
+    fini = np.append(inizi[1:], n)
+    celle = {(int(chiavi[a, 0]), int(chiavi[a, 1])): (a, b) for a, b in zip(inizi, fini)}
+
+    distanza, durata = finestre_gk(mag)
+    prossimo = 0
+    for i in np.argsort(-mag, kind="stable"):
+        if cluster[i] != -1:
+            continue
+        r = int(np.ceil(distanza[i] / CELLA_KM))
+        t0, t1 = t[i] - durata[i] * frazione_precursori, t[i] + durata[i]
+        pezzi = []
+        for dx in range(cx[i] - r, cx[i] + r + 1):
+            for dy in range(cy[i] - r, cy[i] + r + 1):
+                intervallo = celle.get((dx, dy))
+                if intervallo is None:
+                    continue
+                a, b = intervallo
+                lo = a + np.searchsorted(t_ord[a:b], t0, side="left")
+                hi = a + np.searchsorted(t_ord[a:b], t1, side="right")
+                if hi > lo:
+                    pezzi.append(ordine[lo:hi])
+        cand = np.concatenate(pezzi)
+        cand = cand[(cluster[cand] == -1) & (cand != i)]
+        if not cand.size:
+            continue
+        cand = cand[_haversine_km(lat[i], lon[i], lat[cand], lon[cand]) <= distanza[i]]
+        if not cand.size:
+            continue
+        cluster[cand] = prossimo
+        cluster[i] = prossimo
+        ruolo[cand] = np.where(t[cand] < t[i], PRECURSORE, REPLICA)
+        ruolo[i] = PRINCIPALE
+        prossimo += 1
+    return {"cluster": cluster, "ruolo": ruolo}
+
+
+def riepilogo(time_ms, mag, lat, lon, cluster, ruolo, place=None) -> pd.DataFrame:
+    """
+    Una riga per sequenza: inizio/fine (epoch ms), durata (ore), Mmax, numero
+    di eventi, precursori, repliche e posizione/luogo dell'evento principale.
+    Ordinata per numero di eventi decrescente.
+    """
+    df = pd.DataFrame({"cluster": cluster, "ruolo": ruolo, "time_ms": time_ms, "mag": mag,
+                       "lat": lat, "lon": lon, "place": place if place is not None else ""})
+    df = df[df["cluster"] >= 0].assign(pre=lambda d: d["ruolo"] == PRECURSORE,
+                                       rep=lambda d: d["ruolo"] == REPLICA)
+    if df.empty:
+        return pd.DataFrame(columns=["cluster", "inizio_ms", "fine_ms", "durata_h", "mag_max",
+                                     "n_eventi", "n_precursori", "n_repliche",
+                                     "lat", "lon", "place"])
+    g = df.groupby("cluster")
+    out = g.agg(inizio_ms=("time_ms", "min"), fine_ms=("time_ms", "max"),
+                mag_max=("mag", "max"), n_eventi=("mag", "size"),
+                n_precursori=("pre", "sum"), n_repliche=("rep", "sum"))
+    out["durata_h"] = (out["fine_ms"] - out["inizio_ms"]) / 3_600_000.0
+    principali = df[df["ruolo"] == PRINCIPALE].set_index("cluster")[["lat", "lon", "place"]]
+    out = out.join(principali)
+    return (out.reset_index().sort_values(["n_eventi", "mag_max"], ascending=False)
+            .reset_index(drop=True))
+
+
+def sequenze(tabella) -> tuple:
+    """TabellaEventi → (etichette di decluster(), riepilogo per sequenza)."""
+    et = decluster(tabella.time_ms, tabella.mag, tabella.lat, tabella.lon)
+    return et, riepilogo(tabella.time_ms, tabella.mag, tabella.lat, tabella.lon,
+                         et["cluster"], et["ruolo"], tabella.place)
+
+
+@cache_swr.swr(ttl=120)
+def sequenze_recenti(regione: str = None, min_mag: float = 0.5, bbox=None):
+    """Sequenze della finestra di 7 giorni del catalogo condiviso (monitoraggio)."""
+    from modules import catalogo_sismico
+    tab = catalogo_sismico.eventi(days=7, min_mag=min_mag, bbox=bbox,
+                                  regione=None if bbox is not None else regione)
+    et, rie = sequenze(tab)
+    return {"id": tab.id, "cluster": et["cluster"], "ruolo": et["ruolo"], "riepilogo": rie}
+
+
+@cache_swr.swr(ttl=600)
+def sequenze_archivio(days: int, min_mag: float):
+    """Sequenze della finestra dell'archivio locale (statistiche)."""
+    from modules import archivio_eventi
+    ev = archivio_eventi.punti(days, min_mag)
+    et = decluster(ev["time_ms"], ev["mag"], ev["lat"], ev["lon"])
+    rie = riepilogo(ev["time_ms"].to_numpy(), ev["mag"].to_numpy(), ev["lat"].to_numpy(),
+                    ev["lon"].to_numpy(), et["cluster"], et["ruolo"], ev["place"].to_numpy())
+    return {"n_eventi": len(ev), "ruolo": et["ruolo"], "riepilogo": rie}
@@ -3,8 +3,7 @@ from modules.dati_regioni_a import dati_regioni_a
 from modules.dati_regioni_b import dati_regioni_b
 from modules.dati_regioni_c import dati_regioni_c
 import folium
-from streamlit_folium import folium_static
-from geopy.geocoders import Nominatim
+from modules import cache_mappe, gazzetteer, punti_raccolta
 import time
 
 # Dizionario di coordinate precaricate per le principali città/regioni italiane
@@ -52,62 +51,6 @@ COORDINATES_CACHE = {
     "Campobasso": [41.56, 14.65]
 }
 
-# Utilizziamo cache_data per ottimizzare la geolocalizzazione
-@st.cache_data(ttl=86400, show_spinner=False)  # Cache valida per 24 ore
-def geocode_location(location_name):
-    """
-    Geocodifica le coordinate di una località con sistema di cache avanzato e fallback.
-    Prima controlla nella cache interna poi usa Nominatim (OpenStreetMap) come geocoder.
-    """
-    # Step 1: Verifica se abbiamo la località nella nostra cache statica precaricata
-    for key in COORDINATES_CACHE:
-        if key.lower() in location_name.lower():
-            # Ritorna le coordinate dalla cache statica
-            return COORDINATES_CACHE[key][0], COORDINATES_CACHE[key][1]
-    
-    # Step 2: Estrai nome regione/città principale dal testo
-    # Ad esempio da "Roma: Piazza del Popolo" estrae "Roma"
-    main_location = location_name.split(':')[0].strip() if ':' in location_name else location_name
-    
-    # Verifica se il nome principale è nella cache
-    if main_location in COORDINATES_CACHE:
-        return COORDINATES_CACHE[main_location][0], COORDINATES_CACHE[main_location][1]
-    
-    # Step 3: Solo se non abbiamo trovato nulla in cache, proviamo con API esterna
-    try:
-        # Verifica connettività prima di procedere
-        import socket
-        try:
-            # Test rapido di connettività a internet
-            socket.create_connection(("www.google.com", 80), timeout=3)
-            online = True
-        except OSError:
-            online = False
-            
-        if not online:
-            # Se non c'è connessione, ritorna coordinate Italia di default
-            return 41.9, 12.5
-            
-        # Aggiungiamo un suffisso ", Italia" per migliorare precisione localizzazione
-        if not location_name.lower().endswith("italia"):
-            search_name = f"{location_name}, Italia"
-        else:
-            search_name = location_name
-            
-        # Utilizzo di Nominatim (OpenStreetMap) con timeout e user-agent personalizzati
-        geolocator = Nominatim(user_agent="sismaVer2-app", timeout=5)
-        location = geolocator.geocode(search_name)
-        
-        if location:
-            return location.latitude, location.longitude
-        else:
-            # Fallback a coordinate di default per l'Italia
-            return 41.9, 12.5
-    except Exception as e:
-        print(f"Errore geocoding per {location_name}: {e}")
-        # Coordinate di default per l'Italia in caso di errore
-        return 41.9, 12.5
-
 def show():
     from modules.banner_utils import banner_emergenza
     banner_emergenza()
@@ -537,34 +480,30 @@ def show():
 
                 # Punti di raccolta con GPS navigazione
                 st.markdown("### 📍 Punti di raccolta")
-                _coords_dict = dati.get("punti_raccolta_coords", {})
-                for punto in dati["punti_raccolta"]:
-                    _pk = punto.strip()
-                    _c  = _coords_dict.get(_pk)
-                    if _c:
-                        _g  = f"https://www.google.com/maps/dir/?api=1&destination={_c[0]},{_c[1]}&travelmode=driving"
-                        _wz = f"https://waze.com/ul?ll={_c[0]},{_c[1]}&navigate=yes"
-                        _am = f"https://maps.apple.com/?daddr={_c[0]},{_c[1]}&dirflg=d"
-                        col_pi, col_pn = st.columns([3, 2])
-                        with col_pi:
-                            st.markdown(
-                                '<div style="border-left:4px solid #DC2626;padding-left:10px;margin-bottom:4px;">'
-                                f'<p style="margin:0;font-size:14px;">📌 <b>{_pk}</b></p>'
-                                f'<p style="margin:0;font-size:11px;color:#888;font-family:monospace;">{_c[0]:.5f}, {_c[1]:.5f}</p>'
-                                '</div>',
-                                unsafe_allow_html=True)
-                        with col_pn:
-                            st.markdown(
-                                '<div style="background:#fff7f7;border:1px solid #fecaca;border-radius:6px;padding:6px 10px;">'
-                                '<div style="display:flex;gap:4px;flex-wrap:wrap;">'
-                                f'<a href="{_g}" target="_blank" style="background:#4285F4;color:white;padding:4px 7px;text-decoration:none;border-radius:4px;font-size:11px;font-weight:600;white-space:nowrap;">🗺️ GMaps</a>'
-                                f'<a href="{_wz}" target="_blank" style="background:#00BCD4;color:#000;padding:4px 7px;text-decoration:none;border-radius:4px;font-size:11px;font-weight:600;white-space:nowrap;">🚗 Waze</a>'
-                                f'<a href="{_am}" target="_blank" style="background:#555;color:white;padding:4px 7px;text-decoration:none;border-radius:4px;font-size:11px;font-weight:600;white-space:nowrap;">🍎 Maps</a>'
-                                '</div></div>',
-                                unsafe_allow_html=True)
-                    else:
-                        st.markdown(f"📌 {_pk}")
-                st.caption(f"Totale punti: {len(dati['punti_raccolta'])} · Fonte: Protezione Civile")
+                punti = punti_raccolta.della_regione(regione_sel)
+                for p in punti:
+                    _g  = f"https://www.google.com/maps/dir/?api=1&destination={p['lat']},{p['lon']}&travelmode=driving"
+                    _wz = f"https://waze.com/ul?ll={p['lat']},{p['lon']}&navigate=yes"
+                    _am = f"https://maps.apple.com/?daddr={p['lat']},{p['lon']}&dirflg=d"
+                    col_pi, col_pn = st.columns([3, 2])
+                    with col_pi:
+                        st.markdown(
+                            '<div style="border-left:4px solid #DC2626;padding-left:10px;margin-bottom:4px;">'
+                            f'<p style="margin:0;font-size:14px;">📌 <b>{p["etichetta"]}</b></p>'
+                            f'<p style="margin:0;font-size:11px;color:#888;font-family:monospace;">{p["lat"]:.5f}, {p["lon"]:.5f}'
+                            f'{" · ⚠️ approssimate" if p["approssimato"] else ""}</p>'
+                            '</div>',
+                            unsafe_allow_html=True)
+                    with col_pn:
+                        st.markdown(
+                            '<div style="background:#fff7f7;border:1px solid #fecaca;border-radius:6px;padding:6px 10px;">'
+                            '<div style="display:flex;gap:4px;flex-wrap:wrap;">'
+                            f'<a href="{_g}" target="_blank" style="background:#4285F4;color:white;padding:4px 7px;text-decoration:none;border-radius:4px;font-size:11px;font-weight:600;white-space:nowrap;">🗺️ GMaps</a>'
+                            f'<a href="{_wz}" target="_blank" style="background:#00BCD4;color:#000;padding:4px 7px;text-decoration:none;border-radius:4px;font-size:11px;font-weight:600;white-space:nowrap;">🚗 Waze</a>'
+                            f'<a href="{_am}" target="_blank" style="background:#555;color:white;padding:4px 7px;text-decoration:none;border-radius:4px;font-size:11px;font-weight:600;white-space:nowrap;">🍎 Maps</a>'
+                            '</div></div>',
+                            unsafe_allow_html=True)
+                st.caption(f"Totale punti: {len(punti)} · Fonte: Protezione Civile")
 
                 # Rischio idrogeologico (se presente)
                 if "rischio_idrogeologico" in dati and dati["rischio_idrogeologico"]:
@@ -602,115 +541,72 @@ def show():
                 # Aggiungiamo una visualizzazione mappa per i punti di raccolta
                 st.markdown("### 🗺️ Mappa punti di raccolta")
                 
-                # Ottimizzazione: verifichiamo se ci sono coordinate precaricate
-                if "coordinates" in dati and dati["coordinates"]:
-                    start_lat, start_lon = dati["coordinates"]
-                else:
-                    # Geocodifichiamo il nome della regione
-                    with st.spinner("Caricamento mappa..."):
-                        start_lat, start_lon = geocode_location(regione_sel)
-                
-                # Creiamo mappa folium centrata sulla regione
-                m = folium.Map(location=[start_lat, start_lon], zoom_start=9)
-                
-                # Aggiungiamo i marker alla mappa usando le coordinate precaricate
-                with st.spinner("Posizionamento punti di raccolta..."):
-                    added_points = 0
-                    
-                    # Utilizziamo prioritariamente le coordinate precaricate
-                    if "punti_raccolta_coords" in dati:
-                        # Mostra tutti i punti disponibili sulla mappa
-                        for i, punto in enumerate(dati["punti_raccolta"]):
-                            punto_key = punto.strip()
-                            if punto_key in dati["punti_raccolta_coords"]:
-                                lat, lon = dati["punti_raccolta_coords"][punto_key]
-                                _pg  = f"https://www.google.com/maps/dir/?api=1&destination={lat},{lon}&travelmode=driving"
-                                _pwz = f"https://waze.com/ul?ll={lat},{lon}&navigate=yes"
-                                _pam = f"https://maps.apple.com/?daddr={lat},{lon}&dirflg=d"
-                                _ph  = (
-                                    '<div style="min-width:220px;font-family:sans-serif;font-size:13px;">'
-                                    f'<h4 style="color:#DC2626;margin:0 0 6px 0;font-size:13px;border-bottom:2px solid #DC2626;padding-bottom:3px;">📌 {punto_key}</h4>'
-                                    f'<p style="margin:0 0 6px 0;font-size:11px;color:#888;font-family:monospace;">{lat:.5f}, {lon:.5f}</p>'
-                                    '<div style="display:flex;gap:4px;">'
-                                    f'<a href="{_pg}" target="_blank" style="background:#4285F4;color:white;padding:4px 7px;text-decoration:none;border-radius:4px;font-size:11px;font-weight:600;">🗺️ GMaps</a>'
-                                    f'<a href="{_pwz}" target="_blank" style="background:#00BCD4;color:#000;padding:4px 7px;text-decoration:none;border-radius:4px;font-size:11px;font-weight:600;">🚗 Waze</a>'
-                                    f'<a href="{_pam}" target="_blank" style="background:#555;color:white;padding:4px 7px;text-decoration:none;border-radius:4px;font-size:11px;font-weight:600;">🍎 Maps</a>'
-                                    '</div></div>'
-                                )
-                                folium.Marker(
-                                    [lat, lon],
-                                    popup=folium.Popup(_ph, max_width=280),
-                                    tooltip=punto_key,
-                                    icon=folium.Icon(color="red", icon="info-sign")
-                                ).add_to(m)
-                                added_points += 1
-                            else:
-                                if "coordinates" in dati:
-                                    base_lat, base_lon = dati["coordinates"]
-                                    offset = 0.02 * (i + 1)
-                                    lat = base_lat + offset
-                                    lon = base_lon + offset
-                                    _pg2  = f"https://www.google.com/maps/dir/?api=1&destination={lat},{lon}&travelmode=driving"
-                                    _pwz2 = f"https://waze.com/ul?ll={lat},{lon}&navigate=yes"
-                                    _pam2 = f"https://maps.apple.com/?daddr={lat},{lon}&dirflg=d"
-                                    _ph2  = (
-                                        '<div style="min-width:200px;font-family:sans-serif;font-size:13px;">'
-                                        f'<h4 style="color:#D97706;margin:0 0 6px 0;font-size:13px;border-bottom:2px solid #D97706;padding-bottom:3px;">📌 {punto_key}</h4>'
-                                        f'<p style="margin:0 0 2px 0;font-size:11px;color:#888;">⚠️ Coordinate approssimative</p>'
-                                        '<div style="display:flex;gap:4px;margin-top:6px;">'
-                                        f'<a href="{_pg2}" target="_blank" style="background:#4285F4;color:white;padding:4px 7px;text-decoration:none;border-radius:4px;font-size:11px;font-weight:600;">🗺️ GMaps</a>'
-                                        f'<a href="{_pwz2}" target="_blank" style="background:#00BCD4;color:#000;padding:4px 7px;text-decoration:none;border-radius:4px;font-size:11px;font-weight:600;">🚗 Waze</a>'
-                                        f'<a href="{_pam2}" target="_blank" style="background:#555;color:white;padding:4px 7px;text-decoration:none;border-radius:4px;font-size:11px;font-weight:600;">🍎 Maps</a>'
-                                        '</div></div>'
-                                    )
-                                    folium.Marker(
-                                        [lat, lon],
-                                        popup=folium.Popup(_ph2, max_width=260),
-                                        tooltip=punto_key,
-                                        icon=folium.Icon(color="orange", icon="info-sign")
-                                    ).add_to(m)
-                                    added_points += 1
-                    else:
-                        # Fallback: se non abbiamo coordinate precaricate, creiamo marker artificiali
-                        # attorno al centro della regione per assicurarci che tutti i punti siano visibili
-                        n_punti = len(dati["punti_raccolta"])
-                        for i, punto in enumerate(dati["punti_raccolta"]):
-                            # Calcoliamo posizioni distribuite attorno al centro regione
-                            # con un pattern circolare per massimizzare la visibilità
-                            import math
-                            angle = (2 * math.pi / max(n_punti, 1)) * i
-                            radius = 0.05  # ~5km di raggio
-                            lat = start_lat + radius * math.sin(angle)
-                            lon = start_lon + radius * math.cos(angle)
-                            
-                            _pf  = punto.strip()
-                            _pfg  = f"https://www.google.com/maps/dir/?api=1&destination={lat},{lon}&travelmode=driving"
-                            _pfwz = f"https://waze.com/ul?ll={lat},{lon}&navigate=yes"
-                            _pfam = f"https://maps.apple.com/?daddr={lat},{lon}&dirflg=d"
-                            _pfh  = (
-                                '<div style="min-width:200px;font-family:sans-serif;font-size:13px;">'
-                                f'<h4 style="color:#16A34A;margin:0 0 6px 0;font-size:13px;border-bottom:2px solid #16A34A;padding-bottom:3px;">📌 {_pf}</h4>'
-                                '<div style="display:flex;gap:4px;margin-top:6px;">'
-                                f'<a href="{_pfg}" target="_blank" style="background:#4285F4;color:white;padding:4px 7px;text-decoration:none;border-radius:4px;font-size:11px;font-weight:600;">🗺️ GMaps</a>'
-                                f'<a href="{_pfwz}" target="_blank" style="background:#00BCD4;color:#000;padding:4px 7px;text-decoration:none;border-radius:4px;font-size:11px;font-weight:600;">🚗 Waze</a>'
-                                f'<a href="{_pfam}" target="_blank" style="background:#555;color:white;padding:4px 7px;text-decoration:none;border-radius:4px;font-size:11px;font-weight:600;">🍎 Maps</a>'
-                                '</div></div>'
-                            )
-                            folium.Marker(
-                                [lat, lon],
-                                popup=folium.Popup(_pfh, max_width=260),
-                                tooltip=_pf,
-                                icon=folium.Icon(color="green", icon="info-sign")
-                            ).add_to(m)
-                            added_points += 1
-                
+                # Centro mappa: coordinate precaricate della regione (nessuna geocodifica)
+                start_lat, start_lon = (dati.get("coordinates")
+                                        or COORDINATES_CACHE.get(regione_sel, [41.9, 12.5]))
+
+                def _mappa_punti_raccolta():
+                    m = folium.Map(location=[start_lat, start_lon], zoom_start=9)
+                    for p in punti:
+                        lat, lon = p["lat"], p["lon"]
+                        colore = "#D97706" if p["approssimato"] else "#DC2626"
+                        _pg  = f"https://www.google.com/maps/dir/?api=1&destination={lat},{lon}&travelmode=driving"
+                        _pwz = f"https://waze.com/ul?ll={lat},{lon}&navigate=yes"
+                        _pam = f"https://maps.apple.com/?daddr={lat},{lon}&dirflg=d"
+                        _ph  = (
+                            '<div style="min-width:220px;font-family:sans-serif;font-size:13px;">'
+                            f'<h4 style="color:{colore};margin:0 0 6px 0;font-size:13px;border-bottom:2px solid {colore};padding-bottom:3px;">📌 {p["etichetta"]}</h4>'
+                            + ('<p style="margin:0 0 2px 0;font-size:11px;color:#888;">⚠️ Coordinate approssimative</p>'
+                               if p["approssimato"] else
+                               f'<p style="margin:0 0 6px 0;font-size:11px;color:#888;font-family:monospace;">{lat:.5f}, {lon:.5f}</p>')
+                            + '<div style="display:flex;gap:4px;">'
+                            f'<a href="{_pg}" target="_blank" style="background:#4285F4;color:white;padding:4px 7px;text-decoration:none;border-radius:4px;font-size:11px;font-weight:600;">🗺️ GMaps</a>'
+                            f'<a href="{_pwz}" target="_blank" style="background:#00BCD4;color:#000;padding:4px 7px;text-decoration:none;border-radius:4px;font-size:11px;font-weight:600;">🚗 Waze</a>'
+                            f'<a href="{_pam}" target="_blank" style="background:#555;color:white;padding:4px 7px;text-decoration:none;border-radius:4px;font-size:11px;font-weight:600;">🍎 Maps</a>'
+                            '</div></div>'
+                        )
+                        folium.Marker(
+                            [lat, lon],
+                            popup=folium.Popup(_ph, max_width=280),
+                            tooltip=p["etichetta"],
+                            icon=folium.Icon(color="orange" if p["approssimato"] else "red", icon="info-sign")
+                        ).add_to(m)
+                    return m
+
                 # Visualizziamo la mappa con indicazione dei punti trovati
-                folium_static(m, width=800, height=420)
-                if added_points > 0:
-                    st.success(f"{added_points} punti di raccolta visualizzati sulla mappa")
+                cache_mappe.mostra(("emergenza_punti", regione_sel, start_lat, start_lon, punti),
+                                   _mappa_punti_raccolta, width=800, height=420)
+                if punti:
+                    st.success(f"{len(punti)} punti di raccolta visualizzati sulla mappa")
                 else:
                     st.warning("Nessun punto di raccolta geolocalizzato. Consulta l'elenco testuale.")
-                    
+
+                # Punti di raccolta più vicini a una posizione (indice locale, nessuna rete)
+                st.markdown("### 🧭 Dove vado?")
+                mio_comune = st.text_input("Il tuo comune (oppure inserisci le coordinate)",
+                                           value="", key="em_mio_comune")
+                trovato = gazzetteer.cerca(mio_comune, n=1) if mio_comune.strip() else []
+                if trovato:
+                    start_lat, start_lon = trovato[0]["lat"], trovato[0]["lon"]
+                    st.caption(f"📍 {gazzetteer.etichetta(trovato[0])}")
+                elif mio_comune.strip():
+                    st.caption("Comune non trovato nel gazzetteer offline: inserisci le coordinate.")
+                col_la, col_lo = st.columns(2)
+                with col_la:
+                    mia_lat = st.number_input("Latitudine", value=float(start_lat), format="%.5f",
+                                              min_value=35.0, max_value=48.0,
+                                              key=f"em_mia_lat_{start_lat:.4f}")
+                with col_lo:
+                    mia_lon = st.number_input("Longitudine", value=float(start_lon), format="%.5f",
+                                              min_value=6.0, max_value=19.0,
+                                              key=f"em_mia_lon_{start_lon:.4f}")
+                for p in punti_raccolta.vicini(mia_lat, mia_lon, n=3):
+                    _g = f"https://www.google.com/maps/dir/?api=1&destination={p['lat']},{p['lon']}&travelmode=walking"
+                    st.markdown(f"📌 **{p['etichetta']}** ({p['regione']}) — "
+                                f"{p['distanza_km']:.1f} km · [🗺️ Indicazioni]({_g})")
+                st.caption("Inserisci la tua posizione (es. dalle coordinate GPS del telefono): "
+                           "i punti più vicini sono calcolati sul dispositivo, senza connessione.")
+
                 # Espander per informazioni extra
                 with st.expander("ℹ️ Come raggiungere i punti di raccolta"):
                     st.markdown("""
@@ -0,0 +1,338 @@
+"""
+fetch_async.py — Motore di fan-out HTTP asincrono per SismaVer2.
+
+Sostituisce i ThreadPoolExecutor creati a ogni render solo per parallelizzare
+una manciata di richieste. Un unico event loop asyncio vive in un thread
+daemon per tutto il processo:
+  - fetch_batch(): un lotto di Richiesta eseguite in parallelo, ciascuna con
+    la propria scadenza; per le richieste con mirror vince la PRIMA risposta
+    valida e le altre vengono cancellate
+  - httpx.AsyncClient (se installato) → decine di richieste con pochi socket
+    riusati; altrimenti ripiego su http_client in un executor condiviso
+  - in_parallelo(): esegue funzioni sincrone (fetch con cache Streamlit) su
+    un pool di lavoro a lunga vita invece di crearne uno per render
+  - hedging: con `hedge=True` i mirror non partono tutti insieme ma uno alla
+    volta, dopo un ritardo pari al p90 della latenza osservata per l'host
+    precedente (o subito, se il precedente fallisce)
+  - circuit breaker per host: i mirror con circuito aperto falliscono subito
+    e la corsa passa al successivo senza attendere
+  - failover: con `sequenziale=True` il mirror successivo parte solo se il
+    precedente fallisce (nessun hedging per lentezza); ordina_per_salute()
+    mette in testa gli host con circuito chiuso e latenza migliore
+
+Le pagine Streamlit usano solo la facciata sincrona.
+"""
+
+import asyncio
+import functools
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from modules import circuit_breaker, http_client
+
+try:
+    import httpx
+    _HTTPX = True
+except ImportError:
+    _HTTPX = False
+
+SCADENZA_DEFAULT = 8.0      # secondi per richiesta (mirror compresi)
+_MAX_CONNESSIONI = 32
+
+# Hedging: ritardo prima di interrogare il mirror successivo
+HEDGE_DEFAULT = 1.5         # secondi, finché non ci sono abbastanza campioni
+HEDGE_MIN = 0.25
+_CAMPIONI_MIN = 5
+_CAMPIONI_MAX = 50
+
+
+# ── Statistiche di latenza per fonte ─────────────────────────────────────────
+
+class _Latenze:
+    """Ultime N latenze (s) delle risposte riuscite, per host."""
+
+    def __init__(self):
+        self._per_host = {}
+        self._lock = threading.Lock()
+
+    def registra(self, host: str, secondi: float):
+        with self._lock:
+            campioni = self._per_host.get(host)
+            if campioni is None:
+                campioni = self._per_host[host] = deque(maxlen=_CAMPIONI_MAX)
+            campioni.append(secondi)
+
+    def percentile(self, host: str, q: float):
+        with self._lock:
+            campioni = sorted(self._per_host.get(host, ()))
+        if len(campioni) < _CAMPIONI_MIN:
+            return None
+        return campioni[min(len(campioni) - 1, int(q * len(campioni)))]
+
+    def ritardo_hedge(self, host: str, scadenza: float) -> float:
+        """p90 della latenza dell'host, limitato a [HEDGE_MIN, metà scadenza]."""
+        p90 = self.percentile(host, 0.9)
+        ritardo = HEDGE_DEFAULT if p90 is None else p90
+        return max(HEDGE_MIN, min(ritardo, scadenza / 2))
+
+    def riepilogo(self) -> dict:
+        with self._lock:
+            host = list(self._per_host)
+        return {h: {"campioni": len(self._per_host[h]),
+                    "p50": self.percentile(h, 0.5),
+                    "p90": self.percentile(h, 0.9)} for h in host}
+
+
+LATENZE = _Latenze()
+
+
+def _host(url: str) -> str:
+    return urlsplit(url).netloc.lower()
+
+
+class Richiesta:
+    """Una richiesta GET del lotto: url principale + eventuali mirror equivalenti."""
+
+    __slots__ = ("url", "mirror", "params", "headers", "timeout", "accetta", "valida",
+                 "hedge", "sequenziale")
+
+    def __init__(self, url: str, mirror=(), params=None, headers=None,
+                 timeout: float = SCADENZA_DEFAULT, accetta=(200,), valida=None,
+                 hedge: bool = False, sequenziale: bool = False):
+        self.url = url
+        self.mirror = tuple(mirror)
+        self.params = params
+        self.headers = headers
+        self.timeout = timeout
+        self.accetta = tuple(accetta)      # status code considerati validi
+        self.valida = valida               # controllo extra opzionale: f(risposta) -> bool
+        self.hedge = hedge                 # mirror scaglionati invece che tutti subito
+        self.sequenziale = sequenziale     # mirror solo dopo un fallimento del precedente
+
+    def ok(self, risposta) -> bool:
+        if risposta.status_code not in self.accetta:
+            return False
+        if self.valida is None:
+            return True
+        try:
+            return bool(self.valida(risposta))
+        except Exception:
+            return False
+
+
+class _Motore:
+    """Event loop dedicato + client HTTP asincrono + pool di lavoro condivisi."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.io = ThreadPoolExecutor(max_workers=16, thread_name_prefix="sismaver-io")
+        self.lavori = ThreadPoolExecutor(max_workers=8, thread_name_prefix="sismaver-lavori")
+        self.loop.set_default_executor(self.io)
+        self._client = None
+        self._semafori = {}
+        self.thread = threading.Thread(target=self._esegui, name="sismaver-fetch-loop",
+                                       daemon=True)
+        self.thread.start()
+
+    def _esegui(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    # ── Trasporto ──────────────────────────────────────────────────────────
+
+    def _client_async(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                headers={"User-Agent": http_client.USER_AGENT,
+                         "Accept-Encoding": "gzip, deflate"},
+                limits=httpx.Limits(max_connections=_MAX_CONNESSIONI,
+                                    max_keepalive_connections=_MAX_CONNESSIONI // 2),
+                follow_redirects=True,
+            )
+        return self._client
+
+    def _semaforo(self, url: str) -> asyncio.Semaphore:
+        """Stesso limite di concorrenza per host del client sincrono."""
+        host = _host(url)
+        sem = self._semafori.get(host)
+        if sem is None:
+            sem = self._semafori[host] = asyncio.Semaphore(http_client.limite_host(host))
+        return sem
+
+    async def _get(self, url: str, r: Richiesta):
+        if not _HTTPX:
+            # http_client applica già circuit breaker e limiti per host
+            return await self.loop.run_in_executor(
+                None, functools.partial(http_client.get, url, params=r.params,
+                                        headers=r.headers, timeout=r.timeout))
+        host = _host(url)
+        circuit_breaker.verifica(host)
+        try:
+            async with self._semaforo(url):
+                risposta = await self._client_async().get(
+                    url, params=r.params, headers=r.headers, timeout=r.timeout)
+        except asyncio.CancelledError:
+            circuit_breaker.annulla(host)
+            raise
+        except httpx.HTTPError as e:
+            circuit_breaker.fallimento(host, str(e) or type(e).__name__)
+            raise
+        except Exception:
+            circuit_breaker.annulla(host)
+            raise
+        circuit_breaker.esito_status(host, risposta.status_code)
+        return risposta
+
+    async def _get_misurato(self, url: str, r: Richiesta):
+        """GET che alimenta le statistiche di latenza dell'host (solo risposte < 500)."""
+        t0 = self.loop.time()
+        risposta = await self._get(url, r)
+        if risposta.status_code < 500:
+            LATENZE.registra(_host(url), self.loop.time() - t0)
+        return risposta
+
+    # ── Semantica ──────────────────────────────────────────────────────────
+
+    async def _una(self, r: Richiesta):
+        """
+        (indice dell'url vincente, risposta) per la prima risposta valida tra url
+        e mirror entro la scadenza, altrimenti (None, None).
+        """
+        urls = (r.url,) + r.mirror
+        fine = self.loop.time() + r.timeout
+        tasks, in_corso = [], set()
+
+        def lancia():
+            url = urls[len(tasks)]
+            t = asyncio.ensure_future(self._get_misurato(url, r))
+            tasks.append(t)
+            in_corso.add(t)
+            if r.sequenziale:
+                return fine                 # il prossimo parte solo su fallimento
+            if not r.hedge:
+                return self.loop.time()
+            return self.loop.time() + LATENZE.ritardo_hedge(_host(url), r.timeout)
+
+        prossimo = lancia()
+        while not (r.hedge or r.sequenziale) and len(tasks) < len(urls):
+            prossimo = lancia()
+        try:
+            while True:
+                ora = self.loop.time()
+                if ora >= fine:
+                    # Scadenza raggiunta: chi non ha risposto conta come timeout
+                    for t in in_corso:
+                        circuit_breaker.fallimento(_host(urls[tasks.index(t)]), "scadenza")
+                    break
+                restano = len(tasks) < len(urls)
+                if restano and (not in_corso or ora >= prossimo):
+                    prossimo = lancia()         # hedge: il precedente è lento o fallito
+                    continue
+                if not in_corso:
+                    break
+                attesa = fine - ora
+                if restano:
+                    attesa = min(attesa, prossimo - ora)
+                fatti, _ = await asyncio.wait(in_corso, timeout=attesa,
+                                              return_when=asyncio.FIRST_COMPLETED)
+                for t in fatti:
+                    in_corso.discard(t)
+                    if t.cancelled() or t.exception() is not None:
+                        continue
+                    risposta = t.result()
+                    if r.ok(risposta):
+                        return tasks.index(t), risposta
+                if fatti:
+                    prossimo = self.loop.time()    # fallimento: non aspettare oltre
+            return None, None
+        finally:
+            for t in tasks:
+                if not t.done():
+                    t.cancel()
+
+    async def _lotto(self, richieste):
+        return await asyncio.gather(*(self._una(r) for r in richieste))
+
+
+_motore = None
+_motore_lock = threading.Lock()
+
+
+def _motore_attivo() -> _Motore:
+    global _motore
+    if _motore is None:
+        with _motore_lock:
+            if _motore is None:
+                _motore = _Motore()
+    return _motore
+
+
+# ── Facciata sincrona ────────────────────────────────────────────────────────
+
+def _attendi(richieste) -> list:
+    """Lotto sul loop condiviso → lista di (indice, risposta) allineata alle richieste."""
+    richieste = list(richieste)
+    if not richieste:
+        return []
+    m = _motore_attivo()
+    fut = asyncio.run_coroutine_threadsafe(m._lotto(richieste), m.loop)
+    try:
+        return fut.result(timeout=max(r.timeout for r in richieste) + 2.0)
+    except Exception as e:
+        print(f"Fetch batch fallito: {e}")
+        fut.cancel()
+        return [(None, None)] * len(richieste)
+
+
+def fetch_batch(richieste) -> list:
+    """
+    Esegue il lotto in parallelo sul loop condiviso e attende i risultati.
+    Ritorna una lista allineata alle richieste: risposta valida oppure None.
+    """
+    return [risposta for _i, risposta in _attendi(richieste)]
+
+
+def ordina_per_salute(urls) -> list:
+    """
+    Url ordinati per salute dell'host: prima i circuiti chiusi, poi per
+    latenza mediana osservata (host senza campioni nell'ordine dato, dopo
+    quelli misurati più veloci del p50 di default HEDGE_DEFAULT).
+    """
+    def chiave(iu):
+        i, url = iu
+        host = _host(url)
+        p50 = LATENZE.percentile(host, 0.5)
+        return (circuit_breaker.aperto(host), HEDGE_DEFAULT if p50 is None else p50, i)
+    return [u for _i, u in sorted(enumerate(urls), key=chiave)]
+
+
+def fetch(url: str, **kwargs):
+    """Singola richiesta (con eventuali mirror) tramite il motore: risposta o None."""
+    return fetch_batch([Richiesta(url, **kwargs)])[0]
+
+
+def fetch_primo(richiesta: Richiesta):
+    """
+    Come fetch(), ma ritorna anche quale url ha vinto la corsa:
+    (indice in [url] + mirror, risposta) oppure (None, None).
+    """
+    return _attendi([richiesta])[0]
+
+
+def in_parallelo(*funzioni) -> list:
+    """
+    Esegue funzioni sincrone senza argomenti sul pool di lavoro condiviso e
+    ritorna i risultati nello stesso ordine (None se la funzione solleva).
+    """
+    m = _motore_attivo()
+    futures = [m.lavori.submit(f) for f in funzioni]
+    risultati = []
+    for f in futures:
+        try:
+            risultati.append(f.result())
+        except Exception as e:
+            print(f"Lavoro parallelo fallito: {e}")
+            risultati.append(None)
+    return risultati
@@ -0,0 +1,252 @@
+"""
+gazzetteer.py — Gazzetteer offline dei comuni italiani per SismaVer2.
+
+Geocodifica diretta (nome → coordinate) e inversa (coordinate → comune)
+senza rete, usata PRIMA dei geocoder online (Open-Meteo, Nominatim) da meteo,
+qualita_aria, segnala_evento_enhanced ed emergenza: i servizi online restano
+solo come ultima risorsa. Il set installato copre tutti i comuni ISTAT 2023
+(© Openpolis, CC BY 4.0; build_gazzetteer.py --istat).
+
+File in data/gazzetteer/ (generati da build_gazzetteer.py), tutti .npy
+semplici aperti con np.load(mmap_mode="r"):
+    nome, provincia, regione_code, lat, lon, popolazione   una riga per comune
+    chiave, chiave_id, chiave_ntri     nomi normalizzati ordinati (anche i nomi
+                                       alternativi) → ricerca per prefisso
+    tri_codice, tri_inizio, tri_chiave indice trigrammi (CSR) → ricerca tollerante
+                                       agli errori di battitura
+    cella_codice, cella_inizio, cella_id  griglia di CELLA_GRADI → ricerca inversa
+"""
+
+import os
+import threading
+import unicodedata
+
+import numpy as np
+
+from modules import regioni_geo
+
+DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                   "data", "gazzetteer")
+CELLA_GRADI = 0.1
+DISTANZA_MAX_KM = 10.0      # ricerca inversa: oltre, il baricentro più vicino non identifica il comune
+_ALFABETO = " abcdefghijklmnopqrstuvwxyz0123456789"
+_CODICE_CAR = {c: i for i, c in enumerate(_ALFABETO)}
+_B = len(_ALFABETO)
+_R_TERRA_KM = 6371.0
+_KM_GRADO = 111.2
+_COS_LAT_MIN = np.cos(np.radians(48.0))
+
+_COLONNE = ("nome", "provincia", "regione_code", "lat", "lon", "popolazione",
+            "chiave", "chiave_id", "chiave_ntri", "tri_codice", "tri_inizio", "tri_chiave",
+            "cella_codice", "cella_inizio", "cella_id")
+_DATI = None
+_LOCK = threading.Lock()
+
+
+# ── Normalizzazione e trigrammi ──────────────────────────────────────────────
+
+def normalizza(testo: str) -> str:
+    """Minuscolo, senza accenti né apostrofi, separatori → spazio singolo."""
+    s = unicodedata.normalize("NFKD", str(testo)).encode("ascii", "ignore").decode().lower()
+    s = s.replace("'", "").replace("`", "")
+    s = "".join(c if c in _CODICE_CAR else " " for c in s)
+    return " ".join(s.split())
+
+
+def trigrammi(chiave: str) -> np.ndarray:
+    """Codici (int32) distinti dei trigrammi di "  chiave " nell'alfabeto ridotto."""
+    s = "  " + chiave + " "
+    c = np.array([_CODICE_CAR.get(ch, 0) for ch in s], dtype=np.int32)
+    if c.size < 3:
+        return np.zeros(0, dtype=np.int32)
+    return np.unique(c[:-2] * _B * _B + c[1:-1] * _B + c[2:])
+
+
+def _cella(lat, lon):
+    cy = np.floor(np.asarray(lat, dtype=np.float64) / CELLA_GRADI).astype(np.int64)
+    cx = np.floor(np.asarray(lon, dtype=np.float64) / CELLA_GRADI).astype(np.int64)
+    return cy, cx
+
+
+def _codice_cella(cy, cx):
+    return cy * 10_000 + cx
+
+
+# ── Scrittura (build) ────────────────────────────────────────────────────────
+
+def scrivi(comuni: list, cartella: str = None):
+    """
+    comuni: dict con nome, provincia (sigla), regione, lat, lon, popolazione
+    e, facoltativi, "alternativi" (altri nomi cercabili). Scrive tutti gli
+    array e gli indici in `cartella` (default DIR).
+    """
+    from modules import snapshot
+    cartella = cartella or DIR
+    comuni = sorted(comuni, key=lambda c: (-int(c.get("popolazione") or 0), c["nome"]))
+    col = {
+        "nome":         np.array([c["nome"] for c in comuni], dtype=str),
+        "provincia":    np.array([c.get("provincia") or "" for c in comuni], dtype="<U2"),
+        "regione_code": np.array([regioni_geo.codice_regione(c.get("regione"))
+                                  if regioni_geo.codice_regione(c.get("regione")) is not None
+                                  else regioni_geo.NESSUNA for c in comuni], dtype=np.int8),
+        "lat":          np.array([c["lat"] for c in comuni], dtype=np.float64),
+        "lon":          np.array([c["lon"] for c in comuni], dtype=np.float64),
+        "popolazione":  np.array([int(c.get("popolazione") or 0) for c in comuni], dtype=np.int32),
+    }
+
+    # Chiavi di ricerca: nome e alternativi normalizzati, ordinati
+    coppie = set()
+    for i, c in enumerate(comuni):
+        for nome in [c["nome"], *c.get("alternativi", [])]:
+            k = normalizza(nome)
+            if k:
+                coppie.add((k, i))
+    coppie = sorted(coppie)
+    col["chiave"] = np.array([k for k, _i in coppie], dtype=str)
+    col["chiave_id"] = np.array([i for _k, i in coppie], dtype=np.int32)
+    tri = [trigrammi(k) for k, _i in coppie]
+    col["chiave_ntri"] = np.array([t.size for t in tri], dtype=np.int16)
+
+    # Indice trigrammi in formato CSR: codice → chiavi che lo contengono
+    codici = np.concatenate(tri) if tri else np.zeros(0, dtype=np.int32)
+    chiavi = np.repeat(np.arange(len(tri), dtype=np.int32), [t.size for t in tri])
+    ordine = np.argsort(codici, kind="stable")
+    col["tri_codice"], inizi = np.unique(codici[ordine], return_index=True)
+    col["tri_inizio"] = np.append(inizi, codici.size).astype(np.int32)
+    col["tri_chiave"] = chiavi[ordine]
+
+    # Griglia per la ricerca inversa
+    cy, cx = _cella(col["lat"], col["lon"])
+    codice = _codice_cella(cy, cx)
+    ordine = np.argsort(codice, kind="stable")
+    col["cella_codice"], inizi = np.unique(codice[ordine], return_index=True)
+    col["cella_inizio"] = np.append(inizi, codice.size).astype(np.int32)
+    col["cella_id"] = ordine.astype(np.int32)
+
+    for nome in _COLONNE:
+        snapshot.scrivi_atomico(os.path.join(cartella, f"{nome}.npy"),
+                                lambda f, a=col[nome]: np.save(f, a, allow_pickle=False))
+
+
+# ── Lettura (mmap, lazy) ─────────────────────────────────────────────────────
+
+def _carica():
+    global _DATI
+    if _DATI is not None:
+        return _DATI
+    with _LOCK:
+        if _DATI is None:
+            try:
+                _DATI = {nome: np.load(os.path.join(DIR, f"{nome}.npy"), mmap_mode="r",
+                                       allow_pickle=False)
+                         for nome in _COLONNE}
+            except Exception as e:
+                print(f"[gazzetteer] non disponibile: {e}")
+                _DATI = {}
+    return _DATI
+
+
+def disponibile() -> bool:
+    return bool(_carica())
+
+
+def _posizioni(ordinati, valori) -> np.ndarray:
+    """Posizioni in `ordinati` dei `valori` presenti (ricerca binaria)."""
+    ordinati = np.asarray(ordinati)
+    pos = np.searchsorted(ordinati, valori)
+    presenti = pos < ordinati.size
+    presenti[presenti] = ordinati[pos[presenti]] == np.asarray(valori)[presenti]
+    return pos[presenti]
+
+
+def _comune(d, i: int, **extra) -> dict:
+    prov = str(d["provincia"][i])
+    regione = regioni_geo.nome_regione(int(d["regione_code"][i]))
+    return {"nome": str(d["nome"][i]), "provincia": prov, "regione": regione,
+            "lat": float(d["lat"][i]), "lon": float(d["lon"][i]),
+            "popolazione": int(d["popolazione"][i]), **extra}
+
+
+def etichetta(comune: dict) -> str:
+    """'Comune (PR, Regione)' — solo le parti note."""
+    parti = [p for p in (comune.get("provincia"), comune.get("regione")) if p]
+    return f"{comune['nome']} ({', '.join(parti)})" if parti else comune["nome"]
+
+
+def cerca(testo: str, n: int = 5, tollerante: bool = True) -> list:
+    """
+    Comuni che corrispondono a `testo`: prima i nomi che iniziano con il testo
+    normalizzato (esatti in testa, poi per popolazione), poi — se non bastano
+    e `tollerante` — i più simili per trigrammi condivisi (Jaccard ≥ 0.3).
+    """
+    d = _carica()
+    q = normalizza(testo)
+    if not d or not q:
+        return []
+    chiavi = d["chiave"]
+    lo = int(np.searchsorted(chiavi, q, side="left"))
+    hi = int(np.searchsorted(chiavi, q + "\x7f", side="left"))
+    trovati = []
+    if hi > lo:
+        ids = np.asarray(d["chiave_id"][lo:hi])
+        esatti = np.asarray(chiavi[lo:hi]) == q
+        pop = np.asarray(d["popolazione"])[ids]
+        ordine = np.lexsort((-pop, ~esatti))
+        trovati = list(dict.fromkeys(ids[ordine].tolist()))
+
+    if tollerante and len(trovati) < n:
+        tq = trigrammi(q)
+        pos = _posizioni(d["tri_codice"], tq)
+        if pos.size:
+            inizi, fini = np.asarray(d["tri_inizio"])[pos], np.asarray(d["tri_inizio"])[pos + 1]
+            postings = np.concatenate([np.asarray(d["tri_chiave"][a:b])
+                                       for a, b in zip(inizi.tolist(), fini.tolist())])
+            comuni_k, condivisi = np.unique(postings, return_counts=True)
+            jaccard = condivisi / (tq.size + np.asarray(d["chiave_ntri"])[comuni_k] - condivisi)
+            buoni = jaccard >= 0.3
+            comuni_k, jaccard = comuni_k[buoni], jaccard[buoni]
+            ids = np.asarray(d["chiave_id"])[comuni_k]
+            ordine = np.lexsort((-np.asarray(d["popolazione"])[ids], -jaccard))
+            for i in ids[ordine].tolist():
+                if i not in trovati:
+                    trovati.append(i)
+                if len(trovati) >= n:
+                    break
+    return [_comune(d, i) for i in trovati[:n]]
+
+
+def inversa(lat: float, lon: float, distanza_max_km: float = DISTANZA_MAX_KM):
+    """
+    Comune più vicino (baricentro/capoluogo) a (lat, lon) con distanza_km,
+    oppure None se nessun comune entro distanza_max_km (in mare aperto, o
+    comune assente dal gazzetteer: il centroide è lontano).
+    Ricerca ad anelli di celle sulla griglia.
+    """
+    d = _carica()
+    if not d:
+        return None
+    cy0, cx0 = (int(v) for v in _cella(lat, lon))
+    r_max = int(np.ceil(distanza_max_km / (CELLA_GRADI * _KM_GRADO * _COS_LAT_MIN))) + 1
+    candidati = []
+    migliore = None
+    for r in range(r_max + 1):
+        cy = np.arange(cy0 - r, cy0 + r + 1)
+        bordo = [(y, x) for y in cy.tolist() for x in range(cx0 - r, cx0 + r + 1)
+                 if abs(y - cy0) == r or abs(x - cx0) == r]
+        codici = _codice_cella(np.array([b[0] for b in bordo]), np.array([b[1] for b in bordo]))
+        for p in _posizioni(d["cella_codice"], codici).tolist():
+            candidati.append(np.asarray(d["cella_id"][d["cella_inizio"][p]:d["cella_inizio"][p + 1]]))
+        if candidati:
+            ids = np.concatenate(candidati)
+            la, lo = np.radians(np.asarray(d["lat"])[ids]), np.radians(np.asarray(d["lon"])[ids])
+            p1, l1 = np.radians(lat), np.radians(lon)
+            a = np.sin((la - p1) / 2) ** 2 + np.cos(p1) * np.cos(la) * np.sin((lo - l1) / 2) ** 2
+            dist = 2 * _R_TERRA_KM * np.arcsin(np.sqrt(a))
+            k = int(np.argmin(dist))
+            migliore = (int(ids[k]), float(dist[k]))
+            # celle oltre l'anello r distano almeno r celle
+            if migliore[1] <= r * CELLA_GRADI * _KM_GRADO * _COS_LAT_MIN:
+                break
+    if migliore is None or migliore[1] > distanza_max_km:
+        return None
+    return _comune(d, migliore[0], distanza_km=round(migliore[1], 2))
@@ -0,0 +1,310 @@
+"""
+griglia_meteo.py — Campo meteo e qualità dell'aria su griglia regolare sull'Italia.
+
+Invece di campionare poche città fisse, lo scheduler scarica ogni CADENZA_S
+una griglia di PASSO gradi (solo i nodi che servono a interpolare sulla
+terraferma e sulla fascia costiera, ~280 punti) con due richieste
+multi-località di open_meteo, una per prodotto:
+  - "meteo"  previsioni orarie (oggi e domani) di temperatura, umidità,
+             vento e precipitazioni → array (righe, colonne, ore)
+  - "aria"   valori correnti qualità dell'aria → array (righe, colonne)
+Gli array restano in memoria (NaN = nodo non scaricato) e sono persistiti
+in data/griglia_meteo.npz: dopo un riavvio la griglia è subito disponibile
+e non si riscarica prima della cadenza.
+
+Letture senza rete:
+  - interpola()        bilineare su coordinate arbitrarie (vettoriale; i
+                       vertici mancanti vengono esclusi e i pesi rinormalizzati)
+  - punto()            valori correnti in una località (comune, posizione utente)
+  - rischio_incendi()  indice incendi per nodo (stessa formula di mappa_rischi)
+  - aggregati_regioni() media / min / max per regione su campioni a CAMPIONE_GRADI
+
+Passo 0.5° e cadenza 3h: ogni località conta come una chiamata nella quota
+gratuita di Open-Meteo (10.000/giorno); a 0.25° servirebbero ~1.000 punti
+per prodotto, oltre la quota già con un aggiornamento ogni 3h.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from modules import open_meteo, regioni_geo, snapshot
+
+PASSO = 0.5
+LAT0, LAT1 = 36.5, 47.5
+LON0, LON1 = 6.5, 18.5
+CADENZA_S = 3 * 3600
+ETA_MAX_ARIA_S = CADENZA_S + 1800   # oltre, la qualità dell'aria "corrente" è troppo vecchia
+CAMPIONE_GRADI = 0.1        # campioni per gli aggregati regionali
+GIORNI = 2                  # previsioni orarie oggi + domani (copre il cambio di data)
+VARIABILI_METEO = ("temperature_2m", "relative_humidity_2m", "windspeed_10m", "precipitation")
+PRODOTTI = ("meteo", "aria")
+PERCORSO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        "data", "griglia_meteo.npz")
+
+LAT = np.round(np.arange(LAT0, LAT1 + PASSO / 2, PASSO), 4)
+LON = np.round(np.arange(LON0, LON1 + PASSO / 2, PASSO), 4)
+FORMA = (LAT.size, LON.size)
+
+_CAMPI = None               # prodotto → {"aggiornato": epoch, "tempi": array, variabile: array}
+_NODI = None                # (righe, colonne) dei nodi scaricati
+_CAMPIONI = None            # (lat, lon, codice regione) dei campioni per gli aggregati
+_LOCK = threading.RLock()
+
+
+# ── Nodi e campioni ──────────────────────────────────────────────────────────
+
+def _nodi():
+    """Nodi da scaricare: i 4 vertici di ogni cella il cui centro cade in una regione."""
+    global _NODI
+    if _NODI is None:
+        centri_lat, centri_lon = np.meshgrid(LAT[:-1] + PASSO / 2, LON[:-1] + PASSO / 2,
+                                             indexing="ij")
+        celle = (regioni_geo.regioni_da_coordinate(centri_lat.ravel(), centri_lon.ravel())
+                 .reshape(centri_lat.shape) != regioni_geo.NESSUNA)
+        maschera = np.zeros(FORMA, bool)
+        for dr in (0, 1):
+            for dc in (0, 1):
+                maschera[dr:dr + celle.shape[0], dc:dc + celle.shape[1]] |= celle
+        _NODI = np.nonzero(maschera)
+    return _NODI
+
+
+def _campioni():
+    global _CAMPIONI
+    if _CAMPIONI is None:
+        lat, lon = np.meshgrid(np.arange(LAT0, LAT1, CAMPIONE_GRADI) + CAMPIONE_GRADI / 2,
+                               np.arange(LON0, LON1, CAMPIONE_GRADI) + CAMPIONE_GRADI / 2,
+                               indexing="ij")
+        lat, lon = lat.ravel(), lon.ravel()
+        codici = regioni_geo.regioni_da_coordinate(lat, lon)
+        dentro = codici != regioni_geo.NESSUNA
+        _CAMPIONI = (lat[dentro], lon[dentro], codici[dentro])
+    return _CAMPIONI
+
+
+# ── Disco ────────────────────────────────────────────────────────────────────
+
+def _carica() -> dict:
+    global _CAMPI
+    if _CAMPI is not None:
+        return _CAMPI
+    with _LOCK:
+        if _CAMPI is None:
+            campi = {}
+            try:
+                with np.load(PERCORSO, allow_pickle=False) as f:
+                    for chiave in f.files:
+                        prodotto, nome = chiave.split("__", 1)
+                        campi.setdefault(prodotto, {})[nome] = f[chiave]
+                for prodotto, c in list(campi.items()):
+                    griglie = [v for k, v in c.items() if k not in ("passo", "aggiornato", "tempi")]
+                    if c.pop("passo", None) != PASSO or any(g.shape[:2] != FORMA for g in griglie):
+                        del campi[prodotto]          # griglia di un'altra versione
+                    else:
+                        c["aggiornato"] = float(c["aggiornato"])
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"[griglia_meteo] {PERCORSO} non leggibile ({e})")
+                campi = {}
+            _CAMPI = campi
+    return _CAMPI
+
+
+def _salva(campi: dict):
+    dati = {f"{prodotto}__{nome}": np.asarray(v)
+            for prodotto, c in campi.items() for nome, v in c.items()}
+    dati.update({f"{prodotto}__passo": np.float64(PASSO) for prodotto in campi})
+    snapshot.scrivi_atomico(PERCORSO, lambda f: np.savez_compressed(f, **dati))
+
+
+# ── Aggiornamento (scheduler) ────────────────────────────────────────────────
+
+def aggiorna(prodotto: str, forza: bool = False) -> bool:
+    """
+    Scarica la griglia del prodotto ("meteo" | "aria") con una richiesta
+    multi-località. Se i dati in memoria (anche ricaricati dal disco) sono
+    più recenti della cadenza non chiama la rete. False se Open-Meteo non
+    risponde: resta la griglia precedente.
+    """
+    global _CAMPI
+    eta_dati = eta(prodotto)
+    if not forza and eta_dati is not None and eta_dati < CADENZA_S - 60:
+        return True
+    righe, colonne = _nodi()
+    punti = tuple(zip(LAT[righe].tolist(), LON[colonne].tolist()))
+    if prodotto == "meteo":
+        valori = open_meteo.meteo_orario.__wrapped__(punti, VARIABILI_METEO, GIORNI)
+    else:
+        valori = open_meteo.aria_corrente.__wrapped__(punti)
+    if valori is None:
+        return False
+
+    campo = {"aggiornato": time.time()}
+    for nome, v in valori.items():
+        if nome == "tempi":
+            campo["tempi"] = v
+            continue
+        griglia = np.full(FORMA + v.shape[1:], np.nan)
+        griglia[righe, colonne] = v
+        campo[nome] = griglia
+    if all(np.isnan(v).all() for k, v in campo.items() if k not in ("aggiornato", "tempi")):
+        return False
+    with _LOCK:
+        campi = dict(_carica())
+        campi[prodotto] = campo
+        _salva(campi)
+        _CAMPI = campi
+    print(f"[griglia_meteo] {prodotto}: {len(punti)} nodi aggiornati")
+    return True
+
+
+def disponibile(prodotto: str) -> bool:
+    return prodotto in _carica()
+
+
+def eta(prodotto: str):
+    """Secondi dall'ultimo aggiornamento della griglia (None se mai scaricata)."""
+    c = _carica().get(prodotto)
+    return time.time() - c["aggiornato"] if c else None
+
+
+# ── Interpolazione ───────────────────────────────────────────────────────────
+
+def interpola(campo: np.ndarray, lat, lon) -> np.ndarray:
+    """
+    Bilineare di `campo` (righe, colonne[, ...]) nei punti (lat, lon):
+    array (N[, ...]). I vertici NaN sono esclusi e i pesi rinormalizzati;
+    fuori griglia o senza vertici validi → NaN.
+    """
+    lat = np.atleast_1d(np.asarray(lat, dtype=np.float64))
+    lon = np.atleast_1d(np.asarray(lon, dtype=np.float64))
+    y = (lat - LAT0) / PASSO
+    x = (lon - LON0) / PASSO
+    fuori = (y < 0) | (y > FORMA[0] - 1) | (x < 0) | (x > FORMA[1] - 1)
+    i = np.clip(np.floor(y).astype(np.int64), 0, FORMA[0] - 2)
+    j = np.clip(np.floor(x).astype(np.int64), 0, FORMA[1] - 2)
+    fy, fx = np.clip(y - i, 0, 1), np.clip(x - j, 0, 1)
+
+    extra = (slice(None),) + (None,) * (campo.ndim - 2)
+    somma = 0.0
+    pesi = 0.0
+    for di, dj, w in ((0, 0, (1 - fy) * (1 - fx)), (1, 0, fy * (1 - fx)),
+                      (0, 1, (1 - fy) * fx), (1, 1, fy * fx)):
+        v = campo[i + di, j + dj]
+        w = np.where(np.isnan(v), 0.0, w[extra])
+        somma = somma + w * np.nan_to_num(v)
+        pesi = pesi + w
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out = np.where(pesi > 0, somma / pesi, np.nan)
+    out[fuori] = np.nan
+    return out
+
+
+def _ora_corrente(tempi: np.ndarray):
+    ora = datetime.now(snapshot.fuso_italia()).strftime("%Y-%m-%dT%H:00")
+    idx = np.flatnonzero(tempi == ora)
+    return int(idx[0]) if idx.size else None
+
+
+def valori(lat, lon) -> dict:
+    """
+    Valori correnti interpolati nei punti: variabili meteo dell'ora in corso
+    e chiavi di open_meteo.CAMPI_ARIA → array (N,), NaN se non disponibili.
+    La qualità dell'aria è un valore istantaneo: assente se la griglia è più
+    vecchia di ETA_MAX_ARIA_S (scheduler fermo, npz di un avvio precedente).
+    """
+    campi = _carica()
+    risultati = {}
+    meteo = campi.get("meteo")
+    if meteo is not None:
+        h = _ora_corrente(meteo["tempi"])
+        if h is not None:
+            for v in VARIABILI_METEO:
+                risultati[v] = interpola(meteo[v][:, :, h], lat, lon)
+    aria = campi.get("aria")
+    if aria is not None and time.time() - aria["aggiornato"] <= ETA_MAX_ARIA_S:
+        for k in open_meteo.CAMPI_ARIA:
+            risultati[k] = interpola(aria[k], lat, lon)
+    return risultati
+
+
+def punto(lat: float, lon: float) -> dict:
+    """Valori correnti in una località come dict (None dove mancano); {} senza griglia."""
+    riga = {k: (None if np.isnan(v[0]) else float(v[0])) for k, v in valori(lat, lon).items()}
+    if all(x is None for x in riga.values()):
+        return {}
+    if riga.get("aqi") is not None:
+        riga["aqi"] = int(round(riga["aqi"]))
+    return riga
+
+
+# ── Prodotti derivati ────────────────────────────────────────────────────────
+
+def rischio_incendi():
+    """
+    Indice incendi per nodo (righe, colonne), NaN fuori dai nodi scaricati:
+    temperatura e vento massimi, umidità minima tra le 11 e le 16 di oggi,
+    pioggia cumulata della giornata. None se la griglia non copre oggi.
+    """
+    meteo = _carica().get("meteo")
+    if meteo is None:
+        return None
+    oggi = datetime.now(snapshot.fuso_italia()).strftime("%Y-%m-%d")
+    giorno = np.char.startswith(meteo["tempi"].astype(str), oggi)
+    if not giorno.any():
+        return None
+    ore = np.flatnonzero(giorno)
+    finestra = ore[11:17]
+
+    def _riduci(var, riduzione, predefinito):
+        v = riduzione.reduce(meteo[var][:, :, finestra], axis=2)
+        return np.where(np.isnan(v), predefinito, v)
+
+    t_max = _riduci("temperature_2m", np.fmax, 20)
+    rh_min = _riduci("relative_humidity_2m", np.fmin, 60)
+    w_max = _riduci("windspeed_10m", np.fmax, 10)
+    p_sum = np.nansum(meteo["precipitation"][:, :, ore], axis=2)
+    score = np.maximum(np.maximum(t_max - 15, 0) * 0.5 +
+                       np.maximum(60 - rh_min, 0) * 0.35 +
+                       w_max * 0.15 -
+                       np.minimum(p_sum * 3, 20), 0)
+    score[np.isnan(meteo["temperature_2m"][:, :, finestra]).all(axis=2)] = np.nan
+    return score
+
+
+def aggregati_regioni(campo: np.ndarray) -> dict:
+    """
+    Regione → {"media", "min", "max", "campioni"} del campo (righe, colonne)
+    interpolato sui campioni regolari della regione; media pesata per l'area
+    dei campioni (cos lat); solo regioni con dati.
+    """
+    lat, lon, codici = _campioni()
+    v = interpola(campo, lat, lon)
+    ok = ~np.isnan(v)
+    v, codici, pesi = v[ok], codici[ok], np.cos(np.radians(lat[ok]))
+    risultati = {}
+    for codice in np.unique(codici):
+        sel = codici == codice
+        risultati[regioni_geo.nome_regione(int(codice))] = {
+            "media": round(float(np.average(v[sel], weights=pesi[sel])), 1),
+            "min": round(float(v[sel].min()), 1), "max": round(float(v[sel].max()), 1),
+            "campioni": int(sel.sum())}
+    return risultati
+
+
+def media_nazionale(campo: np.ndarray):
+    """
+    Media del campo sui campioni di tutte le regioni, pesata per l'area dei
+    campioni: una cella di CAMPIONE_GRADI misura ∝ cos(lat). None senza dati.
+    """
+    lat, lon, _codici = _campioni()
+    v = interpola(campo, lat, lon)
+    ok = ~np.isnan(v)
+    if not ok.any():
+        return None
+    return float(np.average(v[ok], weights=np.cos(np.radians(lat[ok]))))
@@ -1,11 +1,11 @@
 """
 home.py — Home page SismaVer2 v3.1
-Dashboard live: KPI reali (1 sola chiamata INGV), vulcani, EMSC, MeteoAlarm, notizie DPC
+Dashboard live: KPI reali (catalogo sismico condiviso), vulcani, EMSC, MeteoAlarm, notizie DPC
 """
 import streamlit as st
-import requests
+from modules import fetch_async, http_client, ingestione, snapshot
+from modules.tabella_eventi import TabellaEventi
 from datetime import datetime, timezone, timedelta
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
 try:
     from streamlit_autorefresh import st_autorefresh
@@ -23,87 +23,46 @@ def _get_tz():
 FUSO_ORARIO_ITALIA = _get_tz()
 
 
-# ── Unica chiamata INGV per tutti i KPI + lista terremoti ────────────────────
+# ── Catalogo sismico condiviso per tutti i KPI + lista terremoti ────────────
 
-@st.cache_data(ttl=300, show_spinner=False)
 def _fetch_ingv_7days():
-    """Una sola chiamata INGV (7 giorni, M≥1.0). Usata da KPI e lista recenti."""
+    """Eventi 7 giorni M≥1.0 dal catalogo condiviso. Usati da KPI e lista recenti."""
+    from modules import catalogo_sismico
+    from modules.tabella_eventi import TabellaEventi
     try:
-        start = (datetime.utcnow() - timedelta(days=7)).strftime("%Y-%m-%dT%H:%M:%S")
-        r = requests.get(
-            f"https://webservices.ingv.it/fdsnws/event/1/query?format=geojson"
-            f"&starttime={start}&minmag=1.0"
-            f"&minlat=35.0&maxlat=48.0&minlon=5.0&maxlon=20.0"
-            f"&limit=500&orderby=time",
-            timeout=10)
-        if r.status_code == 200:
-            return r.json().get("features", [])
+        return catalogo_sismico.eventi(days=7, min_mag=1.0)
     except Exception:
-        pass
-    return []
+        return TabellaEventi.vuota()
 
 
-def _parse_ingv_kpi(features):
-    """Calcola KPI dalla lista features INGV già scaricata."""
-    oggi_str = datetime.utcnow().strftime("%Y-%m-%dT00:00:00")
-    oggi_dt  = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+def _parse_ingv_kpi(eventi):
+    """Calcola KPI dalla tabella eventi del catalogo (ordinata dal più recente)."""
+    oggi_ms = datetime.utcnow().replace(
+        hour=0, minute=0, second=0, microsecond=0, tzinfo=timezone.utc
+    ).timestamp() * 1000
 
-    quakes_today = 0
-    quakes_week  = len(features)
-    max_mag_val  = None
-    max_mag_feat = None
-    recenti = []  # ultimi 7 M≥1.5
+    quakes_today = int((eventi.time_ms >= oggi_ms).sum())
+    quakes_week  = len(eventi)
 
-    for f in features:
-        p = f.get("properties", {})
-        g = f.get("geometry", {}).get("coordinates", [])
-        mag  = float(p.get("mag") or 0)
-        t    = p.get("time")
-
-        # Data/ora
-        try:
-            if isinstance(t, (int, float)):
-                dt = datetime.utcfromtimestamp(t / 1000.0)
-            else:
-                raw = str(t).replace("Z", "").replace("+00:00", "")
-                dt  = datetime.fromisoformat(raw)
-        except Exception:
-            dt = None
-
-        # Conta oggi
-        if dt and dt >= oggi_dt:
-            quakes_today += 1
-
-        # Max magnitude
-        if max_mag_val is None or mag > max_mag_val:
-            max_mag_val  = mag
-            max_mag_feat = f
-
-        # Lista recenti M≥1.5
-        if mag >= 1.5 and len(recenti) < 7:
-            if dt:
-                dt_it = datetime.fromtimestamp(
-                    t / 1000.0 if isinstance(t, (int, float)) else dt.timestamp(),
-                    FUSO_ORARIO_ITALIA)
-                ora_str = dt_it.strftime("%d/%m %H:%M")
-            else:
-                ora_str = "—"
-            recenti.append({
-                "mag":   mag,
-                "luogo": p.get("place", "N/D"),
-                "ora":   ora_str,
-                "prof":  round(float(g[2]), 1) if len(g) > 2 else None,
-            })
+    # Lista recenti: ultimi 7 M≥1.5
+    recenti = []
+    for ev in eventi.filtra(limit=7, min_mag=1.5).righe():
+        dt_it = datetime.fromtimestamp(ev["time_ms"] / 1000.0, FUSO_ORARIO_ITALIA)
+        recenti.append({
+            "mag":   ev["mag"],
+            "luogo": ev["place"] or "N/D",
+            "ora":   dt_it.strftime("%d/%m %H:%M"),
+            "prof":  round(ev["depth"], 1) if ev["depth"] is not None else None,
+        })
 
     # Max mag info
     max_mag_str = "—"
     max_mag_ora = "—"
-    if max_mag_feat and max_mag_val:
-        p = max_mag_feat.get("properties", {})
-        max_mag_str = f"M {max_mag_val:.1f}"
-        t = p.get("time")
-        if isinstance(t, (int, float)):
-            dt_it = datetime.fromtimestamp(t / 1000.0, FUSO_ORARIO_ITALIA)
+    if len(eventi):
+        max_ev = eventi.riga(int(eventi.mag.argmax()))
+        if max_ev["mag"]:
+            max_mag_str = f"M {max_ev['mag']:.1f}"
+            dt_it = datetime.fromtimestamp(max_ev["time_ms"] / 1000.0, FUSO_ORARIO_ITALIA)
             max_mag_ora = dt_it.strftime("%H:%M")
 
     return {
@@ -172,20 +131,13 @@ def _fetch_meteoalarm():
     return None, []
 
 
-@st.cache_data(ttl=120, show_spinner=False)
 def _fetch_emsc_quick():
-    """EMSC: eventi M≥4.5 nel Mediterraneo ultime 24h."""
+    """EMSC: eventi M≥4.5 nel Mediterraneo ultime 24h (snapshot di ingestione)."""
     try:
-        start = (datetime.utcnow() - timedelta(hours=24)).strftime("%Y-%m-%dT%H:%M:%S")
-        r = requests.get(
-            f"https://www.seismicportal.eu/fdsnws/event/1/query?format=json"
-            f"&starttime={start}&minmag=4.5"
-            f"&minlat=28.0&maxlat=48.0&minlon=-10.0&maxlon=42.0"
-            f"&limit=10&orderby=time",
-            timeout=8)
-        if r.status_code == 200:
+        features = ingestione.leggi("emsc_mediterraneo")
+        if features is not None:
             events = []
-            for f in r.json().get("features", []):
+            for f in features[:10]:
                 p = f.get("properties", {})
                 g = f.get("geometry", {}).get("coordinates", [])
                 mag = float(p.get("mag") or p.get("magnitude") or 0)
@@ -205,7 +157,7 @@ def _fetch_emsc_quick():
             return events
     except Exception:
         pass
-    return []
+    return None
 
 
 @st.cache_data(ttl=600, show_spinner=False)
@@ -263,7 +215,7 @@ def _fetch_dpc_news():
     all_items = []
     for url, label, max_n, do_filter in sources:
         try:
-            r = requests.get(url, timeout=8, headers={"User-Agent": "SismaVer2/3.4"})
+            r = http_client.get(url, timeout=8, headers={"User-Agent": "SismaVer2/3.4"})
             if r.status_code == 200 and len(r.content) > 200:
                 all_items.extend(_parse_feed(r.content, label, max_n, do_filter))
         except Exception:
@@ -271,53 +223,14 @@ def _fetch_dpc_news():
     return all_items[:8]
 
 
-@st.cache_data(ttl=600, show_spinner=False)
 def _fetch_volcano_activity():
     """Sismicità aree vulcaniche principali INGV — 10 vulcani (incl. Marsili e Panarea).
-    
-    Raggi aumentati per catturare più eventi; 204 No Content → 0 eventi (Silente).
-    Max 4 thread paralleli per non saturare il rate-limit INGV.
+
+    Conteggi eventi 7gg dallo snapshot "vulcani" aggiornato dallo scheduler di
+    ingestione (aree di registro_vulcani, come Monitoraggio e Mappa rischi); None → N/D.
     """
-    vulcani = {
-        "Etna":          (37.755, 14.995, 0.25),
-        "Stromboli":     (38.789, 15.213, 0.20),
-        "Campi Flegrei": (40.827, 14.139, 0.20),
-        "Vesuvio":       (40.821, 14.426, 0.18),
-        "Vulcano":       (38.404, 14.962, 0.20),
-        "Ischia":        (40.731, 13.897, 0.18),
-        "Pantelleria":   (36.769, 12.021, 0.18),
-        "Colli Albani":  (41.757, 12.700, 0.18),
-        "Marsili":       (39.270, 14.400, 0.40),   # sottomarino — raggio esteso
-        "Panarea":       (38.636, 15.064, 0.18),   # sistema idrotermale Eolie
-    }
-    result = {}
-    start = (datetime.utcnow() - timedelta(days=7)).strftime("%Y-%m-%dT%H:%M:%S")
-
-    def _one(name, lat, lon, rad):
-        urls = [
-            f"https://webservices.ingv.it/fdsnws/event/1/query?format=geojson"
-            f"&starttime={start}&minmag=0.5&lat={lat}&lon={lon}&maxradius={rad}&limit=50",
-            f"https://terremoti.ingv.it/fdsnws/event/1/query?format=geojson"
-            f"&starttime={start}&minmag=0.5&lat={lat}&lon={lon}&maxradius={rad}&limit=50",
-        ]
-        for url in urls:
-            try:
-                r = requests.get(url, timeout=9)
-                if r.status_code == 200:
-                    return name, len(r.json().get("features", []))
-                if r.status_code == 204:
-                    # Nessun evento in area — vulcano silente
-                    return name, 0
-            except Exception:
-                continue
-        return name, None  # Tutti i tentativi falliti → N/D
-
-    # Max 4 thread paralleli per non saturare il rate-limit INGV
-    with ThreadPoolExecutor(max_workers=4) as ex:
-        futs = {ex.submit(_one, n, la, lo, ra): n for n, (la, lo, ra) in vulcani.items()}
-        for ft in as_completed(futs):
-            name, count = ft.result()
-            result[name] = count
+    vulcani = ingestione.leggi("vulcani") or {}
+    result = {nome: v["count"] for nome, v in vulcani.items()}
     # Ordina per attività decrescente (silente in fondo)
     return dict(sorted(result.items(), key=lambda x: (x[1] if x[1] is not None else -1), reverse=True))
 
@@ -381,6 +294,9 @@ def show():
     ora = datetime.now(FUSO_ORARIO_ITALIA)
     from modules.banner_utils import banner_home
     banner_home()
+    marcatore = snapshot.marcatore("catalogo_recente", "emsc_mediterraneo", "vulcani", "meteoalarm")
+    if marcatore:
+        st.caption(marcatore)
 
     st.markdown(
         f"<p style='color:#64748B;font-size:0.9rem;margin-top:0;margin-bottom:1rem;'>"
@@ -392,13 +308,12 @@ def show():
 
     # ── Caricamento parallelo ─────────────────────────────────────────────────
     with st.spinner("Caricamento dati in tempo reale..."):
-        with ThreadPoolExecutor(max_workers=3) as ex:
-            f_ingv  = ex.submit(_fetch_ingv_7days)
-            f_emsc  = ex.submit(_fetch_emsc_quick)
-            f_ma    = ex.submit(_fetch_meteoalarm)
-            ingv_features = f_ingv.result()
-            emsc_events   = f_emsc.result()
-            ma_count, ma_details = f_ma.result()
+        ingv_features, emsc_events, ma = fetch_async.in_parallelo(
+            _fetch_ingv_7days, _fetch_emsc_quick, _fetch_meteoalarm)
+        emsc_events = emsc_events or []
+        ma_count, ma_details = ma or (0, [])
+        if ingv_features is None:
+            ingv_features = TabellaEventi.vuota()
 
     kpi = _parse_ingv_kpi(ingv_features)
 
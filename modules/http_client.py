@@ -0,0 +1,134 @@
+"""
+http_client.py — Client HTTP CONDIVISO di processo per SismaVer2.
+
+Tutti i fetcher passano da qui invece di chiamare `requests.get` direttamente:
+  - una `requests.Session` per host upstream → connessioni keep-alive riusate
+    (niente handshake TCP+TLS a ogni richiesta)
+  - pool di connessioni dimensionato sul limite di concorrenza dell'host
+  - semaforo per host: al massimo N richieste contemporanee (Nominatim = 1,
+    come da policy d'uso OSM)
+  - gzip/deflate sempre richiesti, User-Agent uniforme
+  - timeout (connect, read) e retry uniformi: un solo nuovo tentativo rapido
+    su errori di connessione e 502/503/504 — le catene di fallback tra fonti
+    restano nei moduli chiamanti.
+  - circuit breaker per host (circuit_breaker.py): con l'upstream giù le
+    richieste falliscono subito con CircuitoAperto (una ConnectionError).
+
+API compatibile con requests: get()/post() ritornano `requests.Response`.
+"""
+
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from modules import circuit_breaker
+
+USER_AGENT = "SismaVer2/3.4 (https://sisma-ver-2.replit.app/)"
+
+# (connect, read) in secondi — usato se il chiamante non specifica timeout
+TIMEOUT_DEFAULT = (4, 10)
+
+# Richieste contemporanee per host (default per gli host non elencati)
+MAX_PER_HOST = 6
+_LIMITI_HOST = {
+    "webservices.ingv.it": 10,
+    "cnt.rm.ingv.it": 6,
+    "terremoti.ingv.it": 6,
+    "www.seismicportal.eu": 6,
+    "earthquake.usgs.gov": 4,
+    "api.open-meteo.com": 8,
+    "air-quality-api.open-meteo.com": 8,
+    "geocoding-api.open-meteo.com": 4,
+    "nominatim.openstreetmap.org": 1,
+    "api.openweathermap.org": 6,
+}
+
+
+def _retry() -> Retry:
+    return Retry(
+        total=1, connect=1, read=0, status=1,
+        backoff_factor=0.3,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        respect_retry_after_header=False,
+        raise_on_status=False,
+    )
+
+
+class _Host:
+    """Sessione + semaforo di concorrenza per un singolo host."""
+
+    def __init__(self, host: str):
+        self.limite = limite_host(host)
+        self.semaforo = threading.BoundedSemaphore(self.limite)
+        self.session = requests.Session()
+        self.session.headers.update({
+            "User-Agent": USER_AGENT,
+            "Accept-Encoding": "gzip, deflate",
+        })
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.limite,
+                              max_retries=_retry())
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+
+_HOSTS = {}
+_HOSTS_LOCK = threading.Lock()
+
+
+def limite_host(host: str) -> int:
+    """Richieste contemporanee ammesse verso `host` (condiviso con fetch_async)."""
+    return _LIMITI_HOST.get(host.lower(), MAX_PER_HOST)
+
+
+def _per_host(url: str) -> _Host:
+    host = urlsplit(url).netloc.lower()
+    h = _HOSTS.get(host)
+    if h is None:
+        with _HOSTS_LOCK:
+            h = _HOSTS.get(host)
+            if h is None:
+                h = _HOSTS[host] = _Host(host)
+    return h
+
+
+def _attesa_slot(timeout) -> float:
+    """Attesa massima per uno slot del semaforo: il timeout di lettura della richiesta."""
+    if isinstance(timeout, (tuple, list)):
+        timeout = timeout[-1]
+    return float(timeout) if timeout else 30.0
+
+
+def richiesta(metodo: str, url: str, timeout=None, **kwargs) -> requests.Response:
+    """Richiesta tramite la sessione condivisa dell'host, entro il suo limite di concorrenza."""
+    host = urlsplit(url).netloc.lower()
+    circuit_breaker.verifica(host)          # CircuitoAperto: fallimento immediato
+    h = _per_host(url)
+    timeout = timeout if timeout is not None else TIMEOUT_DEFAULT
+    if not h.semaforo.acquire(timeout=_attesa_slot(timeout)):
+        circuit_breaker.annulla(host)
+        raise requests.ConnectionError(f"Troppe richieste contemporanee verso {host}")
+    try:
+        r = h.session.request(metodo, url, timeout=timeout, **kwargs)
+    except requests.RequestException as e:
+        circuit_breaker.fallimento(host, str(e))
+        raise
+    except Exception:
+        circuit_breaker.annulla(host)
+        raise
+    finally:
+        h.semaforo.release()
+    circuit_breaker.esito_status(host, r.status_code)
+    return r
+
+
+def get(url: str, params=None, timeout=None, **kwargs) -> requests.Response:
+    return richiesta("GET", url, params=params, timeout=timeout, **kwargs)
+
+
+def post(url: str, data=None, json=None, timeout=None, **kwargs) -> requests.Response:
+    return richiesta("POST", url, data=data, json=json, timeout=timeout, **kwargs)
+
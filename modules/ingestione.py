@@ -0,0 +1,235 @@
+"""
+ingestione.py — Fonti live acquisite dallo scheduler, lette dalle pagine.
+
+Ogni fonte è una funzione di download + una cadenza di polling. Lo scheduler
+(scheduler.py) le esegue in background e pubblica l'ultimo valore buono in
+snapshot.py; le pagine chiamano leggi(nome) e non attendono mai la rete,
+salvo il primissimo accesso prima del primo giro dello scheduler.
+
+Fonti:
+  - catalogo_recente / catalogo_storico → store di catalogo_sismico (delta),
+                        poi upsert nell'archivio SQLite (archivio_eventi) dei soli
+                        eventi INGV nuovi o rivisti dall'ultimo giro
+  - archivio          → completamento all'indietro dell'archivio, un mese per giro
+  - emsc_mediterraneo → feature EMSC M≥4.5 ultime 24h (Mediterraneo esteso)
+  - meteoalarm        → feed Atom MeteoAlarm Italia (bytes)
+  - vulcani           → eventi 7gg per area vulcanica: una query INGV sul riquadro
+                        di registro_vulcani, partizionata localmente (fallback:
+                        catalogo condiviso), accumulati in serie_vulcani
+  - aria_citta        → indice AQI europeo delle 20 città principali, una
+                        richiesta Open-Meteo multi-località (open_meteo)
+  - griglia_meteo / griglia_aria → campo a griglia 0.5° sull'Italia (griglia_meteo),
+                        array NumPy persistiti in proprio, nessuno snapshot
+"""
+
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from modules import fetch_async, registro_vulcani, snapshot
+
+# ── Città per la panoramica qualità dell'aria ────────────────────────────────
+CITTA_ARIA = {
+    "Roma":    (41.8955, 12.4823), "Milano":  (45.4642, 9.1900),
+    "Napoli":  (40.8517, 14.2681), "Torino":  (45.0703, 7.6869),
+    "Palermo": (38.1157, 13.3613), "Firenze": (43.7696, 11.2558),
+    "Bologna": (44.4934, 11.3420), "Venezia": (45.4408, 12.3155),
+    "Bari":    (41.1171, 16.8719), "Catania": (37.5079, 15.0830),
+    "Genova":  (44.4056, 8.9463),  "Cagliari":(39.2238, 9.1217),
+    "Messina": (38.1938, 15.5540), "Verona":  (45.4384, 10.9916),
+    "Trieste": (45.6495, 13.7768), "Taranto": (40.4756, 17.2291),
+    "Brescia": (45.5416, 10.2118), "Padova":  (45.4064, 11.8768),
+    "Parma":   (44.8015, 10.3279), "Reggio Calabria": (38.1112, 15.6476),
+}
+
+_FMT = "%Y-%m-%dT%H:%M:%S"
+
+
+# ── Download ─────────────────────────────────────────────────────────────────
+
+def _emsc_mediterraneo():
+    start = (datetime.utcnow() - timedelta(hours=24)).strftime(_FMT)
+    r = fetch_async.fetch(
+        f"https://www.seismicportal.eu/fdsnws/event/1/query?format=json"
+        f"&starttime={start}&minmagnitude=4.5"
+        f"&minlatitude=28.0&maxlatitude=48.0&minlongitude=-10.0&maxlongitude=42.0"
+        f"&limit=50&orderby=time",
+        timeout=8, accetta=(200, 204))
+    if r is None:
+        return None
+    return [] if r.status_code == 204 else r.json().get("features", [])
+
+
+def _meteoalarm():
+    from modules.meteoalarm_cache import scarica_feed
+    return scarica_feed()
+
+
+def _vulcani():
+    """
+    nome → statistiche 7gg dell'area (registro_vulcani.statistiche) + "fonte".
+    Una sola query INGV FDSN sul riquadro che contiene tutte le aree, poi
+    partizione locale per raggio; se INGV non risponde si partiziona il
+    catalogo condiviso (INGV → EMSC → USGS), già scaricato dallo scheduler.
+    """
+    from modules import catalogo_sismico
+    from modules.tabella_eventi import TabellaEventi
+    start = (datetime.utcnow() - timedelta(days=7)).strftime(_FMT)
+    la0, la1, lo0, lo1 = registro_vulcani.BBOX
+    query = (f"/fdsnws/event/1/query?format=geojson&starttime={start}&minmag=0.5"
+             f"&minlat={la0}&maxlat={la1}&minlon={lo0}&maxlon={lo1}"
+             f"&limit=10000&orderby=time")
+    r = fetch_async.fetch("https://webservices.ingv.it" + query,
+                          mirror=("https://terremoti.ingv.it" + query,),
+                          timeout=12, accetta=(200, 204), hedge=True)
+    tab, fonte = None, "INGV"
+    try:
+        if r is not None:
+            features = [] if r.status_code == 204 else r.json().get("features", [])
+            tab = TabellaEventi.da_eventi(
+                [e for e in (catalogo_sismico._normalizza(f, "INGV") for f in features) if e])
+    except Exception as e:
+        print(f"Ingestione vulcani: risposta INGV non valida ({e})")
+    if tab is None:
+        try:
+            tab = catalogo_sismico.eventi(days=7, min_mag=0.5, bbox=registro_vulcani.BBOX)
+            fonte = catalogo_sismico.stato()["fonte"]
+        except Exception as e:
+            print(f"Ingestione vulcani: catalogo non disponibile ({e})")
+            fonte = None
+        if fonte is None:      # catalogo mai scaricato: nessun dato, non "0 eventi"
+            return {nome: {"count": None, "fonte": "N/D"} for nome in registro_vulcani.NOMI}
+    risultati = {nome: {**v, "fonte": fonte}
+                 for nome, v in registro_vulcani.statistiche(tab).items()}
+    try:
+        from modules import serie_vulcani
+        serie_vulcani.registra(risultati)
+    except Exception as e:
+        print(f"Ingestione vulcani: serie temporali non aggiornate: {e}")
+    return risultati
+
+
+def _aria_citta():
+    # Una sola richiesta multi-località per tutte le città (senza cache: lo
+    # scheduler ha già la sua cadenza)
+    from modules import open_meteo
+    valori = open_meteo.aria_corrente.__wrapped__(tuple(CITTA_ARIA.values()))
+    if valori is None:
+        return {nome: {} for nome in CITTA_ARIA}
+    return {nome: open_meteo.valori_aria(valori, i) for i, nome in enumerate(CITTA_ARIA)}
+
+
+def _griglia(prodotto: str) -> bool:
+    from modules import griglia_meteo
+    return griglia_meteo.aggiorna(prodotto)
+
+
+_ARCHIVIATI = {}        # storico → ultima tabella passata all'archivio
+_LOCK_ARCHIVIO = threading.Lock()
+
+
+def _novita(tab, precedente):
+    """Eventi di `tab` nuovi o rivisti (tempo, magnitudo, localizzazione) rispetto a `precedente`."""
+    if precedente is None or not len(precedente) or not len(tab):
+        return tab
+    ordine = np.argsort(precedente.id)
+    ids = precedente.id[ordine]
+    pos = np.minimum(np.searchsorted(ids, tab.id), ids.size - 1)
+    j = ordine[pos]
+    uguali = ((ids[pos] == tab.id) & (precedente.time_ms[j] == tab.time_ms)
+              & (precedente.mag[j] == tab.mag)
+              & (precedente.lat[j] == tab.lat) & (precedente.lon[j] == tab.lon)
+              & ((precedente.depth[j] == tab.depth)
+                 | (np.isnan(precedente.depth[j]) & np.isnan(tab.depth))))
+    return tab.prendi(~uguali)
+
+
+def archivia_catalogo(storico: bool) -> int:
+    """
+    Unico punto di scrittura dal catalogo live all'archivio SQLite: solo se lo
+    store viene da INGV (gli id EMSC/USGS dello stesso terremoto sono diversi
+    e diventerebbero duplicati permanenti) e solo gli eventi INGV nuovi o
+    rivisti dall'ultima scrittura. Ritorna il numero di eventi scritti.
+    """
+    from modules import archivio_eventi, catalogo_sismico
+    if catalogo_sismico.stato(storico)["fonte"] != "INGV":
+        return 0
+    tab = catalogo_sismico.tabella(storico)
+    tab = tab.prendi(tab.fonte == "INGV")
+    with _LOCK_ARCHIVIO:
+        try:
+            n = archivio_eventi.registra(_novita(tab, _ARCHIVIATI.get(storico)))
+            _ARCHIVIATI[storico] = tab
+            return n
+        except Exception as e:
+            print(f"Ingestione: archivio eventi non aggiornato: {e}")
+            return 0
+
+
+def _catalogo(storico: bool):
+    from modules import catalogo_sismico
+    catalogo_sismico.aggiorna(storico=storico)
+    archivia_catalogo(storico)
+    return True
+
+
+def _archivio():
+    from modules import archivio_eventi
+    return archivio_eventi.completa_storico()
+
+
+# ── Registro fonti ───────────────────────────────────────────────────────────
+
+# nome → (download, cadenza s, valido(valore) -> bool, pubblica snapshot)
+_FONTI = {
+    "catalogo_recente":  (lambda: _catalogo(False), 120,  bool, False),
+    "catalogo_storico":  (lambda: _catalogo(True),  900,  bool, False),
+    "archivio":          (_archivio,                 60,   bool, False),
+    "emsc_mediterraneo": (_emsc_mediterraneo,        120,  lambda v: v is not None, True),
+    "meteoalarm":        (_meteoalarm,               120,  lambda v: v is not None, True),
+    "vulcani":           (_vulcani,                  300,
+                          lambda v: any(x["count"] is not None for x in v.values()), True),
+    "aria_citta":        (_aria_citta,               1800, lambda v: any(v.values()), True),
+    "griglia_meteo":     (lambda: _griglia("meteo"), 10800, bool, False),
+    "griglia_aria":      (lambda: _griglia("aria"),  10800, bool, False),
+}
+
+_LOCKS = {nome: threading.RLock() for nome in _FONTI}
+
+
+def aggiorna(nome: str) -> bool:
+    """Scarica la fonte e, se il valore è valido, pubblica lo snapshot."""
+    scarica, _ogni, valido, pubblica = _FONTI[nome]
+    with _LOCKS[nome]:
+        valore = scarica()
+        if not valido(valore):
+            print(f"Ingestione {nome}: nessun dato valido, resta lo snapshot precedente")
+            return False
+        if pubblica:
+            snapshot.pubblica(nome, valore)
+        return True
+
+
+def leggi(nome: str):
+    """
+    Ultimo snapshot della fonte. Se lo scheduler non l'ha ancora prodotto
+    (primo accesso dopo l'avvio) lo scarica ora, una sola volta per tutti.
+    """
+    valore = snapshot.leggi(nome)
+    if valore is not None:
+        return valore
+    with _LOCKS[nome]:
+        valore = snapshot.leggi(nome)
+        if valore is None:
+            try:
+                aggiorna(nome)
+            except Exception as e:
+                print(f"Ingestione {nome}: {e}")
+            valore = snapshot.leggi(nome)
+    return valore
+
+
+def compiti():
+    """(nome, funzione, cadenza s) per lo scheduler."""
+    return [(nome, lambda n=nome: aggiorna(n), ogni) for nome, (_f, ogni, _v, _p) in _FONTI.items()]
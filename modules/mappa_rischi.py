@@ -3,20 +3,19 @@ mappa_rischi.py — Dashboard Allerte Multi-Rischio v4.0
 Mostra su mappa le ALLERTE ATTIVE per regione italiana:
   - MeteoAlarm: allerta meteo per regione (colore = livello)
   - EMSC: eventi Mediterraneo significativi M≥4.5 (ultime 24h)
-  - EMSC Italia M≥3.0 (ultime 24h) — nuovo metric
+  - Italia M≥3.0 (ultime 24h) dal catalogo sismico condiviso
   - Vulcani: attività sismica LIVE da INGV FDSN + fallback EMSC (10 vulcani)
   - Rischio incendi: derivato da Open-Meteo (temp/umidità/vento)
-  - Heatmap sismica: calore eventi recenti M≥2.0 in Italia (EMSC)
+  - Heatmap sismica: calore eventi recenti M≥2.0 in Italia (catalogo sismico condiviso)
   - Stato allerta tsunami: CAT-INGV
 DIFFERENTE da monitoraggio.py (catalogo sismico) e rischi_allerte.py (tab testuali)
 """
 import streamlit as st
-import requests
+from modules import cache_mappe, fetch_async, ingestione, open_meteo, registro_vulcani
 import folium
 from folium.plugins import HeatMap
-from streamlit_folium import folium_static
+import numpy as np
 from datetime import datetime, timezone, timedelta
-from concurrent.futures import ThreadPoolExecutor, as_completed
 import re
 
 try:
@@ -81,41 +80,24 @@ _MA_LEVEL_COLOR = {
     "green":  ("#16A34A", "🟢", "Verde",    1),
 }
 
-# ── 10 vulcani monitorati — sincronizzato con monitoraggio.py e home.py ──────
-_VULCANI_COORDS = {
-    "Etna":          {"lat": 37.755, "lon": 14.995, "rad": 0.20},
-    "Stromboli":     {"lat": 38.789, "lon": 15.213, "rad": 0.12},
-    "Campi Flegrei": {"lat": 40.827, "lon": 14.139, "rad": 0.15},
-    "Vesuvio":       {"lat": 40.821, "lon": 14.426, "rad": 0.10},
-    "Vulcano":       {"lat": 38.404, "lon": 14.962, "rad": 0.12},
-    "Ischia":        {"lat": 40.731, "lon": 13.897, "rad": 0.10},
-    "Pantelleria":   {"lat": 36.769, "lon": 12.021, "rad": 0.10},
-    "Colli Albani":  {"lat": 41.757, "lon": 12.700, "rad": 0.12},
-    "Marsili":       {"lat": 39.270, "lon": 14.400, "rad": 0.30},
-    "Panarea":       {"lat": 38.636, "lon": 15.064, "rad": 0.10},
-}
-
-_HDR = {"User-Agent": "SismaVer2/4.0 (https://sos-italia.replit.app; meteotorre@gmail.com)"}
+# ── 10 vulcani monitorati: registro condiviso in registro_vulcani ──────────
 
 
 # ─────────────────────────────────────────────────────────────────────────────
 # FETCH FUNCTIONS
 # ─────────────────────────────────────────────────────────────────────────────
 
-@st.cache_data(ttl=300, show_spinner=False)
 def _fetch_volcano_alerts_live():
     """
-    Indicatori attività vulcanica LIVE: INGV FDSN primario, EMSC come fallback.
-    Metrica: eventi sismici M≥0.5 (INGV) / M≥1.0 (EMSC) negli ultimi 7 giorni
-    nell'area del vulcano.
+    Indicatori attività vulcanica LIVE dallo snapshot "vulcani" (scheduler di
+    ingestione): una query INGV FDSN sul riquadro vulcanico partizionata per
+    area, catalogo condiviso come fallback.
+    Metrica: eventi sismici M≥0.5 negli ultimi 7 giorni nell'area del vulcano.
       Verde     = 0 eventi   (silente)
       Giallo    = 1–4 eventi (bassa attività)
       Arancione = 5–19 eventi (moderata)
       Rosso     = 20+ eventi  (elevata)
     """
-    start = (datetime.utcnow() - timedelta(days=7)).strftime("%Y-%m-%dT%H:%M:%S")
-    results = {}
-
     def _classify(count):
         if count >= 20:
             return "Rosso",     "#DC2626", "🔴", f"Alta ({count} ev.)"
@@ -126,49 +108,19 @@ def _fetch_volcano_alerts_live():
         else:
             return "Verde",     "#16A34A", "🟢", "Silente (0 ev.)"
 
-    def _fetch_one(name, coords):
-        lat, lon, rad = coords["lat"], coords["lon"], coords["rad"]
-        # Tentativo 1: INGV
-        try:
-            r = requests.get(
-                f"https://webservices.ingv.it/fdsnws/event/1/query?format=geojson"
-                f"&starttime={start}&minmag=0.5&lat={lat}&lon={lon}&maxradius={rad}&limit=50",
-                timeout=7, headers=_HDR)
-            if r.status_code == 200:
-                count = len(r.json().get("features", []))
-                level, col, emoji, label = _classify(count)
-                return name, {"count": count, "level": level, "col": col,
-                              "emoji": emoji, "label": label,
-                              "lat": lat, "lon": lon, "fonte": "INGV"}
-        except Exception:
-            pass
-        # Tentativo 2: EMSC fallback
-        try:
-            r = requests.get(
-                f"https://www.seismicportal.eu/fdsnws/event/1/query?format=json"
-                f"&starttime={start}&minmagnitude=1.0"
-                f"&lat={lat}&lon={lon}&maxradius={rad}&limit=50",
-                timeout=8, headers=_HDR)
-            if r.status_code == 200:
-                count = len(r.json().get("features", []))
-                level, col, emoji, label = _classify(count)
-                return name, {"count": count, "level": level, "col": col,
-                              "emoji": emoji, "label": label,
-                              "lat": lat, "lon": lon, "fonte": "EMSC"}
-        except Exception:
-            pass
-        return name, {
-            "count": None, "level": "N/D",
-            "col": "#94A3B8", "emoji": "⚫", "label": "N/D",
-            "lat": lat, "lon": lon, "fonte": "N/D",
-        }
+    def _voce(name, count, fonte):
+        c = registro_vulcani.VULCANI[name]
+        if count is None:
+            return {"count": None, "level": "N/D",
+                    "col": "#94A3B8", "emoji": "⚫", "label": "N/D",
+                    "lat": c["lat"], "lon": c["lon"], "fonte": "N/D"}
+        level, col, emoji, label = _classify(count)
+        return {"count": count, "level": level, "col": col,
+                "emoji": emoji, "label": label,
+                "lat": c["lat"], "lon": c["lon"], "fonte": fonte}
 
-    with ThreadPoolExecutor(max_workers=5) as ex:
-        futs = {ex.submit(_fetch_one, n, d): n for n, d in _VULCANI_COORDS.items()}
-        for ft in as_completed(futs):
-            name, data = ft.result()
-            results[name] = data
-    return results
+    vulcani = ingestione.leggi("vulcani") or {}
+    return {name: _voce(name, v["count"], v["fonte"]) for name, v in vulcani.items()}
 
 
 @st.cache_data(ttl=300, show_spinner=False)
@@ -178,19 +130,8 @@ def _fetch_meteoalarm_regions():
     result = {}
 
     try:
-        urls = [
-            "https://feeds.meteoalarm.org/feeds/meteoalarm-legacy-atom-italy",
-            "https://feeds.meteoalarm.org/api/v1/warnings/feeds-italy/",
-        ]
-        raw = None
-        for url in urls:
-            try:
-                r = requests.get(url, timeout=9, headers=_HDR)
-                if r.status_code == 200 and len(r.content) > 100:
-                    raw = r.content
-                    break
-            except Exception:
-                pass
+        from modules.meteoalarm_cache import fetch_meteoalarm_raw
+        raw = fetch_meteoalarm_raw()   # cache condivisa con home e rischi_allerte
 
         if not raw:
             return result, 0, []
@@ -244,20 +185,13 @@ def _fetch_meteoalarm_regions():
         return {}, 0, []
 
 
-@st.cache_data(ttl=120, show_spinner=False)
 def _fetch_emsc_significant():
-    """EMSC: eventi M≥4.5 nel Mediterraneo ultime 24h (per mappa)."""
+    """EMSC: eventi M≥4.5 nel Mediterraneo ultime 24h (per mappa, snapshot di ingestione)."""
     try:
-        start = (datetime.utcnow() - timedelta(hours=24)).strftime("%Y-%m-%dT%H:%M:%S")
-        r = requests.get(
-            f"https://www.seismicportal.eu/fdsnws/event/1/query?format=json"
-            f"&starttime={start}&minmagnitude=4.5"
-            f"&minlatitude=28.0&maxlatitude=48.0&minlongitude=-10.0&maxlongitude=42.0"
-            f"&limit=15&orderby=time",
-            timeout=8, headers=_HDR)
-        if r.status_code == 200:
+        features = ingestione.leggi("emsc_mediterraneo")
+        if features is not None:
             events = []
-            for f in r.json().get("features", []):
+            for f in features[:15]:
                 p = f.get("properties", {})
                 g = f.get("geometry", {}).get("coordinates", [])
                 if len(g) < 2:
@@ -282,159 +216,94 @@ def _fetch_emsc_significant():
             return events
     except Exception:
         pass
-    return []
+    return None
 
 
-@st.cache_data(ttl=300, show_spinner=False)
 def _fetch_emsc_italy_m3():
     """
-    EMSC: terremoti M≥3.0 in Italia nelle ultime 24h.
+    Catalogo sismico condiviso: terremoti M≥3.0 in Italia nelle ultime 24h.
     Restituisce lista eventi e conteggio.
     """
     try:
-        start = (datetime.utcnow() - timedelta(hours=24)).strftime("%Y-%m-%dT%H:%M:%S")
-        r = requests.get(
-            "https://www.seismicportal.eu/fdsnws/event/1/query?format=json"
-            f"&starttime={start}&minmagnitude=3.0"
-            "&minlatitude=35.5&maxlatitude=47.1"
-            "&minlongitude=6.6&maxlongitude=18.6"
-            "&limit=50&orderby=time",
-            timeout=8, headers=_HDR)
-        if r.status_code == 200:
-            events = []
-            for f in r.json().get("features", []):
-                p = f.get("properties", {})
-                g = f.get("geometry", {}).get("coordinates", [])
-                if len(g) < 2:
-                    continue
-                mag = float(p.get("mag") or p.get("magnitude") or 0)
-                luogo = p.get("place") or p.get("flynn_region") or "N/D"
-                t = p.get("time") or p.get("lastupdate")
-                ora_str = "—"
-                if t:
-                    try:
-                        if isinstance(t, (int, float)):
-                            dt = datetime.fromtimestamp(t / 1000.0, FUSO_IT)
-                        else:
-                            dt = datetime.fromisoformat(str(t).replace("Z", "+00:00")).astimezone(FUSO_IT)
-                        ora_str = dt.strftime("%d/%m %H:%M")
-                    except Exception:
-                        pass
-                events.append({
-                    "mag": mag, "luogo": luogo, "ora": ora_str,
-                    "lat": float(g[1]), "lon": float(g[0]),
-                    "depth": round(float(g[2]), 1) if len(g) > 2 else 0,
-                })
-            return events
+        from modules import catalogo_sismico
+        from modules.catalogo_sismico import BBOX_ITALIA
+        events = []
+        for ev in catalogo_sismico.eventi(days=1, min_mag=3.0, bbox=BBOX_ITALIA, limit=50).righe():
+            dt = datetime.fromtimestamp(ev["time_ms"] / 1000.0, FUSO_IT)
+            events.append({
+                "mag": ev["mag"], "luogo": ev["place"] or "N/D",
+                "ora": dt.strftime("%d/%m %H:%M"),
+                "lat": ev["lat"], "lon": ev["lon"],
+                "depth": round(ev["depth"], 1) if ev["depth"] is not None else 0,
+                "regione": ev["regione"] or "Mare / estero",
+            })
+        return events
     except Exception:
-        pass
-    return []
+        return []
 
 
-@st.cache_data(ttl=300, show_spinner=False)
-def _fetch_seismic_heatmap():
+def _fetch_seismic_heatmap(giorni: int = 7):
     """
-    EMSC (primario) + INGV (fallback): eventi M≥2.0 in Italia ultimi 7gg per heatmap.
-    Restituisce lista [lat, lon, peso] dove peso = mag^2.
+    Catalogo sismico condiviso: eventi M≥2.0 in Italia degli ultimi `giorni`
+    (7 dallo store recente, fino a 90 dallo store storico) per heatmap.
+    Pesi mag^2 sommati per cella di 0.05° (aggregazione_mappa.celle_pesate):
+    il numero di punti passati al browser resta limitato anche su 90 giorni.
+    Restituisce (lista [lat, lon, peso], numero di eventi).
     """
-    start = (datetime.utcnow() - timedelta(days=7)).strftime("%Y-%m-%dT%H:%M:%S")
-
-    def _parse_features(features):
-        points = []
-        for f in features:
-            p = f.get("properties", {})
-            g = f.get("geometry", {}).get("coordinates", [])
-            if len(g) < 2:
-                continue
-            try:
-                mag = float(p.get("mag") or p.get("magnitude") or 2.0)
-                lat, lon = float(g[1]), float(g[0])
-                # Filtra bbox Italia
-                if 35.5 <= lat <= 47.1 and 6.6 <= lon <= 18.6:
-                    points.append([lat, lon, max(mag ** 2, 0.5)])
-            except Exception:
-                pass
-        return points
-
-    # 1) EMSC
     try:
-        r = requests.get(
-            "https://www.seismicportal.eu/fdsnws/event/1/query?format=json"
-            f"&starttime={start}&minmagnitude=2.0"
-            "&minlatitude=35.5&maxlatitude=47.1"
-            "&minlongitude=6.6&maxlongitude=18.6"
-            "&limit=300&orderby=time",
-            timeout=10, headers=_HDR)
-        if r.status_code == 200:
-            pts = _parse_features(r.json().get("features", []))
-            if pts:
-                return pts
+        from modules import aggregazione_mappa, catalogo_sismico
+        from modules.catalogo_sismico import BBOX_ITALIA
+        if giorni <= 7:
+            tab = catalogo_sismico.eventi(days=giorni, min_mag=2.0, bbox=BBOX_ITALIA)
+        else:
+            tab = catalogo_sismico.eventi_storici(days=giorni, min_mag=2.0, bbox=BBOX_ITALIA)
+        peso = np.maximum(tab.mag.astype(np.float64) ** 2, 0.5)
+        return aggregazione_mappa.celle_pesate(tab.lat, tab.lon, peso), len(tab)
     except Exception:
-        pass
+        return [], 0
 
-    # 2) Fallback INGV
-    try:
-        r = requests.get(
-            "https://webservices.ingv.it/fdsnws/event/1/query?format=geojson"
-            f"&starttime={start}&minmag=2.0&limit=300"
-            "&minlatitude=35.5&maxlatitude=47.1"
-            "&minlongitude=6.6&maxlongitude=18.6",
-            timeout=10, headers=_HDR)
-        if r.status_code == 200:
-            pts = _parse_features(r.json().get("features", []))
-            if pts:
-                return pts
-    except Exception:
-        pass
 
-    return []
+_PUNTI_INCENDI = (
+    ("Nord Italia",   45.5, 10.0),
+    ("Centro Italia", 42.5, 12.5),
+    ("Sud Italia",    40.5, 15.5),
+    ("Sicilia",       37.5, 14.0),
+    ("Sardegna",      39.5,  9.0),
+)
 
 
-@st.cache_data(ttl=300, show_spinner=False)
-def _fetch_fire_risk():
+def _fire_risk_punti():
     """
-    Rischio incendi derivato da Open-Meteo: temperatura, umidità relativa,
-    velocità del vento, precipitazioni. Media su 5 punti italiani (N/C/S + isole).
+    Ripiego senza griglia: indice medio su 5 punti italiani (N/C/S + isole),
+    scaricati in una sola richiesta multi-località (cache di open_meteo, 15 min).
     """
-    punti = [
-        ("Nord Italia",  45.5, 10.0),
-        ("Centro Italia", 42.5, 12.5),
-        ("Sud Italia",   40.5, 15.5),
-        ("Sicilia",      37.5, 14.0),
-        ("Sardegna",     39.5,  9.0),
-    ]
-    scores = []
-    for _, lat, lon in punti:
-        try:
-            r = requests.get(
-                "https://api.open-meteo.com/v1/forecast"
-                f"?latitude={lat}&longitude={lon}"
-                "&hourly=temperature_2m,relative_humidity_2m,windspeed_10m,precipitation"
-                "&timezone=Europe%2FRome&forecast_days=1",
-                timeout=8)
-            if r.status_code == 200:
-                h = r.json().get("hourly", {})
-                temps = h.get("temperature_2m", [])
-                rh    = h.get("relative_humidity_2m", [])
-                wind  = h.get("windspeed_10m", [])
-                prec  = h.get("precipitation", [])
-                if temps:
-                    idx = slice(11, 17)
-                    t_max  = max((x for x in temps[idx] if x is not None), default=20)
-                    rh_min = min((x for x in rh[idx]    if x is not None), default=60)
-                    w_max  = max((x for x in wind[idx]  if x is not None), default=10)
-                    p_sum  = sum((x for x in prec        if x is not None), 0)
-                    score  = (max(t_max - 15, 0) * 0.5 +
-                              max(60 - rh_min, 0) * 0.35 +
-                              w_max * 0.15 -
-                              min(p_sum * 3, 20))
-                    scores.append(max(score, 0))
-        except Exception:
-            pass
-
-    if not scores:
+    h = open_meteo.meteo_orario(
+        tuple((lat, lon) for _, lat, lon in _PUNTI_INCENDI),
+        ("temperature_2m", "relative_humidity_2m", "windspeed_10m", "precipitation"), 1)
+    if h is None:
+        return None
+    ok = ~np.isnan(h["temperature_2m"]).all(axis=1)
+    if not ok.any():
         return None
-    avg = sum(scores) / len(scores)
+
+    def _finestra(var, riduzione, predefinito):
+        # Ore 11–16: NaN ignorati, finestra vuota → valore predefinito
+        v = riduzione.reduce(h[var][ok, 11:17], axis=1)
+        return np.where(np.isnan(v), predefinito, v)
+
+    t_max  = _finestra("temperature_2m", np.fmax, 20)
+    rh_min = _finestra("relative_humidity_2m", np.fmin, 60)
+    w_max  = _finestra("windspeed_10m", np.fmax, 10)
+    p_sum  = np.nansum(h["precipitation"][ok], axis=1)
+    scores = np.maximum(np.maximum(t_max - 15, 0) * 0.5 +
+                        np.maximum(60 - rh_min, 0) * 0.35 +
+                        w_max * 0.15 -
+                        np.minimum(p_sum * 3, 20), 0)
+
+    return float(scores.mean())
+
+
+def _livello_incendi(avg: float) -> dict:
     if avg >= 55:
         return {"level": "MOLTO ALTO", "col": "#DC2626", "emoji": "🔴",
                 "score": round(avg, 1), "desc": "Condizioni meteorologiche critiche per incendi"}
@@ -449,12 +318,37 @@ def _fetch_fire_risk():
                 "score": round(avg, 1), "desc": "Condizioni favorevoli"}
 
 
+def _fetch_fire_risk():
+    """
+    Rischio incendi derivato da Open-Meteo: temperatura, umidità relativa,
+    velocità del vento, precipitazioni. Indice calcolato su ogni nodo della
+    griglia nazionale (griglia_meteo), mediato sul territorio e aggregato per
+    regione; senza griglia, media dei 5 punti di _fire_risk_punti().
+    """
+    try:
+        from modules import griglia_meteo
+        campo = griglia_meteo.rischio_incendi()
+        if campo is not None:
+            media = griglia_meteo.media_nazionale(campo)
+            regioni = griglia_meteo.aggregati_regioni(campo)
+            if media is not None and regioni:
+                rischio = _livello_incendi(media)
+                peggiore = max(regioni, key=lambda r: regioni[r]["media"])
+                rischio["desc"] += f" · più esposta: {peggiore} ({regioni[peggiore]['media']})"
+                rischio["regioni"] = regioni
+                return rischio
+    except Exception as e:
+        print(f"Rischio incendi: griglia non disponibile ({e})")
+    avg = _fire_risk_punti()
+    return _livello_incendi(avg) if avg is not None else None
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # COSTRUZIONE MAPPA
 # ─────────────────────────────────────────────────────────────────────────────
 
 def _build_alert_map(ma_regions, emsc_events, show_vulc, vulc_live,
-                     show_heatmap, heatmap_data):
+                     show_heatmap, heatmap_data, heatmap_giorni=7):
     """Costruisce la mappa di allerta regioni + EMSC + vulcani live + heatmap."""
     m = folium.Map(location=[42.0, 12.5], zoom_start=6,
                    tiles="CartoDB positron",
@@ -464,7 +358,7 @@ def _build_alert_map(ma_regions, emsc_events, show_vulc, vulc_live,
     if show_heatmap and heatmap_data:
         HeatMap(
             heatmap_data,
-            name="🌡️ Heatmap sismica (M≥2.0 · 7gg)",
+            name=f"🌡️ Heatmap sismica (M≥2.0 · {heatmap_giorni}gg)",
             min_opacity=0.35,
             radius=22, blur=18,
             gradient={0.2: "#3B82F6", 0.5: "#D97706", 0.8: "#EA580C", 1.0: "#DC2626"},
@@ -597,23 +491,33 @@ def show():
     with col_c2:
         show_emsc    = st.checkbox("🌊 Mostra eventi EMSC Mediterraneo", value=True, key="mr_emsc")
     with col_c3:
-        show_heatmap = st.checkbox("🌡️ Heatmap sismica Italia (7gg)", value=False, key="mr_heat")
+        show_heatmap = st.checkbox("🌡️ Heatmap sismica Italia", value=False, key="mr_heat")
+        heatmap_giorni = 7
+        if show_heatmap:
+            heatmap_giorni = st.radio("Finestra heatmap", [7, 30, 90], horizontal=True,
+                                      format_func=lambda g: f"{g} giorni", key="mr_heat_giorni")
 
     # ── Caricamento dati in parallelo ─────────────────────────────────────────
     with st.spinner("Caricamento dati live: MeteoAlarm · EMSC · INGV vulcani · Incendi..."):
-        with ThreadPoolExecutor(max_workers=6) as ex:
-            f_ma    = ex.submit(_fetch_meteoalarm_regions)
-            f_emsc  = ex.submit(_fetch_emsc_significant)
-            f_vulc  = ex.submit(_fetch_volcano_alerts_live)
-            f_m3    = ex.submit(_fetch_emsc_italy_m3)
-            f_fire  = ex.submit(_fetch_fire_risk)
-            f_heat  = ex.submit(_fetch_seismic_heatmap)
-            (ma_regions, ma_total, ma_titles) = f_ma.result()
-            emsc_events   = f_emsc.result() if show_emsc else []
-            vulc_live     = f_vulc.result() if show_vulc else {}
-            italy_m3      = f_m3.result()
-            fire_risk     = f_fire.result()
-            heatmap_data  = f_heat.result() if show_heatmap else []
+        # Solo i layer attivi: i fetch dei layer nascosti non vengono lanciati
+        lavori = {
+            "ma":   _fetch_meteoalarm_regions,
+            "m3":   _fetch_emsc_italy_m3,
+            "fire": _fetch_fire_risk,
+        }
+        if show_emsc:
+            lavori["emsc"] = _fetch_emsc_significant
+        if show_vulc:
+            lavori["vulc"] = _fetch_volcano_alerts_live
+        if show_heatmap:
+            lavori["heat"] = lambda: _fetch_seismic_heatmap(heatmap_giorni)
+        dati = dict(zip(lavori, fetch_async.in_parallelo(*lavori.values())))
+        (ma_regions, ma_total, ma_titles) = dati["ma"] or ({}, 0, [])
+        emsc_events   = dati.get("emsc") or []
+        vulc_live     = dati.get("vulc") or {}
+        italy_m3      = dati["m3"] or []
+        fire_risk     = dati["fire"] or {}
+        heatmap_data, heatmap_n = dati.get("heat") or ([], 0)
 
     # ── 5 Metric boxes ────────────────────────────────────────────────────────
     n_reg_allerta = len(ma_regions)
@@ -651,6 +555,14 @@ def show():
                   </span>
                 </div>""",
                 unsafe_allow_html=True)
+            if fire_risk.get("regioni"):
+                with st.expander("🗺️ Indice incendi per regione (griglia 0.5°)"):
+                    st.dataframe(
+                        [{"Regione": r, "Media": v["media"], "Min": v["min"], "Max": v["max"],
+                          "Livello": _livello_incendi(v["media"])["level"]}
+                         for r, v in sorted(fire_risk["regioni"].items(),
+                                            key=lambda x: -x[1]["media"])],
+                        use_container_width=True, hide_index=True)
         with col_ts:
             st.markdown(
                 """<div style="background:#0F172A;border:2px solid #334155;border-radius:10px;
@@ -680,15 +592,19 @@ def show():
 
     if show_heatmap:
         if heatmap_data:
-            st.caption(f"🌡️ Heatmap sismica attiva — {len(heatmap_data)} eventi M≥2.0 (ultimi 7gg · EMSC)")
+            st.caption(f"🌡️ Heatmap sismica attiva — {heatmap_n} eventi M≥2.0 "
+                       f"(ultimi {heatmap_giorni}gg · INGV) in {len(heatmap_data)} celle di 0.05°")
         else:
-            st.warning("🌡️ Heatmap: nessun dato disponibile da EMSC al momento. Riprova tra qualche minuto.")
-
-    alert_map = _build_alert_map(
-        ma_regions, emsc_events, show_vulc, vulc_live,
-        show_heatmap, heatmap_data,
+            st.warning("🌡️ Heatmap: nessun dato sismico disponibile al momento. Riprova tra qualche minuto.")
+
+    # HTML in cache per impronta dei dati e dei layer attivi (condiviso tra sessioni)
+    cache_mappe.mostra(
+        ("mappa_rischi", ma_regions, emsc_events, show_vulc, vulc_live,
+         show_heatmap, heatmap_data, heatmap_giorni),
+        lambda: _build_alert_map(ma_regions, emsc_events, show_vulc, vulc_live,
+                                 show_heatmap, heatmap_data, heatmap_giorni),
+        width=None, height=560,
     )
-    folium_static(alert_map, width=None, height=560)
 
     # ── Legenda ───────────────────────────────────────────────────────────────
     st.markdown("---")
@@ -739,7 +655,7 @@ def show():
         <span style="color:#D97706;">⬤</span> Giallo — attività moderata<br>
         <span style="color:#EA580C;">⬤</span> Arancione — attività alta<br>
         <span style="color:#DC2626;">⬤</span> Rosso — concentrazione elevata<br>
-        <i>M≥2.0 · ultimi 7 giorni · EMSC</i>
+        <i>M≥2.0 · ultimi 7 giorni · INGV</i>
         </div>
         """, unsafe_allow_html=True)
 
@@ -805,15 +721,16 @@ def show():
         df_m3 = pd.DataFrame([{
             "Magnitudo":      f"M {ev['mag']:.1f}",
             "Luogo":          ev["luogo"],
+            "Regione":        ev["regione"],
             "Profondità (km)": ev["depth"],
             "Data/Ora":       ev["ora"],
         } for ev in italy_m3])
         df_m3.index = range(1, len(df_m3) + 1)
         st.dataframe(df_m3, use_container_width=True)
-        st.caption("Fonte: EMSC seismicportal.eu · bounding box territorio italiano · aggiorn. 5 min")
+        st.caption("Fonte: INGV (fallback EMSC/USGS) · bounding box territorio italiano · aggiorn. 5 min")
     else:
         st.markdown("---")
-        st.success("✅ Nessun terremoto M≥3.0 in Italia nelle ultime 24 ore (fonte: EMSC)")
+        st.success("✅ Nessun terremoto M≥3.0 in Italia nelle ultime 24 ore (fonte: INGV)")
 
     # ── Stato attività vulcanica LIVE ─────────────────────────────────────────
     if show_vulc and vulc_live:
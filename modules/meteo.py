@@ -1,6 +1,6 @@
 def show():
     import streamlit as st
-    import requests
+    from modules import cache_swr, gazzetteer, http_client, open_meteo
     from streamlit_js_eval import streamlit_js_eval
     import os
     from datetime import datetime, timedelta, timezone
@@ -85,7 +85,7 @@ def show():
             params_count = url.count('&') + url.count('=')
             adaptive_timeout = max(5, min(15, 5 + params_count))
             
-            response = requests.get(url, timeout=adaptive_timeout, headers=headers)
+            response = http_client.get(url, timeout=adaptive_timeout, headers=headers)
             
             if response.status_code == 200:
                 # Salva in cache rapida
@@ -136,7 +136,7 @@ def show():
             # Implementazione con retry automatico
             @resilient_api_request
             def make_request():
-                response = requests.get(url, timeout=15, headers=headers)  # Timeout più lungo per geocoding
+                response = http_client.get(url, timeout=15, headers=headers)  # Timeout più lungo per geocoding
                 if response.status_code == 200:
                     data = response.json()
                     # Cache in memoria per futuri utilizzi
@@ -162,7 +162,7 @@ def show():
     if API_KEY and API_STATUS == "OK":
         test_url = f"https://api.openweathermap.org/data/2.5/weather?q=Rome&appid={API_KEY}&units=metric&lang=it"
         try:
-            test_response = requests.get(test_url, timeout=5)
+            test_response = http_client.get(test_url, timeout=5)
             if test_response.status_code == 401:
                 API_STATUS = "INVALID"
                 API_KEY = None
@@ -171,19 +171,9 @@ def show():
 
     # ── Se API OpenWeather non disponibile → usa Open-Meteo (gratuito) ───────
     if not API_KEY:
-        _WMO = {
-            0: ("☀️", "Sereno"), 1: ("🌤️", "Prev. sereno"), 2: ("⛅", "Parz. nuvoloso"),
-            3: ("☁️", "Nuvoloso"), 45: ("🌫️", "Nebbia"), 48: ("🌫️", "Nebbia"),
-            51: ("🌦️", "Pioggerella"), 53: ("🌦️", "Pioggerella"), 55: ("🌦️", "Pioggerella"),
-            61: ("🌧️", "Pioggia leggera"), 63: ("🌧️", "Pioggia"), 65: ("🌧️", "Pioggia forte"),
-            71: ("🌨️", "Neve leggera"), 73: ("🌨️", "Neve"), 75: ("🌨️", "Neve forte"),
-            80: ("🌦️", "Rovesci"), 81: ("🌧️", "Rovesci"), 82: ("⛈️", "Rovesci forti"),
-            95: ("⛈️", "Temporale"), 96: ("⛈️", "Temporale+grandine"), 99: ("⛈️", "Temporale forte"),
-        }
-
-        def _wmo(code):
-            return _WMO.get(int(code) if code else 0, ("🌡️", "Variabile"))
+        _wmo = open_meteo.wmo
 
+        @cache_swr.swr(ttl=900)
         def _fetch_openmeteo(lat, lon):
             try:
                 url_om = (
@@ -193,7 +183,7 @@ def show():
                     f"&daily=weather_code,temperature_2m_max,temperature_2m_min,precipitation_sum"
                     f"&timezone=Europe%2FRome&forecast_days=7"
                 )
-                r = requests.get(url_om, timeout=8)
+                r = http_client.get(url_om, timeout=8)
                 if r.status_code == 200:
                     return r.json()
             except Exception:
@@ -201,8 +191,13 @@ def show():
             return None
 
         def _geocode_city(city):
+            # Gazzetteer offline prima (nome/prefisso), poi Open-Meteo, infine
+            # la ricerca offline tollerante agli errori di battitura
+            locali = gazzetteer.cerca(city, n=1, tollerante=False)
+            if locali:
+                return locali[0]["lat"], locali[0]["lon"], locali[0]["nome"]
             try:
-                r = requests.get(
+                r = http_client.get(
                     f"https://geocoding-api.open-meteo.com/v1/search?name={city}&count=1&language=it",
                     timeout=5
                 )
@@ -211,6 +206,9 @@ def show():
                     return results[0]["latitude"], results[0]["longitude"], results[0].get("name", city)
             except Exception:
                 pass
+            simili = gazzetteer.cerca(city, n=1)
+            if simili:
+                return simili[0]["lat"], simili[0]["lon"], simili[0]["nome"]
             return None, None, city
 
         st.caption("🌐 Dati: Open-Meteo (gratuito, nessuna API key) · Aggiornamento automatico")
@@ -222,9 +220,12 @@ def show():
 
         @st.cache_data(ttl=3600, show_spinner=False)
         def _reverse_geocode(lat, lon):
-            """Lat/lon → 'Comune (Provincia, Regione)' in italiano via Nominatim OSM."""
+            """Lat/lon → 'Comune (Provincia, Regione)': gazzetteer offline, poi Nominatim OSM."""
+            locale = gazzetteer.inversa(lat, lon)
+            if locale:
+                return gazzetteer.etichetta(locale)
             try:
-                r = requests.get(
+                r = http_client.get(
                     "https://nominatim.openstreetmap.org/reverse",
                     params={"lat": lat, "lon": lon, "format": "json", "zoom": 12, "addressdetails": 1},
                     headers={"User-Agent": "SismaVer2/1.0 (monitoraggio italiano)",
@@ -693,8 +694,8 @@ def show():
         # Aggiungiamo la leggenda alla mappa
         m_italy.get_root().html.add_child(folium.Element(legend_html))
         
-        # Utilizziamo i dati delle principali città italiane 
-        # Dati meteo in tempo reale tramite API OpenWeather
+        # Utilizziamo i dati delle principali città italiane
+        # Condizioni correnti di tutte le città in una sola richiesta Open-Meteo
         # Definisco le città e le loro coordinate
         cities = [
             {"city": "Milano", "lat": 45.464, "lon": 9.190},
@@ -713,50 +714,21 @@ def show():
             {"city": "Aosta", "lat": 45.737, "lon": 7.315}
         ]
         
-        # Funzione per ottenere dati meteo in tempo reale con caching
-        @st.cache_data(ttl=600)  # Cache per 10 minuti
-        def fetch_city_weather_data(city, lat, lon, api_key):
-            """Recupera dati meteo in tempo reale da OpenWeatherMap per monitoraggio multiplo."""
-            try:
-                url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={api_key}&units=metric&lang=it"
-                response = requests.get(url)
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    return None
-            except Exception as e:
-                print(f"Errore nel recupero dei dati meteo: {e}")
-                return None
-        
-        # Raccogliamo i dati meteo per tutte le città
+        # Raccogliamo i dati meteo per tutte le città (cache open_meteo, 10 min)
+        correnti = open_meteo.meteo_corrente(tuple((c["lat"], c["lon"]) for c in cities))
         precipitation_data = []
-        
-        # Otteniamo i dati meteo per ciascuna città
-        for city_data in cities:
-            weather = fetch_city_weather_data(city_data["city"], city_data["lat"], city_data["lon"], API_KEY)
-            
-            if weather:
-                # Estrai l'intensità della pioggia se presente
-                rain_intensity = 0.0
-                description = "Sereno"
-                if "rain" in weather and "1h" in weather["rain"]:
-                    rain_intensity = weather["rain"]["1h"]  # mm/h
-                elif "rain" in weather and "3h" in weather["rain"]:
-                    rain_intensity = weather["rain"]["3h"] / 3  # Approssimazione oraria
-                    
-                # Ottieni la descrizione del tempo
-                if weather.get("weather") and len(weather["weather"]) > 0:
-                    description = weather["weather"][0]["description"].capitalize()
-                    
-                # Aggiungi i dati alla lista
+        for i, city_data in enumerate(cities):
+            if correnti is not None and not np.isnan(correnti["temperature_2m"][i]):
+                pioggia = correnti["precipitation"][i]
+                umidita = correnti["relative_humidity_2m"][i]
                 precipitation_data.append({
                     "city": city_data["city"],
                     "lat": city_data["lat"],
                     "lon": city_data["lon"],
-                    "intensity": rain_intensity,
-                    "description": description,
-                    "temp": weather["main"]["temp"] if "main" in weather else None,
-                    "humidity": weather["main"]["humidity"] if "main" in weather else None
+                    "intensity": 0.0 if np.isnan(pioggia) else float(pioggia),  # mm/h
+                    "description": open_meteo.wmo(correnti["weather_code"][i])[1],
+                    "temp": float(correnti["temperature_2m"][i]),
+                    "humidity": None if np.isnan(umidita) else int(umidita)
                 })
             else:
                 # Uso dati di fallback
@@ -972,7 +944,7 @@ def show_monitoraggio_meteo():
     import pandas as pd
     import plotly.express as px
     import os
-    import requests
+    from modules import http_client
     
     st.subheader("☀️ Monitoraggio Meteo Nazionale")
 
@@ -984,7 +956,7 @@ def show_monitoraggio_meteo():
     def _fetch_meteoalarm_national():
         try:
             url = "https://feeds.meteoalarm.org/feeds/meteoalarm-legacy-atom-italy"
-            r = requests.get(url, timeout=10)
+            r = http_client.get(url, timeout=10)
             if r.status_code != 200:
                 return []
             import xml.etree.ElementTree as ET
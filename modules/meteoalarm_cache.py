@@ -1,13 +1,13 @@
 """
 meteoalarm_cache.py — Cache CONDIVISA MeteoAlarm per SismaVer2.
 
-Questo modulo contiene l'UNICA funzione di fetch con cache.
-Importato da home.py e rischi_allerte.py — garantisce che entrambe
+Questo modulo contiene l'UNICA funzione di fetch del feed; il valore è
+conservato nello snapshot "meteoalarm" aggiornato dallo scheduler.
+Importato da home.py, rischi_allerte.py e mappa_rischi.py — garantisce che
 le pagine mostrino SEMPRE lo stesso numero di allerte (stessa cache).
 """
 
-import streamlit as st
-import requests
+from modules import http_client
 
 _URLS = [
     "https://feeds.meteoalarm.org/feeds/meteoalarm-legacy-atom-italy",
@@ -15,18 +15,24 @@ _URLS = [
 ]
 
 
-@st.cache_data(ttl=120, show_spinner=False)
-def fetch_meteoalarm_raw() -> bytes | None:
-    """
-    Fetch del feed Atom MeteoAlarm per l'Italia.
-    Cache condivisa 2 minuti — usata da home.py e rischi_allerte.py.
-    Chiamare questa funzione da ENTRAMBE le pagine garantisce coerenza.
-    """
+def scarica_feed() -> bytes | None:
+    """Download del feed Atom MeteoAlarm per l'Italia (eseguito dallo scheduler)."""
     for url in _URLS:
         try:
-            r = requests.get(url, timeout=8, headers={"User-Agent": "SismaVer2/3.3"})
+            r = http_client.get(url, timeout=8, headers={"User-Agent": "SismaVer2/3.3"})
             if r.status_code == 200 and len(r.content) > 200:
                 return r.content
         except Exception:
             pass
     return None
+
+
+def fetch_meteoalarm_raw() -> bytes | None:
+    """
+    Feed Atom MeteoAlarm per l'Italia dallo snapshot condiviso, aggiornato
+    ogni 2 minuti dallo scheduler di ingestione — usato da home.py,
+    rischi_allerte.py e mappa_rischi.py.
+    Chiamare questa funzione da TUTTE le pagine garantisce coerenza.
+    """
+    from modules import ingestione
+    return ingestione.leggi("meteoalarm")
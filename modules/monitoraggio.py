@@ -10,12 +10,9 @@ from datetime import datetime, timedelta, timezone
 import plotly.express as px
 import plotly.graph_objects as go
 import folium
-from streamlit_folium import folium_static
-import requests
+from modules import cache_swr, http_client, ingestione, snapshot
 import json
 import os
-import re as _re_prov
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # ── Fuso orario italiano con ora legale automatica ───────────────────────────
 def _get_tz_italia():
@@ -27,181 +24,32 @@ def _get_tz_italia():
 
 FUSO_ORARIO_ITALIA = _get_tz_italia()
 
-# ── Mappatura Province → Regione ─────────────────────────────────────────────
-_PROVINCE_TO_REGION = {
-    "AQ": "Abruzzo", "CH": "Abruzzo", "PE": "Abruzzo", "TE": "Abruzzo",
-    "MT": "Basilicata", "PZ": "Basilicata",
-    "CS": "Calabria", "CZ": "Calabria", "KR": "Calabria", "RC": "Calabria", "VV": "Calabria",
-    "AV": "Campania", "BN": "Campania", "CE": "Campania", "NA": "Campania", "SA": "Campania",
-    "BO": "Emilia-Romagna", "FC": "Emilia-Romagna", "FE": "Emilia-Romagna", "MO": "Emilia-Romagna",
-    "PC": "Emilia-Romagna", "PR": "Emilia-Romagna", "RA": "Emilia-Romagna", "RE": "Emilia-Romagna", "RN": "Emilia-Romagna",
-    "GO": "Friuli-Venezia Giulia", "PN": "Friuli-Venezia Giulia", "TS": "Friuli-Venezia Giulia", "UD": "Friuli-Venezia Giulia",
-    "FR": "Lazio", "LT": "Lazio", "RI": "Lazio", "RM": "Lazio", "VT": "Lazio",
-    "GE": "Liguria", "IM": "Liguria", "SP": "Liguria", "SV": "Liguria",
-    "BG": "Lombardia", "BS": "Lombardia", "CO": "Lombardia", "CR": "Lombardia", "LC": "Lombardia",
-    "LO": "Lombardia", "MB": "Lombardia", "MI": "Lombardia", "MN": "Lombardia", "PV": "Lombardia",
-    "SO": "Lombardia", "VA": "Lombardia",
-    "AN": "Marche", "AP": "Marche", "FM": "Marche", "MC": "Marche", "PU": "Marche",
-    "CB": "Molise", "IS": "Molise",
-    "AL": "Piemonte", "AT": "Piemonte", "BI": "Piemonte", "CN": "Piemonte", "NO": "Piemonte",
-    "TO": "Piemonte", "VB": "Piemonte", "VC": "Piemonte",
-    "BA": "Puglia", "BR": "Puglia", "BT": "Puglia", "FG": "Puglia", "LE": "Puglia", "TA": "Puglia",
-    "CA": "Sardegna", "NU": "Sardegna", "OR": "Sardegna", "SS": "Sardegna", "SU": "Sardegna",
-    "AG": "Sicilia", "CL": "Sicilia", "CT": "Sicilia", "EN": "Sicilia", "ME": "Sicilia",
-    "PA": "Sicilia", "RG": "Sicilia", "SR": "Sicilia", "TP": "Sicilia",
-    "AR": "Toscana", "FI": "Toscana", "GR": "Toscana", "LI": "Toscana", "LU": "Toscana",
-    "MS": "Toscana", "PI": "Toscana", "PO": "Toscana", "PT": "Toscana", "SI": "Toscana",
-    "BZ": "Trentino-Alto Adige", "TN": "Trentino-Alto Adige",
-    "PG": "Umbria", "TR": "Umbria",
-    "AO": "Valle d'Aosta",
-    "BL": "Veneto", "PD": "Veneto", "RO": "Veneto", "TV": "Veneto", "VE": "Veneto", "VI": "Veneto", "VR": "Veneto",
-}
-
-_REGIONI_BBOX = {
-    "Abruzzo": (41.68, 42.90, 13.02, 14.79),
-    "Basilicata": (39.90, 41.14, 15.34, 16.87),
-    "Calabria": (37.91, 40.15, 15.63, 17.21),
-    "Campania": (39.99, 41.51, 13.75, 15.81),
-    "Emilia-Romagna": (43.73, 45.14, 9.20, 12.76),
-    "Friuli-Venezia Giulia": (45.58, 46.65, 12.32, 13.92),
-    "Lazio": (40.78, 42.84, 11.45, 14.03),
-    "Liguria": (43.77, 44.68, 7.49, 10.07),
-    "Lombardia": (44.68, 46.64, 8.50, 11.42),
-    "Marche": (42.69, 43.97, 12.18, 13.92),
-    "Molise": (41.36, 42.06, 14.10, 15.16),
-    "Piemonte": (44.06, 46.46, 6.62, 9.21),
-    "Puglia": (39.79, 42.22, 14.94, 18.55),
-    "Sardegna": (38.85, 41.32, 8.13, 9.83),
-    "Sicilia": (35.49, 38.81, 11.93, 15.65),
-    "Toscana": (42.24, 44.47, 9.69, 12.37),
-    "Trentino-Alto Adige": (45.67, 47.10, 10.38, 12.48),
-    "Umbria": (42.36, 43.62, 11.89, 13.27),
-    "Valle d'Aosta": (45.46, 45.99, 6.79, 7.94),
-    "Veneto": (44.79, 46.68, 10.62, 13.10),
-}
-
-# Coordinate dei vulcani monitorati con raggio bbox in gradi
-_VULCANI_MON = {
-    "Etna":          {"lat": 37.755, "lon": 14.995, "rad": 0.20, "obs": "INGV-CT", "ult_eruz": "Attivo"},
-    "Stromboli":     {"lat": 38.789, "lon": 15.213, "rad": 0.12, "obs": "INGV-CT", "ult_eruz": "Attivo"},
-    "Campi Flegrei": {"lat": 40.827, "lon": 14.139, "rad": 0.15, "obs": "INGV-OV", "ult_eruz": "1538"},
-    "Vesuvio":       {"lat": 40.821, "lon": 14.426, "rad": 0.10, "obs": "INGV-OV", "ult_eruz": "1944"},
-    "Vulcano":       {"lat": 38.404, "lon": 14.962, "rad": 0.12, "obs": "INGV-CT", "ult_eruz": "1888-90"},
-    "Ischia":        {"lat": 40.731, "lon": 13.897, "rad": 0.10, "obs": "INGV-OV", "ult_eruz": "1302"},
-    "Pantelleria":   {"lat": 36.769, "lon": 12.021, "rad": 0.10, "obs": "INGV-CT", "ult_eruz": "1891 (sub.)"},
-    "Colli Albani":  {"lat": 41.757, "lon": 12.700, "rad": 0.12, "obs": "INGV-RM", "ult_eruz": "5000 a.f."},
-    "Marsili":       {"lat": 39.270, "lon": 14.400, "rad": 0.30, "obs": "INGV",    "ult_eruz": "Non doc. (sub.)"},
-    "Panarea":       {"lat": 38.636, "lon": 15.064, "rad": 0.10, "obs": "INGV-CT", "ult_eruz": "2002 (sub.)"},
-}
-
-
-def _evento_in_regione(place: str, lat, lon, regione: str) -> bool:
-    """Filtro robusto: prima sigla provincia tra parentesi, poi bounding box come fallback."""
-    if not regione or regione.startswith("Italia"):
-        return True
-    try:
-        if isinstance(place, str):
-            m = _re_prov.search(r"\(([A-Z]{2})\)", place)
-            if m:
-                sigla = m.group(1)
-                reg_match = _PROVINCE_TO_REGION.get(sigla)
-                if reg_match is not None:
-                    return reg_match == regione
-        bbox = _REGIONI_BBOX.get(regione)
-        if bbox and lat is not None and lon is not None:
-            lat_min, lat_max, lon_min, lon_max = bbox
-            return (lat_min <= float(lat) <= lat_max) and (lon_min <= float(lon) <= lon_max)
-    except Exception:
-        return False
-    return False
+# ── Catalogo sismico condiviso (province → regione, bbox, store eventi) ────
+from modules import (aggregazione_mappa, cache_mappe, catalogo_sismico, declustering,
+                     registro_vulcani, serie_vulcani)
+from modules.catalogo_sismico import BBOX_ITALIA as _ITA_BBOX
 
-
-# ── Fetch INGV sismicità (modulo-level, cache 5 minuti) ──────────────────────
-@st.cache_data(ttl=300, show_spinner=False)
-def _fetch_ingv_seismic(url: str):
+# ── Sismicità dal catalogo condiviso (store in-process, refresh 5 minuti) ──
+def _fetch_eventi_sismici(regione: str, min_mag: float):
     """
-    Recupera eventi sismici da INGV FDSN con fallback a USGS.
-    Returns (geojson_dict, warning_message_or_None)
+    Eventi degli ultimi 7 giorni dal catalogo condiviso, filtrati per regione
+    (o territorio nazionale). Returns (TabellaEventi, warning_message_or_None)
     """
-    headers = {
-        "User-Agent": "SismaVer2/3.3 (https://sisma-ver-2.replit.app/)",
-        "Accept": "application/json",
-    }
-    # 1) Prova INGV principale
-    try:
-        r = requests.get(url, timeout=10, headers=headers)
-        if r.status_code == 200:
-            data = r.json()
-            if isinstance(data, dict) and isinstance(data.get("features"), list):
-                print(f"INFO INGV: {len(data['features'])} eventi")
-                return data, None
-    except Exception as e:
-        print(f"INGV primario fallito: {e}")
-
-    # 2) Fallback INGV mirror cnt.rm.ingv.it
-    try:
-        mirror_url = url.replace("webservices.ingv.it", "cnt.rm.ingv.it")
-        r = requests.get(mirror_url, timeout=10, headers=headers)
-        if r.status_code == 200:
-            data = r.json()
-            if isinstance(data, dict) and isinstance(data.get("features"), list):
-                print(f"INFO INGV mirror: {len(data['features'])} eventi")
-                return data, None
-    except Exception as e:
-        print(f"INGV mirror fallito: {e}")
-
-    # 3) Fallback EMSC (European-Mediterranean Seismological Centre)
-    try:
-        start_time = (datetime.utcnow() - timedelta(days=7)).strftime("%Y-%m-%dT%H:%M:%S")
-        emsc_url = (
-            f"https://www.seismicportal.eu/fdsnws/event/1/query?format=json"
-            f"&starttime={start_time}&minlatitude=35.0&maxlatitude=47.5"
-            f"&minlongitude=6.0&maxlongitude=20.0&minmagnitude=1.5"
-            f"&orderby=time&limit=300"
-        )
-        r = requests.get(emsc_url, timeout=10, headers=headers)
-        if r.status_code == 200:
-            data = r.json()
-            if isinstance(data, dict) and isinstance(data.get("features"), list) and data["features"]:
-                print(f"INFO EMSC fallback: {len(data['features'])} eventi")
-                return data, "⚠️ INGV temporaneamente non disponibile. Dati da EMSC (European-Mediterranean Seismological Centre)."
-    except Exception as e:
-        print(f"EMSC fallback fallito: {e}")
-
-    # 4) Fallback USGS — nota: USGS non dispone di eventi italiani M<2.0
-    try:
-        start_time = (datetime.utcnow() - timedelta(days=7)).strftime("%Y-%m-%d")
-        usgs_url = (
-            f"https://earthquake.usgs.gov/fdsnws/event/1/query?format=geojson"
-            f"&starttime={start_time}&minlatitude=35.0&maxlatitude=47.5"
-            f"&minlongitude=6.0&maxlongitude=20.0&minmagnitude=1.5"
-            f"&limit=300"
-        )
-        r = requests.get(usgs_url, timeout=10, headers=headers)
-        if r.status_code == 200:
-            data = r.json()
-            if isinstance(data, dict) and isinstance(data.get("features"), list) and data["features"]:
-                print(f"INFO USGS fallback: {len(data['features'])} eventi")
-                return data, "⚠️ INGV temporaneamente non disponibile. Dati da USGS (United States Geological Survey)."
-    except Exception as e:
-        print(f"USGS fallback fallito: {e}")
-
-    # 5) Struttura vuota valida
-    return {"features": [], "type": "FeatureCollection", "metadata": {}}, \
-           "⚠️ Impossibile accedere ai dati sismici — riprova tra qualche minuto."
-
-
-# ── Fetch attività sismica per vulcano (cache 5 minuti) ─────────────────────
-@st.cache_data(ttl=300, show_spinner=False)
+    if not regione or regione.startswith("Italia"):
+        evs = catalogo_sismico.eventi(days=7, min_mag=min_mag, bbox=_ITA_BBOX)
+    else:
+        evs = catalogo_sismico.eventi(days=7, min_mag=min_mag, regione=regione)
+    return evs, catalogo_sismico.stato()["avviso"]
+
+
+# ── Attività sismica per vulcano (snapshot di ingestione, refresh 5 minuti) ──
 def _fetch_volcano_seismicity_all():
     """
-    Fetch parallelo INGV FDSN per ogni vulcano monitorato.
-    Ritorna dict: nome_vulcano -> {count, level, label, emoji, col}
+    Statistiche eventi 7gg per vulcano dallo snapshot "vulcani" (una query
+    INGV FDSN sul riquadro vulcanico, partizionata per area), classificate.
+    Ritorna dict: nome_vulcano -> {count, level, label, emoji, col} più le
+    distribuzioni (mag_max, prof_mediana, ist_mag, ist_prof) se disponibili
     """
-    start = (datetime.utcnow() - timedelta(days=7)).strftime("%Y-%m-%dT%H:%M:%S")
-
-    _HDR_V = {"User-Agent": "SismaVer2/3.3 (https://sisma-ver-2.replit.app/)"}
-
     def _classify_v(count):
         if count >= 20:
             return {"count": count, "level": "ROSSO",    "emoji": "🔴", "label": f"Alta ({count} ev/7gg)",    "col": "#DC2626"}
@@ -212,44 +60,34 @@ def _fetch_volcano_seismicity_all():
         else:
             return {"count": 0,     "level": "VERDE",    "emoji": "🟢", "label": "Silente (0 ev/7gg)",       "col": "#16A34A"}
 
-    def _one(name, cfg):
-        lat, lon, rad = cfg["lat"], cfg["lon"], cfg["rad"]
-        # Tentativo 1: INGV
-        try:
-            r = requests.get(
-                f"https://webservices.ingv.it/fdsnws/event/1/query?format=geojson"
-                f"&starttime={start}&minmag=0.5&lat={lat}&lon={lon}&maxradius={rad}&limit=100",
-                timeout=8, headers=_HDR_V)
-            if r.status_code == 200:
-                count = len(r.json().get("features", []))
-                return name, _classify_v(count)
-        except Exception as e:
-            print(f"Vulcano {name} INGV error: {e}")
-        # Tentativo 2: EMSC fallback (M≥1.0 nell'area)
-        try:
-            r = requests.get(
-                f"https://www.seismicportal.eu/fdsnws/event/1/query?format=json"
-                f"&starttime={start}&minmagnitude=1.0"
-                f"&lat={lat}&lon={lon}&maxradius={rad}&limit=100",
-                timeout=8, headers=_HDR_V)
-            if r.status_code == 200:
-                count = len(r.json().get("features", []))
-                result = _classify_v(count)
-                result["fonte"] = "EMSC"
-                return name, result
-        except Exception as e:
-            print(f"Vulcano {name} EMSC error: {e}")
-        return name, {"count": None, "level": "N/D", "emoji": "⚫", "label": "N/D", "col": "#94A3B8"}
-
+    _ND = {"count": None, "level": "N/D", "emoji": "⚫", "label": "N/D", "col": "#94A3B8"}
+    vulcani = ingestione.leggi("vulcani") or {}
     results = {}
-    with ThreadPoolExecutor(max_workers=6) as ex:
-        futs = {ex.submit(_one, n, d): n for n, d in _VULCANI_MON.items()}
-        for ft in as_completed(futs):
-            n, d = ft.result()
-            results[n] = d
+    for name in registro_vulcani.VULCANI:
+        v = vulcani.get(name)
+        if v is None or v["count"] is None:
+            results[name] = dict(_ND)
+            continue
+        results[name] = _classify_v(v["count"])
+        for k in ("mag_max", "prof_mediana", "ist_mag", "ist_prof"):
+            if k in v:
+                results[name][k] = v[k]
+        if v["fonte"] not in ("INGV", None):
+            results[name]["fonte"] = v["fonte"]
     return results
 
 
+def _tendenza(nome: str) -> str:
+    """Rapporto STA/LTA (24h / 30gg) dalle serie locali, con freccia se in aumento."""
+    try:
+        var = serie_vulcani.variazione(nome)
+    except Exception:
+        return "N/D"
+    if var["rapporto"] is None:
+        return "N/D"
+    return f"{'↑ ' if var['in_aumento'] else ''}{var['rapporto']:.2f}"
+
+
 def show():
     # Auto-refresh ogni 5 minuti
     if _AUTOREFRESH:
@@ -257,6 +95,9 @@ def show():
 
     from modules.banner_utils import banner_monitoraggio
     banner_monitoraggio()
+    marcatore = snapshot.marcatore("catalogo_recente", "vulcani", "meteoalarm")
+    if marcatore:
+        st.caption(marcatore)
 
     # ── Sidebar ──────────────────────────────────────────────────────────────
     st.sidebar.subheader("🗄️ Filtra visualizzazione")
@@ -305,55 +146,16 @@ def show():
         with col_refresh:
             if st.button("🔄 Aggiorna dati"):
                 st.cache_data.clear()
+                cache_swr.invalida()
+                catalogo_sismico.invalida()
                 st.rerun()
         with col_time:
             st.markdown(f"**🕒 Dati aggiornati:** {current_time.strftime('%d/%m/%Y %H:%M:%S')} (IT) · Cache 5 min")
 
-        # Costruisci URL INGV
-        start_date = (datetime.utcnow() - timedelta(days=7)).strftime("%Y-%m-%dT%H:%M:%S")
         min_mag = 0.5
-        if regione_scelta == "Italia (Visione nazionale)":
-            ingv_url = (
-                f"https://webservices.ingv.it/fdsnws/event/1/query?format=geojson"
-                f"&starttime={start_date}&minmag={min_mag}&limit=300"
-            )
-        else:
-            lat_c, lon_c = regioni_coords.get(regione_scelta, [42.0, 12.5])
-            ingv_url = (
-                f"https://webservices.ingv.it/fdsnws/event/1/query?format=geojson"
-                f"&starttime={start_date}&minmag={min_mag}"
-                f"&lat={lat_c}&lon={lon_c}&maxradius=1.5&limit=300"
-            )
-
         with st.spinner("⏳ Recupero dati sismici INGV in corso..."):
-            sensor_data, error_msg = _fetch_ingv_seismic(ingv_url)
-            features = sensor_data.get("features", [])
-
-        # Filtro bbox Italia (solo visione nazionale) o per regione
-        _is_nazionale = (not regione_scelta) or regione_scelta.startswith("Italia")
-        _ITA_BBOX = (35.5, 47.1, 6.6, 18.55)
-        _tot_pre = len(features)
-        _filtered = []
-        for _f in features:
-            try:
-                _props = _f.get("properties", {}) or {}
-                _geom = (_f.get("geometry", {}) or {}).get("coordinates", []) or []
-                _place = _props.get("place", "") or ""
-                _lon = _geom[0] if len(_geom) > 0 else None
-                _lat = _geom[1] if len(_geom) > 1 else None
-                if _is_nazionale:
-                    if _lat is None or _lon is None:
-                        continue
-                    la, lo = float(_lat), float(_lon)
-                    if _ITA_BBOX[0] <= la <= _ITA_BBOX[1] and _ITA_BBOX[2] <= lo <= _ITA_BBOX[3]:
-                        _filtered.append(_f)
-                else:
-                    if _evento_in_regione(_place, _lat, _lon, regione_scelta):
-                        _filtered.append(_f)
-            except Exception:
-                continue
-        features = _filtered
-        _label = "Italia" if _is_nazionale else regione_scelta
+            features, error_msg = _fetch_eventi_sismici(regione_scelta, min_mag)
+
 
         if error_msg:
             if error_msg.startswith("✅"):
@@ -361,12 +163,6 @@ def show():
             else:
                 st.warning(error_msg)
 
-        if _tot_pre and not features:
-            st.info(f"Nessun evento nelle ultime 24 ore con epicentro in {_label} "
-                    f"(esclusi {_tot_pre} eventi esteri/limitrofi).")
-        elif _tot_pre != len(features) and len(features) > 0:
-            st.caption(f"🔎 Filtrati {len(features)} eventi su {_tot_pre} con epicentro effettivo in {_label}.")
-
         if not features:
             st.info(f"Nessun evento sismico rilevato negli ultimi 7 giorni "
                     f"{'in ' + regione_scelta if regione_scelta != 'Italia (Visione nazionale)' else 'in Italia'}.")
@@ -375,93 +171,103 @@ def show():
                 "[Bollettini ufficiali](https://www.ingv.it/cat/it/comunicati-stampa)"
             )
         else:
-            max_events = 100
-            limited_features = features[:max_events]
-
-            seismic_data = []
-            for feature in limited_features:
-                props = feature["properties"]
-                geom = feature["geometry"]["coordinates"]
-                event_time = props.get("time", "")
-                try:
-                    if isinstance(event_time, (int, float)):
-                        dt_it = datetime.fromtimestamp(event_time / 1000.0, FUSO_ORARIO_ITALIA)
-                        formatted_time = dt_it.strftime("%d/%m/%Y %H:%M:%S") + " (IT)"
-                    elif isinstance(event_time, str):
-                        et = event_time.replace("Z", "+00:00")
-                        dt = datetime.fromisoformat(et)
-                        dt_it = dt.astimezone(FUSO_ORARIO_ITALIA)
-                        formatted_time = dt_it.strftime("%d/%m/%Y %H:%M:%S") + " (IT)"
-                    else:
-                        formatted_time = str(event_time)
-                except Exception:
-                    formatted_time = str(event_time)
-
-                seismic_data.append({
-                    "Luogo": props.get("place", "N/A"),
-                    "Magnitudo": props.get("mag", 0),
-                    "Data/Ora": formatted_time,
-                    "Profondità (km)": round(geom[2], 1) if len(geom) > 2 else 0,
-                    "Latitudine": geom[1],
-                    "Longitudine": geom[0],
-                })
-
-            df_seismic = pd.DataFrame(seismic_data)
+            # ── Sequenze sismiche (declustering Gardner-Knopoff) ─────────────
+            nazionale = regione_scelta == "Italia (Visione nazionale)"
+            seq = declustering.sequenze_recenti(
+                regione=None if nazionale else regione_scelta, min_mag=min_mag,
+                bbox=_ITA_BBOX if nazionale else None)
+            pos = pd.Index(seq["id"]).get_indexer(features.id)
+            trovati = pos >= 0
+            cluster = np.where(trovati, seq["cluster"][np.maximum(pos, 0)], -1)
+            ruolo = np.where(trovati, seq["ruolo"][np.maximum(pos, 0)], declustering.ISOLATO)
+            n_per_cluster = dict(zip(seq["riepilogo"]["cluster"], seq["riepilogo"]["n_eventi"]))
+
+            raggruppa = st.checkbox(
+                "🔗 Raggruppa le sequenze sismiche (mostra solo l'evento principale di ogni sequenza)",
+                value=True, key="monit_raggruppa",
+            )
+            if raggruppa:
+                principali = (ruolo == declustering.ISOLATO) | (ruolo == declustering.PRINCIPALE)
+                vista, cluster_vista = features.prendi(principali), cluster[principali]
+            else:
+                vista, cluster_vista = features, cluster
+
+            # Tabella completa, costruita per colonne (nessun limite di righe)
+            df_v = vista.to_dataframe()
+            ora_it = df_v["time"].dt.tz_convert(FUSO_ORARIO_ITALIA)
+            df_seismic = pd.DataFrame({
+                "Luogo": df_v["place"].astype(str).replace("", "N/A"),
+                "Magnitudo": df_v["mag"].astype(float).round(2),
+                "Data/Ora": ora_it.dt.strftime("%d/%m/%Y %H:%M:%S") + " (IT)",
+                "Profondità (km)": df_v["depth"].astype(float).round(1).fillna(0),
+                "Latitudine": df_v["lat"],
+                "Longitudine": df_v["lon"],
+            })
+            if raggruppa:
+                df_seismic["Eventi in sequenza"] = (pd.Series(cluster_vista).map(n_per_cluster)
+                                                    .fillna(1).astype(int))
             df_seismic.index = range(1, len(df_seismic) + 1)
 
             st.subheader(f"🔍 Eventi sismici in tempo reale — {regione_scelta}")
-            if len(features) > max_events:
-                st.caption(f"Visualizzati {max_events} eventi su {len(features)} totali (ultimi 7 giorni, M≥{min_mag})")
+            if raggruppa and len(vista) < len(features):
+                st.caption(f"{len(vista)} righe per {len(features)} eventi: le repliche e i "
+                           f"precursori sono raggruppati sotto l'evento principale.")
             st.dataframe(df_seismic, use_container_width=True)
 
+            rie = seq["riepilogo"]
+            rie = rie[rie["n_eventi"] >= 3]
+            if not rie.empty:
+                with st.expander(f"🔗 Sequenze sismiche in corso ({len(rie)})", expanded=False):
+                    tab_seq = pd.DataFrame({
+                        "Area (evento principale)": rie["place"].fillna("").replace("", "N/A"),
+                        "Inizio": pd.to_datetime(rie["inizio_ms"], unit="ms", utc=True)
+                                    .dt.tz_convert(FUSO_ORARIO_ITALIA).dt.strftime("%d/%m %H:%M"),
+                        "Durata (h)": rie["durata_h"].round(1),
+                        "Mmax": rie["mag_max"].round(1),
+                        "Eventi": rie["n_eventi"],
+                        "Precursori": rie["n_precursori"],
+                        "Repliche": rie["n_repliche"],
+                    })
+                    st.dataframe(tab_seq, use_container_width=True, hide_index=True)
+                    st.caption("Declustering a finestre spazio-temporali di Gardner-Knopoff "
+                               "(sequenze con almeno 3 eventi).")
+
             # ── Mappa eventi ─────────────────────────────────────────────────
             map_center = regioni_coords.get(regione_scelta, [41.9, 12.5]) \
                 if regione_scelta != "Italia (Visione nazionale)" else [41.9, 12.5]
             zoom = 6 if regione_scelta == "Italia (Visione nazionale)" else 8
-            m = folium.Map(location=map_center, zoom_start=zoom)
-
-            for _, row in df_seismic.iterrows():
-                mag = row["Magnitudo"]
-                color = "green" if mag < 3.0 else "orange" if mag < 4.0 else "red"
-                eq_lat, eq_lon = row["Latitudine"], row["Longitudine"]
-                _eqg  = f"https://www.google.com/maps/dir/?api=1&destination={eq_lat},{eq_lon}&travelmode=driving"
-                _eqwz = f"https://waze.com/ul?ll={eq_lat},{eq_lon}&navigate=yes"
-                _eqam = f"https://maps.apple.com/?daddr={eq_lat},{eq_lon}&dirflg=d"
-                popup_text = (
-                    '<div style="min-width:210px;font-family:sans-serif;font-size:12px;">'
-                    f'<h4 style="color:#DC2626;margin:0 0 5px 0;font-size:13px;border-bottom:2px solid #DC2626;padding-bottom:3px;">🌊 Evento sismico</h4>'
-                    f'<p style="margin:0 0 2px 0;"><b>Luogo:</b> {row["Luogo"]}</p>'
-                    f'<p style="margin:0 0 2px 0;"><b>Magnitudo:</b> {mag}</p>'
-                    f'<p style="margin:0 0 2px 0;"><b>Data/Ora:</b> {row["Data/Ora"]}</p>'
-                    f'<p style="margin:0 0 6px 0;"><b>Profondità:</b> {row["Profondità (km)"]} km</p>'
-                    '<div style="font-size:10px;color:#888;margin-bottom:4px;">📍 Naviga all\'epicentro:</div>'
-                    '<div style="display:flex;gap:4px;">'
-                    f'<a href="{_eqg}" target="_blank" style="background:#4285F4;color:white;padding:3px 6px;text-decoration:none;border-radius:3px;font-size:10px;font-weight:600;">🗺️ GMaps</a>'
-                    f'<a href="{_eqwz}" target="_blank" style="background:#00BCD4;color:#000;padding:3px 6px;text-decoration:none;border-radius:3px;font-size:10px;font-weight:600;">🚗 Waze</a>'
-                    f'<a href="{_eqam}" target="_blank" style="background:#555;color:white;padding:3px 6px;text-decoration:none;border-radius:3px;font-size:10px;font-weight:600;">🍎 Maps</a>'
-                    '</div></div>'
-                )
-                folium.Circle(
-                    location=[eq_lat, eq_lon],
-                    radius=mag * 5000,
-                    color=color, fill=True, fill_opacity=0.4,
-                    popup=folium.Popup(popup_text, max_width=270)
-                ).add_to(m)
+            finestra_mappa = st.radio(
+                "Finestra della mappa", ["7 giorni", "30 giorni", "90 giorni"],
+                horizontal=True, key="monit_finestra_mappa",
+            )
+            if finestra_mappa == "7 giorni":
+                eventi_mappa = vista
+            else:
+                # Finestre lunghe dallo store storico (M≥1.5), aggregate per cella
+                giorni_mappa = int(finestra_mappa.split()[0])
+                eventi_mappa = catalogo_sismico.eventi_storici(
+                    days=giorni_mappa, min_mag=1.5,
+                    regione=None if nazionale else regione_scelta,
+                    bbox=_ITA_BBOX if nazionale else None)
+
+            def _mappa_eventi():
+                m = folium.Map(location=map_center, zoom_start=zoom)
+                aggregazione_mappa.LivelloEventi(
+                    aggregazione_mappa.aggrega(eventi_mappa)).add_to(m)
+                return m
 
             st.subheader("🗺️ Mappa eventi sismici in tempo reale")
-            folium_static(m, width=1100, height=520)
+            cache_mappe.mostra(("monit_eventi", map_center, zoom, eventi_mappa),
+                               _mappa_eventi, width=1100, height=520)
+            if len(eventi_mappa) > aggregazione_mappa.SOGLIA_DETTAGLIO:
+                st.caption(f"{len(eventi_mappa)} eventi ({finestra_mappa}): le aree con più "
+                           f"eventi sono raggruppate (numero = eventi, colore = magnitudo "
+                           f"massima); ingrandisci la mappa per separarle nei singoli eventi.")
 
             # ── Grafico magnitudo nel tempo ───────────────────────────────────
             st.subheader("📈 Andamento sismico eventi recenti")
             try:
-                def _parse_date(date_str):
-                    s = str(date_str).replace(" (IT)", "")
-                    try:
-                        return pd.to_datetime(s)
-                    except Exception:
-                        return pd.Timestamp.now()
-
-                df_seismic["Data/Ora Obj"] = df_seismic["Data/Ora"].apply(_parse_date)
+                df_seismic["Data/Ora Obj"] = ora_it.dt.tz_localize(None).to_numpy()
                 df_seismic = df_seismic.sort_values("Data/Ora Obj")
 
                 fig = px.scatter(
@@ -520,49 +326,26 @@ def show():
             # ── Mappa di intensità sismica ────────────────────────────────────
             st.subheader("🗺️ Mappa di intensità sismica")
             try:
-                intensity_map = folium.Map(location=map_center, zoom_start=zoom, tiles="CartoDB positron")
-                città_italiane = {
-                    "Roma": [41.9028, 12.4964], "Milano": [45.4642, 9.1900],
-                    "Napoli": [40.8518, 14.2681], "Palermo": [38.1157, 13.3615],
-                    "Torino": [45.0703, 7.6869], "Bologna": [44.4949, 11.3426],
-                }
-                for città, pos in città_italiane.items():
-                    folium.Marker(pos, popup=città, icon=folium.Icon(color="blue", icon="info-sign")).add_to(intensity_map)
-
-                for _, row in df_seismic.iterrows():
-                    try:
-                        lat = float(row["Latitudine"])
-                        lon = float(row["Longitudine"])
-                        mag = float(row["Magnitudo"])
-                        depth = float(row["Profondità (km)"])
-                        if not (35.0 <= lat <= 48.0 and 6.0 <= lon <= 19.0):
-                            continue
-                        color = "red" if mag >= 4.0 else "orange" if mag >= 3.0 else "yellow" if mag >= 2.0 else "green"
-                        _ig  = f"https://www.google.com/maps/dir/?api=1&destination={lat},{lon}&travelmode=driving"
-                        _iwz = f"https://waze.com/ul?ll={lat},{lon}&navigate=yes"
-                        _iam = f"https://maps.apple.com/?daddr={lat},{lon}&dirflg=d"
-                        popup_text = (
-                            '<div style="min-width:200px;font-family:sans-serif;font-size:12px;">'
-                            f'<h4 style="color:#DC2626;margin:0 0 5px 0;font-size:13px;border-bottom:2px solid #DC2626;padding-bottom:3px;">🌊 Evento sismico</h4>'
-                            f'<p style="margin:0 0 2px 0;"><b>Magnitudo:</b> {mag}</p>'
-                            f'<p style="margin:0 0 2px 0;"><b>Profondità:</b> {depth} km</p>'
-                            f'<p style="margin:0 0 2px 0;"><b>Data:</b> {row.get("Data/Ora", "N/D")}</p>'
-                            f'<p style="margin:0 0 6px 0;"><b>Località:</b> {row.get("Luogo", "N/D")}</p>'
-                            '<div style="display:flex;gap:3px;">'
-                            f'<a href="{_ig}" target="_blank" style="background:#4285F4;color:white;padding:3px 5px;text-decoration:none;border-radius:3px;font-size:10px;font-weight:600;">🗺️ GMaps</a>'
-                            f'<a href="{_iwz}" target="_blank" style="background:#00BCD4;color:#000;padding:3px 5px;text-decoration:none;border-radius:3px;font-size:10px;font-weight:600;">🚗 Waze</a>'
-                            f'<a href="{_iam}" target="_blank" style="background:#555;color:white;padding:3px 5px;text-decoration:none;border-radius:3px;font-size:10px;font-weight:600;">🍎 Maps</a>'
-                            '</div></div>'
-                        )
-                        folium.Circle(
-                            location=[lat, lon], radius=mag * 5000,
-                            color=color, fill=True, fill_opacity=0.4,
-                            popup=folium.Popup(popup_text, max_width=260)
-                        ).add_to(intensity_map)
-                    except Exception:
-                        continue
-
-                folium_static(intensity_map, width=1100, height=520)
+                nel_riquadro = vista.prendi(vista.maschera(bbox=(35.0, 48.0, 6.0, 19.0)))
+
+                def _mappa_intensita():
+                    intensity_map = folium.Map(location=map_center, zoom_start=zoom, tiles="CartoDB positron")
+                    città_italiane = {
+                        "Roma": [41.9028, 12.4964], "Milano": [45.4642, 9.1900],
+                        "Napoli": [40.8518, 14.2681], "Palermo": [38.1157, 13.3615],
+                        "Torino": [45.0703, 7.6869], "Bologna": [44.4949, 11.3426],
+                    }
+                    for città, pos in città_italiane.items():
+                        folium.Marker(pos, popup=città, icon=folium.Icon(color="blue", icon="info-sign")).add_to(intensity_map)
+
+                    aggregazione_mappa.LivelloEventi(
+                        aggregazione_mappa.aggrega(nel_riquadro),
+                        colori=((4.0, "red"), (3.0, "orange"), (2.0, "yellow"), (0.0, "green")),
+                    ).add_to(intensity_map)
+                    return intensity_map
+
+                cache_mappe.mostra(("monit_intensita", map_center, zoom, nel_riquadro),
+                                   _mappa_intensita, width=1100, height=520)
                 st.caption("La dimensione e il colore dei cerchi rappresentano la magnitudo dell'evento.")
             except Exception as map_err:
                 st.error(f"Errore nella mappa di intensità: {map_err}")
@@ -629,7 +412,7 @@ def show():
 
             # Tabella dinamica con livelli da INGV FDSN
             vulc_rows = []
-            for nome, cfg in _VULCANI_MON.items():
+            for nome, cfg in registro_vulcani.VULCANI.items():
                 live = vulc_live.get(nome, {})
                 count_str = f"{live.get('count', 'N/D')}" if live.get("count") is not None else "N/D"
                 vulc_rows.append({
@@ -637,6 +420,9 @@ def show():
                     "Osservatorio": cfg["obs"],
                     "Ultima eruzione": cfg["ult_eruz"],
                     "Sismicità 7gg": count_str + " eventi",
+                    "Mmax 7gg": f"{live['mag_max']:.1f}" if live.get("mag_max") is not None else "—",
+                    "Prof. mediana": f"{live['prof_mediana']:.1f} km" if live.get("prof_mediana") is not None else "—",
+                    "STA/LTA 24h": _tendenza(nome),
                     "Livello attività": live.get("level", "N/D"),
                     "Stato": live.get("emoji", "⚫") + " " + live.get("label", "N/D"),
                 })
@@ -669,36 +455,39 @@ def show():
                 "ROSSO": "red", "ARANCIONE": "orange", "GIALLO": "beige",
                 "VERDE": "green", "N/D": "gray",
             }
-            vmap = folium.Map(location=[39.5, 13.5], zoom_start=5)
-            for nome, cfg in _VULCANI_MON.items():
-                live = vulc_live.get(nome, {})
-                col_m = alert_color_map.get(live.get("level", "N/D"), "gray")
-                coords = [cfg["lat"], cfg["lon"]]
-                _vmg  = f"https://www.google.com/maps/dir/?api=1&destination={cfg['lat']},{cfg['lon']}&travelmode=driving"
-                _vmwz = f"https://waze.com/ul?ll={cfg['lat']},{cfg['lon']}&navigate=yes"
-                _vmam = f"https://maps.apple.com/?daddr={cfg['lat']},{cfg['lon']}&dirflg=d"
-                popup_html = (
-                    '<div style="min-width:230px;font-family:sans-serif;font-size:13px;">'
-                    f'<h4 style="color:#DC2626;margin:0 0 6px 0;font-size:14px;border-bottom:2px solid #DC2626;padding-bottom:3px;">🌋 {nome}</h4>'
-                    f'<p style="margin:0 0 2px 0;"><b>Osservatorio:</b> {cfg["obs"]}</p>'
-                    f'<p style="margin:0 0 2px 0;"><b>Ultima eruzione:</b> {cfg["ult_eruz"]}</p>'
-                    f'<p style="margin:0 0 2px 0;"><b>Sismicità (7gg):</b> {live.get("label", "N/D")}</p>'
-                    f'<p style="margin:0 0 6px 0;"><b>Livello:</b> {live.get("emoji","⚫")} {live.get("level","N/D")}</p>'
-                    f'<p style="font-size:10px;color:#888;font-family:monospace;">{cfg["lat"]:.4f}, {cfg["lon"]:.4f}</p>'
-                    '<div style="display:flex;gap:4px;">'
-                    f'<a href="{_vmg}" target="_blank" style="background:#4285F4;color:white;padding:4px 7px;text-decoration:none;border-radius:4px;font-size:11px;font-weight:600;">🗺️ GMaps</a>'
-                    f'<a href="{_vmwz}" target="_blank" style="background:#00BCD4;color:#000;padding:4px 7px;text-decoration:none;border-radius:4px;font-size:11px;font-weight:600;">🚗 Waze</a>'
-                    f'<a href="{_vmam}" target="_blank" style="background:#555;color:white;padding:4px 7px;text-decoration:none;border-radius:4px;font-size:11px;font-weight:600;">🍎 Maps</a>'
-                    '</div></div>'
-                )
-                folium.Marker(
-                    location=coords,
-                    popup=folium.Popup(popup_html, max_width=280),
-                    icon=folium.Icon(color=col_m, icon="fire", prefix="fa"),
-                    tooltip=nome,
-                ).add_to(vmap)
-
-            folium_static(vmap, width=1100, height=520)
+
+            def _mappa_vulcani():
+                vmap = folium.Map(location=[39.5, 13.5], zoom_start=5)
+                for nome, cfg in registro_vulcani.VULCANI.items():
+                    live = vulc_live.get(nome, {})
+                    col_m = alert_color_map.get(live.get("level", "N/D"), "gray")
+                    coords = [cfg["lat"], cfg["lon"]]
+                    _vmg  = f"https://www.google.com/maps/dir/?api=1&destination={cfg['lat']},{cfg['lon']}&travelmode=driving"
+                    _vmwz = f"https://waze.com/ul?ll={cfg['lat']},{cfg['lon']}&navigate=yes"
+                    _vmam = f"https://maps.apple.com/?daddr={cfg['lat']},{cfg['lon']}&dirflg=d"
+                    popup_html = (
+                        '<div style="min-width:230px;font-family:sans-serif;font-size:13px;">'
+                        f'<h4 style="color:#DC2626;margin:0 0 6px 0;font-size:14px;border-bottom:2px solid #DC2626;padding-bottom:3px;">🌋 {nome}</h4>'
+                        f'<p style="margin:0 0 2px 0;"><b>Osservatorio:</b> {cfg["obs"]}</p>'
+                        f'<p style="margin:0 0 2px 0;"><b>Ultima eruzione:</b> {cfg["ult_eruz"]}</p>'
+                        f'<p style="margin:0 0 2px 0;"><b>Sismicità (7gg):</b> {live.get("label", "N/D")}</p>'
+                        f'<p style="margin:0 0 6px 0;"><b>Livello:</b> {live.get("emoji","⚫")} {live.get("level","N/D")}</p>'
+                        f'<p style="font-size:10px;color:#888;font-family:monospace;">{cfg["lat"]:.4f}, {cfg["lon"]:.4f}</p>'
+                        '<div style="display:flex;gap:4px;">'
+                        f'<a href="{_vmg}" target="_blank" style="background:#4285F4;color:white;padding:4px 7px;text-decoration:none;border-radius:4px;font-size:11px;font-weight:600;">🗺️ GMaps</a>'
+                        f'<a href="{_vmwz}" target="_blank" style="background:#00BCD4;color:#000;padding:4px 7px;text-decoration:none;border-radius:4px;font-size:11px;font-weight:600;">🚗 Waze</a>'
+                        f'<a href="{_vmam}" target="_blank" style="background:#555;color:white;padding:4px 7px;text-decoration:none;border-radius:4px;font-size:11px;font-weight:600;">🍎 Maps</a>'
+                        '</div></div>'
+                    )
+                    folium.Marker(
+                        location=coords,
+                        popup=folium.Popup(popup_html, max_width=280),
+                        icon=folium.Icon(color=col_m, icon="fire", prefix="fa"),
+                        tooltip=nome,
+                    ).add_to(vmap)
+                return vmap
+
+            cache_mappe.mostra(("monit_vulcani", vulc_live), _mappa_vulcani, width=1100, height=520)
             st.caption("Colori: 🟢 Verde=Silente · 🟡 Giallo=Bassa attività · 🟠 Arancione=Moderata · 🔴 Rosso=Elevata")
 
             # Tabella vulcani estesa (inclusi tutti i vulcani italiani)
@@ -726,19 +515,14 @@ def show():
 
         else:
             # ── Vista per regione specifica ───────────────────────────────────
-            # Solo vulcani presenti in _VULCANI_MON (con dati live INGV/EMSC)
+            # Solo vulcani del registro condiviso (con dati live)
             # Lipari-Vulcanello, Ustica, Linosa, Monte Amiata non hanno monitoraggio
             # in tempo reale → sono nell'elenco completo ma non nel selectbox
             # Marsili è in mare aperto → solo vista nazionale
-            regioni_vulcaniche = {
-                "Campania": ["Vesuvio", "Campi Flegrei", "Ischia"],
-                "Sicilia":  ["Etna", "Stromboli", "Vulcano", "Pantelleria", "Panarea"],
-                "Lazio":    ["Colli Albani"],
-            }
+            vulcani_disponibili = registro_vulcani.vulcani_regione(regione_scelta)
 
-            if regione_scelta in regioni_vulcaniche:
+            if vulcani_disponibili:
                 st.subheader(f"🌋 Monitoraggio vulcanico — {regione_scelta}")
-                vulcani_disponibili = regioni_vulcaniche[regione_scelta]
                 vulcano_selezionato = st.selectbox("Seleziona vulcano", vulcani_disponibili)
 
                 # ── Scheda dettaglio per ogni vulcano ─────────────────────────
@@ -758,7 +542,7 @@ def show():
                 else:
                     st.success(f"🟢 Vulcano SILENTE — {vulcano_selezionato}: {label_v}")
 
-                cfg_v = _VULCANI_MON.get(vulcano_selezionato, {})
+                cfg_v = registro_vulcani.VULCANI.get(vulcano_selezionato, {})
                 col1, col2, col3 = st.columns(3)
                 with col1:
                     st.metric(
@@ -771,6 +555,28 @@ def show():
                 with col3:
                     st.metric("Osservatorio", cfg_v.get("obs", "INGV"))
 
+                # Distribuzioni magnitudo / profondità dalla partizione locale
+                if count_v and live_v.get("ist_mag"):
+                    cm = registro_vulcani.CLASSI_MAG
+                    cp = registro_vulcani.CLASSI_PROF_KM
+                    etich_mag = [f"{a:.1f}–{b:.1f}" for a, b in zip(cm, cm[1:])] + [f"≥{cm[-1]:.1f}"]
+                    etich_prof = [f"{a:.0f}–{b:.0f}" for a, b in zip(cp, cp[1:])] + [f"≥{cp[-1]:.0f}"]
+                    dcol1, dcol2 = st.columns(2)
+                    with dcol1:
+                        fig_m = px.bar(x=etich_mag, y=live_v["ist_mag"],
+                                       labels={"x": "Magnitudo", "y": "Eventi"},
+                                       title=f"Magnitudo 7gg · Mmax {live_v.get('mag_max')}")
+                        fig_m.update_traces(marker_color="#EA580C")
+                        fig_m.update_layout(height=260, margin=dict(l=10, r=10, t=40, b=10))
+                        st.plotly_chart(fig_m, use_container_width=True)
+                    with dcol2:
+                        fig_p = px.bar(x=etich_prof, y=live_v["ist_prof"],
+                                       labels={"x": "Profondità (km)", "y": "Eventi"},
+                                       title=f"Profondità 7gg · mediana {live_v.get('prof_mediana')} km")
+                        fig_p.update_traces(marker_color="#2563EB")
+                        fig_p.update_layout(height=260, margin=dict(l=10, r=10, t=40, b=10))
+                        st.plotly_chart(fig_p, use_container_width=True)
+
                 # Link diretti INGV per questo vulcano
                 ingv_links = {
                     "Vesuvio":       "https://www.ov.ingv.it/index.php/rete-fissa",
@@ -948,7 +754,7 @@ Il settore submarino si trova a profondità tra 10 e 300 m.
         def _meteoalarm_allerte_italia():
             try:
                 url = "https://feeds.meteoalarm.org/feeds/meteoalarm-legacy-atom-italy"
-                r = requests.get(url, timeout=10)
+                r = http_client.get(url, timeout=10)
                 if r.status_code != 200:
                     return []
                 import xml.etree.ElementTree as ET
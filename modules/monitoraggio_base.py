@@ -1,7 +1,7 @@
 
 import streamlit as st
 import pandas as pd
-import requests
+from modules import http_client
 import pydeck as pdk
 import plotly.express as px
 from datetime import datetime
@@ -21,7 +21,7 @@ def show():
     city = st.text_input("📍 Inserisci una città per visualizzare il meteo", value="Napoli")
     if api_key and city:
         weather_url = f"https://api.openweathermap.org/data/2.5/weather?q={city}&units=metric&appid={api_key}"
-        response = requests.get(weather_url)
+        response = http_client.get(weather_url)
         if response.status_code == 200:
             data = response.json()
             st.subheader(f"☀️ Meteo a {city}")
@@ -36,7 +36,7 @@ def show():
     st.subheader("🇮🇹 Eventi sismici in Italia (INGV)")
     ingv_url = f"https://webservices.ingv.it/fdsnws/event/1/query?format=geojson&starttime={datetime.utcnow().date()}T00:00:00"
     try:
-        resp = requests.get(ingv_url)
+        resp = http_client.get(ingv_url)
         quakes = resp.json()["features"]
         rows = []
         for q in quakes:
@@ -65,7 +65,7 @@ def show():
     st.subheader("🌎 Eventi globali (USGS)")
     usgs_url = "https://earthquake.usgs.gov/earthquakes/feed/v1.0/summary/all_day.geojson"
     try:
-        r = requests.get(usgs_url)
+        r = http_client.get(usgs_url)
         data = r.json()
         quakes = []
         for f in data["features"]:
@@ -0,0 +1,168 @@
+"""
+open_meteo.py — Client Open-Meteo multi-località per SismaVer2.
+
+Open-Meteo accetta liste di coordinate separate da virgola
+(latitude=45.46,41.90&longitude=9.19,12.50) e risponde con un array JSON,
+un oggetto per località nello stesso ordine. Qui tutte le città di una
+vista viaggiano in UNA richiesta per prodotto (previsioni, qualità
+dell'aria) invece che una richiesta per città:
+  - punti oltre MAX_PUNTI si dividono in blocchi, scaricati in parallelo
+    sul motore condiviso (fetch_async)
+  - la risposta diventa un array NumPy per variabile (N località, oppure
+    N × ore per le serie orarie); NaN = dato mancante o blocco fallito
+  - cache condivisa tra sessioni per prodotto (cache_swr), chiave = tupla
+    dei punti e delle variabili
+
+Prodotti:
+  aria_corrente()   valori correnti qualità dell'aria (AQI europeo, PM, gas)
+  meteo_corrente()  condizioni correnti (temperatura, umidità, pioggia, codice WMO)
+  meteo_orario()    serie orarie di previsione
+"""
+
+import numpy as np
+
+from modules import cache_swr, fetch_async
+
+FORECAST_URL = "https://api.open-meteo.com/v1/forecast"
+AQI_URL = "https://air-quality-api.open-meteo.com/v1/air-quality"
+MAX_PUNTI = 100             # località per richiesta (lunghezza URL contenuta)
+TIMEOUT = 10
+
+# Variabili AQI → chiavi usate dalle pagine (qualita_aria, snapshot "aria_citta")
+CAMPI_ARIA = {
+    "aqi":  "european_aqi",
+    "pm10": "pm10",
+    "pm25": "pm2_5",
+    "no2":  "nitrogen_dioxide",
+    "o3":   "ozone",
+    "co":   "carbon_monoxide",
+    "so2":  "sulphur_dioxide",
+}
+VARIABILI_CORRENTI = ("temperature_2m", "relative_humidity_2m", "precipitation",
+                      "weather_code", "wind_speed_10m")
+
+# Codici meteo WMO → (icona, descrizione)
+WMO = {
+    0: ("☀️", "Sereno"), 1: ("🌤️", "Prev. sereno"), 2: ("⛅", "Parz. nuvoloso"),
+    3: ("☁️", "Nuvoloso"), 45: ("🌫️", "Nebbia"), 48: ("🌫️", "Nebbia"),
+    51: ("🌦️", "Pioggerella"), 53: ("🌦️", "Pioggerella"), 55: ("🌦️", "Pioggerella"),
+    61: ("🌧️", "Pioggia leggera"), 63: ("🌧️", "Pioggia"), 65: ("🌧️", "Pioggia forte"),
+    71: ("🌨️", "Neve leggera"), 73: ("🌨️", "Neve"), 75: ("🌨️", "Neve forte"),
+    80: ("🌦️", "Rovesci"), 81: ("🌧️", "Rovesci"), 82: ("⛈️", "Rovesci forti"),
+    95: ("⛈️", "Temporale"), 96: ("⛈️", "Temporale+grandine"), 99: ("⛈️", "Temporale forte"),
+}
+
+
+def wmo(codice):
+    """(icona, descrizione) del codice meteo WMO; NaN/None → "Variabile"."""
+    try:
+        return WMO.get(int(codice), ("🌡️", "Variabile"))
+    except (TypeError, ValueError):
+        return ("🌡️", "Variabile")
+
+
+# ── Download ─────────────────────────────────────────────────────────────────
+
+def _coordinate(valori) -> str:
+    return ",".join(f"{float(v):.4f}" for v in valori)
+
+
+def scarica(url: str, punti, **params) -> list:
+    """
+    Una risposta per punto (dict Open-Meteo, None se il suo blocco è fallito),
+    allineata a `punti` [(lat, lon), ...]; None se nessun blocco risponde.
+    """
+    punti = list(punti)
+    blocchi = [punti[i:i + MAX_PUNTI] for i in range(0, len(punti), MAX_PUNTI)]
+    risposte = fetch_async.fetch_batch(
+        fetch_async.Richiesta(url, params={"latitude": _coordinate(p[0] for p in b),
+                                           "longitude": _coordinate(p[1] for p in b),
+                                           **params},
+                              timeout=TIMEOUT)
+        for b in blocchi)
+    risultati = []
+    for blocco, r in zip(blocchi, risposte):
+        dati = None
+        try:
+            if r is not None:
+                dati = r.json()
+                dati = dati if isinstance(dati, list) else [dati]   # località singola
+                if len(dati) != len(blocco):
+                    dati = None
+        except Exception as e:
+            print(f"Open-Meteo: risposta non valida ({e})")
+        risultati.extend(dati if dati is not None else [None] * len(blocco))
+    return risultati if any(d is not None for d in risultati) else None
+
+
+def _colonna(risposte, sezione: str, variabile: str) -> np.ndarray:
+    """Valori correnti di una variabile come array (N,), NaN dove mancano."""
+    return np.array([(d or {}).get(sezione, {}).get(variabile) for d in risposte],
+                    dtype=np.float64)
+
+
+def _matrice(risposte, variabile: str, ore: int) -> np.ndarray:
+    """Serie oraria di una variabile come matrice (N, ore), NaN dove manca."""
+    m = np.full((len(risposte), ore), np.nan)
+    for i, d in enumerate(risposte):
+        serie = (d or {}).get("hourly", {}).get(variabile)
+        if serie:
+            riga = np.array(serie[:ore], dtype=np.float64)
+            m[i, :riga.size] = riga
+    return m
+
+
+# ── Prodotti (cache condivisa per prodotto) ──────────────────────────────────
+
+@cache_swr.swr(ttl=1800)
+def aria_corrente(punti: tuple) -> dict:
+    """
+    Qualità dell'aria corrente per i punti ((lat, lon), ...): chiavi di
+    CAMPI_ARIA → array (N,) float, NaN se il dato manca. None se Open-Meteo
+    non risponde. Lo scheduler usa aria_corrente.__wrapped__ (senza cache).
+    """
+    risposte = scarica(AQI_URL, punti, current=",".join(CAMPI_ARIA.values()),
+                       timezone="Europe/Rome")
+    if risposte is None:
+        return None
+    return {chiave: _colonna(risposte, "current", var) for chiave, var in CAMPI_ARIA.items()}
+
+
+def valori_aria(valori: dict, i: int) -> dict:
+    """
+    Riga i di aria_corrente() come dict {aqi, pm10, ...} con None al posto di
+    NaN; {} se la località non ha alcun dato (blocco fallito).
+    """
+    riga = {k: (None if np.isnan(v[i]) else float(v[i])) for k, v in valori.items()}
+    if all(x is None for x in riga.values()):
+        return {}
+    if riga.get("aqi") is not None:
+        riga["aqi"] = int(round(riga["aqi"]))
+    return riga
+
+
+@cache_swr.swr(ttl=600)
+def meteo_corrente(punti: tuple, variabili: tuple = VARIABILI_CORRENTI) -> dict:
+    """Condizioni correnti: variabile → array (N,) float (NaN se manca); None se offline."""
+    risposte = scarica(FORECAST_URL, punti, current=",".join(variabili),
+                       timezone="Europe/Rome")
+    if risposte is None:
+        return None
+    return {v: _colonna(risposte, "current", v) for v in variabili}
+
+
+@cache_swr.swr(ttl=900)
+def meteo_orario(punti: tuple, variabili: tuple, giorni: int = 1) -> dict:
+    """
+    Previsioni orarie (ora locale italiana): "tempi" → array delle ore ISO,
+    variabile → matrice (N, 24·giorni) float, NaN se manca; None se offline.
+    """
+    risposte = scarica(FORECAST_URL, punti, hourly=",".join(variabili),
+                       timezone="Europe/Rome", forecast_days=int(giorni))
+    if risposte is None:
+        return None
+    ore = 24 * int(giorni)
+    primo = next(d for d in risposte if d is not None)
+    valori = {v: _matrice(risposte, v, ore) for v in variabili}
+    valori["tempi"] = np.array(primo.get("hourly", {}).get("time", [])[:ore], dtype=str)
+    return valori
@@ -0,0 +1,169 @@
+"""
+punti_raccolta.py — Indice statico dei punti di raccolta con ricerca dei più vicini.
+
+I punti di raccolta di dati_regioni_a/b/c vengono risolti UNA volta (script
+build_punti_raccolta.py) in data/punti_raccolta.json, distribuito con l'app:
+una riga per punto con lat, lon, regione, etichetta e flag "approssimato".
+All'import lazy il file diventa un insieme di array piatti (NumPy) più un
+indice a griglia (celle di CELLA_GRADI), quindi:
+  - della_regione()  elenco dei punti di una regione, in ordine di dataset
+  - vicini()         gli N punti più vicini a una posizione, con distanza
+rispondono in pochi millisecondi e senza chiamate di rete.
+
+Se il file manca l'indice si costruisce al volo dai dizionari regionali,
+con la sola risoluzione offline delle coordinate (vedi risolvi()).
+"""
+
+import json
+import os
+import threading
+
+import numpy as np
+
+PERCORSO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        "data", "punti_raccolta.json")
+CELLA_GRADI = 0.25
+_R_TERRA_KM = 6371.0
+_KM_GRADO = 111.2
+_COS_LAT_MIN = np.cos(np.radians(48.0))   # limite inferiore sul territorio italiano
+
+_INDICE = None
+_LOCK = threading.Lock()
+
+
+# ── Risoluzione (build) ──────────────────────────────────────────────────────
+
+def _dati_regioni() -> dict:
+    from modules.dati_regioni_a import dati_regioni_a
+    from modules.dati_regioni_b import dati_regioni_b
+    from modules.dati_regioni_c import dati_regioni_c
+    return {**dati_regioni_a, **dati_regioni_b, **dati_regioni_c}
+
+
+def risolvi(geocodifica=None) -> list:
+    """
+    Tutti i punti di raccolta come righe [lat, lon, regione, etichetta, approssimato].
+    Ordine di risoluzione: coordinate precaricate del dataset → città del
+    punto ("Città: luogo") nelle coordinate note → geocodifica(etichetta)
+    se fornita (solo nello script di build) → centro della regione (approssimato).
+    """
+    from modules.emergenza import COORDINATES_CACHE
+    righe = []
+    for regione, dati in sorted(_dati_regioni().items()):
+        coords = dati.get("punti_raccolta_coords", {})
+        centro = dati.get("coordinates") or COORDINATES_CACHE.get(regione)
+        for punto in dati.get("punti_raccolta", []):
+            etichetta = punto.strip()
+            c, approssimato = coords.get(etichetta), False
+            if c is None:
+                citta = etichetta.split(":")[0].strip()
+                c = COORDINATES_CACHE.get(citta)
+                approssimato = True
+            if c is None and geocodifica is not None:
+                c = geocodifica(etichetta)
+                approssimato = c is None
+            if c is None:
+                c = centro
+            if c is None:
+                continue
+            righe.append([round(float(c[0]), 5), round(float(c[1]), 5), regione,
+                          etichetta, approssimato])
+    return righe
+
+
+# ── Indice ───────────────────────────────────────────────────────────────────
+
+class _Indice:
+    """Array piatti dei punti + griglia cella → indici dei punti."""
+
+    def __init__(self, righe: list):
+        self.lat = np.array([r[0] for r in righe], dtype=np.float64)
+        self.lon = np.array([r[1] for r in righe], dtype=np.float64)
+        self.regione = np.array([r[2] for r in righe], dtype=object)
+        self.etichetta = np.array([r[3] for r in righe], dtype=object)
+        self.approssimato = np.array([bool(r[4]) for r in righe], dtype=bool)
+        cy = np.floor(self.lat / CELLA_GRADI).astype(np.int64)
+        cx = np.floor(self.lon / CELLA_GRADI).astype(np.int64)
+        self.celle = {}
+        for i, chiave in enumerate(zip(cy.tolist(), cx.tolist())):
+            self.celle.setdefault(chiave, []).append(i)
+        self.celle = {k: np.array(v, dtype=np.int64) for k, v in self.celle.items()}
+        if self.celle:
+            chiavi = np.array(list(self.celle))
+            self.estensione = (chiavi[:, 0].min(), chiavi[:, 0].max(),
+                               chiavi[:, 1].min(), chiavi[:, 1].max())
+
+    def __len__(self):
+        return int(self.lat.shape[0])
+
+
+def _carica() -> _Indice:
+    global _INDICE
+    if _INDICE is not None:
+        return _INDICE
+    with _LOCK:
+        if _INDICE is None:
+            try:
+                with open(PERCORSO, encoding="utf-8") as f:
+                    righe = json.load(f)["punti"]
+            except Exception as e:
+                print(f"[punti_raccolta] {PERCORSO} non disponibile ({e}), indice dai dati regionali")
+                righe = risolvi()
+            _INDICE = _Indice(righe)
+    return _INDICE
+
+
+def _haversine_km(lat0, lon0, lat, lon):
+    p1, p2 = np.radians(lat0), np.radians(lat)
+    dl = np.radians(lon - lon0)
+    a = np.sin((p2 - p1) / 2) ** 2 + np.cos(p1) * np.cos(p2) * np.sin(dl / 2) ** 2
+    return 2 * _R_TERRA_KM * np.arcsin(np.sqrt(a))
+
+
+def _righe(idx, indici, distanze=None) -> list:
+    return [{"lat": float(idx.lat[i]), "lon": float(idx.lon[i]),
+             "regione": idx.regione[i], "etichetta": idx.etichetta[i],
+             "approssimato": bool(idx.approssimato[i]),
+             **({"distanza_km": round(float(d), 2)} if distanze is not None else {})}
+            for i, d in zip(indici.tolist(), (distanze.tolist() if distanze is not None
+                                               else [None] * len(indici)))]
+
+
+def della_regione(regione: str) -> list:
+    """Punti della regione come dict (lat, lon, regione, etichetta, approssimato)."""
+    idx = _carica()
+    return _righe(idx, np.flatnonzero(idx.regione == regione))
+
+
+def vicini(lat: float, lon: float, n: int = 5) -> list:
+    """
+    Gli n punti di raccolta più vicini a (lat, lon), dal più vicino, con
+    distanza_km. Ricerca ad anelli crescenti sulla griglia: ci si ferma
+    quando nessuna cella oltre l'anello può contenere un punto più vicino
+    dell'n-esimo trovato.
+    """
+    idx = _carica()
+    if not len(idx):
+        return []
+    n = min(n, len(idx))
+    cy0, cx0 = int(np.floor(lat / CELLA_GRADI)), int(np.floor(lon / CELLA_GRADI))
+    y_min, y_max, x_min, x_max = idx.estensione
+    r_max = max(abs(cy0 - y_min), abs(cy0 - y_max), abs(cx0 - x_min), abs(cx0 - x_max))
+    candidati, distanze = [], np.zeros(0)
+    for r in range(r_max + 1):
+        for dy in range(-r, r + 1):
+            passo = 1 if abs(dy) == r else 2 * r       # solo il bordo dell'anello
+            for dx in range(-r, r + 1, max(passo, 1)):
+                cella = idx.celle.get((cy0 + dy, cx0 + dx))
+                if cella is not None:
+                    candidati.append(cella)
+        if candidati and sum(len(c) for c in candidati) >= n:
+            tutti = np.concatenate(candidati)
+            distanze = _haversine_km(lat, lon, idx.lat[tutti], idx.lon[tutti])
+            # Punti fuori dall'anello r distano almeno r celle (limite conservativo)
+            if np.partition(distanze, n - 1)[n - 1] <= r * CELLA_GRADI * _KM_GRADO * _COS_LAT_MIN:
+                break
+    tutti = np.concatenate(candidati)
+    distanze = _haversine_km(lat, lon, idx.lat[tutti], idx.lon[tutti])
+    ordine = np.argsort(distanze, kind="stable")[:n]
+    return _righe(idx, tutti[ordine], distanze[ordine])
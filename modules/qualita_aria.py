@@ -3,7 +3,7 @@ qualita_aria.py — Qualità dell'aria in tempo reale per le principali città i
 Fonte: Open-Meteo Air Quality API (gratuita, nessuna API key)
 """
 import streamlit as st
-import requests
+from modules import gazzetteer, griglia_meteo, http_client, ingestione, open_meteo, snapshot
 from datetime import datetime, timezone, timedelta
 try:
     from streamlit_autorefresh import st_autorefresh as _sar
@@ -19,18 +19,7 @@ def _get_tz():
 
 FUSO_IT = _get_tz()
 
-CITTA = {
-    "Roma":    (41.8955, 12.4823), "Milano":  (45.4642, 9.1900),
-    "Napoli":  (40.8517, 14.2681), "Torino":  (45.0703, 7.6869),
-    "Palermo": (38.1157, 13.3613), "Firenze": (43.7696, 11.2558),
-    "Bologna": (44.4934, 11.3420), "Venezia": (45.4408, 12.3155),
-    "Bari":    (41.1171, 16.8719), "Catania": (37.5079, 15.0830),
-    "Genova":  (44.4056, 8.9463),  "Cagliari":(39.2238, 9.1217),
-    "Messina": (38.1938, 15.5540), "Verona":  (45.4384, 10.9916),
-    "Trieste": (45.6495, 13.7768), "Taranto": (40.4756, 17.2291),
-    "Brescia": (45.5416, 10.2118), "Padova":  (45.4064, 11.8768),
-    "Parma":   (44.8015, 10.3279), "Reggio Calabria": (38.1112, 15.6476),
-}
+CITTA = ingestione.CITTA_ARIA
 
 def _aqi_label(v):
     if v is None: return "N/D", "#94A3B8"
@@ -42,29 +31,20 @@ def _aqi_label(v):
     if v <= 100: return f"Pessima ({v})",    "#ef4444"
     return f"Critica ({v})", "#7c3aed"
 
-@st.cache_data(ttl=1800, show_spinner=False)
 def _fetch_aqi(lat, lon):
-    try:
-        url = (f"https://air-quality-api.open-meteo.com/v1/air-quality"
-               f"?latitude={lat}&longitude={lon}"
-               f"&current=european_aqi,pm10,pm2_5,carbon_monoxide,"
-               f"nitrogen_dioxide,sulphur_dioxide,ozone"
-               f"&timezone=Europe%2FRome")
-        r = requests.get(url, timeout=8)
-        if r.status_code == 200:
-            c = r.json().get("current", {})
-            return {
-                "aqi":  c.get("european_aqi"),
-                "pm10": c.get("pm10"),
-                "pm25": c.get("pm2_5"),
-                "no2":  c.get("nitrogen_dioxide"),
-                "o3":   c.get("ozone"),
-                "co":   c.get("carbon_monoxide"),
-                "so2":  c.get("sulphur_dioxide"),
-            }
-    except Exception:
-        pass
-    return {}
+    # Griglia nazionale interpolata (nessuna chiamata) se recente, altrimenti
+    # richiesta puntuale con la cache condivisa per prodotto di open_meteo (30 min)
+    d = griglia_meteo.punto(lat, lon)
+    if d.get("aqi") is not None:
+        return {k: d.get(k) for k in open_meteo.CAMPI_ARIA} | {"interpolato": True}
+    valori = open_meteo.aria_corrente(((lat, lon),))
+    return open_meteo.valori_aria(valori, 0) if valori is not None else {}
+
+
+def _fetch_aqi_tutte():
+    """Panoramica delle 20 città dallo snapshot "aria_citta" (scheduler, ogni 30 min)."""
+    return ingestione.leggi("aria_citta") or {}
+
 
 def show():
     if _AR:
@@ -80,6 +60,9 @@ def show():
         f"· <i>Auto-aggiornamento ogni 30 min</i></p>",
         unsafe_allow_html=True
     )
+    marcatore = snapshot.marcatore("aria_citta")
+    if marcatore:
+        st.caption(marcatore)
 
     # Legenda
     with st.expander("📊 Legenda Indice AQI europeo"):
@@ -99,18 +82,30 @@ def show():
 
     @st.cache_data(ttl=86400, show_spinner=False)
     def _geocode_it(name):
+        # Gazzetteer offline prima (nome/prefisso), poi Open-Meteo, infine la
+        # ricerca offline tollerante agli errori di battitura
+        def _locali(tollerante):
+            return [{"name": c["nome"], "latitude": c["lat"], "longitude": c["lon"],
+                     "admin2": c["provincia"], "admin1": c["regione"], "country_code": "IT"}
+                    for c in gazzetteer.cerca(name, n=5, tollerante=tollerante)]
+
+        locali = _locali(False)
+        if locali:
+            return locali
         try:
-            r = requests.get(
+            r = http_client.get(
                 "https://geocoding-api.open-meteo.com/v1/search",
                 params={"name": name, "count": 5, "language": "it", "countryCode": "IT"},
                 timeout=6
             )
             if r.status_code == 200:
                 data = r.json().get("results", []) or []
-                return [x for x in data if x.get("country_code") == "IT"]
+                data = [x for x in data if x.get("country_code") == "IT"]
+                if data:
+                    return data
         except Exception:
             pass
-        return []
+        return _locali(True)
 
     # ── Ricerca libera (sempre visibile) ──
     st.markdown("#### 🔎 Cerca un qualsiasi comune italiano")
@@ -159,7 +154,10 @@ def show():
 
     if lat is not None:
         with st.spinner(f"Caricamento dati {citta_scelta}..."):
-            d = _fetch_aqi(lat, lon)
+            # Le 20 città principali sono già nello snapshot dello scheduler
+            if CITTA.get(citta_scelta) == (lat, lon):
+                d = _fetch_aqi_tutte().get(citta_scelta)
+            d = d or _fetch_aqi(lat, lon)
 
         if d and d.get("aqi") is not None:
             aqi_label, aqi_color = _aqi_label(d.get("aqi"))
@@ -181,6 +179,8 @@ def show():
             _m(c4,"O₃",       d.get("o3"),    "µg/m³")
             _m(c5,"CO",       d.get("co"),    "µg/m³")
             _m(c6,"SO₂",      d.get("so2"),   "µg/m³")
+            if d.get("interpolato"):
+                st.caption("Valori interpolati dalla griglia nazionale Open-Meteo (passo 0.5°).")
 
             st.markdown("---")
             st.subheader("📋 Valori limite OMS (WHO 2021)")
@@ -195,21 +195,11 @@ def show():
             st.warning("Dati di qualità dell'aria non disponibili per questa località. Riprova tra qualche minuto.")
     else:
         st.subheader("📍 Panoramica qualità aria — tutte le principali città")
-        st.info("Caricamento di 20 città in parallelo — potrebbe richiedere alcuni secondi...")
 
-        from concurrent.futures import ThreadPoolExecutor, as_completed
         import pandas as pd
 
-        risultati = {}
         with st.spinner("Recupero dati in corso..."):
-            with ThreadPoolExecutor(max_workers=10) as ex:
-                futures = {ex.submit(_fetch_aqi, lat, lon): nome for nome, (lat,lon) in CITTA.items()}
-                for f in as_completed(futures):
-                    nome = futures[f]
-                    try:
-                        risultati[nome] = f.result()
-                    except Exception:
-                        risultati[nome] = {}
+            risultati = _fetch_aqi_tutte()
 
         rows = []
         for nome in sorted(CITTA.keys()):
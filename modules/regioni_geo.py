@@ -0,0 +1,310 @@
+"""
+regioni_geo.py — Classificazione vettoriale degli eventi per regione italiana.
+
+Indice costruito UNA volta all'import:
+  - regex delle sigle di provincia "(XX)" compilata
+  - sigla → codice regione
+  - bounding box delle 20 regioni come array NumPy (20×4) con area
+
+assegna_regioni() attribuisce la regione a un intero array di eventi in un
+solo passaggio: sigla di provincia per luogo distinto (vocabolario interned
+della tabella eventi), poi point-in-polygon sui confini regionali semplificati
+(data/regioni_semplificate.json) per gli eventi senza sigla. Gli eventi in
+mare entro ~20 km dalla costa sono attribuiti alla regione più vicina.
+Il risultato è un codice int8 per evento (-1 = nessuna regione), esposto
+come colonna categorica "regione" dal catalogo sismico.
+
+Indice spaziale dei poligoni: griglia uniforme (0.1°) costruita in modo LAZY
+una sola volta per processo. Le celle interamente dentro una regione (o
+lontane da tutte) si risolvono con un lookup; solo le celle attraversate da
+un confine richiedono il ray casting, limitato alle regioni candidate.
+Se il file dei poligoni manca si usa il vecchio criterio a bounding box.
+"""
+
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+# ── Mappatura Province → Regione ─────────────────────────────────────────────
+PROVINCE_TO_REGION = {
+    "AQ": "Abruzzo", "CH": "Abruzzo", "PE": "Abruzzo", "TE": "Abruzzo",
+    "MT": "Basilicata", "PZ": "Basilicata",
+    "CS": "Calabria", "CZ": "Calabria", "KR": "Calabria", "RC": "Calabria", "VV": "Calabria",
+    "AV": "Campania", "BN": "Campania", "CE": "Campania", "NA": "Campania", "SA": "Campania",
+    "BO": "Emilia-Romagna", "FC": "Emilia-Romagna", "FE": "Emilia-Romagna", "MO": "Emilia-Romagna",
+    "PC": "Emilia-Romagna", "PR": "Emilia-Romagna", "RA": "Emilia-Romagna", "RE": "Emilia-Romagna", "RN": "Emilia-Romagna",
+    "GO": "Friuli-Venezia Giulia", "PN": "Friuli-Venezia Giulia", "TS": "Friuli-Venezia Giulia", "UD": "Friuli-Venezia Giulia",
+    "FR": "Lazio", "LT": "Lazio", "RI": "Lazio", "RM": "Lazio", "VT": "Lazio",
+    "GE": "Liguria", "IM": "Liguria", "SP": "Liguria", "SV": "Liguria",
+    "BG": "Lombardia", "BS": "Lombardia", "CO": "Lombardia", "CR": "Lombardia", "LC": "Lombardia",
+    "LO": "Lombardia", "MB": "Lombardia", "MI": "Lombardia", "MN": "Lombardia", "PV": "Lombardia",
+    "SO": "Lombardia", "VA": "Lombardia",
+    "AN": "Marche", "AP": "Marche", "FM": "Marche", "MC": "Marche", "PU": "Marche",
+    "CB": "Molise", "IS": "Molise",
+    "AL": "Piemonte", "AT": "Piemonte", "BI": "Piemonte", "CN": "Piemonte", "NO": "Piemonte",
+    "TO": "Piemonte", "VB": "Piemonte", "VC": "Piemonte",
+    "BA": "Puglia", "BR": "Puglia", "BT": "Puglia", "FG": "Puglia", "LE": "Puglia", "TA": "Puglia",
+    "CA": "Sardegna", "NU": "Sardegna", "OR": "Sardegna", "SS": "Sardegna", "SU": "Sardegna",
+    "AG": "Sicilia", "CL": "Sicilia", "CT": "Sicilia", "EN": "Sicilia", "ME": "Sicilia",
+    "PA": "Sicilia", "RG": "Sicilia", "SR": "Sicilia", "TP": "Sicilia",
+    "AR": "Toscana", "FI": "Toscana", "GR": "Toscana", "LI": "Toscana", "LU": "Toscana",
+    "MS": "Toscana", "PI": "Toscana", "PO": "Toscana", "PT": "Toscana", "SI": "Toscana",
+    "BZ": "Trentino-Alto Adige", "TN": "Trentino-Alto Adige",
+    "PG": "Umbria", "TR": "Umbria",
+    "AO": "Valle d'Aosta",
+    "BL": "Veneto", "PD": "Veneto", "RO": "Veneto", "TV": "Veneto", "VE": "Veneto", "VI": "Veneto", "VR": "Veneto",
+}
+
+REGIONI_BBOX = {
+    "Abruzzo": (41.68, 42.90, 13.02, 14.79),
+    "Basilicata": (39.90, 41.14, 15.34, 16.87),
+    "Calabria": (37.91, 40.15, 15.63, 17.21),
+    "Campania": (39.99, 41.51, 13.75, 15.81),
+    "Emilia-Romagna": (43.73, 45.14, 9.20, 12.76),
+    "Friuli-Venezia Giulia": (45.58, 46.65, 12.32, 13.92),
+    "Lazio": (40.78, 42.84, 11.45, 14.03),
+    "Liguria": (43.77, 44.68, 7.49, 10.07),
+    "Lombardia": (44.68, 46.64, 8.50, 11.42),
+    "Marche": (42.69, 43.97, 12.18, 13.92),
+    "Molise": (41.36, 42.06, 14.10, 15.16),
+    "Piemonte": (44.06, 46.46, 6.62, 9.21),
+    "Puglia": (39.79, 42.22, 14.94, 18.55),
+    "Sardegna": (38.85, 41.32, 8.13, 9.83),
+    "Sicilia": (35.49, 38.81, 11.93, 15.65),
+    "Toscana": (42.24, 44.47, 9.69, 12.37),
+    "Trentino-Alto Adige": (45.67, 47.10, 10.38, 12.48),
+    "Umbria": (42.36, 43.62, 11.89, 13.27),
+    "Valle d'Aosta": (45.46, 45.99, 6.79, 7.94),
+    "Veneto": (44.79, 46.68, 10.62, 13.10),
+}
+
+# ── Indice precomputato ──────────────────────────────────────────────────────
+REGIONI = tuple(sorted(REGIONI_BBOX))
+NESSUNA = -1
+# Nomi indicizzabili con i codici (l'ultimo, "", corrisponde a NESSUNA = -1)
+NOMI = np.array(REGIONI + ("",), dtype=object)
+
+_RE_PROVINCIA = re.compile(r"\(([A-Z]{2})\)")
+_CODICE = {nome: i for i, nome in enumerate(REGIONI)}
+_SIGLA_CODICE = {sigla: _CODICE[reg] for sigla, reg in PROVINCE_TO_REGION.items()}
+_BBOX = np.array([REGIONI_BBOX[r] for r in REGIONI], dtype=np.float64)   # lat0, lat1, lon0, lon1
+_AREA = (_BBOX[:, 1] - _BBOX[:, 0]) * (_BBOX[:, 3] - _BBOX[:, 2])
+
+
+def codice_regione(nome: str):
+    """Nome regione → codice int, None se sconosciuta (o "Italia…")."""
+    return _CODICE.get(nome) if nome else None
+
+
+def nome_regione(codice: int) -> str:
+    return NOMI[codice]
+
+
+def regione_da_luogo(place: str) -> int:
+    """Codice regione dalla sigla di provincia nel testo, NESSUNA se assente."""
+    if not place:
+        return NESSUNA
+    m = _RE_PROVINCIA.search(place)
+    return _SIGLA_CODICE.get(m.group(1), NESSUNA) if m else NESSUNA
+
+
+def regioni_da_bbox(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """Codice della bbox regionale più piccola che contiene ciascun punto."""
+    lat = np.asarray(lat, dtype=np.float64)[:, None]
+    lon = np.asarray(lon, dtype=np.float64)[:, None]
+    dentro = ((lat >= _BBOX[:, 0]) & (lat <= _BBOX[:, 1])
+              & (lon >= _BBOX[:, 2]) & (lon <= _BBOX[:, 3]))
+    migliore = np.where(dentro, _AREA, np.inf).argmin(axis=1)
+    return np.where(dentro.any(axis=1), migliore, NESSUNA).astype(np.int8)
+
+
+def assegna_regioni(luoghi, place_code: np.ndarray, lat: np.ndarray,
+                    lon: np.ndarray) -> np.ndarray:
+    """
+    Regione (codice int8) per ogni evento.
+    luoghi: vocabolario dei luoghi; place_code: indice nel vocabolario per evento.
+    """
+    per_luogo = np.fromiter((regione_da_luogo(l) for l in luoghi),
+                            dtype=np.int8, count=len(luoghi))
+    codici = per_luogo[place_code] if len(place_code) else np.zeros(0, dtype=np.int8)
+    senza = codici == NESSUNA
+    if senza.any():
+        codici[senza] = regioni_da_coordinate(lat[senza], lon[senza])
+    return codici
+
+
+# ── Poligoni regionali + indice a griglia (lazy, una volta per processo) ────
+_FILE_POLIGONI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                              "data", "regioni_semplificate.json")
+_CELLA = 0.1               # lato cella della griglia (gradi)
+_BUFFER_COSTA = 0.2        # gradi (~20 km): eventi in mare attribuiti alla costa vicina
+_FUORI = -1                # cella fuori da tutte le regioni
+_MISTA = -2                # cella attraversata da almeno un confine
+_BLOCCO = 4096             # punti per blocco nel ray casting (limita la memoria)
+
+
+class _IndicePoligoni:
+    """Lati dei poligoni per regione + griglia uniforme con stato/candidati per cella."""
+
+    def __init__(self, anelli_per_regione: dict):
+        self.lati = {}                     # codice → (x0, y0, x1, y1) array dei lati
+        for nome, anelli in anelli_per_regione.items():
+            codice = _CODICE.get(nome)
+            if codice is None:
+                continue
+            seg = []
+            for anello in anelli:
+                a = np.asarray(anello, dtype=np.float64)
+                seg.append(np.column_stack([a[:-1], a[1:]]))
+            seg = np.concatenate(seg)
+            self.lati[codice] = (seg[:, 0], seg[:, 1], seg[:, 2], seg[:, 3])
+
+        tutti = np.concatenate([np.concatenate([l[0], l[2]]) for l in self.lati.values()])
+        tutti_y = np.concatenate([np.concatenate([l[1], l[3]]) for l in self.lati.values()])
+        self.lon0 = float(tutti.min()) - _BUFFER_COSTA
+        self.lat0 = float(tutti_y.min()) - _BUFFER_COSTA
+        self.nx = int(np.ceil((tutti.max() + _BUFFER_COSTA - self.lon0) / _CELLA)) + 1
+        self.ny = int(np.ceil((tutti_y.max() + _BUFFER_COSTA - self.lat0) / _CELLA)) + 1
+
+        # Candidati per cella: regioni con un lato nella cella (point-in-polygon)
+        # e, allargando del buffer, regioni con costa vicina (eventi in mare)
+        forma = (self.ny, self.nx, len(REGIONI))
+        self.candidati = np.zeros(forma, dtype=bool)
+        self.costa = np.zeros(forma, dtype=bool)
+        for codice, (x0, y0, x1, y1) in self.lati.items():
+            for griglia, b in ((self.candidati, 0.0), (self.costa, _BUFFER_COSTA)):
+                ix0 = self._ix(np.minimum(x0, x1) - b)
+                ix1 = self._ix(np.maximum(x0, x1) + b)
+                iy0 = self._iy(np.minimum(y0, y1) - b)
+                iy1 = self._iy(np.maximum(y0, y1) + b)
+                for a, z, c, d in zip(iy0, iy1, ix0, ix1):
+                    griglia[a:z + 1, c:d + 1, codice] = True
+
+        # Stato cella: codice regione (interamente dentro), _FUORI o _MISTA.
+        # Una cella non attraversata da confini è tutta dentro una regione o
+        # tutta fuori: basta il suo centro. Se è fuori ma vicina alla costa
+        # resta _MISTA per l'attribuzione per distanza.
+        attraversata = self.candidati.any(axis=2)
+        self.stato = np.full((self.ny, self.nx), _MISTA, dtype=np.int8)
+        iy, ix = np.nonzero(~attraversata)
+        cx = self.lon0 + (ix + 0.5) * _CELLA
+        cy = self.lat0 + (iy + 0.5) * _CELLA
+        centro = np.full(len(ix), _FUORI, dtype=np.int8)
+        for codice, (x0, y0, x1, y1) in self.lati.items():
+            sel = np.flatnonzero((centro == _FUORI)
+                                 & (cx >= x0.min()) & (cx <= x0.max())
+                                 & (cy >= y0.min()) & (cy <= y0.max()))
+            centro[sel[self._dentro(codice, cx[sel], cy[sel])]] = codice
+        vicino_costa = self.costa[iy, ix].any(axis=1)
+        centro[(centro == _FUORI) & vicino_costa] = _MISTA
+        self.stato[iy, ix] = centro
+
+    def _ix(self, lon):
+        return np.clip(((lon - self.lon0) / _CELLA).astype(np.int64), 0, self.nx - 1)
+
+    def _iy(self, lat):
+        return np.clip(((lat - self.lat0) / _CELLA).astype(np.int64), 0, self.ny - 1)
+
+    def _dentro(self, codice, px, py):
+        """Ray casting pari-dispari di più punti contro tutti gli anelli di una regione."""
+        x0, y0, x1, y1 = self.lati[codice]
+        esito = np.zeros(len(px), dtype=bool)
+        for i in range(0, len(px), _BLOCCO):
+            bx = px[i:i + _BLOCCO, None]
+            by = py[i:i + _BLOCCO, None]
+            attraversa = (y0 > by) != (y1 > by)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                x_int = x0 + (by - y0) * (x1 - x0) / (y1 - y0)
+            esito[i:i + _BLOCCO] = ((attraversa & (bx < x_int)).sum(axis=1) % 2) == 1
+        return esito
+
+    def _distanza(self, codice, px, py):
+        """Distanza minima (gradi, lon scalata con cos(lat)) dei punti dai lati."""
+        x0, y0, x1, y1 = self.lati[codice]
+        out = np.empty(len(px))
+        for i in range(0, len(px), _BLOCCO):
+            by = py[i:i + _BLOCCO, None]
+            k = np.cos(np.radians(by))
+            bx = px[i:i + _BLOCCO, None] * k
+            ax, bx1 = x0 * k, x1 * k
+            dx, dy = bx1 - ax, y1 - y0
+            l2 = dx * dx + dy * dy
+            with np.errstate(divide="ignore", invalid="ignore"):
+                t = np.clip(((bx - ax) * dx + (by - y0) * dy) / l2, 0.0, 1.0)
+            t = np.where(l2 > 0, t, 0.0)
+            ex = ax + t * dx - bx
+            ey = y0 + t * dy - by
+            out[i:i + _BLOCCO] = np.sqrt((ex * ex + ey * ey).min(axis=1))
+        return out
+
+    def classifica(self, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        iy = ((lat - self.lat0) / _CELLA).astype(np.int64)
+        ix = ((lon - self.lon0) / _CELLA).astype(np.int64)
+        in_griglia = (iy >= 0) & (iy < self.ny) & (ix >= 0) & (ix < self.nx)
+        codici = np.full(len(lat), _FUORI, dtype=np.int8)
+        codici[in_griglia] = self.stato[iy[in_griglia], ix[in_griglia]]
+
+        miste = np.flatnonzero(codici == _MISTA)
+        if not len(miste):
+            return codici
+        codici[miste] = _FUORI
+        cand = self.candidati[iy[miste], ix[miste]]            # (k, 20)
+        costa = self.costa[iy[miste], ix[miste]]
+        px, py = lon[miste], lat[miste]
+
+        # 1) Point-in-polygon sulle sole regioni candidate
+        for codice in np.flatnonzero(cand.any(axis=0)):
+            sel = np.flatnonzero(cand[:, codice] & (codici[miste] == _FUORI))
+            if len(sel):
+                dentro = self._dentro(codice, px[sel], py[sel])
+                codici[miste[sel[dentro]]] = codice
+
+        # 2) Eventi in mare vicino alla costa → regione con il confine più vicino
+        resto = np.flatnonzero(codici[miste] == _FUORI)
+        if len(resto):
+            migliore = np.full(len(resto), np.inf)
+            scelta = np.full(len(resto), _FUORI, dtype=np.int8)
+            for codice in np.flatnonzero(costa[resto].any(axis=0)):
+                sel = np.flatnonzero(costa[resto, codice])
+                dist = self._distanza(codice, px[resto[sel]], py[resto[sel]])
+                meglio = dist < migliore[sel]
+                migliore[sel[meglio]] = dist[meglio]
+                scelta[sel[meglio]] = codice
+            scelta[migliore > _BUFFER_COSTA] = _FUORI
+            codici[miste[resto]] = scelta
+        return codici
+
+
+_indice_poligoni = None
+_indice_caricato = False
+_indice_lock = threading.Lock()
+
+
+def _indice():
+    """Indice dei poligoni, costruito al primo uso (None se il file non è disponibile)."""
+    global _indice_poligoni, _indice_caricato
+    if _indice_caricato:
+        return _indice_poligoni
+    with _indice_lock:
+        if not _indice_caricato:
+            try:
+                with open(_FILE_POLIGONI, encoding="utf-8") as f:
+                    _indice_poligoni = _IndicePoligoni(json.load(f)["regioni"])
+            except Exception as e:
+                print(f"Poligoni regionali non disponibili, uso bounding box: {e}")
+                _indice_poligoni = None
+            _indice_caricato = True
+    return _indice_poligoni
+
+
+def regioni_da_coordinate(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """Codice regione per ciascun punto: poligoni regionali, bbox come ripiego."""
+    indice = _indice()
+    if indice is None:
+        return regioni_da_bbox(lat, lon)
+    return indice.classifica(lat, lon)
@@ -0,0 +1,109 @@
+"""
+registro_vulcani.py — Registro unico dei vulcani monitorati e partizione locale degli eventi.
+
+Un solo elenco (coordinate, raggio dell'area in gradi, osservatorio, ultima
+eruzione, regione) condiviso da ingestione, monitoraggio, mappa_rischi,
+home, rischi_allerte, statistiche e archivio_eventi.
+
+La sismicità vulcanica non si chiede più con una query FDSN a raggio per
+ogni vulcano: basta una query sul riquadro BBOX che li contiene tutti, poi
+appartenenza() assegna gli eventi alle aree con un haversine vettoriale
+(angolo al centro in gradi ≤ raggio, stessa semantica di maxradius FDSN;
+un evento può cadere in due aree vicine, es. Vulcano e Panarea).
+statistiche() ricava dalla stessa partizione conteggi e distribuzioni di
+magnitudo e profondità per vulcano.
+"""
+
+import numpy as np
+
+# ── Registro (raggio dell'area in gradi d'arco) ──────────────────────────────
+VULCANI = {
+    "Etna":          {"lat": 37.755, "lon": 14.995, "rad": 0.20, "obs": "INGV-CT",
+                      "ult_eruz": "Attivo",          "regione": "Sicilia"},
+    "Stromboli":     {"lat": 38.789, "lon": 15.213, "rad": 0.12, "obs": "INGV-CT",
+                      "ult_eruz": "Attivo",          "regione": "Sicilia"},
+    "Campi Flegrei": {"lat": 40.827, "lon": 14.139, "rad": 0.15, "obs": "INGV-OV",
+                      "ult_eruz": "1538",            "regione": "Campania"},
+    "Vesuvio":       {"lat": 40.821, "lon": 14.426, "rad": 0.10, "obs": "INGV-OV",
+                      "ult_eruz": "1944",            "regione": "Campania"},
+    "Vulcano":       {"lat": 38.404, "lon": 14.962, "rad": 0.12, "obs": "INGV-CT",
+                      "ult_eruz": "1888-90",         "regione": "Sicilia"},
+    "Ischia":        {"lat": 40.731, "lon": 13.897, "rad": 0.10, "obs": "INGV-OV",
+                      "ult_eruz": "1302",            "regione": "Campania"},
+    "Pantelleria":   {"lat": 36.769, "lon": 12.021, "rad": 0.10, "obs": "INGV-CT",
+                      "ult_eruz": "1891 (sub.)",     "regione": "Sicilia"},
+    "Colli Albani":  {"lat": 41.757, "lon": 12.700, "rad": 0.12, "obs": "INGV-RM",
+                      "ult_eruz": "5000 a.f.",       "regione": "Lazio"},
+    "Marsili":       {"lat": 39.270, "lon": 14.400, "rad": 0.30, "obs": "INGV",
+                      "ult_eruz": "Non doc. (sub.)", "regione": None},   # mare aperto
+    "Panarea":       {"lat": 38.636, "lon": 15.064, "rad": 0.10, "obs": "INGV-CT",
+                      "ult_eruz": "2002 (sub.)",     "regione": "Sicilia"},
+}
+NOMI = tuple(VULCANI)
+
+_LAT = np.array([v["lat"] for v in VULCANI.values()])
+_LON = np.array([v["lon"] for v in VULCANI.values()])
+_RAD = np.array([v["rad"] for v in VULCANI.values()])
+
+# Riquadro che contiene tutte le aree (margine in longitudine per cos(lat))
+_DLON = _RAD / np.cos(np.radians(_LAT + _RAD))
+BBOX = tuple(round(float(x), 2) for x in ((_LAT - _RAD).min() - 0.01, (_LAT + _RAD).max() + 0.01,
+                                          (_LON - _DLON).min() - 0.01, (_LON + _DLON).max() + 0.01))
+
+# Classi delle distribuzioni (estremo inferiore incluso, ultima aperta)
+CLASSI_MAG = (0.5, 1.0, 1.5, 2.0, 2.5, 3.0, 4.0)
+CLASSI_PROF_KM = (0.0, 2.0, 5.0, 10.0, 20.0)
+
+
+def vulcani_regione(regione: str) -> list:
+    """Nomi dei vulcani della regione, nell'ordine del registro."""
+    return [n for n, v in VULCANI.items() if v["regione"] == regione]
+
+
+# ── Partizione ───────────────────────────────────────────────────────────────
+
+def appartenenza(lat, lon) -> np.ndarray:
+    """
+    Matrice booleana N eventi × V vulcani: True se l'evento è entro il raggio
+    dell'area (angolo al centro haversine, in gradi).
+    """
+    la = np.radians(np.asarray(lat, dtype=np.float64))[:, None]
+    lo = np.radians(np.asarray(lon, dtype=np.float64))[:, None]
+    la0, lo0 = np.radians(_LAT)[None, :], np.radians(_LON)[None, :]
+    a = np.sin((la - la0) / 2) ** 2 + np.cos(la) * np.cos(la0) * np.sin((lo - lo0) / 2) ** 2
+    angolo = np.degrees(2 * np.arcsin(np.sqrt(np.minimum(a, 1.0))))
+    return angolo <= _RAD[None, :]
+
+
+def _istogramma(valori, classi) -> list:
+    valori = valori[~np.isnan(valori)]
+    indici = np.searchsorted(np.asarray(classi), valori, side="right") - 1
+    return np.bincount(indici[indici >= 0], minlength=len(classi)).tolist()
+
+
+def statistiche(tab) -> dict:
+    """
+    TabellaEventi (già filtrata per finestra e magnitudo) → nome → dict con
+    count, mag_max, mag_media, prof_mediana, ist_mag (CLASSI_MAG),
+    ist_prof (CLASSI_PROF_KM) ed eventi [[time_ms, mag, depth], ...] dal più
+    recente. Valori JSON-serializzabili (snapshot).
+    """
+    dentro = appartenenza(tab.lat, tab.lon) if len(tab) else np.zeros((0, len(NOMI)), bool)
+    mag = np.asarray(tab.mag, dtype=np.float64)
+    prof = np.asarray(tab.depth, dtype=np.float64)
+    risultati = {}
+    for j, nome in enumerate(NOMI):
+        idx = np.flatnonzero(dentro[:, j])
+        m, p = mag[idx], prof[idx]
+        p_note = p[~np.isnan(p)]
+        risultati[nome] = {
+            "count": int(idx.size),
+            "mag_max": round(float(m.max()), 1) if idx.size else None,
+            "mag_media": round(float(m.mean()), 2) if idx.size else None,
+            "prof_mediana": round(float(np.median(p_note)), 1) if p_note.size else None,
+            "ist_mag": _istogramma(m, CLASSI_MAG),
+            "ist_prof": _istogramma(p, CLASSI_PROF_KM),
+            "eventi": [[int(t), round(float(a), 1), None if np.isnan(b) else round(float(b), 1)]
+                       for t, a, b in zip(tab.time_ms[idx].tolist(), m.tolist(), p.tolist())],
+        }
+    return risultati
@@ -9,10 +9,9 @@ Fonti:
 """
 
 import streamlit as st
-import requests
+from modules import cache_swr, fetch_async, ingestione, registro_vulcani, snapshot
 import xml.etree.ElementTree as ET
 from datetime import datetime, timezone, timedelta
-from concurrent.futures import ThreadPoolExecutor, as_completed
 try:
     from streamlit_autorefresh import st_autorefresh
     _AUTOREFRESH = True
@@ -33,40 +32,21 @@ FUSO_IT = _get_tz()
 
 # ─── Fetch helpers (tutte con cache) ───────────────────────────────────────
 
-@st.cache_data(ttl=120, show_spinner=False)   # 2 minuti per sismica
 def _ingv_recent(min_mag: float, days: float, lat_min=35.0, lat_max=48.0,
                  lon_min=5.0, lon_max=20.0):
-    """Recupera eventi INGV nel riquadro geografico dato."""
-    start = (datetime.utcnow() - timedelta(days=days)).strftime("%Y-%m-%dT%H:%M:%S")
-    url = (f"https://webservices.ingv.it/fdsnws/event/1/query?format=geojson"
-           f"&starttime={start}&minmag={min_mag}"
-           f"&minlat={lat_min}&maxlat={lat_max}&minlon={lon_min}&maxlon={lon_max}"
-           f"&limit=50&orderby=time")
-    try:
-        r = requests.get(url, timeout=8)
-        if r.status_code == 200:
-            return r.json().get("features", [])
-    except Exception:
-        pass
-    return []
-
-
-@st.cache_data(ttl=120, show_spinner=False)
-def _emsc_mediterranean(min_mag: float, days: float):
-    """Recupera eventi EMSC nel Mediterraneo (area estesa, incluso Mar Nero)."""
-    start = (datetime.utcnow() - timedelta(days=days)).strftime("%Y-%m-%dT%H:%M:%S")
-    url = (f"https://www.seismicportal.eu/fdsnws/event/1/query?format=json"
-           f"&starttime={start}&minmag={min_mag}"
-           f"&minlat=28.0&maxlat=48.0&minlon=-10.0&maxlon=42.0"
-           f"&limit=30&orderby=time")
-    try:
-        r = requests.get(url, timeout=8)
-        if r.status_code == 200:
-            data = r.json()
-            return data.get("features", [])
-    except Exception:
-        pass
-    return []
+    """Eventi INGV nel riquadro geografico dato, dal catalogo sismico condiviso."""
+    from modules import catalogo_sismico
+    return catalogo_sismico.eventi(days=days, min_mag=min_mag,
+                                   bbox=(lat_min, lat_max, lon_min, lon_max), limit=50)
+
+
+def _emsc_mediterranean(min_mag: float):
+    """Eventi EMSC nel Mediterraneo (area estesa) delle ultime 24h con M≥min_mag (snapshot)."""
+    features = ingestione.leggi("emsc_mediterraneo")
+    if features is None:
+        return None
+    return [f for f in features
+            if float(f.get("properties", {}).get("mag") or 0) >= min_mag][:30]
 
 
 def _meteoalarm_italy():
@@ -80,38 +60,10 @@ def _meteoalarm_italy():
     return fetch_meteoalarm_raw()
 
 
-@st.cache_data(ttl=300, show_spinner=False)
 def _ingv_vulcani_counts():
-    """Conta eventi sismici recenti attorno ai principali vulcani italiani."""
-    vulcani = {
-        "Etna":          (37.755, 14.995, 0.15),
-        "Stromboli":     (38.789, 15.213, 0.10),
-        "Vulcano":       (38.404, 14.962, 0.08),
-        "Campi Flegrei": (40.827, 14.139, 0.12),
-        "Vesuvio":       (40.821, 14.426, 0.08),
-        "Ischia":        (40.731, 13.897, 0.07),
-        "Pantelleria":   (36.769, 12.021, 0.10),
-    }
-    start = (datetime.utcnow() - timedelta(days=7)).strftime("%Y-%m-%dT%H:%M:%S")
-    result = {}
-
-    def _fetch(name, lat, lon, rad):
-        url = (f"https://webservices.ingv.it/fdsnws/event/1/query?format=geojson"
-               f"&starttime={start}&minmag=0.5&lat={lat}&lon={lon}&maxradius={rad}&limit=50")
-        try:
-            r = requests.get(url, timeout=6)
-            if r.status_code == 200:
-                return name, len(r.json().get("features", []))
-        except Exception:
-            pass
-        return name, None
-
-    with ThreadPoolExecutor(max_workers=7) as ex:
-        futures = {ex.submit(_fetch, n, la, lo, ra): n for n, (la, lo, ra) in vulcani.items()}
-        for f in as_completed(futures):
-            name, count = f.result()
-            result[name] = count
-    return result
+    """Eventi sismici recenti (7gg) nell'area di ciascun vulcano del registro condiviso."""
+    vulcani = ingestione.leggi("vulcani") or {}
+    return {n: vulcani[n]["count"] for n in registro_vulcani.NOMI if n in vulcani}
 
 
 # ─── Parsing e classificazione ─────────────────────────────────────────────
@@ -143,6 +95,14 @@ def _parse_event(feat):
     return {"mag": mag, "luogo": luogo, "ora": ora_str, "depth": depth, "lat": lat, "lon": lon}
 
 
+def _parse_evento(ev):
+    """Come _parse_event, per un evento normalizzato del catalogo sismico."""
+    dt = datetime.fromtimestamp(ev["time_ms"] / 1000.0, FUSO_IT)
+    depth = round(ev["depth"], 1) if ev["depth"] is not None else None
+    return {"mag": ev["mag"], "luogo": ev["place"] or "N/D", "ora": dt.strftime("%d/%m %H:%M"),
+            "depth": depth, "lat": ev["lat"], "lon": ev["lon"]}
+
+
 def _tsunami_level(events_med):
     """
     Calcola livello tsunami dal più forte evento mediterraneo recente.
@@ -167,8 +127,7 @@ def _seismic_level(events_ita):
     """Calcola livello allerta sismica per il territorio italiano."""
     if not events_ita:
         return 0, "🟢 Attività sismica nella norma", "Nessun evento M≥3.0 registrato nelle ultime 48 ore.", "#10B981"
-    best = max(events_ita, key=lambda f: float(f.get("properties", {}).get("mag") or 0))
-    ev = _parse_event(best)
+    ev = _parse_evento(events_ita.riga(int(events_ita.mag.argmax())))
     m = ev["mag"]
     if m >= 5.0:
         return 4, "🔴 EVENTO FORTE", f"Evento M{m:.1f} in Italia ({ev['luogo']}, {ev['ora']}). Seguire aggiornamenti ufficiali.", "#EF4444"
@@ -305,6 +264,9 @@ def show():
         f"<i>Aggiornamento automatico ogni 2 min</i></p>",
         unsafe_allow_html=True,
     )
+    marcatore = snapshot.marcatore("emsc_mediterraneo", "vulcani", "meteoalarm", "catalogo_recente")
+    if marcatore:
+        st.caption(marcatore)
 
     # Auto-refresh ogni 2 minuti (JavaScript nativo)
     if _AUTOREFRESH:
@@ -314,22 +276,21 @@ def show():
     with col_btn:
         if st.button("🔄 Aggiorna ora"):
             st.cache_data.clear()
+            cache_swr.invalida()
+            from modules import catalogo_sismico
+            catalogo_sismico.invalida()
             st.rerun()
 
     st.markdown("---")
 
     # ── Caricamento dati in parallelo ──────────────────────────────────────
     with st.spinner("Caricamento allerte in corso…"):
-        with ThreadPoolExecutor(max_workers=4) as ex:
-            f_med   = ex.submit(_emsc_mediterranean, 5.5, 1.0)
-            f_ita   = ex.submit(_ingv_recent, 3.0, 2.0)
-            f_volc  = ex.submit(_ingv_vulcani_counts)
-            f_meteo = ex.submit(_meteoalarm_italy)
-
-        ev_med   = f_med.result()
-        ev_ita   = f_ita.result()
-        vc       = f_volc.result()
-        ma_raw   = f_meteo.result()
+        ev_med, ev_ita, vc, ma_raw = fetch_async.in_parallelo(
+            lambda: _emsc_mediterranean(5.5),
+            lambda: _ingv_recent(3.0, 2.0),
+            _ingv_vulcani_counts,
+            _meteoalarm_italy,
+        )
 
     # ── SEZIONE 1: Banner stato generale ───────────────────────────────────
     ts_lvl, ts_label, ts_desc, ts_color = _tsunami_level(ev_med)
@@ -433,7 +394,7 @@ def show():
         st.subheader("🌊 Attività Sismica — Italia (ultimi 2 giorni, M≥3.0)")
 
         if ev_ita:
-            evs = [_parse_event(f) for f in ev_ita]
+            evs = [_parse_evento(e) for e in ev_ita.righe()]
             evs.sort(key=lambda x: -x["mag"])
             for ev in evs[:15]:
                 m = ev["mag"]
@@ -479,6 +440,8 @@ def show():
                     "Vesuvio": "https://www.ov.ingv.it/",
                     "Ischia": "https://www.ov.ingv.it/",
                     "Pantelleria": "https://www.ct.ingv.it/",
+                    "Panarea": "https://www.ct.ingv.it/",
+                    "Colli Albani": "https://www.roma2.ingv.it/",
                 }
                 link = ingv_links.get(name, "https://www.ingv.it/")
                 st.markdown(
@@ -0,0 +1,102 @@
+"""
+scheduler.py — Scheduler di ingestione in background per SismaVer2.
+
+Un thread daemon per processo esegue le fonti di ingestione.py ciascuna con
+la propria cadenza, indipendentemente dal traffico: il carico verso gli
+upstream resta costante con 1 o 100 sessioni aperte e i render delle pagine
+leggono solo gli snapshot già pronti.
+
+Avviato una sola volta da app.py accanto a keep_alive.activate(); ogni
+compito gira su un piccolo pool, così un upstream lento non ritarda gli altri,
+e non viene rilanciato finché l'esecuzione precedente non è terminata.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+_TICK_S = 1.0
+_RIPROVA_S = 30          # dopo un errore si riprova prima della cadenza piena
+
+
+class _Compito:
+    __slots__ = ("nome", "funzione", "ogni", "prossimo", "in_corso",
+                 "ultimo_esito", "ultimo_errore", "durata")
+
+    def __init__(self, nome: str, funzione, ogni: float):
+        self.nome = nome
+        self.funzione = funzione
+        self.ogni = ogni
+        self.prossimo = 0.0        # subito al primo giro
+        self.in_corso = False
+        self.ultimo_esito = None   # epoch s dell'ultima esecuzione terminata
+        self.ultimo_errore = None
+        self.durata = None
+
+
+_COMPITI = {}
+_LOCK = threading.Lock()
+_thread = None
+_pool = None
+
+
+def registra(nome: str, funzione, ogni_s: float):
+    """Aggiunge (o sostituisce) un compito periodico."""
+    with _LOCK:
+        _COMPITI[nome] = _Compito(nome, funzione, ogni_s)
+
+
+def _esegui(c: _Compito):
+    t0 = time.time()
+    ok = False
+    try:
+        ok = c.funzione() is not False
+        c.ultimo_errore = None if ok else "nessun dato valido"
+    except Exception as e:
+        c.ultimo_errore = str(e)[:200]
+        print(f"Scheduler: {c.nome} fallito: {e}")
+    finally:
+        c.durata = time.time() - t0
+        c.ultimo_esito = time.time()
+        c.prossimo = c.ultimo_esito + (c.ogni if ok else min(c.ogni, _RIPROVA_S))
+        c.in_corso = False
+
+
+def _ciclo():
+    while True:
+        ora = time.time()
+        with _LOCK:
+            dovuti = [c for c in _COMPITI.values() if not c.in_corso and ora >= c.prossimo]
+            for c in dovuti:
+                c.in_corso = True
+        for c in dovuti:
+            _pool.submit(_esegui, c)
+        time.sleep(_TICK_S)
+
+
+def avvia():
+    """Registra le fonti di ingestione e avvia il thread (idempotente)."""
+    global _thread, _pool
+    with _LOCK:
+        if _thread is not None and _thread.is_alive():
+            return
+    from modules import ingestione
+    for nome, funzione, ogni in ingestione.compiti():
+        registra(nome, funzione, ogni)
+    with _LOCK:
+        if _thread is not None and _thread.is_alive():
+            return
+        _pool = ThreadPoolExecutor(max_workers=3, thread_name_prefix="sismaver-ingestione")
+        _thread = threading.Thread(target=_ciclo, name="sismaver-scheduler", daemon=True)
+        _thread.start()
+
+
+def stato() -> dict:
+    """nome → cadenza, ultima esecuzione, durata, errore, prossima esecuzione."""
+    with _LOCK:
+        return {
+            c.nome: {"ogni_s": c.ogni, "ultimo_esito": c.ultimo_esito,
+                     "durata_s": c.durata, "errore": c.ultimo_errore,
+                     "prossimo": c.prossimo, "in_corso": c.in_corso}
+            for c in _COMPITI.values()
+        }
@@ -13,12 +13,15 @@ import os
 import json
 import uuid
 import time
-import requests
+from modules import gazzetteer, http_client
 
 def _reverse_geocode(lat, lon):
-    """Chiama Nominatim per ottenere regione e comune dalle coordinate."""
+    """Regione e comune dalle coordinate: gazzetteer offline, poi Nominatim."""
+    locale = gazzetteer.inversa(lat, lon)
+    if locale:
+        return locale["regione"], locale["nome"]
     try:
-        r = requests.get(
+        r = http_client.get(
             "https://nominatim.openstreetmap.org/reverse",
             params={"lat": lat, "lon": lon, "format": "json", "addressdetails": 1},
             headers={"User-Agent": "SismaVer2/2.9.8 (meteotorre@gmail.com)"},
@@ -0,0 +1,298 @@
+"""
+serie_vulcani.py — Serie temporali della sismicità per vulcano (buffer circolari).
+
+Per ogni vulcano di registro_vulcani un buffer circolare di eventi tipizzati
+(time_ms int64, mag float32, depth float32) conservati per RITENZIONE_GIORNI:
+  - alimentato dallo scheduler a ogni giro della fonte "vulcani" (registra(),
+    eventi 7gg M≥0.5 già partizionati per area; i doppioni delle finestre
+    sovrapposte si scartano entro TOLLERANZA_MS)
+  - alla prima apertura, senza file su disco, riempito dall'archivio SQLite
+    (archivio_eventi, M≥1.5) sull'anno precedente
+  - persistito in data/serie_vulcani.npz dopo ogni aggiornamento
+
+Le pagine leggono serie già pronte, senza rete:
+  - tasso()             eventi per giorno / per ora (classi vuote incluse)
+  - momento_cumulato()  rilascio cumulato di momento sismico (Hanks-Kanamori)
+  - sta_lta()           rapporto tra tasso a breve e a lungo termine
+  - variazione()        ultimo rapporto STA/LTA e allarme di variazione
+
+Completezza: prima di inizio_live() il buffer contiene solo M≥1.5
+(archivio); tasso e STA/LTA usano quindi M≥1.5 quando la finestra richiesta
+comincia prima, per non scambiare il cambio di soglia per un aumento.
+"""
+
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from modules import registro_vulcani
+
+PERCORSO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        "data", "serie_vulcani.npz")
+RITENZIONE_GIORNI = 400
+CAPACITA = 65_536           # eventi per vulcano; pieno → si sovrascrivono i più vecchi
+TOLLERANZA_MS = 1500        # stesso evento rivisto: tempo origine entro 1.5 s
+MAG_LIVE = 0.5              # soglia della fonte "vulcani"
+MAG_ARCHIVIO = 1.5          # soglia dell'archivio SQLite (archivio_eventi.MAG_MIN_ARCHIVIO)
+
+STA_ORE = 24
+LTA_GIORNI = 30
+SOGLIA_STALTA = 3.0         # STA/LTA oltre cui il tasso è "in aumento"
+MIN_EVENTI_STA = 5          # sotto questo numero di eventi nella STA nessun allarme
+
+_ORA_MS = 3_600_000
+_GIORNO_MS = 86_400_000
+
+_SERIE = None               # nome → _Anello
+_INIZIO_LIVE = [None]       # epoch ms da cui il buffer è completo a M≥MAG_LIVE
+_LOCK = threading.RLock()
+
+
+# ── Buffer circolare ─────────────────────────────────────────────────────────
+
+class _Anello:
+    """Buffer circolare a capacità fissa, in ordine di inserimento."""
+
+    __slots__ = ("time_ms", "mag", "depth", "n", "testa", "_ordinati")
+
+    def __init__(self, capacita: int = CAPACITA):
+        self.time_ms = np.zeros(capacita, dtype=np.int64)
+        self.mag = np.zeros(capacita, dtype=np.float32)
+        self.depth = np.zeros(capacita, dtype=np.float32)
+        self.n = 0            # elementi validi
+        self.testa = 0        # prossima posizione di scrittura
+        self._ordinati = None
+
+    def aggiungi(self, t, m, d) -> int:
+        """Aggiunge gli eventi non già presenti; ritorna quanti ne ha scritti."""
+        t = np.asarray(t, dtype=np.int64)
+        if not t.size:
+            return 0
+        m = np.asarray(m, dtype=np.float32)
+        d = np.asarray(d, dtype=np.float32)
+        esistenti = self.ordinati()[0]
+        if esistenti.size:
+            pos = np.searchsorted(esistenti, t)
+            prima = np.abs(t - esistenti[np.clip(pos - 1, 0, esistenti.size - 1)])
+            dopo = np.abs(esistenti[np.clip(pos, 0, esistenti.size - 1)] - t)
+            nuovi = np.minimum(prima, dopo) > TOLLERANZA_MS
+            t, m, d = t[nuovi], m[nuovi], d[nuovi]
+        if not t.size:
+            return 0
+        ordine = np.argsort(t, kind="stable")           # i più vecchi sovrascritti per primi
+        t, m, d = t[ordine], m[ordine], d[ordine]
+        cap = self.time_ms.size
+        if t.size > cap:
+            t, m, d = t[-cap:], m[-cap:], d[-cap:]
+        idx = (self.testa + np.arange(t.size)) % cap
+        self.time_ms[idx], self.mag[idx], self.depth[idx] = t, m, d
+        self.testa = int((self.testa + t.size) % cap)
+        self.n = min(cap, self.n + int(t.size))
+        self._ordinati = None
+        return int(t.size)
+
+    def ordinati(self):
+        """(time_ms, mag, depth) degli eventi validi in ordine di tempo (vista in cache)."""
+        if self._ordinati is None:
+            t, m, d = self.time_ms[:self.n], self.mag[:self.n], self.depth[:self.n]
+            ordine = np.argsort(t, kind="stable")
+            self._ordinati = (t[ordine], m[ordine], d[ordine])
+        return self._ordinati
+
+
+# ── Caricamento / persistenza ────────────────────────────────────────────────
+
+def _semina() -> dict:
+    """Buffer iniziali dall'archivio SQLite (ultimo anno, M≥1.5), partizionati per area."""
+    serie = {nome: _Anello() for nome in registro_vulcani.NOMI}
+    try:
+        from modules import archivio_eventi
+        dati = archivio_eventi.nel_riquadro(RITENZIONE_GIORNI, registro_vulcani.BBOX)
+    except Exception as e:
+        print(f"[serie_vulcani] archivio non disponibile: {e}")
+        return serie
+    if len(dati):
+        dentro = registro_vulcani.appartenenza(dati[:, 3], dati[:, 4])
+        for j, nome in enumerate(registro_vulcani.NOMI):
+            sel = dati[dentro[:, j]]
+            serie[nome].aggiungi(sel[:, 0], sel[:, 1], sel[:, 2])
+    print(f"[serie_vulcani] {len(dati)} eventi dall'archivio")
+    return serie
+
+
+def _carica() -> dict:
+    global _SERIE
+    if _SERIE is not None:
+        return _SERIE
+    with _LOCK:
+        if _SERIE is None:
+            try:
+                with np.load(PERCORSO, allow_pickle=False) as f:
+                    f = {k: f[k] for k in f.files}
+                serie = {nome: _Anello() for nome in registro_vulcani.NOMI}
+                for j, nome in enumerate(f["nomi"].tolist()):
+                    if nome in serie:
+                        sel = f["vulcano"] == j
+                        serie[nome].aggiungi(f["time_ms"][sel], f["mag"][sel], f["depth"][sel])
+                _INIZIO_LIVE[0] = int(f["inizio_live"]) or None
+            except FileNotFoundError:
+                serie = _semina()
+            except Exception as e:
+                print(f"[serie_vulcani] {PERCORSO} non leggibile ({e}), ricostruzione dall'archivio")
+                serie = _semina()
+            _SERIE = serie
+    return _SERIE
+
+
+def _salva(serie: dict):
+    from modules import snapshot
+    nomi = list(serie)
+    da_ms = int(time.time() * 1000) - RITENZIONE_GIORNI * _GIORNO_MS
+    viste = []
+    for n in nomi:
+        t, m, d = serie[n].ordinati()
+        viste.append((t[t >= da_ms], m[t >= da_ms], d[t >= da_ms]))
+    dati = {
+        "nomi": np.array(nomi, dtype=str),
+        "vulcano": np.concatenate([np.full(v[0].size, j, dtype=np.int8)
+                                   for j, v in enumerate(viste)]),
+        "time_ms": np.concatenate([v[0] for v in viste]),
+        "mag": np.concatenate([v[1] for v in viste]),
+        "depth": np.concatenate([v[2] for v in viste]),
+        "inizio_live": np.int64(_INIZIO_LIVE[0] or 0),
+    }
+    snapshot.scrivi_atomico(PERCORSO, lambda f: np.savez_compressed(f, **dati))
+
+
+def registra(statistiche: dict) -> int:
+    """
+    Aggiunge gli eventi della fonte "vulcani" (nome → {"eventi": [[time_ms,
+    mag, depth], ...]}) e salva su disco. Ritorna il numero di eventi nuovi.
+    """
+    with _LOCK:
+        serie = _carica()
+        nuovi = 0
+        for nome, v in statistiche.items():
+            eventi = v.get("eventi")
+            if nome not in serie or not eventi:
+                continue
+            arr = np.array([[e[0], e[1], np.nan if e[2] is None else e[2]] for e in eventi],
+                           dtype=np.float64)
+            nuovi += serie[nome].aggiungi(arr[:, 0], arr[:, 1], arr[:, 2])
+        if _INIZIO_LIVE[0] is None and any(v.get("count") is not None
+                                           for v in statistiche.values()):
+            _INIZIO_LIVE[0] = int(time.time() * 1000) - 7 * _GIORNO_MS
+        try:
+            _salva(serie)
+        except Exception as e:
+            print(f"[serie_vulcani] salvataggio non riuscito: {e}")
+        return nuovi
+
+
+def inizio_live():
+    """Epoch ms da cui il buffer è completo a M≥0.5 (None: solo dati d'archivio)."""
+    _carica()
+    return _INIZIO_LIVE[0]
+
+
+# ── Serie ────────────────────────────────────────────────────────────────────
+
+def _soglia(da_ms: int, min_mag) -> float:
+    if min_mag is not None:
+        return float(min_mag)
+    live = _INIZIO_LIVE[0]
+    return MAG_LIVE if live is not None and da_ms >= live else MAG_ARCHIVIO
+
+
+def eventi(nome: str, giorni: float = None, min_mag: float = None, ora_ms: int = None):
+    """(time_ms, mag, depth) del vulcano in ordine di tempo, filtrati per finestra/soglia."""
+    t, m, d = _carica()[nome].ordinati()
+    ora_ms = ora_ms if ora_ms is not None else int(time.time() * 1000)
+    da_ms = ora_ms - int((giorni if giorni is not None else RITENZIONE_GIORNI) * _GIORNO_MS)
+    sel = (t >= da_ms) & (t <= ora_ms)
+    if min_mag is not None:
+        sel &= m >= np.float32(min_mag)
+    return t[sel], m[sel], d[sel]
+
+
+def tasso(nome: str, passo: str = "giorno", giorni: float = 30, min_mag: float = None,
+          offset_s: int = 0, ora_ms: int = None) -> pd.DataFrame:
+    """
+    Eventi per classe ("giorno" o "ora", confini in ora locale con offset_s):
+    colonne inizio (datetime locale), count, mag_max. Classi senza eventi incluse.
+    """
+    larghezza = _GIORNO_MS if passo == "giorno" else _ORA_MS
+    ora_ms = ora_ms if ora_ms is not None else int(time.time() * 1000)
+    off = int(offset_s) * 1000
+    fine = (ora_ms + off) // larghezza + 1
+    inizio = fine - int(np.ceil(giorni * _GIORNO_MS / larghezza))
+    da_ms = inizio * larghezza - off
+    t, m, _d = eventi(nome, min_mag=_soglia(da_ms, min_mag), ora_ms=ora_ms)
+    t, m = t[t >= da_ms], m[t >= da_ms]
+    classi = (t + off) // larghezza - inizio
+    k = fine - inizio
+    count = np.bincount(classi, minlength=k)[:k]
+    mag_max = np.full(k, np.nan)
+    np.fmax.at(mag_max, classi, m.astype(np.float64))
+    return pd.DataFrame({
+        "inizio": pd.to_datetime((np.arange(inizio, fine) * larghezza), unit="ms"),
+        "count": count,
+        "mag_max": np.round(mag_max, 1),
+    })
+
+
+def momento_nm(mag) -> np.ndarray:
+    """Momento sismico (N·m) da magnitudo, M0 = 10^(1.5·M + 9.1) con ML ≈ Mw."""
+    return 10.0 ** (1.5 * np.asarray(mag, dtype=np.float64) + 9.1)
+
+
+def momento_cumulato(nome: str, giorni: float = 365, min_mag: float = None,
+                     ora_ms: int = None) -> pd.DataFrame:
+    """Rilascio cumulato di momento: colonne time (datetime UTC), mag, momento_cum (N·m)."""
+    t, m, _d = eventi(nome, giorni=giorni, min_mag=min_mag, ora_ms=ora_ms)
+    return pd.DataFrame({"time": pd.to_datetime(t, unit="ms"), "mag": m,
+                         "momento_cum": np.cumsum(momento_nm(m))})
+
+
+def sta_lta(nome: str, sta_ore: float = STA_ORE, lta_giorni: float = LTA_GIORNI,
+            giorni: float = 30, min_mag: float = None, ora_ms: int = None) -> pd.DataFrame:
+    """
+    Rapporto STA/LTA del tasso orario: per ogni ora, eventi/ora nelle ultime
+    sta_ore diviso eventi/ora negli ultimi lta_giorni (somme cumulative, tutte
+    le finestre in un colpo). LTA minima di un evento per finestra, per non
+    dividere per zero su un vulcano silente.
+    Colonne: inizio, sta (ev/h), lta (ev/h), rapporto, n_sta.
+    """
+    lta_ore = int(round(lta_giorni * 24))
+    sta_ore = int(round(sta_ore))
+    ora_ms = ora_ms if ora_ms is not None else int(time.time() * 1000)
+    da_ms = ora_ms - int((giorni + lta_giorni) * _GIORNO_MS)
+    orario = tasso(nome, passo="ora", giorni=giorni + lta_giorni,
+                   min_mag=_soglia(da_ms, min_mag), ora_ms=ora_ms)
+    cum = np.concatenate([[0], np.cumsum(orario["count"].to_numpy())])
+    i = np.arange(lta_ore, len(orario)) + 1
+    n_sta = cum[i] - cum[np.maximum(i - sta_ore, 0)]
+    n_lta = cum[i] - cum[i - lta_ore]
+    sta = n_sta / sta_ore
+    lta = np.maximum(n_lta, 1) / lta_ore
+    return pd.DataFrame({"inizio": orario["inizio"].to_numpy()[i - 1],
+                         "sta": sta, "lta": n_lta / lta_ore,
+                         "rapporto": sta / lta, "n_sta": n_sta})
+
+
+def variazione(nome: str, min_mag: float = None) -> dict:
+    """Ultimo STA/LTA del vulcano: rapporto, eventi nella STA e flag di aumento."""
+    try:
+        s = sta_lta(nome, giorni=1, min_mag=min_mag)
+    except Exception as e:
+        print(f"[serie_vulcani] STA/LTA {nome}: {e}")
+        return {"rapporto": None, "n_sta": 0, "in_aumento": False}
+    if s.empty:
+        return {"rapporto": None, "n_sta": 0, "in_aumento": False}
+    ultimo = s.iloc[-1]
+    rapporto, n_sta = float(ultimo["rapporto"]), int(ultimo["n_sta"])
+    return {"rapporto": round(rapporto, 2), "n_sta": n_sta,
+            "in_aumento": rapporto >= SOGLIA_STALTA and n_sta >= MIN_EVENTI_STA}
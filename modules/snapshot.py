@@ -0,0 +1,190 @@
+"""
+snapshot.py — Snapshot CONDIVISI di processo per SismaVer2, persistiti su disco.
+
+Lo scheduler di ingestione (scheduler.py) scrive qui l'ultimo valore buono di
+ogni fonte live; le funzioni show() delle pagine si limitano a leggerlo.
+Ogni snapshot conserva anche l'istante di aggiornamento, per mostrare
+"dati aggiornati alle ..." e per capire quanto è vecchio un valore.
+
+Persistenza: ogni pubblicazione viene salvata in data/snapshot/<nome>.json.gz
+con scrittura atomica (file temporaneo + os.replace). Al primo accesso dopo
+un riavvio / risveglio dall'ibernazione gli snapshot vengono ricaricati dal
+disco: le pagine mostrano subito l'ultimo dato noto, con il marcatore
+"dati del ..." finché lo scheduler non pubblica il primo aggiornamento.
+"""
+
+import base64
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone, timedelta
+
+DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                   "data", "snapshot")
+ETA_MAX_DISCO = 48 * 3600     # snapshot più vecchi di 48h non vengono ricaricati
+
+_SNAPSHOT = {}
+_DA_DISCO = {}                 # nome → epoch dei dati ricaricati, finché non arriva un refresh
+_LOCK = threading.Lock()
+_caricati = False
+
+
+def fuso_italia():
+    """Fuso orario italiano corrente (CET/CEST, cambio l'ultima domenica di marzo/ottobre alle 01 UTC)."""
+    n = datetime.utcnow(); y = n.year
+    ds = datetime(y, 3, 31 - (datetime(y, 3, 31).weekday() + 1) % 7, 1)
+    de = datetime(y, 10, 31 - (datetime(y, 10, 31).weekday() + 1) % 7, 1)
+    return timezone(timedelta(hours=2 if ds <= n < de else 1))
+
+
+class _Snapshot:
+    __slots__ = ("valore", "aggiornato")
+
+    def __init__(self, valore, aggiornato: float):
+        self.valore = valore
+        self.aggiornato = aggiornato
+
+
+# ── Disco ────────────────────────────────────────────────────────────────────
+
+def scrivi_atomico(percorso: str, scrivi):
+    """
+    Scrive `percorso` in modo atomico: `scrivi(file_binario)` riempie un file
+    temporaneo nella stessa cartella che poi sostituisce quello vecchio.
+    Un crash a metà scrittura non lascia mai un file troncato.
+    """
+    os.makedirs(os.path.dirname(percorso), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(percorso), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            scrivi(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, percorso)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _percorso(nome: str) -> str:
+    return os.path.join(DIR, f"{nome}.json.gz")
+
+
+def _salva(nome: str, valore, aggiornato: float):
+    if isinstance(valore, bytes):
+        doc = {"tipo": "bytes", "valore": base64.b64encode(valore).decode("ascii")}
+    else:
+        doc = {"tipo": "json", "valore": valore}
+    doc["aggiornato"] = aggiornato
+    dati = gzip.compress(json.dumps(doc, separators=(",", ":")).encode("utf-8"))
+    try:
+        scrivi_atomico(_percorso(nome), lambda f: f.write(dati))
+    except Exception as e:
+        print(f"Snapshot {nome}: salvataggio su disco fallito: {e}")
+
+
+def _carica_file(percorso: str):
+    with gzip.open(percorso, "rb") as f:
+        doc = json.loads(f.read().decode("utf-8"))
+    valore = doc["valore"]
+    if doc.get("tipo") == "bytes":
+        valore = base64.b64decode(valore)
+    return valore, float(doc["aggiornato"])
+
+
+def _assicura_caricati():
+    """Ricarica dal disco gli snapshot dell'ultima esecuzione (una volta per processo)."""
+    global _caricati
+    if _caricati:
+        return
+    with _LOCK:
+        if _caricati:
+            return
+        _caricati = True
+        try:
+            nomi = [f[:-len(".json.gz")] for f in os.listdir(DIR) if f.endswith(".json.gz")]
+        except OSError:
+            return
+        for nome in nomi:
+            try:
+                valore, aggiornato = _carica_file(_percorso(nome))
+            except Exception as e:
+                print(f"Snapshot {nome}: file su disco illeggibile: {e}")
+                continue
+            if time.time() - aggiornato > ETA_MAX_DISCO or nome in _SNAPSHOT:
+                continue
+            _SNAPSHOT[nome] = _Snapshot(valore, aggiornato)
+            _DA_DISCO[nome] = aggiornato
+        if _DA_DISCO:
+            print(f"Snapshot ricaricati dal disco: {', '.join(sorted(_DA_DISCO))}")
+
+
+# ── API ──────────────────────────────────────────────────────────────────────
+
+def pubblica(nome: str, valore, aggiornato: float = None, persisti: bool = True):
+    """Sostituisce lo snapshot `nome` (i lettori vedono il nuovo valore per intero)."""
+    _assicura_caricati()
+    aggiornato = aggiornato if aggiornato is not None else time.time()
+    with _LOCK:
+        _SNAPSHOT[nome] = _Snapshot(valore, aggiornato)
+        _DA_DISCO.pop(nome, None)
+    if persisti:
+        _salva(nome, valore, aggiornato)
+
+
+def leggi(nome: str, default=None):
+    _assicura_caricati()
+    s = _SNAPSHOT.get(nome)
+    return s.valore if s is not None else default
+
+
+def aggiornato(nome: str):
+    """Epoch s dell'ultimo aggiornamento dello snapshot, None se assente."""
+    _assicura_caricati()
+    s = _SNAPSHOT.get(nome)
+    return s.aggiornato if s is not None else None
+
+
+def eta(nome: str):
+    """Età in secondi dello snapshot, None se assente."""
+    t = aggiornato(nome)
+    return time.time() - t if t is not None else None
+
+
+def segna_da_disco(nome: str, aggiornato: float):
+    """Dati di `nome` ricaricati dal disco da un altro store (es. catalogo sismico)."""
+    with _LOCK:
+        _DA_DISCO[nome] = aggiornato
+
+
+def segna_aggiornato(nome: str):
+    """Il primo refresh dopo l'avvio è arrivato: niente più marcatore per `nome`."""
+    with _LOCK:
+        _DA_DISCO.pop(nome, None)
+
+
+def marcatore(*nomi) -> str:
+    """
+    Testo "dati del ..." se almeno uno degli snapshot indicati è ancora quello
+    ricaricato dal disco all'avvio, altrimenti None.
+    """
+    _assicura_caricati()
+    ts = [_DA_DISCO[n] for n in nomi if n in _DA_DISCO]
+    if not ts:
+        return None
+    dt = datetime.fromtimestamp(min(ts), fuso_italia())
+    return (f"⏳ Dati del {dt.strftime('%d/%m/%Y %H:%M')} (ultima sessione) — "
+            f"aggiornamento in corso…")
+
+
+def elenco() -> dict:
+    """nome → epoch s di aggiornamento, per diagnostica."""
+    _assicura_caricati()
+    with _LOCK:
+        return {nome: s.aggiornato for nome, s in sorted(_SNAPSHOT.items())}
@@ -1,15 +1,22 @@
 """
 statistiche.py — Analisi storica e statistiche sismiche per SismaVer2 v3.0
 Fonte: INGV FDSN Web Service — dati storici liberi
+
+I grafici leggono aggregati SQL dall'archivio locale (archivio_eventi.py),
+alimentato dallo scheduler: finestre fino a 5 anni senza riscaricare eventi.
+La scheda "Lungo periodo" legge l'archivio colonnare pluridecennale
+(archivio_colonne.py, popolato offline da import_storico.py).
 """
+import os
 import streamlit as st
-import requests
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta, timezone
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
+from modules import (analisi_gr, archivio_colonne, archivio_eventi, cache_swr, declustering,
+                     regioni_geo)
 try:
     from streamlit_autorefresh import st_autorefresh as _sar
     _AR = True
@@ -25,80 +32,64 @@ def _get_tz():
 
 FUSO_IT = _get_tz()
 
-# ─── Fetch dati storici INGV ───────────────────────────────────────────────────
-
-@st.cache_data(ttl=300, show_spinner=False)
-def _fetch_storico(days: int = 90, min_mag: float = 2.0) -> pd.DataFrame:
-    """Recupera eventi sismici storici: INGV primario, USGS come fallback affidabile."""
-    end   = datetime.utcnow()
-    start = end - timedelta(days=days)
-    fmt_s = start.strftime("%Y-%m-%dT%H:%M:%S")
-    fmt_e = end.strftime("%Y-%m-%dT%H:%M:%S")
-
-    sources = [
-        (   # INGV — catalogo ufficiale italiano
-            f"https://webservices.ingv.it/fdsnws/event/1/query?format=geojson"
-            f"&starttime={fmt_s}&endtime={fmt_e}"
-            f"&minmag={min_mag}&minlat=35.0&maxlat=48.0&minlon=5.0&maxlon=20.0"
-            f"&limit=2000&orderby=time",
-            "INGV", 15,
-        ),
-        (   # USGS — fallback sempre disponibile
-            f"https://earthquake.usgs.gov/fdsnws/event/1/query?format=geojson"
-            f"&starttime={fmt_s}&endtime={fmt_e}"
-            f"&minmagnitude={min_mag}&minlatitude=35.0&maxlatitude=48.0"
-            f"&minlongitude=5.0&maxlongitude=20.0"
-            f"&limit=2000&orderby=time",
-            "USGS", 20,
-        ),
-    ]
-
-    for url, source, timeout in sources:
-        try:
-            r = requests.get(url, timeout=timeout)
-            if r.status_code != 200:
-                continue
-            features = r.json().get("features", [])
-            if not features:
-                continue
-            rows = []
-            for f in features:
-                p = f.get("properties", {})
-                g = f.get("geometry", {}).get("coordinates", [None, None, None])
-                t = p.get("time")
-                try:
-                    if isinstance(t, (int, float)):
-                        dt = datetime.fromtimestamp(t / 1000.0, FUSO_IT)
-                    else:
-                        dt = datetime.fromisoformat(
-                            str(t).replace("Z", "+00:00")).astimezone(FUSO_IT)
-                except Exception:
-                    continue
-                rows.append({
-                    "datetime": dt,
-                    "mag":      p.get("mag"),
-                    "depth":    round(g[2], 1) if g[2] is not None else None,
-                    "lat":      g[1],
-                    "lon":      g[0],
-                    "place":    p.get("place", ""),
-                    "mag_type": p.get("magType", ""),
-                    "data":     dt.date(),
-                    "ora":      dt.hour,
-                    "giorno_settimana": dt.weekday(),
-                    "mese":     dt.strftime("%b %Y"),
-                    "fonte":    source,
-                })
-            df = pd.DataFrame(rows)
-            if not df.empty:
-                df["mag"]   = pd.to_numeric(df["mag"],   errors="coerce")
-                df["depth"] = pd.to_numeric(df["depth"], errors="coerce")
-                df = df.dropna(subset=["mag"])
-                print(f"INFO statistiche: {len(df)} eventi da {source}")
-                return df
-        except Exception as e:
-            print(f"Errore fetch statistiche ({source}): {e}")
-            continue
-    return pd.DataFrame()
+# ─── Aggregati dall'archivio eventi (SQLite) ──────────────────────────────────
+
+def _offset_s() -> int:
+    return int(FUSO_IT.utcoffset(None).total_seconds())
+
+
+@cache_swr.swr(ttl=300)
+def _statistiche(days: int = 90, min_mag: float = 2.0):
+    """
+    Aggregati della finestra (riepilogo, giornaliero, istogrammi, ora/giorno,
+    luoghi, celle, eventi più forti) dall'archivio; None se non ci sono eventi.
+    """
+    try:
+        if days <= 365 and archivio_eventi.vuoto():
+            # Archivio ancora vuoto (primo avvio): lo alimenta la finestra storica
+            # del catalogo, con le stesse regole dello scheduler (solo INGV)
+            from modules import catalogo_sismico, ingestione
+            catalogo_sismico.eventi_storici(days=days, min_mag=1.5)
+            ingestione.archivia_catalogo(storico=True)
+        riepilogo = archivio_eventi.riepilogo(days, min_mag)
+        if not riepilogo["n"]:
+            return None
+        off = _offset_s()
+        dati = {
+            "riepilogo":   riepilogo,
+            "giornaliero": archivio_eventi.giornaliero(days, min_mag, off),
+            "mag":         archivio_eventi.istogramma("mag", 0.1, days, min_mag),
+            "depth":       archivio_eventi.istogramma("depth", 2.0, days, min_mag),
+            "ora":         archivio_eventi.per_ora(days, min_mag, off),
+            "settimana":   archivio_eventi.per_giorno_settimana(days, min_mag, off),
+            "luoghi":      archivio_eventi.per_luogo(days, min_mag),
+            "celle":       archivio_eventi.celle(days, min_mag, 0.1 if days <= 365 else 0.2),
+            "top":         archivio_eventi.piu_forti(days, min_mag, 20),
+        }
+    except Exception as e:
+        print(f"Errore statistiche archivio: {e}")
+        return None
+    print(f"INFO statistiche: {riepilogo['n']} eventi dall'archivio ({days}gg, M≥{min_mag})")
+    return dati
+
+
+# ─── Lungo periodo: archivio colonnare + terremoti storici ────────────────────
+
+_CSV_STORICI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            "terremoti_italia.csv")
+
+
+@st.cache_data(show_spinner=False)
+def _terremoti_storici() -> pd.DataFrame:
+    """Grandi terremoti storici italiani (data, magnitudo, località, vittime)."""
+    try:
+        df = pd.read_csv(_CSV_STORICI)
+        df["Data"] = pd.to_datetime(df["Data"])
+        df["anno"] = df["Data"].dt.year
+        return df
+    except Exception as e:
+        print(f"Terremoti storici non disponibili: {e}")
+        return pd.DataFrame()
 
 
 # ─── Categoria magnitudo ───────────────────────────────────────────────────────
@@ -124,39 +115,62 @@ _GIORNI_ITA = ["Lunedì","Martedì","Mercoledì","Giovedì","Venerdì","Sabato",
 
 # ─── Estrai regione approssimata ──────────────────────────────────────────────
 
+_ZONE_MAP = {
+    "sicilia": "Sicilia", "etna": "Sicilia", "messina": "Sicilia",
+    "calabria": "Calabria", "reggio": "Calabria",
+    "campania": "Campania", "vesuvio": "Campania", "flegrei": "Campania", "naples": "Campania",
+    "puglia": "Puglia", "bari": "Puglia", "foggia": "Puglia",
+    "basilicata": "Basilicata", "potenza": "Basilicata",
+    "abruzzo": "Abruzzo", "l'aquila": "Abruzzo", "pescara": "Abruzzo",
+    "marche": "Marche", "ancona": "Marche",
+    "lazio": "Lazio", "roma": "Lazio", "rieti": "Lazio",
+    "umbria": "Umbria", "perugia": "Umbria",
+    "toscana": "Toscana", "florence": "Toscana",
+    "emilia": "Emilia-Romagna", "bologna": "Emilia-Romagna",
+    "lombardia": "Lombardia", "milan": "Lombardia",
+    "friuli": "Friuli-VG", "trieste": "Friuli-VG",
+    "veneto": "Veneto", "venezia": "Veneto",
+    "trentino": "Trentino-AA", "alto adige": "Trentino-AA",
+    "sardegna": "Sardegna", "sardinia": "Sardegna",
+    "mar tirreno": "Mar Tirreno", "tirreno": "Mar Tirreno",
+    "mar adriatico": "Adriatico", "adriatico": "Adriatico",
+    "mar ionio": "Mar Ionio", "ionio": "Mar Ionio",
+    "stromboli": "Eolie", "lipari": "Eolie",
+}
+
+# Nomi brevi usati da _ZONE_MAP per le regioni assegnate dal catalogo
+_ZONA_DA_REGIONE = {"Friuli-Venezia Giulia": "Friuli-VG", "Trentino-Alto Adige": "Trentino-AA"}
+
+
 def _estrai_zona(place: str) -> str:
     """Estrae area geografica dal campo 'place' INGV."""
     if not place:
         return "Altra zona"
     place_lower = place.lower()
-    zone_map = {
-        "sicilia": "Sicilia", "etna": "Sicilia", "messina": "Sicilia",
-        "calabria": "Calabria", "reggio": "Calabria",
-        "campania": "Campania", "vesuvio": "Campania", "flegrei": "Campania", "naples": "Campania",
-        "puglia": "Puglia", "bari": "Puglia", "foggia": "Puglia",
-        "basilicata": "Basilicata", "potenza": "Basilicata",
-        "abruzzo": "Abruzzo", "l'aquila": "Abruzzo", "pescara": "Abruzzo",
-        "marche": "Marche", "ancona": "Marche",
-        "lazio": "Lazio", "roma": "Lazio", "rieti": "Lazio",
-        "umbria": "Umbria", "perugia": "Umbria",
-        "toscana": "Toscana", "florence": "Toscana",
-        "emilia": "Emilia-Romagna", "bologna": "Emilia-Romagna",
-        "lombardia": "Lombardia", "milan": "Lombardia",
-        "friuli": "Friuli-VG", "trieste": "Friuli-VG",
-        "veneto": "Veneto", "venezia": "Veneto",
-        "trentino": "Trentino-AA", "alto adige": "Trentino-AA",
-        "sardegna": "Sardegna", "sardinia": "Sardegna",
-        "mar tirreno": "Mar Tirreno", "tirreno": "Mar Tirreno",
-        "mar adriatico": "Adriatico", "adriatico": "Adriatico",
-        "mar ionio": "Mar Ionio", "ionio": "Mar Ionio",
-        "stromboli": "Eolie", "lipari": "Eolie",
-    }
-    for chiave, zona in zone_map.items():
+    for chiave, zona in _ZONE_MAP.items():
         if chiave in place_lower:
             return zona
     return "Altra zona"
 
 
+def _zone(luoghi: pd.DataFrame) -> pd.Series:
+    """
+    Zona per (luogo, regione) aggregati dall'archivio: parole chiave sul luogo,
+    poi regione del catalogo (sigla provincia / poligoni).
+    """
+    zona = luoghi["place"].fillna("").map(_estrai_zona).astype(str)
+    codici = luoghi["regione"].fillna(regioni_geo.NESSUNA).astype(int).to_numpy()
+    regione = pd.Series(regioni_geo.NOMI[codici], index=luoghi.index).replace(_ZONA_DA_REGIONE)
+    usa_regione = (zona == "Altra zona") & (regione != "")
+    return zona.where(~usa_regione, regione)
+
+
+def _periodo(x: int) -> str:
+    if x < 365:
+        return f"Ultimi {x} giorni"
+    return "Ultimo anno" if x == 365 else f"Ultimi {x // 365} anni"
+
+
 # ─── Pagina principale ────────────────────────────────────────────────────────
 
 def show():
@@ -183,31 +197,38 @@ def show():
     st.sidebar.subheader("⚙️ Parametri analisi")
     days = st.sidebar.selectbox(
         "Periodo storico",
-        [30, 60, 90, 180, 365],
+        [30, 60, 90, 180, 365, 730, 1095, 1825],
         index=2,
-        format_func=lambda x: f"Ultimi {x} giorni" if x < 365 else "Ultimo anno"
+        format_func=_periodo,
     )
     min_mag = st.sidebar.slider("Magnitudo minima", 1.5, 4.0, 2.0, 0.5)
 
-    with st.spinner("Caricamento dati storici (INGV → USGS fallback)..."):
-        df = _fetch_storico(days=days, min_mag=min_mag)
+    with st.spinner("Caricamento dati storici dall'archivio eventi..."):
+        dati = _statistiche(days=days, min_mag=min_mag)
 
-    if df.empty:
+    if dati is None:
         st.error(
             "⚠️ Dati storici non disponibili — sia INGV che USGS irraggiungibili. "
             "Riprova tra qualche minuto."
         )
         return
 
-    df["categoria"] = df["mag"].apply(_cat_mag)
-    df["zona"] = df["place"].apply(_estrai_zona)
+    # Finestre lunghe: l'archivio si completa all'indietro un mese alla volta
+    copertura_ms = archivio_eventi.copertura()
+    inizio_finestra = ora - timedelta(days=days)
+    if copertura_ms is not None:
+        dal = datetime.fromtimestamp(copertura_ms / 1000, FUSO_IT)
+        if dal > inizio_finestra + timedelta(days=2):
+            st.info(f"ℹ️ L'archivio locale copre per ora gli eventi dal {dal.strftime('%d/%m/%Y')}: "
+                    f"il completamento degli anni precedenti è in corso in background.")
 
     # ── KPI globali ──────────────────────────────────────────────────────────
-    n_totale = len(df)
-    mag_max = df["mag"].max()
-    mag_media = df["mag"].mean()
-    depth_media = df["depth"].dropna().mean()
-    n_significativi = len(df[df["mag"] >= 4.0])
+    riep = dati["riepilogo"]
+    n_totale = riep["n"]
+    mag_max = riep["mag_max"]
+    mag_media = riep["mag_media"]
+    depth_media = riep["depth_media"] if riep["depth_media"] is not None else np.nan
+    n_significativi = riep["n_significativi"]
 
     c1, c2, c3, c4, c5 = st.columns(5)
     c1.metric("Totale eventi", f"{n_totale:,}", f"M≥{min_mag} · {days}gg")
@@ -218,21 +239,23 @@ def show():
 
     st.markdown("---")
 
+    df_giorno = dati["giornaliero"].copy()
+    df_giorno["data"] = pd.to_datetime(df_giorno["data"])
+
     # ── TAB Grafici ──────────────────────────────────────────────────────────
-    tab1, tab2, tab3, tab4 = st.tabs([
+    tab1, tab2, tab3, tab4, tab_gr, tab5 = st.tabs([
         "📅 Frequenza nel tempo",
         "📊 Distribuzione magnitudo",
         "🌍 Distribuzione geografica",
         "🕐 Analisi temporale",
+        "📐 Gutenberg-Richter",
+        "🏛️ Lungo periodo",
     ])
 
     # ── TAB 1: Frequenza nel tempo ────────────────────────────────────────────
     with tab1:
         st.subheader("Frequenza giornaliera eventi sismici")
 
-        df_giorno = df.groupby("data").size().reset_index(name="count")
-        df_giorno["data"] = pd.to_datetime(df_giorno["data"])
-        df_giorno = df_giorno.sort_values("data")
         df_giorno["media_mobile_7g"] = df_giorno["count"].rolling(7, min_periods=1).mean()
 
         fig = go.Figure()
@@ -263,10 +286,15 @@ def show():
 
         # Grafico per categoria magnitudo nel tempo
         st.subheader("Composizione per magnitudo nel tempo")
-        df_giorno_cat = df.groupby(["data", "categoria"]).size().reset_index(name="count")
-        df_giorno_cat["data"] = pd.to_datetime(df_giorno_cat["data"])
-        cat_ordine = ["Leggero (3-4)", "Moderato (4-5)", "Forte (5-6)", "Severo (≥6.0)"]
-        df_sig = df_giorno_cat[df_giorno_cat["categoria"].isin(cat_ordine)]
+        df_sig = df_giorno.melt(
+            id_vars="data", value_vars=["n_3_4", "n_4_5", "n_5_6", "n_6"],
+            var_name="categoria", value_name="count",
+        )
+        df_sig["categoria"] = df_sig["categoria"].map({
+            "n_3_4": "Leggero (3-4)", "n_4_5": "Moderato (4-5)",
+            "n_5_6": "Forte (5-6)", "n_6": "Severo (≥6.0)",
+        })
+        df_sig = df_sig[df_sig["count"] > 0]
 
         if not df_sig.empty:
             fig2 = px.bar(
@@ -291,20 +319,21 @@ def show():
     # ── TAB 2: Distribuzione magnitudo ────────────────────────────────────────
     with tab2:
         col_l, col_r = st.columns(2)
+        df_mag = dati["mag"]
 
         with col_l:
             st.subheader("Distribuzione delle magnitudo")
-            fig3 = px.histogram(
-                df, x="mag", nbins=40,
-                color_discrete_sequence=["#3B82F6"],
-                labels={"mag": "Magnitudo", "count": "Numero eventi"},
-                height=340,
-            )
+            fig3 = go.Figure(go.Bar(
+                x=df_mag["mag"] + 0.05, y=df_mag["count"], width=0.1,
+                marker_color="#3B82F6",
+                hovertemplate="M %{x:.1f}<br>%{y} eventi<extra></extra>",
+            ))
             fig3.update_traces(
                 marker_line_color="white",
                 marker_line_width=0.5,
             )
             fig3.update_layout(
+                height=340,
                 plot_bgcolor="white", paper_bgcolor="white",
                 xaxis=dict(showgrid=True, gridcolor="#F1F5F9", title="Magnitudo"),
                 yaxis=dict(showgrid=True, gridcolor="#F1F5F9", title="Numero eventi"),
@@ -321,8 +350,9 @@ def show():
 
         with col_r:
             st.subheader("Ripartizione per categoria")
-            cat_counts = df["categoria"].value_counts().reset_index()
-            cat_counts.columns = ["categoria", "count"]
+            cat_counts = (df_mag.assign(categoria=df_mag["mag"].apply(_cat_mag))
+                          .groupby("categoria")["count"].sum()
+                          .sort_values(ascending=False).reset_index())
             colori = [_CAT_COLORS.get(c, "#94A3B8") for c in cat_counts["categoria"]]
             fig4 = go.Figure(go.Pie(
                 labels=cat_counts["categoria"],
@@ -343,16 +373,16 @@ def show():
 
         # Distribuzione profondità
         st.subheader("Distribuzione della profondità ipocentrale")
-        df_depth = df.dropna(subset=["depth"])
+        df_depth = dati["depth"]
         if not df_depth.empty:
-            fig5 = px.histogram(
-                df_depth, x="depth", nbins=50,
-                color_discrete_sequence=["#8B5CF6"],
-                labels={"depth": "Profondità (km)", "count": "Numero eventi"},
-                height=300,
-            )
+            fig5 = go.Figure(go.Bar(
+                x=df_depth["depth"] + 1.0, y=df_depth["count"], width=2.0,
+                marker_color="#8B5CF6",
+                hovertemplate="%{x:.0f} km<br>%{y} eventi<extra></extra>",
+            ))
             fig5.update_traces(marker_line_color="white", marker_line_width=0.5)
             fig5.update_layout(
+                height=300,
                 plot_bgcolor="white", paper_bgcolor="white",
                 xaxis=dict(showgrid=True, gridcolor="#F1F5F9", title="Profondità (km)"),
                 yaxis=dict(showgrid=True, gridcolor="#F1F5F9", title="Numero eventi"),
@@ -369,22 +399,22 @@ def show():
     # ── TAB 3: Distribuzione geografica ───────────────────────────────────────
     with tab3:
         st.subheader("Mappa di densità epicentri")
-        df_geo = df.dropna(subset=["lat", "lon", "mag"])
-        if not df_geo.empty:
+        df_celle = dati["celle"]
+        if not df_celle.empty:
             fig6 = px.scatter_mapbox(
-                df_geo,
+                df_celle,
                 lat="lat", lon="lon",
-                size=df_geo["mag"].apply(lambda m: max(1.5, m) ** 2.2),
+                size=np.sqrt(df_celle["count"]),
                 size_max=28,
-                color="mag",
+                color="mag_max",
                 color_continuous_scale=[
                     [0.0, "#60A5FA"], [0.3, "#34D399"],
                     [0.55, "#FBBF24"], [0.75, "#F97316"],
                     [1.0, "#EF4444"]
                 ],
-                range_color=[min_mag, max(df_geo["mag"].max(), min_mag + 1)],
-                hover_data={"mag": ":.1f", "depth": ":.1f", "place": True, "lat": False, "lon": False},
-                labels={"mag": "Magnitudo", "depth": "Profondità (km)", "place": "Luogo"},
+                range_color=[min_mag, max(df_celle["mag_max"].max(), min_mag + 1)],
+                hover_data={"count": True, "mag_max": ":.1f", "lat": False, "lon": False},
+                labels={"count": "Eventi nella cella", "mag_max": "Magnitudo max"},
                 mapbox_style="carto-positron",
                 center={"lat": 41.9, "lon": 12.5},
                 zoom=4.5,
@@ -393,18 +423,21 @@ def show():
             )
             fig6.update_layout(
                 margin=dict(l=0, r=0, t=0, b=0),
-                coloraxis_colorbar=dict(title="Magnitudo"),
+                coloraxis_colorbar=dict(title="Magnitudo max"),
             )
             st.plotly_chart(fig6, use_container_width=True)
+            st.caption("Eventi aggregati per cella di griglia "
+                       f"{'0,1°' if days <= 365 else '0,2°'} (dimensione = numero di eventi).")
 
         # Top zone sismiche
         st.subheader("Zone più attive nel periodo")
-        zone_counts = df.groupby("zona").agg(
-            n_eventi=("mag", "count"),
-            mag_max=("mag", "max"),
-            mag_media=("mag", "mean"),
-        ).sort_values("n_eventi", ascending=False).head(15).reset_index()
-        zone_counts["mag_media"] = zone_counts["mag_media"].round(2)
+        luoghi = dati["luoghi"]
+        zone_counts = (luoghi.assign(zona=_zone(luoghi)).groupby("zona").agg(
+            n_eventi=("n_eventi", "sum"),
+            mag_max=("mag_max", "max"),
+            mag_somma=("mag_somma", "sum"),
+        ).sort_values("n_eventi", ascending=False).head(15).reset_index())
+        zone_counts["mag_media"] = (zone_counts.pop("mag_somma") / zone_counts["n_eventi"]).round(2)
         zone_counts["mag_max"] = zone_counts["mag_max"].round(1)
         zone_counts.columns = ["Zona", "N. eventi", "Mag. max", "Mag. media"]
 
@@ -426,16 +459,39 @@ def show():
         )
         st.plotly_chart(fig7, use_container_width=True)
 
+        # Sequenze sismiche (declustering Gardner-Knopoff sull'archivio)
+        st.subheader("Sequenze sismiche del periodo")
+        with st.spinner("Raggruppamento degli eventi in sequenze..."):
+            seq = declustering.sequenze_archivio(days=days, min_mag=min_mag)
+        ruoli = np.bincount(seq["ruolo"], minlength=4)
+        s1, s2, s3 = st.columns(3)
+        s1.metric("Sequenze (≥2 eventi)", f"{ruoli[declustering.PRINCIPALE]:,}")
+        s2.metric("Eventi in sequenza", f"{seq['n_eventi'] - ruoli[declustering.ISOLATO]:,}",
+                  f"{(1 - ruoli[declustering.ISOLATO] / max(seq['n_eventi'], 1)) * 100:.0f}% del totale",
+                  delta_color="off")
+        s3.metric("Eventi isolati", f"{ruoli[declustering.ISOLATO]:,}")
+        rie = seq["riepilogo"].head(15)
+        if not rie.empty:
+            st.dataframe(pd.DataFrame({
+                "Area (evento principale)": rie["place"].fillna("").replace("", "N/A"),
+                "Inizio": pd.to_datetime(rie["inizio_ms"], unit="ms", utc=True)
+                            .dt.tz_convert(FUSO_IT).dt.strftime("%d/%m/%Y"),
+                "Durata (giorni)": (rie["durata_h"] / 24).round(1),
+                "Mmax": rie["mag_max"].round(1),
+                "Eventi": rie["n_eventi"],
+                "Precursori": rie["n_precursori"],
+                "Repliche": rie["n_repliche"],
+            }), use_container_width=True, hide_index=True)
+            st.caption("Declustering a finestre spazio-temporali di Gardner-Knopoff · "
+                       "le 15 sequenze più numerose del periodo.")
+
     # ── TAB 4: Analisi temporale ───────────────────────────────────────────────
     with tab4:
         col_a, col_b = st.columns(2)
 
         with col_a:
             st.subheader("Distribuzione oraria degli eventi")
-            hourly = df.groupby("ora").size().reset_index(name="count")
-            all_hours = pd.DataFrame({"ora": range(24)})
-            hourly = all_hours.merge(hourly, on="ora", how="left").fillna(0)
-            hourly["count"] = hourly["count"].astype(int)
+            hourly = dati["ora"]
             colori_ore = ["#BFDBFE"] * 24
             peak_h = hourly["count"].idxmax()
             colori_ore[peak_h] = "#2563EB"
@@ -460,10 +516,7 @@ def show():
 
         with col_b:
             st.subheader("Distribuzione per giorno della settimana")
-            weekly = df.groupby("giorno_settimana").size().reset_index(name="count")
-            all_days = pd.DataFrame({"giorno_settimana": range(7)})
-            weekly = all_days.merge(weekly, on="giorno_settimana", how="left").fillna(0)
-            weekly["count"] = weekly["count"].astype(int)
+            weekly = dati["settimana"].copy()
             weekly["giorno_nome"] = [_GIORNI_ITA[i] for i in weekly["giorno_settimana"]]
             peak_d = weekly["count"].idxmax()
             colori_giorni = ["#BFDBFE"] * 7
@@ -485,13 +538,13 @@ def show():
             st.caption(f"Giorno più attivo: {weekly.loc[peak_d,'giorno_nome']} "
                        f"({int(weekly.loc[peak_d,'count'])} eventi)")
 
-        # Magnitudo massima per settimana
+        # Magnitudo massima per settimana (dai conteggi giornalieri)
         st.subheader("Evoluzione settimanale — Magnitudo massima registrata")
-        df_ts = df.copy()
-        df_ts["settimana"] = pd.to_datetime(df_ts["data"]).dt.to_period("W").apply(lambda p: p.start_time)
+        df_ts = df_giorno.copy()
+        df_ts["settimana"] = df_ts["data"].dt.to_period("W").dt.start_time
         weekly_mag = df_ts.groupby("settimana").agg(
-            mag_max=("mag", "max"),
-            n_eventi=("mag", "count"),
+            mag_max=("mag_max", "max"),
+            n_eventi=("count", "sum"),
         ).reset_index()
 
         fig10 = make_subplots(specs=[[{"secondary_y": True}]])
@@ -524,12 +577,171 @@ def show():
         fig10.update_xaxes(showgrid=True, gridcolor="#F1F5F9")
         st.plotly_chart(fig10, use_container_width=True)
 
+    # ── TAB GR: Gutenberg-Richter e b-value ───────────────────────────────────
+    with tab_gr:
+        from modules.registro_vulcani import NOMI as _NOMI_VULCANI
+        aree = (["Italia (tutto il catalogo)"] + list(regioni_geo.REGIONI)
+                + [f"vulcano:{n}" for n in _NOMI_VULCANI])
+        area = st.selectbox(
+            "Area di analisi", aree, key="gr_area",
+            format_func=lambda a: f"🌋 {a.split(':', 1)[1]}" if a.startswith("vulcano:") else a,
+        )
+        with st.spinner("Calcolo b-value..."):
+            gr = analisi_gr.analisi(area=area, days=days)
+
+        if gr["mc"] is None or gr["b"] is None:
+            st.info("Nessun evento sufficiente nell'area e nel periodo selezionati.")
+        else:
+            g1, g2, g3, g4 = st.columns(4)
+            g1.metric("Mc (max curvatura)", f"M {gr['mc']:.1f}")
+            g2.metric("b-value", f"{gr['b']:.2f} ± {gr['sigma']:.2f}")
+            g3.metric("IC 95% (bootstrap)",
+                      f"{gr['ic'][0]:.2f} – {gr['ic'][1]:.2f}" if gr["ic"] else "N/D")
+            g4.metric("Eventi ≥ Mc", f"{gr['n_mc']:,}", f"a = {gr['a']:.2f}")
+            if gr["n_mc"] < analisi_gr.MIN_EVENTI:
+                st.warning(f"⚠️ Solo {gr['n_mc']} eventi sopra Mc: stima del b-value poco affidabile.")
+
+            fm = gr["fm"]
+            fig_gr = go.Figure()
+            fig_gr.add_trace(go.Scatter(
+                x=fm["m"], y=fm["n_cum"], mode="markers", name="N(≥M) cumulata",
+                marker=dict(color="#4338CA", size=7),
+                hovertemplate="M≥%{x:.1f}: %{y} eventi<extra></extra>",
+            ))
+            fig_gr.add_trace(go.Scatter(
+                x=fm["m"], y=fm["n"], mode="markers", name="Eventi per classe",
+                marker=dict(color="#94A3B8", size=6, symbol="triangle-up"),
+                hovertemplate="M %{x:.1f}: %{y} eventi<extra></extra>",
+            ))
+            m_fit = fm["m"][fm["m"] >= gr["mc"] - 1e-9]
+            fig_gr.add_trace(go.Scatter(
+                x=m_fit, y=10 ** (gr["a"] - gr["b"] * m_fit), mode="lines",
+                name=f"log N = {gr['a']:.2f} − {gr['b']:.2f} M",
+                line=dict(color="#DC2626", width=2),
+            ))
+            fig_gr.add_vline(x=gr["mc"], line_dash="dash", line_color="#F59E0B",
+                             annotation_text=f"Mc {gr['mc']:.1f}",
+                             annotation_position="top right")
+            fig_gr.update_layout(
+                height=380,
+                plot_bgcolor="white", paper_bgcolor="white",
+                xaxis=dict(showgrid=True, gridcolor="#F1F5F9", title="Magnitudo"),
+                yaxis=dict(type="log", showgrid=True, gridcolor="#F1F5F9", title="Numero eventi"),
+                legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
+                margin=dict(l=0, r=0, t=20, b=0),
+                font=dict(family="Inter, sans-serif"),
+            )
+            st.plotly_chart(fig_gr, use_container_width=True)
+
+            serie = gr["serie"]
+            if serie is not None and len(serie["b"]):
+                st.subheader("b-value nel tempo (finestre mobili di 200 eventi)")
+                tempi = pd.to_datetime(serie["time_ms"], unit="ms", utc=True).tz_convert(FUSO_IT)
+                fig_b = go.Figure()
+                fig_b.add_trace(go.Scatter(
+                    x=tempi, y=serie["b"] + serie["sigma"], mode="lines",
+                    line=dict(width=0), showlegend=False, hoverinfo="skip",
+                ))
+                fig_b.add_trace(go.Scatter(
+                    x=tempi, y=serie["b"] - serie["sigma"], mode="lines",
+                    line=dict(width=0), fill="tonexty", fillcolor="rgba(67,56,202,0.15)",
+                    name="± 1σ", hoverinfo="skip",
+                ))
+                fig_b.add_trace(go.Scatter(
+                    x=tempi, y=serie["b"], mode="lines", name="b-value",
+                    line=dict(color="#4338CA", width=2),
+                    hovertemplate="%{x|%d/%m/%Y}<br>b = %{y:.2f}<extra></extra>",
+                ))
+                fig_b.update_layout(
+                    height=320,
+                    plot_bgcolor="white", paper_bgcolor="white",
+                    xaxis=dict(showgrid=True, gridcolor="#F1F5F9", title=""),
+                    yaxis=dict(showgrid=True, gridcolor="#F1F5F9", title="b-value"),
+                    margin=dict(l=0, r=0, t=10, b=0),
+                    font=dict(family="Inter, sans-serif"),
+                    hovermode="x unified",
+                )
+                st.plotly_chart(fig_b, use_container_width=True)
+            st.caption("b-value di massima verosimiglianza (Aki-Utsu) · errore Shi & Bolt · "
+                       "Mc per massima curvatura +0,2 · IC da 500 ricampionamenti bootstrap")
+
+    # ── TAB 5: Lungo periodo (archivio colonnare) ─────────────────────────────
+    with tab5:
+        st.subheader("Sismicità italiana per anno")
+        annuale = archivio_colonne.annuale(min_mag=min_mag)
+        storici = _terremoti_storici()
+        if annuale.empty:
+            st.info(
+                "ℹ️ Archivio pluridecennale non ancora importato. Per popolarlo eseguire "
+                "`python import_storico.py --dal 1985-01` (download mensile dal catalogo INGV)."
+            )
+        else:
+            fig11 = make_subplots(specs=[[{"secondary_y": True}]])
+            fig11.add_trace(go.Bar(
+                x=annuale["anno"], y=annuale["n_eventi"],
+                name=f"Eventi M≥{min_mag}",
+                marker_color="#C7D2FE",
+                hovertemplate="<b>%{x}</b><br>%{y} eventi<extra></extra>",
+            ), secondary_y=False)
+            fig11.add_trace(go.Scatter(
+                x=annuale["anno"], y=annuale["mag_max"],
+                name="Mag. max annuale",
+                line=dict(color="#4338CA", width=2),
+                mode="lines+markers",
+                hovertemplate="<b>%{x}</b><br>Max: M%{y:.1f}<extra></extra>",
+            ), secondary_y=True)
+            if not storici.empty:
+                nel_periodo = storici[storici["anno"].between(annuale["anno"].min(),
+                                                              annuale["anno"].max())]
+                fig11.add_trace(go.Scatter(
+                    x=nel_periodo["anno"], y=nel_periodo["Magnitudo"],
+                    name="Terremoti storici",
+                    mode="markers",
+                    marker=dict(size=13, color="#DC2626", symbol="star"),
+                    text=nel_periodo["Località"],
+                    hovertemplate="<b>%{text}</b> (%{x})<br>M%{y:.1f}<extra></extra>",
+                ), secondary_y=True)
+            fig11.update_layout(
+                height=380,
+                plot_bgcolor="white", paper_bgcolor="white",
+                legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
+                margin=dict(l=0, r=0, t=20, b=0),
+                font=dict(family="Inter, sans-serif"),
+                hovermode="x unified",
+            )
+            fig11.update_yaxes(title_text="N. eventi", secondary_y=False,
+                               showgrid=True, gridcolor="#F1F5F9")
+            fig11.update_yaxes(title_text="Magnitudo", secondary_y=True, showgrid=False)
+            st.plotly_chart(fig11, use_container_width=True)
+            st.caption(f"Archivio INGV {int(annuale['anno'].min())}–{int(annuale['anno'].max())} · "
+                       f"{int(annuale['n_eventi'].sum()):,} eventi M≥{min_mag} · "
+                       f"{int(annuale['n_m5'].sum())} eventi M≥5")
+
+            forti = archivio_colonne.piu_forti(15, min_mag=max(min_mag, 4.0))
+            if not forti.empty:
+                st.subheader("Eventi più forti dell'archivio")
+                forti["Data/ora (IT)"] = (pd.to_datetime(forti["time_ms"], unit="ms", utc=True)
+                                          .dt.tz_convert(FUSO_IT).dt.strftime("%d/%m/%Y %H:%M"))
+                forti = forti.rename(columns={"mag": "Magnitudo", "place": "Luogo"})
+                forti["Magnitudo"] = forti["Magnitudo"].round(1)
+                st.dataframe(forti[["Data/ora (IT)", "Magnitudo", "Luogo"]],
+                             use_container_width=True, hide_index=True)
+
+        if not storici.empty:
+            st.subheader("Grandi terremoti storici in Italia")
+            st.dataframe(storici.sort_values("Data", ascending=False)
+                         [["Data", "Magnitudo", "Località", "Vittime", "Regione"]]
+                         .assign(Data=lambda d: d["Data"].dt.strftime("%d/%m/%Y")),
+                         use_container_width=True, hide_index=True)
+
     # ── Tabella eventi significativi ──────────────────────────────────────────
     st.markdown("---")
     st.subheader("Elenco eventi più significativi nel periodo")
-    df_top = df.nlargest(20, "mag")[["datetime", "mag", "depth", "place", "mag_type"]].copy()
-    df_top["datetime"] = df_top["datetime"].dt.strftime("%d/%m/%Y %H:%M")
+    df_top = dati["top"][["time_ms", "mag", "depth", "place", "mag_type"]].copy()
+    df_top["time_ms"] = (pd.to_datetime(df_top["time_ms"], unit="ms", utc=True)
+                         .dt.tz_convert(FUSO_IT).dt.strftime("%d/%m/%Y %H:%M"))
     df_top["depth"] = df_top["depth"].apply(lambda x: f"{x:.1f} km" if pd.notna(x) else "—")
     df_top.columns = ["Data/ora (IT)", "Magnitudo", "Profondità", "Luogo", "Tipo Mag."]
     st.dataframe(df_top, use_container_width=True, hide_index=True)
-    st.caption(f"Fonte: INGV FDSN · Periodo: ultimi {days} giorni · M≥{min_mag} · Area Italia+Mediterraneo")
+    st.caption(f"Fonte: INGV FDSN (archivio locale) · Periodo: {_periodo(days).lower()} · "
+               f"M≥{min_mag} · Area Italia+Mediterraneo")
@@ -0,0 +1,227 @@
+"""
+tabella_eventi.py — Tabella eventi sismici COLONNARE (struct-of-arrays) per SismaVer2.
+
+Il catalogo sismico condiviso conserva gli eventi come array NumPy paralleli
+invece che come liste di dict GeoJSON annidati:
+  - mag, depth  → float32        - lat, lon → float64
+  - time_ms     → int64 (epoch millisecondi UTC)
+  - place / mag_type / fonte → codici int32 su vocabolari di stringhe (interning)
+  - regione     → codice int8 (regioni_geo.REGIONI, -1 = nessuna), assegnato
+                  in modo vettoriale alla costruzione
+
+La tabella è costruita una volta per refresh; i filtri (bbox, regione, fascia di
+magnitudo, finestra temporale, raggio) sono maschere booleane vettoriali e
+to_dataframe() non richiede cicli Python.
+
+salva() / carica() serializzano le colonne in un .npz compresso (senza pickle:
+id e vocabolari sono scritti come stringhe) per la cache su disco del catalogo.
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from modules import regioni_geo
+
+_R_TERRA_KM = 6371.0
+
+# Colonne numeriche e colonne codificate (codici → attributo vocabolario)
+_NUMERICHE = (("time_ms", np.int64), ("mag", np.float32), ("depth", np.float32),
+              ("lat", np.float64), ("lon", np.float64))
+_CODIFICATE = (("place_code", "luoghi", "place"),
+               ("tipo_code", "tipi", "mag_type"),
+               ("fonte_code", "fonti", "fonte"))
+
+
+def _codifica(valori):
+    """Sequenza di stringhe → (vocabolario ordinato, codici int32)."""
+    arr = np.asarray([v or "" for v in valori], dtype=str)
+    if arr.size == 0:
+        return np.array([], dtype=object), np.zeros(0, dtype=np.int32)
+    voc, codici = np.unique(arr, return_inverse=True)
+    return voc.astype(object), codici.astype(np.int32).ravel()
+
+
+class TabellaEventi:
+    """Eventi sismici ordinati dal più recente, una colonna NumPy per campo."""
+
+    __slots__ = ("id", "time_ms", "mag", "depth", "lat", "lon", "regione_code",
+                 "place_code", "luoghi", "tipo_code", "tipi", "fonte_code", "fonti")
+
+    def __init__(self, **colonne):
+        for nome in self.__slots__:
+            setattr(self, nome, colonne[nome])
+
+    # ── Costruzione ─────────────────────────────────────────────────────────
+
+    @classmethod
+    def vuota(cls):
+        return cls.da_eventi([])
+
+    @classmethod
+    def da_eventi(cls, eventi):
+        """Lista di eventi normalizzati (dict) → tabella ordinata per tempo decrescente."""
+        col = {"id": np.array([e["id"] for e in eventi], dtype=object)}
+        for nome, dtype in _NUMERICHE:
+            val = [e[nome] if e[nome] is not None else np.nan for e in eventi] \
+                if nome == "depth" else [e[nome] for e in eventi]
+            col[nome] = np.array(val, dtype=dtype)
+        for codice, voc, campo in _CODIFICATE:
+            col[voc], col[codice] = _codifica([e[campo] for e in eventi])
+        col["regione_code"] = regioni_geo.assegna_regioni(
+            col["luoghi"], col["place_code"], col["lat"], col["lon"])
+        tab = cls(**col)
+        return tab.prendi(np.argsort(-tab.time_ms, kind="stable"))
+
+    def prendi(self, indice):
+        """Sottoinsieme (maschera booleana, array di indici o slice); vocabolari condivisi."""
+        col = {nome: getattr(self, nome)[indice]
+               for nome in ("id", "time_ms", "mag", "depth", "lat", "lon", "regione_code",
+                            "place_code", "tipo_code", "fonte_code")}
+        col.update(luoghi=self.luoghi, tipi=self.tipi, fonti=self.fonti)
+        return TabellaEventi(**col)
+
+    def unisci(self, nuova):
+        """
+        Merge per id: gli eventi di `nuova` (revisioni) sostituiscono quelli esistenti.
+        Ritorna una nuova tabella ordinata per tempo decrescente.
+        """
+        if len(nuova) == 0:
+            return self
+        if len(self) == 0:
+            return nuova
+        col = {"id": np.concatenate([self.id, nuova.id]),
+               "regione_code": np.concatenate([self.regione_code, nuova.regione_code])}
+        for nome, _dtype in _NUMERICHE:
+            col[nome] = np.concatenate([getattr(self, nome), getattr(nuova, nome)])
+        for codice, voc, _campo in _CODIFICATE:
+            stringhe = np.concatenate([getattr(self, voc)[getattr(self, codice)],
+                                       getattr(nuova, voc)[getattr(nuova, codice)]])
+            col[voc], col[codice] = _codifica(stringhe)
+        unita = TabellaEventi(**col)
+        # Ultima occorrenza di ciascun id (= revisione più recente)
+        n = len(unita)
+        _, primi_rev = np.unique(unita.id[::-1].astype(str), return_index=True)
+        tieni = n - 1 - primi_rev
+        tieni = tieni[np.argsort(-unita.time_ms[tieni], kind="stable")]
+        return unita.prendi(tieni)
+
+    # ── Disco ───────────────────────────────────────────────────────────────
+
+    def salva(self, f, **extra):
+        """Scrive le colonne (e gli array `extra`) in un .npz compresso su file/percorso."""
+        col = {nome: getattr(self, nome) for nome in self.__slots__}
+        for nome in ("id", "luoghi", "tipi", "fonti"):
+            col[nome] = np.asarray(col[nome], dtype=str)
+        np.savez_compressed(f, **col, **extra)
+
+    @classmethod
+    def carica(cls, f):
+        """Inverso di salva() → (tabella, dict degli array extra)."""
+        with np.load(f, allow_pickle=False) as npz:
+            dati = {k: npz[k] for k in npz.files}
+        for nome in ("id", "luoghi", "tipi", "fonti"):
+            dati[nome] = dati[nome].astype(object)
+        col = {nome: dati.pop(nome) for nome in cls.__slots__}
+        return cls(**col), dati
+
+    # ── Accesso ─────────────────────────────────────────────────────────────
+
+    def __len__(self):
+        return int(self.time_ms.shape[0])
+
+    @property
+    def place(self):
+        return self.luoghi[self.place_code]
+
+    @property
+    def regione(self):
+        """Nome regione per evento ("" se fuori dalle 20 regioni)."""
+        return regioni_geo.NOMI[self.regione_code]
+
+    @property
+    def mag_type(self):
+        return self.tipi[self.tipo_code]
+
+    @property
+    def fonte(self):
+        return self.fonti[self.fonte_code]
+
+    def testa(self, n: int):
+        return self.prendi(slice(0, n))
+
+    def riga(self, i: int) -> dict:
+        """Evento i-esimo come dict normalizzato (stesse chiavi del catalogo)."""
+        depth = float(self.depth[i])
+        return {
+            "id":       self.id[i],
+            "time_ms":  int(self.time_ms[i]),
+            "mag":      round(float(self.mag[i]), 2),
+            "mag_type": self.tipi[self.tipo_code[i]],
+            "lat":      float(self.lat[i]),
+            "lon":      float(self.lon[i]),
+            "depth":    None if np.isnan(depth) else round(depth, 2),
+            "place":    self.luoghi[self.place_code[i]],
+            "fonte":    self.fonti[self.fonte_code[i]],
+            "regione":  regioni_geo.nome_regione(int(self.regione_code[i])),
+        }
+
+    def righe(self):
+        """Itera gli eventi come dict (solo per liste brevi da visualizzare)."""
+        for i in range(len(self)):
+            yield self.riga(i)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """DataFrame colonnare: gli array sono passati a pandas senza cicli Python."""
+        return pd.DataFrame({
+            "id":       self.id,
+            "time":     pd.to_datetime(self.time_ms, unit="ms", utc=True),
+            "time_ms":  self.time_ms,
+            "mag":      self.mag,
+            "depth":    self.depth,
+            "lat":      self.lat,
+            "lon":      self.lon,
+            "place":    pd.Categorical.from_codes(self.place_code, categories=self.luoghi),
+            "mag_type": pd.Categorical.from_codes(self.tipo_code, categories=self.tipi),
+            "fonte":    pd.Categorical.from_codes(self.fonte_code, categories=self.fonti),
+            "regione":  pd.Categorical.from_codes(self.regione_code,
+                                                  categories=list(regioni_geo.REGIONI)),
+        })
+
+    # ── Filtri vettoriali ───────────────────────────────────────────────────
+
+    def distanze_km(self, lat: float, lon: float) -> np.ndarray:
+        """Distanza haversine (km) di ogni evento dal punto dato."""
+        p1 = np.radians(lat)
+        p2 = np.radians(self.lat)
+        dp = p2 - p1
+        dl = np.radians(self.lon - lon)
+        a = np.sin(dp / 2) ** 2 + np.cos(p1) * np.cos(p2) * np.sin(dl / 2) ** 2
+        return 2 * _R_TERRA_KM * np.arcsin(np.sqrt(a))
+
+    def maschera(self, days: float = None, min_mag: float = None, max_mag: float = None,
+                 bbox=None, regione: str = None, centro=None, raggio_km: float = None,
+                 ora_ms: int = None) -> np.ndarray:
+        """Maschera booleana combinata dei filtri richiesti (None = filtro assente)."""
+        m = np.ones(len(self), dtype=bool)
+        if days is not None:
+            ora_ms = ora_ms if ora_ms is not None else int(time.time() * 1000)
+            m &= self.time_ms >= ora_ms - int(days * 86_400_000)
+        if min_mag is not None:
+            m &= self.mag >= np.float32(min_mag)
+        if max_mag is not None:
+            m &= self.mag < np.float32(max_mag)
+        if bbox is not None:
+            la0, la1, lo0, lo1 = bbox
+            m &= (self.lat >= la0) & (self.lat <= la1) & (self.lon >= lo0) & (self.lon <= lo1)
+        if regione and not regione.startswith("Italia"):
+            m &= self.regione_code == regioni_geo.codice_regione(regione)
+        if centro is not None and raggio_km is not None:
+            m &= self.distanze_km(centro[0], centro[1]) <= raggio_km
+        return m
+
+    def filtra(self, limit: int = None, **filtri):
+        """Sottotabella con i filtri di maschera(); `limit` tiene i più recenti."""
+        sub = self.prendi(self.maschera(**filtri))
+        return sub.testa(limit) if limit is not None else sub
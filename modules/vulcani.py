@@ -6,16 +6,13 @@ except ImportError:
     _AUTOREFRESH_OK = False
 import pandas as pd
 import numpy as np
-import requests
+from modules import cache_mappe, cache_swr, http_client, fetch_async
 from datetime import datetime, timedelta, timezone
 import plotly.express as px
 import folium
-from streamlit_folium import folium_static
 import json
 import os
 import time
-from functools import lru_cache
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Fuso orario italiano con ora legale automatica
 def _get_tz_italia():
@@ -27,215 +24,56 @@ def _get_tz_italia():
 
 FUSO_ORARIO_ITALIA = _get_tz_italia()
 
-# Funzione per recuperare eventi vulcanici - accessibile a tutto il modulo
-@st.cache_data(ttl=300)  # Cache 5 min — dati sismici vulcani live
-@lru_cache(maxsize=8)  # Doppio livello di cache per maggiore efficienza
+# ── Eventi sismici recenti nell'area di un vulcano ──────────────────────────
+# Host INGV FDSN equivalenti: si interroga il primo sano, gli altri solo se fallisce
+_HOST_INGV = ("webservices.ingv.it", "terremoti.ingv.it", "cnt.rm.ingv.it", "iside.rm.ingv.it")
+
+
+@cache_swr.swr(ttl=300)
 def get_vulcano_recent_events(vulcano_name, lat, lon, days=30, max_radius=0.2):
     """
-    Funzione ottimizzata per recuperare dati sismici recenti nell'area di un vulcano.
-    Include sistema di cache multilivello e fallback automatico a dati storici
-    in caso di impossibilità di accesso ai dati online.
-    
-    Parameters:
-    -----------
-    vulcano_name : str
-        Nome del vulcano (per log e cache)
-    lat : float
-        Latitudine del centro del vulcano
-    lon : float
-        Longitudine del centro del vulcano
-    days : int
-        Numero di giorni indietro da considerare
-    max_radius : float
-        Raggio di ricerca in gradi (1° ≈ 111km)
-        
-    Returns:
-    --------
-    list : Eventi sismici nell'area del vulcano
+    Eventi sismici degli ultimi `days` giorni entro `max_radius` gradi
+    (1° ≈ 111 km) dal vulcano, dal più recente: lista di dict time
+    ("%d/%m/%Y %H:%M" ora italiana), magnitude, depth (km), location.
+
+    Cache condivisa tra sessioni (cache_swr, 5 minuti, numero di voci
+    limitato); una sola richiesta INGV FDSN (GeoJSON) all'host più sano,
+    gli altri host solo in caso di errore. None se nessun host risponde:
+    la cache continua a servire l'ultimo elenco buono.
     """
-    # Crea chiave cache per session_state
-    cache_key = f"vulcano_events_{vulcano_name.lower().replace(' ', '_')}"
-    cache_time_key = f"{cache_key}_time"
-    
-    # Verifica cache in session_state (più veloce)
-    if cache_key in st.session_state and cache_time_key in st.session_state:
-        cache_age = datetime.now(FUSO_ORARIO_ITALIA) - st.session_state[cache_time_key]
-        # Usa cache se più recente di 5 minuti
-        if cache_age.total_seconds() < 300:
-            print(f"INFO: Dati {vulcano_name} da cache (età: {int(cache_age.total_seconds())}s)")
-            return st.session_state[cache_key]
-    
-    # Fallback: lista vuota — mai dati inventati
-    def get_historical_events():
-        return []
-        
-    try:
-        # Prepara richiesta con fuso orario corretto
-        start_date = (datetime.now(FUSO_ORARIO_ITALIA) - timedelta(days=days)).strftime("%Y-%m-%dT%H:%M:%S")
-        
-        # Definizione di tutti i server INGV alternativi
-        ingv_servers = [
-            "webservices.ingv.it",
-            "terremoti.ingv.it",
-            "cnt.rm.ingv.it",
-            "iside.rm.ingv.it"
-        ]
-        
-        # Definizione dei formati alternativi
-        formats = ["json", "geojson"]
-        
-        # Per una maggiore resilienza, proveremo diverse combinazioni di server e formati
-        response = None
-        data = None
-        
-        # Configurazione avanzata per la richiesta
-        headers = {
-            'User-Agent': 'SismaVer2/1.0 (Monitoraggio vulcanico italiano; https://sisma-ver-2.replit.app/)',
-            'Accept': 'application/json, application/xml',
-            'Accept-Encoding': 'gzip, deflate',
-            'Connection': 'keep-alive'
-        }
-        
-        # Utilizza ThreadPoolExecutor per richiedere dati da più server in parallelo
-        with ThreadPoolExecutor(max_workers=4) as executor:
-            future_to_url = {}
-            
-            # Crea tutte le possibili combinazioni
-            for server in ingv_servers:
-                for fmt in formats:
-                    url = f"https://{server}/fdsnws/event/1/query?format={fmt}&starttime={start_date}&lat={lat}&lon={lon}&maxradius={max_radius}"
-                    future_to_url[executor.submit(requests.get, url, timeout=7, headers=headers)] = url
-            
-            # Raccoglie i risultati man mano che arrivano
-            for future in as_completed(future_to_url):
-                url = future_to_url[future]
-                try:
-                    response = future.result()
-                    if response.status_code == 200 and len(response.text) > 100:
-                        print(f"INFO: Ottenuti dati da {url}")
-                        # Tenta di parsare JSON
-                        try:
-                            data = response.json()
-                            break  # Usiamo il primo risultato valido
-                        except:
-                            print(f"INFO: Errore nel parsing JSON da {url}")
-                except Exception as exc:
-                    print(f"INFO: Errore nel recupero dati da {url}: {str(exc)[:50]}...")
-        
-        # Se abbiamo ottenuto dati validi, processiamoli
-        events = []
-        if data:
-            # Gestione del formato GeoJSON
-            if "features" in data:
-                for feature in data.get("features", []):
-                    if not isinstance(feature, dict):
-                        continue
-                        
-                    properties = feature.get("properties", {})
-                    geometry = feature.get("geometry", {}).get("coordinates", [])
-                    
-                    # Estrai i dati rilevanti
-                    mag = properties.get("mag", "N/D")
-                    place = properties.get("place", "N/D")
-                    time_val = properties.get("time")
-                    depth = geometry[2] if len(geometry) > 2 else "N/D"
-                    
-                    # Formatta data/ora
-                    formatted_time = "N/D"
-                    if time_val:
-                        try:
-                            if isinstance(time_val, int):
-                                dt = datetime.fromtimestamp(time_val/1000.0, FUSO_ORARIO_ITALIA)
-                            else:
-                                dt = datetime.fromisoformat(str(time_val).replace("Z", "+00:00"))
-                                dt = dt.astimezone(FUSO_ORARIO_ITALIA)
-                            formatted_time = dt.strftime("%d/%m/%Y %H:%M")
-                        except:
-                            formatted_time = str(time_val)
-                    
-                    events.append({
-                        "time": formatted_time,
-                        "magnitude": mag,
-                        "depth": depth,
-                        "location": place
-                    })
-            # Gestione formato JSON standard INGV
-            elif "events" in data:
-                for event in data.get("events", []):
-                    if not isinstance(event, dict):
-                        continue
-                        
-                    date_str = event.get("origin", {}).get("time", {}).get("value", "")
-                    if date_str:
-                        try:
-                            dt = datetime.fromisoformat(date_str.replace("Z", "+00:00"))
-                            dt = dt.astimezone(FUSO_ORARIO_ITALIA)
-                            formatted_time = dt.strftime("%d/%m/%Y %H:%M")
-                        except:
-                            formatted_time = date_str
-                    else:
-                        formatted_time = "N/D"
-                        
-                    magnitude = event.get("magnitude", [{}])[0].get("mag", {}).get("value", "N/D")
-                    depth = event.get("origin", {}).get("depth", {}).get("value", "N/D")
-                    if depth != "N/D":
-                        depth = depth / 1000  # Converti da metri a km
-                        
-                    # Località (a volte in un campo diverso)
-                    location = event.get("description", {}).get("text", vulcano_name)
-                    
-                    events.append({
-                        "time": formatted_time,
-                        "magnitude": magnitude,
-                        "depth": depth,
-                        "location": location
-                    })
-            
-            # Filtra eventi per rimuovere duplicati
-            seen = set()
-            unique_events = []
-            for event in events:
-                event_key = f"{event['time']}_{event['magnitude']}_{event['depth']}"
-                if event_key not in seen:
-                    seen.add(event_key)
-                    unique_events.append(event)
-            
-            # Ordina per data (più recenti prima)
-            unique_events.sort(key=lambda x: x["time"], reverse=True)
-            
-            # Salva in cache
-            st.session_state[cache_key] = unique_events
-            st.session_state[cache_time_key] = datetime.now(FUSO_ORARIO_ITALIA)
-            
-            return unique_events
-        else:
-            print(f"INFO: Impossibile ottenere dati per {vulcano_name}, uso fallback")
-            fallback_events = get_historical_events()
-            
-            # Salva anche il fallback in cache per evitare richieste continue
-            st.session_state[cache_key] = fallback_events
-            st.session_state[cache_time_key] = datetime.now(FUSO_ORARIO_ITALIA)
-            
-            return fallback_events
-            
-    except Exception as e:
-        print(f"ERROR: Eccezione nel recupero eventi {vulcano_name}: {str(e)}")
-        return get_historical_events()
+    from modules.catalogo_sismico import _normalizza
+    start = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%dT%H:%M:%S")
+    query = (f"/fdsnws/event/1/query?format=geojson&starttime={start}"
+             f"&lat={lat}&lon={lon}&maxradius={max_radius}&orderby=time")
+    urls = fetch_async.ordina_per_salute([f"https://{h}{query}" for h in _HOST_INGV])
+    r = fetch_async.fetch(urls[0], mirror=urls[1:], timeout=12, accetta=(200, 204),
+                          sequenziale=True)
+    if r is None:
+        print(f"INFO: Nessun host INGV disponibile per {vulcano_name}")
+        return None
+    features = [] if r.status_code == 204 else r.json().get("features", [])
+    eventi = {}
+    for e in (_normalizza(f, "INGV") for f in features):
+        if e is not None:
+            eventi[e["id"]] = e
+    return [{
+        "time": datetime.fromtimestamp(e["time_ms"] / 1000.0, FUSO_ORARIO_ITALIA).strftime("%d/%m/%Y %H:%M"),
+        "magnitude": e["mag"],
+        "depth": round(e["depth"], 1) if e["depth"] is not None else "N/D",
+        "location": e["place"] or vulcano_name,
+    } for e in sorted(eventi.values(), key=lambda e: e["time_ms"], reverse=True)]
+
 
 # Funzioni helper per il monitoraggio vulcanico
-@st.cache_data(ttl=300)
 def get_vesuvio_recent_events():
     return get_vulcano_recent_events("Vesuvio", 40.821, 14.426, 30, 0.2)
 
-@st.cache_data(ttl=300)
 def get_etna_recent_events():
     return get_vulcano_recent_events("Etna", 37.751, 14.994, 30, 0.3)
 
-@st.cache_data(ttl=300)
 def get_campi_flegrei_recent_events():
     return get_vulcano_recent_events("Campi Flegrei", 40.827, 14.139, 30, 0.2)
 
-@st.cache_data(ttl=300)
 def get_stromboli_recent_events():
     return get_vulcano_recent_events("Stromboli", 38.789, 15.213, 30, 0.1)
 
@@ -369,6 +207,56 @@ def _show_deformazione_block(vulcano_nome):
     st.markdown(f"📡 [Consulta il bollettino INGV aggiornato →]({d['link']})")
     st.markdown("---")
 
+def _show_tendenza_block(vulcano_nome):
+    """Tendenza della sismicità (serie_vulcani): tasso giornaliero, momento cumulato, STA/LTA."""
+    from modules import registro_vulcani, serie_vulcani
+    if vulcano_nome not in registro_vulcani.VULCANI:
+        return
+    import plotly.graph_objects as go
+    offset_s = int(FUSO_ORARIO_ITALIA.utcoffset(None).total_seconds())
+    try:
+        giornaliero = serie_vulcani.tasso(vulcano_nome, "giorno", giorni=90, offset_s=offset_s)
+        momento = serie_vulcani.momento_cumulato(vulcano_nome, giorni=365)
+        var = serie_vulcani.variazione(vulcano_nome)
+        t24, _m, _d = serie_vulcani.eventi(vulcano_nome, giorni=1, min_mag=0.5)
+        t30, _m, _d = serie_vulcani.eventi(vulcano_nome, giorni=30, min_mag=0.5)
+    except Exception as e:
+        print(f"WARN: tendenza {vulcano_nome} non disponibile: {e}")
+        return
+
+    st.markdown(f"### 📈 Tendenza sismica — {vulcano_nome}")
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Eventi ultime 24h", len(t24))
+    c2.metric("Eventi ultimi 30 giorni", len(t30))
+    c3.metric("Rapporto STA/LTA (24h / 30gg)",
+              f"{var['rapporto']:.2f}" if var["rapporto"] is not None else "N/D",
+              help="Tasso orario medio delle ultime 24 ore diviso quello degli ultimi 30 giorni")
+    if var["in_aumento"]:
+        st.warning(f"⚠️ Tasso di sismicità in aumento: STA/LTA {var['rapporto']:.1f} "
+                   f"({var['n_sta']} eventi nelle ultime 24 ore)")
+
+    g1, g2 = st.columns(2)
+    with g1:
+        fig = go.Figure(go.Bar(x=giornaliero["inizio"], y=giornaliero["count"],
+                               marker_color="#EA580C", name="Eventi/giorno"))
+        fig.update_layout(title="Eventi al giorno (90 giorni)", height=300,
+                          margin=dict(l=10, r=10, t=40, b=10), yaxis_title="Eventi")
+        st.plotly_chart(fig, use_container_width=True)
+    with g2:
+        fig = go.Figure(go.Scatter(x=momento["time"], y=momento["momento_cum"],
+                                   mode="lines", line=dict(color="#DC2626", shape="hv"),
+                                   name="Momento cumulato"))
+        fig.update_layout(title="Rilascio cumulato di momento sismico (365 giorni)", height=300,
+                          margin=dict(l=10, r=10, t=40, b=10), yaxis_title="N·m")
+        st.plotly_chart(fig, use_container_width=True)
+    live = serie_vulcani.inizio_live()
+    st.caption("Serie locale per area vulcanica (eventi M≥0.5 dallo scheduler"
+               + (f", dal {datetime.fromtimestamp(live / 1000, FUSO_ORARIO_ITALIA).strftime('%d/%m/%Y')}"
+                  if live else "")
+               + "; prima, archivio M≥1.5) · Momento M0 = 10^(1.5·M + 9.1) N·m")
+    st.markdown("---")
+
+
 def show():
     # Auto-refresh ogni 5 minuti per dati sismici vulcani
     if _AUTOREFRESH_OK:
@@ -784,45 +672,48 @@ def show():
     st.markdown("---")
     st.subheader("🗺️ Posizione")
     
-    # Creazione mappa interattiva con folium
-    m = folium.Map(location=[info_vulcano["lat"], info_vulcano["lon"]], zoom_start=10)
-    
-    # Aggiungi marker per il vulcano con GPS navigazione
-    _vg  = f"https://www.google.com/maps/dir/?api=1&destination={info_vulcano['lat']},{info_vulcano['lon']}&travelmode=driving"
-    _vwz = f"https://waze.com/ul?ll={info_vulcano['lat']},{info_vulcano['lon']}&navigate=yes"
-    _vam = f"https://maps.apple.com/?daddr={info_vulcano['lat']},{info_vulcano['lon']}&dirflg=d"
-    _vph = (
-        '<div style="min-width:230px;font-family:sans-serif;font-size:13px;">'
-        f'<h4 style="color:#DC2626;margin:0 0 6px 0;font-size:14px;border-bottom:2px solid #DC2626;padding-bottom:3px;">🌋 {vulcano_selezionato}</h4>'
-        f'<p style="margin:0 0 4px 0;font-size:12px;"><b>Tipo:</b> {info_vulcano["tipo"]}</p>'
-        f'<p style="margin:0 0 4px 0;font-size:12px;"><b>Stato:</b> {info_vulcano.get("stato", "N/D")}</p>'
-        f'<p style="margin:0 0 6px 0;font-size:11px;color:#888;font-family:monospace;">{info_vulcano["lat"]:.4f}, {info_vulcano["lon"]:.4f}</p>'
-        '<div style="display:flex;gap:4px;">'
-        f'<a href="{_vg}" target="_blank" style="background:#4285F4;color:white;padding:4px 7px;text-decoration:none;border-radius:4px;font-size:11px;font-weight:600;">🗺️ GMaps</a>'
-        f'<a href="{_vwz}" target="_blank" style="background:#00BCD4;color:#000;padding:4px 7px;text-decoration:none;border-radius:4px;font-size:11px;font-weight:600;">🚗 Waze</a>'
-        f'<a href="{_vam}" target="_blank" style="background:#555;color:white;padding:4px 7px;text-decoration:none;border-radius:4px;font-size:11px;font-weight:600;">🍎 Maps</a>'
-        '</div></div>'
-    )
-    folium.Marker(
-        [info_vulcano["lat"], info_vulcano["lon"]],
-        popup=folium.Popup(_vph, max_width=280),
-        tooltip=f"{vulcano_selezionato} - {info_vulcano['tipo']}",
-        icon=folium.Icon(color="red", icon="fire", prefix="fa")
-    ).add_to(m)
-    
-    # Aggiungi cerchio per l'area di maggior rischio (10 km)
-    folium.Circle(
-        radius=10000,  # 10 km in metri
-        location=[info_vulcano["lat"], info_vulcano["lon"]],
-        color="red",
-        fill=True,
-        fill_color="red",
-        fill_opacity=0.2,
-        tooltip="Area di maggior rischio (10 km)"
-    ).add_to(m)
-    
-    # Visualizza la mappa in Streamlit
-    folium_static(m, width=1100, height=520)
+    def _mappa_vulcano():
+        # Creazione mappa interattiva con folium
+        m = folium.Map(location=[info_vulcano["lat"], info_vulcano["lon"]], zoom_start=10)
+
+        # Aggiungi marker per il vulcano con GPS navigazione
+        _vg  = f"https://www.google.com/maps/dir/?api=1&destination={info_vulcano['lat']},{info_vulcano['lon']}&travelmode=driving"
+        _vwz = f"https://waze.com/ul?ll={info_vulcano['lat']},{info_vulcano['lon']}&navigate=yes"
+        _vam = f"https://maps.apple.com/?daddr={info_vulcano['lat']},{info_vulcano['lon']}&dirflg=d"
+        _vph = (
+            '<div style="min-width:230px;font-family:sans-serif;font-size:13px;">'
+            f'<h4 style="color:#DC2626;margin:0 0 6px 0;font-size:14px;border-bottom:2px solid #DC2626;padding-bottom:3px;">🌋 {vulcano_selezionato}</h4>'
+            f'<p style="margin:0 0 4px 0;font-size:12px;"><b>Tipo:</b> {info_vulcano["tipo"]}</p>'
+            f'<p style="margin:0 0 4px 0;font-size:12px;"><b>Stato:</b> {info_vulcano.get("stato", "N/D")}</p>'
+            f'<p style="margin:0 0 6px 0;font-size:11px;color:#888;font-family:monospace;">{info_vulcano["lat"]:.4f}, {info_vulcano["lon"]:.4f}</p>'
+            '<div style="display:flex;gap:4px;">'
+            f'<a href="{_vg}" target="_blank" style="background:#4285F4;color:white;padding:4px 7px;text-decoration:none;border-radius:4px;font-size:11px;font-weight:600;">🗺️ GMaps</a>'
+            f'<a href="{_vwz}" target="_blank" style="background:#00BCD4;color:#000;padding:4px 7px;text-decoration:none;border-radius:4px;font-size:11px;font-weight:600;">🚗 Waze</a>'
+            f'<a href="{_vam}" target="_blank" style="background:#555;color:white;padding:4px 7px;text-decoration:none;border-radius:4px;font-size:11px;font-weight:600;">🍎 Maps</a>'
+            '</div></div>'
+        )
+        folium.Marker(
+            [info_vulcano["lat"], info_vulcano["lon"]],
+            popup=folium.Popup(_vph, max_width=280),
+            tooltip=f"{vulcano_selezionato} - {info_vulcano['tipo']}",
+            icon=folium.Icon(color="red", icon="fire", prefix="fa")
+        ).add_to(m)
+
+        # Aggiungi cerchio per l'area di maggior rischio (10 km)
+        folium.Circle(
+            radius=10000,  # 10 km in metri
+            location=[info_vulcano["lat"], info_vulcano["lon"]],
+            color="red",
+            fill=True,
+            fill_color="red",
+            fill_opacity=0.2,
+            tooltip="Area di maggior rischio (10 km)"
+        ).add_to(m)
+        return m
+
+    # Visualizza la mappa in Streamlit (HTML in cache per vulcano)
+    cache_mappe.mostra(("vulcano", vulcano_selezionato, info_vulcano), _mappa_vulcano,
+                       width=1100, height=520)
     
     # Monitoraggio in tempo reale e webcam
     st.markdown("---")
@@ -833,7 +724,8 @@ def show():
     
     with tab1:
         st.markdown("### 📊 Monitoraggio sismico in tempo reale")
-        
+        _show_tendenza_block(vulcano_selezionato)
+
         # Date dinamiche: ultimi 7 giorni
         _oggi = datetime.now(FUSO_ORARIO_ITALIA)
         _sette_gg_fa = _oggi - timedelta(days=7)
@@ -935,7 +827,7 @@ def show():
                     df_events = pd.DataFrame(processed_events)
                     try:
                         if isinstance(df_events['Data'].iloc[0], str):
-                            df_events['Data'] = pd.to_datetime(df_events['Data'])
+                            df_events['Data'] = pd.to_datetime(df_events['Data'], format="%d/%m/%Y %H:%M")
                         df_events = df_events.sort_values('Data')
                         
                         fig = px.scatter(
@@ -1088,7 +980,7 @@ def show():
                     "&minlatitude=25&maxlatitude=47&minlongitude=-10&maxlongitude=42"
                     "&limit=5&orderby=magnitude"
                 )
-                r = requests.get(url, timeout=8)
+                r = http_client.get(url, timeout=8)
                 if r.status_code != 200:
                     return None
                 feats = r.json().get("features", [])